@@ -14,4 +14,9 @@ from django.core.asgi import get_asgi_application
 DJANGO_ENV = os.getenv("DJANGO_ENV", "prod")
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", f"backend.settings.{DJANGO_ENV}")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up: the maintenance SSE stream is served natively (no thread per client)
+from maintenance.sse import with_maintenance_stream  # noqa: E402
+
+application = with_maintenance_stream(django_application)
@@ -0,0 +1,15 @@
+"""
+Model mixin keeping the db_audit loaded-state snapshot (backend/db_audit.py) in step with
+refresh_from_db(), which reloads columns without firing post_init on the instance.
+Kept out of backend.db_audit so model modules can import it before the app registry is ready.
+"""
+
+
+class AuditSnapshotMixin:
+    """Audited models: after refresh_from_db() the next save diffs against the reloaded values."""
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # Imported here: backend.db_audit pulls in rest_framework_simplejwt, which needs the app registry
+        from backend.db_audit import refresh_snapshot
+        refresh_snapshot(self, fields)
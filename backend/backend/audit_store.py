@@ -0,0 +1,216 @@
+"""
+Indexed store of the db_audit history (append-only SQLite file, default logs/db_audit.sqlite3).
+
+The audit writer appends every batch it writes to the JSON-lines log also here, so questions
+like "who changed Transaction 1234" or "everything user X did last week" are index lookups:
+- (model, object_pk, ts): history of one object;
+- (actor_user_id, ts): changes made by one user;
+- (ts): time ranges.
+Each row keeps the original JSON line (`entry`) plus a digest of it, so importing a log file
+that is already (partly) in the store inserts nothing twice.
+Timestamps are stored in UTC (ISO text, microseconds) so they sort and compare as strings.
+UPDATE and DELETE are rejected by triggers.
+
+The existing history is loaded with `python manage.py import_audit_log logs/db_audit.log*`;
+queries go through AuditStore.search() (`python manage.py audit_log`, GET /backend/audit-log/).
+"""
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+from pathlib import Path
+
+_TS_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit_event (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    action TEXT,
+    model TEXT,
+    object_pk TEXT,
+    actor_user_id TEXT,
+    digest BLOB NOT NULL,
+    entry TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS audit_event_digest ON audit_event (digest);
+CREATE INDEX IF NOT EXISTS audit_event_object ON audit_event (model, object_pk, ts);
+CREATE INDEX IF NOT EXISTS audit_event_actor ON audit_event (actor_user_id, ts);
+CREATE INDEX IF NOT EXISTS audit_event_ts ON audit_event (ts);
+CREATE TRIGGER IF NOT EXISTS audit_event_no_update BEFORE UPDATE ON audit_event
+BEGIN SELECT RAISE(ABORT, 'audit_event is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS audit_event_no_delete BEFORE DELETE ON audit_event
+BEGIN SELECT RAISE(ABORT, 'audit_event is append-only'); END;
+"""
+
+_INSERT = (
+    "INSERT OR IGNORE INTO audit_event (ts, action, model, object_pk, actor_user_id, digest, entry) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def to_utc_text(value, tz=dt_timezone.utc) -> str:
+    """Stored form of a timestamp: datetime, date (midnight) or ISO string -> UTC ISO text; naive values are in tz."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, dt_time.min)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=tz)
+    return value.astimezone(dt_timezone.utc).strftime(_TS_FORMAT)
+
+
+def _row(entry: dict, line: str) -> tuple:
+    actor = entry.get("actor") or {}
+    user_id = actor.get("user_id") if isinstance(actor, dict) else None
+    pk = entry.get("pk")
+    return (
+        to_utc_text(entry["timestamp"]),
+        entry.get("action"),
+        entry.get("model"),
+        None if pk is None else str(pk),
+        None if user_id is None else str(user_id),
+        hashlib.sha1(line.encode("utf-8")).digest(),
+        line,
+    )
+
+
+class AuditStore:
+    """One SQLite connection per thread (and process) on the store file; tz applies to naive query bounds."""
+
+    def __init__(self, path, tz=dt_timezone.utc):
+        self.path = Path(path)
+        self.tz = tz
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        # WAL: readers (API, command) never block the writer thread and vice versa
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(_SCHEMA)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            connection.close()
+        self._local.connection = None
+
+    # --- Writes ---
+
+    def append(self, entries) -> int:
+        """Insert (entry dict, JSON line) pairs in one transaction; returns the rows actually inserted."""
+        return self._insert([_row(entry, line) for entry, line in entries])
+
+    def _insert(self, rows) -> int:
+        if not rows:
+            return 0
+        connection = self._connection()
+        before = connection.total_changes
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(_INSERT, rows)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return connection.total_changes - before
+
+    def import_lines(self, lines, batch_size: int = 5000) -> dict:
+        """
+        Bulk-load JSON lines (as written in db_audit.log). Lines that are not audit entries are
+        counted as invalid; lines already in the store are skipped.
+        """
+        stats = {"read": 0, "inserted": 0, "invalid": 0}
+        batch = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            stats["read"] += 1
+            try:
+                batch.append(_row(json.loads(line), line))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                stats["invalid"] += 1
+                continue
+            if len(batch) >= batch_size:
+                stats["inserted"] += self._insert(batch)
+                batch = []
+        stats["inserted"] += self._insert(batch)
+        return stats
+
+    # --- Reads ---
+
+    def search(self, model=None, pk=None, user_id=None, action=None, since=None, until=None) -> "AuditQuery":
+        """Events matching every given filter, newest first; since is inclusive, until exclusive."""
+        where, params = [], []
+        for column, value in (("model", model), ("object_pk", pk), ("actor_user_id", user_id), ("action", action)):
+            if value not in (None, ""):
+                where.append(f"{column} = ?")
+                params.append(str(value))
+        if since:
+            where.append("ts >= ?")
+            params.append(to_utc_text(since, self.tz))
+        if until:
+            where.append("ts < ?")
+            params.append(to_utc_text(until, self.tz))
+        return AuditQuery(self, " AND ".join(where) or "1", params)
+
+
+class AuditQuery:
+    """Lazy result of AuditStore.search(): supports count(), len() and slicing, so it can be paginated."""
+
+    ordered = True
+
+    def __init__(self, store: AuditStore, where: str, params: list):
+        self.store = store
+        self.where = where
+        self.params = params
+
+    def count(self) -> int:
+        connection = self.store._connection()
+        return connection.execute(f"SELECT COUNT(*) FROM audit_event WHERE {self.where}", self.params).fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            rows = self._fetch(1, key)
+            if not rows:
+                raise IndexError(key)
+            return rows[0]
+        start, stop = key.start or 0, key.stop
+        if key.step not in (None, 1) or start < 0 or (stop is not None and stop < 0):
+            raise ValueError("AuditQuery supports only non-negative slices")
+        limit = -1 if stop is None else max(stop - start, 0)
+        return self._fetch(limit, start)
+
+    def __iter__(self):
+        return iter(self._fetch(-1, 0))
+
+    def _fetch(self, limit: int, offset: int) -> list:
+        connection = self.store._connection()
+        rows = connection.execute(
+            f"SELECT id, entry FROM audit_event WHERE {self.where} ORDER BY ts DESC, id DESC LIMIT ? OFFSET ?",
+            [*self.params, limit, offset],
+        ).fetchall()
+        return [{"id": row_id, **json.loads(entry)} for row_id, entry in rows]
+
+
+def read_log_lines(path):
+    """Lines of a db_audit log file, also gzipped rotated ones (db_audit.log.*.gz)."""
+    path = Path(path)
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as handle:
+        yield from handle
@@ -0,0 +1,304 @@
+"""
+Background writer for the db_audit log.
+
+Request threads only put (timestamp, actor, payload) tuples on a bounded queue; a daemon
+flusher thread serializes them to JSON and appends them to the log file in batches
+(every `batch_size` events or `flush_interval` seconds).
+
+- Backpressure: when the queue is full an event waits at most `put_timeout` seconds
+  (0 = never blocks) and is then dropped. Drops are counted (stats()) and recorded in the
+  log itself as a {"action": "dropped", "count": N} line, so gaps are visible.
+- Rotation: before a batch is written the file is rotated if it would grow past `max_bytes`
+  or (with `rotate_daily`) it was last written on an earlier day. Rotated files are gzipped
+  (db_audit.log.YYYYmmdd-HHMMSS.gz) and only the newest `backup_count` are kept.
+- Several processes can share the file: writes and rotation happen under an exclusive
+  lock on `<log>.lock` (POSIX only), and a writer reopens the file when another process
+  has rotated it.
+- With a `store` (backend.audit_store.AuditStore) every written batch is also inserted into
+  the indexed store, after the file write; a failing store never loses the file lines.
+- The thread is started lazily in each process (also after a fork) and flushed at exit.
+  With asynchronous=False events are written at once on the calling thread.
+"""
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows development machines
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_ROTATED_SUFFIX_FORMAT = "%Y%m%d-%H%M%S"
+
+
+@dataclass(frozen=True)
+class WriterOptions:
+    path: Path
+    tz: object
+    queue_size: int = 10000
+    batch_size: int = 500
+    flush_interval: float = 1.0
+    put_timeout: float = 0.0
+    max_bytes: int = 50 * 1024 * 1024
+    rotate_daily: bool = True
+    backup_count: int = 30
+    # False: write each event on the calling thread (tests, management commands that exit at once)
+    asynchronous: bool = True
+    store: object = None
+
+
+class AuditWriter:
+    """Bounded queue plus flusher thread writing JSON lines; see the module docstring."""
+
+    def __init__(self, options: WriterOptions):
+        self.options = options
+        self._counters_lock = threading.Lock()
+        self._counters = {"enqueued": 0, "written": 0, "dropped": 0, "batches": 0, "rotations": 0, "errors": 0,
+                          "store_errors": 0}
+        self._pending_drops = 0
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._stop = None
+        self._file = None
+        self._start_lock = threading.Lock()
+
+    # --- Producer side (request threads) ---
+
+    def write(self, timestamp, actor, payload) -> bool:
+        """Queue an event; returns False if it was dropped."""
+        if not self.options.asynchronous:
+            with self._start_lock:
+                self._write_batch([(timestamp, actor, payload)])
+            return True
+        self._ensure_started()
+        try:
+            if self.options.put_timeout > 0:
+                self._queue.put((timestamp, actor, payload), timeout=self.options.put_timeout)
+            else:
+                self._queue.put_nowait((timestamp, actor, payload))
+        except queue.Full:
+            with self._counters_lock:
+                self._counters["dropped"] += 1
+                self._pending_drops += 1
+                dropped = self._counters["dropped"]
+            if dropped == 1 or dropped % 1000 == 0:
+                logger.warning("db_audit: queue full, %s audit events dropped so far", dropped)
+            return False
+        with self._counters_lock:
+            self._counters["enqueued"] += 1
+        return True
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            counters = dict(self._counters)
+        counters["queued"] = self._queue.qsize() if self._queue is not None else 0
+        return counters
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait until every queued event has been written (or the timeout expires)."""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self) -> None:
+        """Stop the flusher thread after writing what is queued."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout=5.0)
+        self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _ensure_started(self) -> None:
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            # First use in this process (or after a fork: the parent's thread does not exist here)
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.options.queue_size)
+            self._stop = threading.Event()
+            self._file = None
+            self._thread = threading.Thread(target=self._run, name="db_audit_writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    # --- Flusher thread ---
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception:  # noqa: BLE001
+                    with self._counters_lock:
+                        self._counters["errors"] += 1
+                    logger.exception("db_audit: writing %s audit events failed; batch dropped", len(batch))
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+            elif self._stop.is_set():
+                return
+
+    def _next_batch(self) -> list:
+        """Up to batch_size events, waiting at most flush_interval for the batch to fill."""
+        batch = []
+        deadline = time.monotonic() + self.options.flush_interval
+        while len(batch) < self.options.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (self._stop.is_set() and self._queue.empty()):
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _format(self, timestamp, actor, payload) -> tuple:
+        """(entry, JSON line) of an event."""
+        entry = {
+            "timestamp": timestamp.astimezone(self.options.tz).isoformat(),
+            "actor": actor,
+            **payload,
+        }
+        line = json.dumps(entry, cls=DjangoJSONEncoder, ensure_ascii=False)
+        return entry, line
+
+    def _write_batch(self, batch) -> None:
+        entries = []
+        for timestamp, actor, payload in batch:
+            try:
+                entries.append(self._format(timestamp, actor, payload))
+            except Exception:  # noqa: BLE001
+                logger.exception("db_audit: audit entry for %s could not be serialized; dropped", payload.get("model"))
+        with self._counters_lock:
+            drops, self._pending_drops = self._pending_drops, 0
+        if drops:
+            entries.append(self._format(datetime.now(dt_timezone.utc), None, {"action": "dropped", "count": drops}))
+        if not entries:
+            return
+        data = "".join(line + "\n" for _, line in entries).encode("utf-8")
+
+        with self._locked():
+            self._open()
+            rotated = None
+            if self._should_rotate(len(data)):
+                rotated = self._rotate()
+                self._open()
+            self._file.write(data)
+            self._file.flush()
+        with self._counters_lock:
+            self._counters["written"] += len(batch)
+            self._counters["batches"] += 1
+        if rotated:
+            self._compress(rotated)
+        if self.options.store is not None:
+            try:
+                self.options.store.append(entries)
+            except Exception:  # noqa: BLE001
+                with self._counters_lock:
+                    self._counters["store_errors"] += 1
+                logger.exception("db_audit: %s audit events not added to the audit store", len(entries))
+
+    # --- File handling ---
+
+    def _locked(self):
+        return _FileLock(self.options.path.with_name(self.options.path.name + ".lock"))
+
+    def _open(self) -> None:
+        """Open the log for appending, reopening it if another process rotated it."""
+        path = self.options.path
+        if self._file is not None:
+            try:
+                if os.stat(path).st_ino == os.fstat(self._file.fileno()).st_ino:
+                    return
+            except FileNotFoundError:
+                pass
+            self._file.close()
+            self._file = None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "ab")
+
+    def _should_rotate(self, incoming: int) -> bool:
+        size = self._file.tell()
+        if size == 0:
+            return False
+        if self.options.max_bytes and size + incoming > self.options.max_bytes:
+            return True
+        # Daily: rotate on the first write of a new day
+        last_write = datetime.fromtimestamp(os.fstat(self._file.fileno()).st_mtime).date()
+        return self.options.rotate_daily and last_write != datetime.now().date()
+
+    def _rotate(self) -> Path:
+        self._file.close()
+        self._file = None
+        path = self.options.path
+        rotated = path.with_name(f"{path.name}.{datetime.now().strftime(_ROTATED_SUFFIX_FORMAT)}")
+        counter = 1
+        while rotated.exists() or rotated.with_name(rotated.name + ".gz").exists():
+            rotated = path.with_name(f"{path.name}.{datetime.now().strftime(_ROTATED_SUFFIX_FORMAT)}-{counter}")
+            counter += 1
+        os.replace(path, rotated)
+        with self._counters_lock:
+            self._counters["rotations"] += 1
+        return rotated
+
+    def _compress(self, rotated: Path) -> None:
+        try:
+            with open(rotated, "rb") as source, gzip.open(f"{rotated}.gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(rotated)
+        except OSError:
+            logger.exception("db_audit: could not compress %s", rotated)
+        self._prune_backups()
+
+    def _prune_backups(self) -> None:
+        path = self.options.path
+        backups = sorted(path.parent.glob(f"{path.name}.*.gz"))
+        for old in backups[:-self.options.backup_count] if self.options.backup_count else []:
+            try:
+                old.unlink()
+            except OSError:
+                logger.exception("db_audit: could not remove %s", old)
+
+
+class _FileLock:
+    """Exclusive advisory lock on a side file (no-op where fcntl is not available)."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._handle = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._handle = open(self.path, "a")
+            fcntl.flock(self._handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._handle is not None:
+            fcntl.flock(self._handle, fcntl.LOCK_UN)
+            self._handle.close()
+            self._handle = None
+        return False
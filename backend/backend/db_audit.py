@@ -1,14 +1,32 @@
-import json
+"""
+Audit log of model changes in the audited apps (JSON lines in logs/db_audit.log).
+
+Update diffs need no extra query: every audited instance keeps a compact snapshot of the
+column values it was loaded with (post_init), refreshed after each save, and pre_save
+compares against it. The stored row is read only when there is no usable snapshot (the
+instance was not loaded from the database, its pk changed, or a saved column was deferred).
+Only the columns in update_fields are serialized and compared.
+refresh_from_db() re-takes the snapshot of the reloaded columns (backend.audit_models.
+AuditSnapshotMixin, on every audited model), so an instance changed with queryset.update()
+and then refreshed is diffed against the stored values. An instance that is not refreshed
+after such a write is still diffed against the values it was loaded with.
+
+Events are handed to backend.audit_writer (bounded queue, batched writes on a background
+thread, rotation with gzip), which also inserts them into the indexed backend.audit_store;
+the DB_AUDIT_* settings are read once, at startup.
+"""
+import copy
 import logging
 from pathlib import Path
 from threading import local
 from zoneinfo import ZoneInfo
 
 from django.conf import settings
-from django.core.serializers.json import DjangoJSONEncoder
-from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_save
 from django.utils import timezone
 
+from backend.audit_store import AuditStore
+from backend.audit_writer import AuditWriter, WriterOptions
 from backend.middleware.db_audit_request import get_audit_actor_context
 
 
@@ -43,23 +61,81 @@ _AUDITED_APP_LABELS: frozenset[str] = frozenset({
 })
 
 
-def _get_audit_logger() -> logging.Logger:
-    logger = logging.getLogger("db_audit")
-    if getattr(logger, "_db_audit_configured", False):
-        return logger
+class _AuditConfig:
+    """DB_AUDIT_* settings, resolved once (see _get_config)."""
 
-    audit_file = getattr(settings, "DB_AUDIT_LOG_FILE", None)
-    log_path = Path(audit_file) if audit_file else Path(settings.BASE_DIR) / "logs" / "db_audit.log"
-    log_path.parent.mkdir(parents=True, exist_ok=True)
+    def __init__(self):
+        self.redact_fields = frozenset(getattr(settings, "DB_AUDIT_REDACT_FIELDS", _DEFAULT_REDACT_FIELDS))
+        self.allowlist_by_model = {
+            label: frozenset(fields)
+            for label, fields in getattr(settings, "DB_AUDIT_ALLOWLIST_BY_MODEL", _DEFAULT_ALLOWLIST_BY_MODEL).items()
+        }
+        self.skip_models = frozenset(getattr(settings, "DB_AUDIT_SKIP_MODELS", _DEFAULT_SKIP_MODELS))
+
+        timezone_name = getattr(settings, "DB_AUDIT_TIMEZONE", "Europe/Rome")
+        try:
+            tz = ZoneInfo(timezone_name)
+        except Exception as e:
+            logging.warning("Invalid DB_AUDIT_TIMEZONE '%s': %s. Falling back to UTC.", timezone_name, e)
+            tz = timezone.utc
+
+        # Indexed copy of the log (backend.audit_store); DB_AUDIT_STORE_FILE = None disables it
+        store_file = getattr(settings, "DB_AUDIT_STORE_FILE", Path(settings.BASE_DIR) / "logs" / "db_audit.sqlite3")
+        self.store = AuditStore(store_file, tz) if store_file else None
+
+        audit_file = getattr(settings, "DB_AUDIT_LOG_FILE", None)
+        self.writer = AuditWriter(WriterOptions(
+            path=Path(audit_file) if audit_file else Path(settings.BASE_DIR) / "logs" / "db_audit.log",
+            tz=tz,
+            queue_size=getattr(settings, "DB_AUDIT_QUEUE_SIZE", 10000),
+            batch_size=getattr(settings, "DB_AUDIT_BATCH_SIZE", 500),
+            flush_interval=getattr(settings, "DB_AUDIT_FLUSH_INTERVAL", 1.0),
+            put_timeout=getattr(settings, "DB_AUDIT_QUEUE_TIMEOUT", 0.0),
+            max_bytes=getattr(settings, "DB_AUDIT_MAX_BYTES", 50 * 1024 * 1024),
+            rotate_daily=getattr(settings, "DB_AUDIT_ROTATE_DAILY", True),
+            backup_count=getattr(settings, "DB_AUDIT_BACKUP_COUNT", 30),
+            asynchronous=getattr(settings, "DB_AUDIT_ASYNC", True),
+            store=self.store,
+        ))
+
+
+_config: _AuditConfig | None = None
+
+
+def _get_config() -> _AuditConfig:
+    global _config
+    if _config is None:
+        _config = _AuditConfig()
+    return _config
+
+
+def get_audit_store():
+    """The indexed audit store (backend.audit_store.AuditStore), or None when disabled."""
+    return _get_config().store
 
-    handler = logging.FileHandler(log_path, encoding="utf-8")
-    handler.setFormatter(logging.Formatter("%(message)s"))
 
-    logger.setLevel(logging.INFO)
-    logger.propagate = False
-    logger.addHandler(handler)
-    logger._db_audit_configured = True
-    return logger
+def audit_writer_stats() -> dict:
+    """Counters of the audit writer of this process (enqueued, written, dropped, queued...)."""
+    return _get_config().writer.stats()
+
+
+class _NotLoaded:
+    """Snapshot value of a column that was deferred when the instance was loaded."""
+
+    def __reduce__(self):
+        return "_NOT_LOADED"
+
+    def __repr__(self):
+        return "<not loaded>"
+
+
+_NOT_LOADED = _NotLoaded()
+
+# Instance attribute holding the loaded-state snapshot: a tuple aligned with _concrete_fields(model)
+_SNAPSHOT_ATTR = "_db_audit_loaded"
+
+_audited_models: dict = {}
+_fields_by_model: dict = {}
 
 
 def _get_cache() -> dict:
@@ -80,93 +156,186 @@ def _should_skip_model(sender) -> bool:
     if getattr(sender, "__audit_skip__", False):
         return True
     # Settings-level skip list (list/set of "app_label.ModelName" strings)
-    skip_models: set[str] = set(getattr(settings, "DB_AUDIT_SKIP_MODELS", _DEFAULT_SKIP_MODELS))
-    return sender._meta.label in skip_models
+    return sender._meta.label in _get_config().skip_models
+
+
+def _is_audited(sender) -> bool:
+    """Audited app and not skipped; decided once per model (post_init runs for every loaded row)."""
+    audited = _audited_models.get(sender)
+    if audited is None:
+        audited = sender._meta.app_label in _AUDITED_APP_LABELS and not _should_skip_model(sender)
+        _audited_models[sender] = audited
+    return audited
+
+
+def _concrete_fields(sender) -> tuple:
+    fields = _fields_by_model.get(sender)
+    if fields is None:
+        fields = tuple(sender._meta.concrete_fields)
+        _fields_by_model[sender] = fields
+    return fields
+
+
+def _fields_for_save(sender, update_fields) -> tuple:
+    """The concrete fields written by a save (all of them, or those in update_fields)."""
+    fields = _concrete_fields(sender)
+    if update_fields is None:
+        return fields
+    names = set(update_fields)
+    return tuple(f for f in fields if f.name in names or f.attname in names)
+
+
+def _loaded_value(value):
+    # JSON values (dict/list) are copied: in-place edits must not change the snapshot
+    return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
 
 
-def _serialize_instance(instance) -> dict:
-    """Serialize concrete fields, applying redaction rules from settings."""
+def _take_snapshot(instance, fields=None) -> None:
+    """Store the current column values of the instance (only the given fields if any)."""
     sender = type(instance)
-    model_label = sender._meta.label
+    all_fields = _concrete_fields(sender)
+    current = instance.__dict__
+    snapshot = getattr(instance, _SNAPSHOT_ATTR, None)
+    if fields is None or snapshot is None:
+        snapshot = tuple(_loaded_value(current.get(f.attname, _NOT_LOADED)) for f in all_fields)
+    else:
+        saved = {f.attname for f in fields}
+        snapshot = tuple(
+            _loaded_value(current.get(f.attname, _NOT_LOADED)) if f.attname in saved else old
+            for f, old in zip(all_fields, snapshot)
+        )
+    instance.__dict__[_SNAPSHOT_ATTR] = snapshot
+
+
+def refresh_snapshot(instance, fields=None) -> None:
+    """Re-take the snapshot of the given fields (names or attnames, all if None) after they were reloaded."""
+    sender = type(instance)
+    if _is_audited(sender):
+        _take_snapshot(instance, _fields_for_save(sender, fields))
+
+
+def _snapshot_values(instance, fields) -> dict | None:
+    """{attname: loaded value} for the given fields, or None if the snapshot cannot be used."""
+    snapshot = instance.__dict__.get(_SNAPSHOT_ATTR)
+    if snapshot is None:
+        return None
+    all_fields = _concrete_fields(type(instance))
+    loaded = {f.attname: value for f, value in zip(all_fields, snapshot)}
+    if loaded.get(instance._meta.pk.attname) != instance.pk:
+        return None
+    values = {f.attname: loaded[f.attname] for f in fields}
+    if any(value is _NOT_LOADED for value in values.values()):
+        return None
+    return values
 
-    # Fields whose values are always replaced with a placeholder
-    redact_fields: set[str] = set(getattr(settings, "DB_AUDIT_REDACT_FIELDS", _DEFAULT_REDACT_FIELDS))
 
+def _serialize_values(sender, values: dict, fields) -> dict:
+    """Serialize {attname: value} of the given fields, applying redaction rules from settings."""
+    config = _get_config()
     # Per-model allowlist: if present, only listed fields are kept; all others are redacted
-    allowlist_by_model: dict[str, list[str]] = getattr(settings, "DB_AUDIT_ALLOWLIST_BY_MODEL", _DEFAULT_ALLOWLIST_BY_MODEL)
-    allowed_fields: set[str] | None = (
-        set(allowlist_by_model[model_label]) if model_label in allowlist_by_model else None
-    )
+    allowed_fields = config.allowlist_by_model.get(sender._meta.label)
 
-    values = {}
-    for field in instance._meta.concrete_fields:
+    serialized = {}
+    for field in fields:
         name = field.name
-        if name in redact_fields or (allowed_fields is not None and name not in allowed_fields):
-            values[name] = _REDACTED
+        if name in config.redact_fields or (allowed_fields is not None and name not in allowed_fields):
+            serialized[name] = _REDACTED
         else:
-            values[name] = getattr(instance, field.attname)
-    return values
+            # Copied like the snapshot: the event is serialized later, on the writer thread
+            serialized[name] = _loaded_value(values.get(field.attname))
+    return serialized
+
+
+def _serialize_instance(instance, fields=None) -> dict:
+    """Serialize concrete fields (or only the given ones), applying redaction rules from settings."""
+    sender = type(instance)
+    fields = _concrete_fields(sender) if fields is None else fields
+    return _serialize_values(sender, {f.attname: getattr(instance, f.attname) for f in fields}, fields)
 
 
 def _write_event(payload: dict) -> None:
+    # JSON encoding and the file write happen on the writer thread
     try:
-        timezone_name = getattr(settings, "DB_AUDIT_TIMEZONE", "Europe/Rome")
-        try:
-            tz = ZoneInfo(timezone_name)
-        except Exception as e:
-            logging.warning("Invalid DB_AUDIT_TIMEZONE '%s': %s. Falling back to UTC.", timezone_name, e)
-            tz = timezone.utc
-        event_time = timezone.now().astimezone(tz).isoformat()
+        _get_config().writer.write(timezone.now(), dict(get_audit_actor_context()), payload)
+    except Exception:  # noqa: BLE001
+        logging.exception("db_audit: _write_event failed; audit entry dropped")
+
 
-        entry = {
-            "timestamp": event_time,
-            "actor": get_audit_actor_context(),
-            **payload,
+def record_update(model, pk, changes: dict, instance=None) -> None:
+    """
+    Write the "update" event of a row changed without save() (queryset.update() sends no
+    signals). changes: {field name: (old value, new value)}. The snapshot of the in-memory
+    instance, if given, takes the new values so a later save() does not log them again.
+    """
+    if not _is_audited(model):
+        return
+    fields = tuple(model._meta.get_field(name) for name in changes)
+    old = _serialize_values(model, {f.attname: changes[f.name][0] for f in fields}, fields)
+    new = _serialize_values(model, {f.attname: changes[f.name][1] for f in fields}, fields)
+    if instance is not None and instance.__dict__.get(_SNAPSHOT_ATTR) is not None:
+        _take_snapshot(instance, fields)
+    diff = {name: {"old": old[name], "new": new[name]} for name in old if old[name] != new[name]}
+    if not diff:
+        return
+    _write_event(
+        {
+            "action": "update",
+            "model": model._meta.label,
+            "pk": pk,
+            "changes": diff,
         }
-        _get_audit_logger().info(json.dumps(entry, cls=DjangoJSONEncoder, ensure_ascii=False))
-    except Exception:  # noqa: BLE001
-        try:
-            _get_audit_logger().exception("db_audit: _write_event failed; audit entry dropped")
-        except Exception:  # noqa: BLE001
-            logging.exception("db_audit: _write_event failed; audit entry dropped")
+    )
+
+
+def _on_post_init(sender, instance, **kwargs):
+    if _is_audited(sender):
+        _take_snapshot(instance)
 
 
 def _on_pre_save(sender, instance, **kwargs):
-    if sender._meta.app_label not in _AUDITED_APP_LABELS or _should_skip_model(sender):
+    if not _is_audited(sender):
         return
     if kwargs.get("raw") or instance.pk is None or instance._state.adding:
         return
 
-    previous = sender._default_manager.filter(pk=instance.pk).first()
+    fields = _fields_for_save(sender, kwargs.get("update_fields"))
+    previous = _snapshot_values(instance, fields)
     if previous is None:
-        return
+        # No usable loaded state: read the stored row (only the columns being saved)
+        previous = sender._default_manager.filter(pk=instance.pk).values(*(f.attname for f in fields)).first()
+        if previous is None:
+            return
 
-    _get_cache()[_cache_key(instance)] = _serialize_instance(previous)
+    _get_cache()[_cache_key(instance)] = _serialize_values(sender, previous, fields)
 
 
 def _on_post_save(sender, instance, created, **kwargs):
-    if sender._meta.app_label not in _AUDITED_APP_LABELS or _should_skip_model(sender):
+    if not _is_audited(sender):
         return
     if kwargs.get("raw"):
         return
 
-    current_values = _serialize_instance(instance)
-
     if created:
+        _take_snapshot(instance)
         _write_event(
             {
                 "action": "create",
                 "model": instance._meta.label,
                 "pk": instance.pk,
-                "values": current_values,
+                "values": _serialize_instance(instance),
             }
         )
         return
 
+    fields = _fields_for_save(sender, kwargs.get("update_fields"))
+    # The saved columns now match the database
+    _take_snapshot(instance, fields)
+
     previous_values = _get_cache().pop(_cache_key(instance), None)
     if previous_values is None:
         return
 
+    current_values = _serialize_instance(instance, fields)
     changes = {}
     for field_name, new_value in current_values.items():
         old_value = previous_values.get(field_name)
@@ -190,7 +359,7 @@ def _on_post_save(sender, instance, created, **kwargs):
 
 
 def _on_post_delete(sender, instance, **kwargs):
-    if sender._meta.app_label not in _AUDITED_APP_LABELS or _should_skip_model(sender):
+    if not _is_audited(sender):
         return
     _write_event(
         {
@@ -203,7 +372,7 @@ def _on_post_delete(sender, instance, **kwargs):
 
 
 def _on_m2m_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
-    if instance._meta.app_label not in _AUDITED_APP_LABELS or _should_skip_model(type(instance)):
+    if not _is_audited(type(instance)):
         return
     if action not in {"post_add", "post_remove", "post_clear"}:
         return
@@ -227,6 +396,10 @@ def setup_db_audit() -> None:
     if _signals_connected:
         return
 
+    # Settings are read once, at startup
+    _get_config()
+
+    post_init.connect(_on_post_init, dispatch_uid="db_audit_post_init", weak=False)
     pre_save.connect(_on_pre_save, dispatch_uid="db_audit_pre_save", weak=False)
     post_save.connect(_on_post_save, dispatch_uid="db_audit_post_save", weak=False)
     post_delete.connect(_on_post_delete, dispatch_uid="db_audit_post_delete", weak=False)
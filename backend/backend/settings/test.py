@@ -1,5 +1,6 @@
 """Settings for CI/CD test environment - Standalone configuration"""
 import os
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -135,9 +136,18 @@ SUMUP_PAY_TO_EMAIL = 'dummy@test.com'
 SUMUP_MERCHANT_CODE = 'dummy'
 
 SCHEME_HOST = 'http://localhost:3000'
+
+# Run event form side effects (checkout, email, uploads) inline so API tests can assert on them
+EVENT_FORM_JOBS_ASYNC = False
+LIBERATORIE_JOBS_ASYNC = False
 SESSION_COOKIE_SECURE = False
 CSRF_COOKIE_SECURE = False
 
+# DB audit: write the log in a temporary directory (not backend/logs/), synchronously, without the indexed store
+DB_AUDIT_LOG_FILE = os.path.join(tempfile.mkdtemp(prefix='db_audit_test_'), 'db_audit.log')
+DB_AUDIT_STORE_FILE = None
+DB_AUDIT_ASYNC = False
+
 # Speed up password hashing in tests
 PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.MD5PasswordHasher',
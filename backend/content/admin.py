@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ContentSection, ContentLink, WhatsAppConfig
+from .models import ContentSection, ContentLink, WhatsAppConfig, WhatsAppRegistration
 
 
 class ContentLinkInline(admin.TabularInline):
@@ -47,3 +47,14 @@ class WhatsAppConfigAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         obj.updated_by = request.user
         super().save_model(request, obj, form, change)
+
+
+@admin.register(WhatsAppRegistration)
+class WhatsAppRegistrationAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'email', 'first_name', 'last_name', 'outcome', 'uploaded_at')
+    list_filter = ('outcome', 'is_international', 'created_at')
+    search_fields = ('email', 'first_name', 'last_name')
+    readonly_fields = [f.name for f in WhatsAppRegistration._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
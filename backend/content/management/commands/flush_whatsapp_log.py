@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from content.models import WhatsAppRegistration
+from content.whatsapp_log import flush_registrations
+
+
+class Command(BaseCommand):
+    help = 'Append the pending WhatsApp registrations to the CSV log on Google Drive (one upload per batch)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Registrations uploaded per Drive update (default: 5000).',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(options.get('batch_size') or 5000, 1)
+        started = time.monotonic()
+        uploaded = 0
+        while True:
+            try:
+                count = flush_registrations(batch_size=batch_size)
+            except Exception as exc:
+                pending = WhatsAppRegistration.objects.filter(uploaded_at__isnull=True).count()
+                raise CommandError(f'Drive upload failed ({pending} registrations still pending): {exc}')
+            uploaded += count
+            if count < batch_size:
+                break
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Uploaded {uploaded} WhatsApp registrations in {time.monotonic() - started:.1f}s.'
+        ))
@@ -1,10 +1,11 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from backend.audit_models import AuditSnapshotMixin
 
 User = get_user_model()
 
 
-class ContentSection(models.Model):
+class ContentSection(AuditSnapshotMixin, models.Model):
     """
     Represents a section of content on the home page.
     Only two categories: LINK UTILI and WIKI E TUTORIAL
@@ -40,7 +41,7 @@ class ContentSection(models.Model):
         return self.get_title_display()
 
 
-class ContentLink(models.Model):
+class ContentLink(AuditSnapshotMixin, models.Model):
     """
     Represents a link within a content section.
     Required fields: name, url, color. Description is optional.
@@ -74,7 +75,7 @@ class ContentLink(models.Model):
         return f"{self.section.get_title_display()} - {self.name}"
 
 
-class WhatsAppConfig(models.Model):
+class WhatsAppConfig(AuditSnapshotMixin, models.Model):
     """
     Singleton model that stores the WhatsApp group link.
     Editable from the ContentManager page.
@@ -107,3 +108,28 @@ class WhatsAppConfig(models.Model):
         """Returns the singleton instance, creating it if it doesn't exist."""
         obj, _ = cls.objects.get_or_create(pk=1)
         return obj
+
+
+class WhatsAppRegistration(AuditSnapshotMixin, models.Model):
+    """
+    One request from the public WhatsApp registration form (content/whatsapp_log.py).
+    Rows are written locally by the endpoint and appended to the CSV log on Google Drive
+    in batches by `python manage.py flush_whatsapp_log` (uploaded_at set once uploaded).
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    email = models.EmailField()
+    first_name = models.CharField(max_length=100)
+    last_name = models.CharField(max_length=100)
+    is_international = models.BooleanField()
+    home_university = models.CharField(max_length=300)
+    course_of_study = models.CharField(max_length=300)
+    outcome = models.CharField(max_length=100, verbose_name="Esito")
+    uploaded_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = "WhatsApp Registration"
+        verbose_name_plural = "WhatsApp Registrations"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.email} - {self.outcome}"
@@ -1,12 +1,13 @@
 """Tests for content module endpoints and behaviors."""
 
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from rest_framework.test import APITestCase
 
-from content.models import ContentSection, ContentLink, WhatsAppConfig
+from content.models import ContentSection, ContentLink, WhatsAppConfig, WhatsAppRegistration
+from content.whatsapp_log import flush_registrations, record_registration
 from profiles.models import Profile
 
 
@@ -723,3 +724,70 @@ class WhatsAppEndpointsTests(ContentBaseTestCase):
 		mock_send_mail.assert_not_called()
 		mock_append_log.assert_called_once_with(self.registration_payload, "Errore: link WhatsApp non configurato")
 
+
+
+class WhatsAppRegistrationLogTests(ContentBaseTestCase):
+	"""Tests for the local WhatsApp registration log and its batched Drive flush."""
+
+	payload = {
+		"email": "mario.rossi@mail.polimi.it",
+		"first_name": "Mario",
+		"last_name": "Rossi",
+		"is_international": False,
+		"home_university": "TU Wien",
+		"course_of_study": "Computer Science",
+	}
+
+	def _drive(self, existing_csv=None):
+		drive = MagicMock()
+		files = drive.files.return_value
+		files.list.return_value.execute.return_value = {"files": [{"id": "csv-id"}] if existing_csv is not None else []}
+		files.get_media.return_value.execute.return_value = (existing_csv or "").encode("utf-8-sig")
+		return drive
+
+	@staticmethod
+	def _uploaded_text(call):
+		return call.kwargs["media_body"].getbytes(0, 10 ** 6).decode("utf-8-sig")
+
+	@patch("content.whatsapp_log.get_drive_service")
+	def test_register_only_records_locally(self, mock_drive):
+		"""The public endpoint stores the registration without calling Drive."""
+		response = self.client.post("/backend/content/whatsapp-register/", self.payload, format="json")
+
+		self.assertEqual(response.status_code, 403)
+		registration = WhatsAppRegistration.objects.get()
+		self.assertEqual(registration.outcome, "Non ammesso (non internazionale/Erasmus)")
+		self.assertIsNone(registration.uploaded_at)
+		mock_drive.assert_not_called()
+
+	def test_flush_appends_pending_rows_with_one_update(self):
+		"""Pending rows are appended to the existing CSV in a single update and marked uploaded."""
+		for outcome in ("Email inviata", "Errore invio email"):
+			record_registration(self.payload, outcome)
+		drive = self._drive("Timestamp,Email\nold,row\n")
+
+		uploaded = flush_registrations(drive=drive)
+
+		self.assertEqual(uploaded, 2)
+		update = drive.files.return_value.update
+		update.assert_called_once()
+		lines = self._uploaded_text(update.call_args).splitlines()
+		self.assertEqual(lines[:2], ["Timestamp,Email", "old,row"])
+		self.assertTrue(lines[2].endswith("Email inviata") and lines[3].endswith("Errore invio email"))
+		self.assertFalse(WhatsAppRegistration.objects.filter(uploaded_at__isnull=True).exists())
+		self.assertEqual(flush_registrations(drive=drive), 0)
+
+	def test_flush_creates_csv_and_keeps_rows_pending_on_failure(self):
+		"""A missing CSV is created with headers; a Drive error leaves the rows pending."""
+		record_registration(self.payload, "Email inviata")
+		failing = self._drive()
+		failing.files.return_value.create.return_value.execute.side_effect = RuntimeError("drive down")
+
+		with self.assertRaises(RuntimeError):
+			flush_registrations(drive=failing)
+		self.assertTrue(WhatsAppRegistration.objects.filter(uploaded_at__isnull=True).exists())
+
+		drive = self._drive()
+		self.assertEqual(flush_registrations(drive=drive), 1)
+		text = self._uploaded_text(drive.files.return_value.create.call_args)
+		self.assertTrue(text.startswith("Timestamp,Email,Nome"))
@@ -1,13 +1,7 @@
-import csv
-import io
 import logging
-import threading
-from datetime import datetime
 
 import sentry_sdk
-from django.conf import settings
 from django.core.mail import send_mail
-from googleapiclient.http import MediaIoBaseUpload
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
@@ -17,19 +11,10 @@ from .serializers import (
     ContentSectionSerializer, ContentLinkSerializer,
     WhatsAppConfigSerializer, WhatsAppRegistrationSerializer,
 )
-from utils.google_drive import get_drive_service
+from .whatsapp_log import record_registration
 
 logger = logging.getLogger(__name__)
 
-_CSV_FILENAME = 'cronologia richieste gruppo whatsapp.csv'
-_CSV_HEADERS = [
-    'Timestamp', 'Email', 'Nome', 'Cognome',
-    'Studente Internazionale/Erasmus', 'Università di Provenienza',
-    'Corso di Studi (Polimi)', 'Esito',
-]
-
-_drive_log_lock = threading.Lock()
-
 
 def _can_manage_content(user):
     """Centralize content management authorization across endpoints."""
@@ -41,79 +26,16 @@ def _can_manage_content(user):
 
 def _append_to_whatsapp_log(data, outcome):
     """
-    Append one registration row to a CSV file on Google Drive.
-    Uses only the Drive API (no Sheets API needed).
+    Record one registration row locally; `flush_whatsapp_log` appends the pending rows to
+    the CSV file on Google Drive in batches (content/whatsapp_log.py).
     Returns None on success, or an error string on failure.
     """
     try:
-        folder_id = settings.GOOGLE_DRIVE_FOLDER_ID
-        drive = get_drive_service()
-
-        with _drive_log_lock:
-            # Search for existing CSV file in the Drive folder
-            escaped_name = _CSV_FILENAME.replace("'", "\\'")
-            query = (
-                f"name='{escaped_name}' and '{folder_id}' in parents and trashed=false"
-            )
-            results = drive.files().list(
-                q=query, spaces='drive', fields='files(id)',
-                supportsAllDrives=True, includeItemsFromAllDrives=True,
-            ).execute()
-            files = results.get('files', [])
-
-            new_row = [
-                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                data['email'],
-                data['first_name'],
-                data['last_name'],
-                'Sì' if data['is_international'] else 'No',
-                data['home_university'],
-                data['course_of_study'],
-                outcome,
-            ]
-
-            if files:
-                # Download existing CSV, append the new row, re-upload
-                file_id = files[0]['id']
-                existing_bytes = drive.files().get_media(fileId=file_id).execute()
-                existing_text = existing_bytes.decode('utf-8-sig')
-
-                output = io.StringIO()
-                output.write(existing_text)
-                if existing_text and not existing_text.endswith('\n'):
-                    output.write('\n')
-                csv.writer(output).writerow(new_row)
-
-                content_bytes = output.getvalue().encode('utf-8-sig')
-                drive.files().update(
-                    fileId=file_id,
-                    media_body=MediaIoBaseUpload(
-                        io.BytesIO(content_bytes), mimetype='text/csv',
-                    ),
-                    supportsAllDrives=True,
-                ).execute()
-            else:
-                # Create a new CSV file with header + first row
-                output = io.StringIO()
-                writer = csv.writer(output)
-                writer.writerow(_CSV_HEADERS)
-                writer.writerow(new_row)
-
-                content_bytes = output.getvalue().encode('utf-8-sig')
-                drive.files().create(
-                    body={'name': _CSV_FILENAME, 'parents': [folder_id]},
-                    media_body=MediaIoBaseUpload(
-                        io.BytesIO(content_bytes), mimetype='text/csv',
-                    ),
-                    fields='id',
-                    supportsAllDrives=True,
-                ).execute()
-
-        logger.info(f"WhatsApp CSV log appended for {data['email']} — {outcome}")
+        record_registration(data, outcome)
         return None
     except Exception as e:
-        logger.exception(f"Drive CSV logging failed: {e}")
-        return "Drive logging failed"
+        logger.exception(f"WhatsApp registration logging failed: {e}")
+        return "Registration logging failed"
 
 
 class IsContentManagerOrReadOnly(permissions.BasePermission):
@@ -0,0 +1,109 @@
+"""
+Registration log of the public WhatsApp form.
+
+whatsapp_register only inserts a WhatsAppRegistration row (one local INSERT, no network).
+flush_registrations() uploads the pending rows to the CSV log on Google Drive in one go:
+one folder lookup, one download of the CSV and one update with all new rows appended,
+then marks the rows as uploaded. The pending rows are locked for the duration of the flush,
+so concurrent flushes (several workers/cron runs) never upload a row twice; if Drive fails
+the rows stay pending and are retried by the next flush.
+"""
+import csv
+import io
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from googleapiclient.http import MediaIoBaseUpload
+
+from content.models import WhatsAppRegistration
+from utils.google_drive import get_drive_service
+
+logger = logging.getLogger(__name__)
+
+CSV_FILENAME = 'cronologia richieste gruppo whatsapp.csv'
+CSV_HEADERS = [
+    'Timestamp', 'Email', 'Nome', 'Cognome',
+    'Studente Internazionale/Erasmus', 'Università di Provenienza',
+    'Corso di Studi (Polimi)', 'Esito',
+]
+
+
+def record_registration(data, outcome):
+    """Store one registration request (validated form data) with its outcome."""
+    return WhatsAppRegistration.objects.create(
+        email=data['email'],
+        first_name=data['first_name'],
+        last_name=data['last_name'],
+        is_international=data['is_international'],
+        home_university=data['home_university'],
+        course_of_study=data['course_of_study'],
+        outcome=outcome,
+    )
+
+
+def csv_row(registration):
+    return [
+        timezone.localtime(registration.created_at).strftime('%Y-%m-%d %H:%M:%S'),
+        registration.email,
+        registration.first_name,
+        registration.last_name,
+        'Sì' if registration.is_international else 'No',
+        registration.home_university,
+        registration.course_of_study,
+        registration.outcome,
+    ]
+
+
+def _find_log_file(drive, folder_id):
+    escaped_name = CSV_FILENAME.replace("'", "\\'")
+    results = drive.files().list(
+        q=f"name='{escaped_name}' and '{folder_id}' in parents and trashed=false",
+        spaces='drive', fields='files(id)',
+        supportsAllDrives=True, includeItemsFromAllDrives=True,
+    ).execute()
+    files = results.get('files', [])
+    return files[0]['id'] if files else None
+
+
+def _upload_rows(drive, rows):
+    """Append rows to the Drive CSV (created with headers if missing) with a single upload."""
+    folder_id = settings.GOOGLE_DRIVE_FOLDER_ID
+    file_id = _find_log_file(drive, folder_id)
+
+    output = io.StringIO()
+    if file_id:
+        existing_text = drive.files().get_media(fileId=file_id).execute().decode('utf-8-sig')
+        output.write(existing_text)
+        if existing_text and not existing_text.endswith('\n'):
+            output.write('\n')
+    else:
+        csv.writer(output).writerow(CSV_HEADERS)
+    csv.writer(output).writerows(rows)
+
+    media_body = MediaIoBaseUpload(io.BytesIO(output.getvalue().encode('utf-8-sig')), mimetype='text/csv')
+    if file_id:
+        drive.files().update(fileId=file_id, media_body=media_body, supportsAllDrives=True).execute()
+    else:
+        drive.files().create(
+            body={'name': CSV_FILENAME, 'parents': [folder_id]},
+            media_body=media_body,
+            fields='id',
+            supportsAllDrives=True,
+        ).execute()
+
+
+def flush_registrations(batch_size=5000, drive=None):
+    """Upload up to batch_size pending registrations to Drive; returns how many were uploaded."""
+    with transaction.atomic():
+        pending = list(
+            WhatsAppRegistration.objects.select_for_update()
+            .filter(uploaded_at__isnull=True).order_by('created_at', 'id')[:batch_size]
+        )
+        if not pending:
+            return 0
+        _upload_rows(drive or get_drive_service(), [csv_row(registration) for registration in pending])
+        WhatsAppRegistration.objects.filter(pk__in=[r.pk for r in pending]).update(uploaded_at=timezone.now())
+    logger.info(f"WhatsApp CSV log: {len(pending)} registrations uploaded")
+    return len(pending)
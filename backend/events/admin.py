@@ -1,5 +1,7 @@
 from django.contrib import admin
-from events.models import Event, EventList, EventOrganizer, Subscription
+from django.utils import timezone
+
+from events.models import Event, EventList, EventOrganizer, Subscription, EventJob
 
 
 class EventListInline(admin.TabularInline):
@@ -51,13 +53,13 @@ class EventListAdmin(admin.ModelAdmin):
     get_events.short_description = 'Events'
 
     def subscription_count(self, obj):
-        return obj.subscriptions.count()
+        return obj.subscription_count
 
     subscription_count.short_description = 'Subscriptions'
 
     def get_queryset(self, request):
-        # Prefetch subscriptions and events for efficiency
-        return super().get_queryset(request).prefetch_related('subscriptions', 'events')
+        # Prefetch events for efficiency (subscriptions are counted by EventList.subscription_counter)
+        return super().get_queryset(request).prefetch_related('events')
 
 
 '''
@@ -94,4 +96,25 @@ class SubscriptionAdmin(admin.ModelAdmin):
         except Subscription.list.RelatedObjectDoesNotExist:
             return "-"
 
-    get_list.short_description = 'List'
\ No newline at end of file
+    get_list.short_description = 'List'
+
+@admin.register(EventJob)
+class EventJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'kind', 'status', 'subscription_id', 'attempts', 'run_after', 'locked_until', 'updated_at'
+    )
+    list_filter = ('status', 'kind')
+    search_fields = ('idempotency_key', 'last_error')
+    date_hierarchy = 'created_at'
+    readonly_fields = (
+        'kind', 'idempotency_key', 'subscription', 'payload', 'attempts', 'locked_until',
+        'last_error', 'created_at', 'updated_at'
+    )
+    actions = ['requeue_jobs']
+
+    @admin.action(description='Requeue selected jobs')
+    def requeue_jobs(self, request, queryset):
+        updated = queryset.exclude(status=EventJob.Status.RUNNING).update(
+            status=EventJob.Status.QUEUED, attempts=0, run_after=timezone.now(), locked_until=None
+        )
+        self.message_user(request, f"{updated} jobs requeued.")
@@ -0,0 +1,188 @@
+"""
+In-process fake of the SumUp endpoints used by events.sumup.SumUpClient.
+
+Used by the tests and for offline load tests of the client:
+
+    with FakeSumUpServer() as server, override_settings(SUMUP_API_BASE_URL=server.url):
+        ...
+
+or standalone with `python manage.py run_fake_sumup --port 8765` and
+SUMUP_API_BASE_URL = "http://127.0.0.1:8765".
+"""
+import json
+import re
+import threading
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_CHECKOUT_PATH = re.compile(r'^/v0\.1/checkouts/(?P<checkout_id>[^/]+)$')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.fake.record_connection()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None):
+        data = json.dumps(body if body is not None else {}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _dispatch(self, method):
+        fake = self.server.fake
+        body = self._body()
+        status, payload = fake.handle(method, self.path, self.headers.get('Authorization', ''), body)
+        self._send(status, payload)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+
+class FakeSumUpServer:
+    """
+    Minimal SumUp: /token, POST /v0.1/checkouts, GET/PUT /v0.1/checkouts/<id>.
+    Counters (token_requests, connections, requests) let tests check pooling and token sharing;
+    fail_next() injects error responses.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, token_lifetime=3600):
+        self.token_lifetime = token_lifetime
+        self.checkouts = {}
+        self.valid_tokens = set()
+        self.token_requests = 0
+        self.connections = 0
+        self.requests = Counter()
+        self._failures = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        # Short poll interval so stop() returns quickly
+        self._thread = threading.Thread(target=self._httpd.serve_forever, kwargs={'poll_interval': 0.05},
+                                        name='fake_sumup', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- Test controls ---
+
+    def fail_next(self, status, count=1, path_prefix='', method=None, after_processing=False):
+        """
+        Answer the next `count` requests whose path starts with path_prefix (and matching `method`,
+        if given) with `status`. With after_processing the request is handled first, as when a
+        response is lost after the charge.
+        """
+        with self._lock:
+            self._failures.extend([(path_prefix, method, status, after_processing)] * count)
+
+    def revoke_tokens(self):
+        with self._lock:
+            self.valid_tokens.clear()
+
+    def set_checkout_status(self, checkout_id, status, transactions=None):
+        with self._lock:
+            self.checkouts[checkout_id]['status'] = status
+            self.checkouts[checkout_id]['transactions'] = transactions or []
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    # --- Request handling ---
+
+    def _take_failure(self, method, path):
+        for index, (prefix, failure_method, status, after_processing) in enumerate(self._failures):
+            if path.startswith(prefix) and failure_method in (None, method):
+                del self._failures[index]
+                return status, after_processing
+        return None, False
+
+    def handle(self, method, path, authorization, body):
+        with self._lock:
+            self.requests[(method, path)] += 1
+            failure, after_processing = self._take_failure(method, path)
+            if failure and not after_processing:
+                return failure, {'error_code': 'INJECTED_FAILURE'}
+            status, payload = self._handle(method, path, authorization, body)
+            if failure:
+                return failure, {'error_code': 'INJECTED_FAILURE'}
+            return status, payload
+
+    def _handle(self, method, path, authorization, body):
+        # Called with self._lock held
+        if method == 'POST' and path == '/token':
+            self.token_requests += 1
+            token = f"tok_{uuid.uuid4().hex}"
+            self.valid_tokens.add(token)
+            return 200, {'access_token': token, 'token_type': 'Bearer', 'expires_in': self.token_lifetime}
+
+        if authorization.removeprefix('Bearer ') not in self.valid_tokens:
+            return 401, {'error_code': 'INVALID_TOKEN'}
+
+        if method == 'POST' and path == '/v0.1/checkouts':
+            payload = json.loads(body or b'{}')
+            reference = payload.get('checkout_reference')
+            if any(c.get('checkout_reference') == reference for c in self.checkouts.values()):
+                return 409, {'error_code': 'DUPLICATED_CHECKOUT'}
+            checkout_id = uuid.uuid4().hex
+            self.checkouts[checkout_id] = {
+                'id': checkout_id,
+                'checkout_reference': reference,
+                'amount': payload.get('amount'),
+                'currency': payload.get('currency'),
+                'description': payload.get('description'),
+                'status': 'PENDING',
+                'transactions': [],
+            }
+            return 201, self.checkouts[checkout_id]
+
+        match = _CHECKOUT_PATH.match(path)
+        if match:
+            checkout = self.checkouts.get(match.group('checkout_id'))
+            if checkout is None:
+                return 404, {'error_code': 'NOT_FOUND'}
+            if method == 'PUT':
+                if checkout['status'] == 'PAID':
+                    return 409, {'error_code': 'CHECKOUT_PROCESSED'}
+                checkout['status'] = 'PAID'
+                checkout['transactions'] = [{'id': f"tx_{uuid.uuid4().hex[:12]}", 'status': 'SUCCESSFUL'}]
+            return 200, checkout
+
+        return 404, {'error_code': 'NOT_FOUND'}
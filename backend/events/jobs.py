@@ -0,0 +1,335 @@
+"""
+Database-backed queue for event side effects (SumUp checkouts, emails, Drive uploads, liberatorie PDFs).
+
+Request handlers enqueue EventJob rows in the same transaction that creates the
+subscription and return immediately; the run_event_jobs management command
+claims due jobs and executes them, retrying failures.
+"""
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+import sentry_sdk
+from django.conf import settings
+from django.core.files.base import File
+from django.db import transaction
+from django.db.models import F, Q, Count
+from django.utils import timezone
+
+from events.models import EventJob, Subscription
+
+logger = logging.getLogger(__name__)
+
+# Retry delay doubles on each failed attempt: 30s, 1m, 2m, 4m... capped at JOB_RETRY_MAX_DELAY
+JOB_RETRY_BASE_DELAY = timedelta(seconds=30)
+JOB_RETRY_MAX_DELAY = timedelta(hours=1)
+# How long a worker owns a running job; longer than any handler's network timeouts
+JOB_LEASE = timedelta(minutes=5)
+# Delay before a job waiting on another job of the same subscription is looked at again
+JOB_DEFER_DELAY = timedelta(seconds=10)
+# Spooled form uploads whose job never ran (e.g. the subscription was rolled back) are removed after this
+FORM_UPLOAD_SPOOL_RETENTION = timedelta(days=30)
+
+
+class JobDeferred(Exception):
+    """Raised by a handler when the job cannot run yet; it is rescheduled without using up an attempt."""
+
+
+def enqueue_job(kind, idempotency_key, *, subscription=None, payload=None, requeue=False):
+    """
+    Create a queued job, or return the existing one if the idempotency key was already used.
+    With requeue=True a finished (done/failed) job with the same key is queued again with fresh attempts.
+    Call inside the transaction that creates the related rows so the job is only visible once they commit.
+    """
+    job, created = EventJob.objects.get_or_create(
+        idempotency_key=idempotency_key,
+        defaults={
+            'kind': kind,
+            'subscription': subscription,
+            'payload': payload or {},
+        }
+    )
+    if requeue and not created and job.status in (EventJob.Status.DONE, EventJob.Status.FAILED):
+        job.status = EventJob.Status.QUEUED
+        job.attempts = 0
+        job.run_after = timezone.now()
+        job.locked_until = None
+        job.last_error = ''
+        job.payload = payload or {}
+        job.save(update_fields=['status', 'attempts', 'run_after', 'locked_until', 'last_error', 'payload',
+                                'updated_at'])
+    return job
+
+
+def _claimable(now):
+    # Due queued jobs, plus running jobs whose worker died without releasing the lease
+    return (Q(status=EventJob.Status.QUEUED, run_after__lte=now)
+            | Q(status=EventJob.Status.RUNNING, locked_until__lt=now))
+
+
+def _claim(job_id, now):
+    # Conditional update: only one worker can take a given job
+    return EventJob.objects.filter(_claimable(now), pk=job_id).update(
+        status=EventJob.Status.RUNNING,
+        attempts=F('attempts') + 1,
+        locked_until=now + JOB_LEASE,
+        updated_at=now,
+    ) == 1
+
+
+def claim_next_job(kinds=None):
+    """Lease the oldest due job to the caller and return it, or None if nothing is due."""
+    now = timezone.now()
+    due = EventJob.objects.filter(_claimable(now))
+    if kinds:
+        due = due.filter(kind__in=kinds)
+    for job_id in due.order_by('run_after', 'pk').values_list('pk', flat=True)[:20]:
+        if _claim(job_id, now):
+            return EventJob.objects.get(pk=job_id)
+    return None
+
+
+def retry_delay(attempts):
+    """Exponential backoff for the given number of attempts already made."""
+    return min(JOB_RETRY_BASE_DELAY * (2 ** max(attempts - 1, 0)), JOB_RETRY_MAX_DELAY)
+
+
+def run_job(job, allow_retry=True):
+    """
+    Execute a claimed job and record the outcome.
+    With allow_retry=False a failure is final (used when jobs run inline in the request).
+    """
+    handler = _JOB_HANDLERS[job.kind]
+    now = timezone.now()
+    try:
+        handler(job)
+    except JobDeferred:
+        job.status = EventJob.Status.QUEUED
+        job.attempts = max(job.attempts - 1, 0)
+        job.run_after = now + JOB_DEFER_DELAY
+        job.locked_until = None
+        job.save(update_fields=['status', 'attempts', 'run_after', 'locked_until', 'updated_at'])
+        return job
+    except Exception as e:
+        logger.error(f"Event job {job.pk} ({job.kind}) failed on attempt {job.attempts}: {e}")
+        sentry_sdk.capture_exception(e)
+        job.last_error = str(e)
+        job.locked_until = None
+        if allow_retry and job.attempts < job.max_attempts:
+            job.status = EventJob.Status.QUEUED
+            job.run_after = now + retry_delay(job.attempts)
+        else:
+            job.status = EventJob.Status.FAILED
+        job.save(update_fields=['status', 'run_after', 'locked_until', 'last_error', 'updated_at'])
+        return job
+
+    job.status = EventJob.Status.DONE
+    job.last_error = ''
+    job.locked_until = None
+    job.save(update_fields=['status', 'last_error', 'locked_until', 'updated_at'])
+    return job
+
+
+def run_jobs_inline(jobs, allow_retry=False):
+    """
+    Run freshly enqueued jobs in-process, in order (EVENT_FORM_JOBS_ASYNC / CHECKOUT_BACKFILL_ASYNC = False).
+    With allow_retry=True failed jobs are left queued for the worker instead of being marked failed.
+    """
+    now = timezone.now()
+    for job in jobs:
+        if _claim(job.pk, now):
+            job.refresh_from_db()
+            run_job(job, allow_retry=allow_retry)
+
+
+def run_pending_jobs(max_jobs=None):
+    """Process due jobs until none is left (or max_jobs is reached). Returns the number processed."""
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def job_backlog(jobs=None):
+    """Counts by status and by kind of the given jobs (default: all), plus the oldest due queued job."""
+    jobs = EventJob.objects.all() if jobs is None else jobs
+    by_status = {choice: 0 for choice in EventJob.Status.values}
+    by_kind = {}
+    for kind, status, count in jobs.values_list('kind', 'status').annotate(count=Count('pk')).order_by():
+        by_status[status] += count
+        by_kind.setdefault(kind, {choice: 0 for choice in EventJob.Status.values})[status] = count
+    oldest_due = (jobs.filter(status=EventJob.Status.QUEUED, run_after__lte=timezone.now())
+                  .order_by('run_after').values_list('run_after', flat=True).first())
+    return {
+        'by_status': by_status,
+        'by_kind': by_kind,
+        'oldest_due_at': oldest_due,
+    }
+
+
+# --- Form upload spool ---
+# Files of FORM_UPLOAD jobs are copied chunk by chunk to FORM_UPLOAD_SPOOL_DIR (not kept in memory
+# or in the job row), and the worker streams them to Drive from there.
+
+def form_upload_spool_dir():
+    return getattr(settings, 'FORM_UPLOAD_SPOOL_DIR', os.path.join(settings.BASE_DIR, 'media', 'form_uploads'))
+
+
+def spool_form_upload(uploaded):
+    """Copy an uploaded file to the spool directory; returns its name there (for the job payload)."""
+    directory = form_upload_spool_dir()
+    os.makedirs(directory, exist_ok=True)
+    name = f"{uuid.uuid4().hex}{os.path.splitext(uploaded.name)[1].lower()}"
+    with open(os.path.join(directory, name), 'wb') as spooled:
+        for chunk in uploaded.chunks():
+            spooled.write(chunk)
+    return name
+
+
+@contextmanager
+def spooled_form_uploads(uploads):
+    """
+    Spool {field: uploaded file} for FORM_UPLOAD jobs, yielding [(field, file, spool name)].
+    The spooled files are removed if the block raises (the jobs that would consume them were
+    never committed).
+    """
+    spooled = []
+    try:
+        for fname, uploaded in uploads.items():
+            spooled.append((fname, uploaded, spool_form_upload(uploaded)))
+        yield spooled
+    except BaseException:
+        for _, _, name in spooled:
+            try:
+                os.remove(os.path.join(form_upload_spool_dir(), name))
+            except OSError as e:
+                logger.warning(f"Could not remove spooled form upload {name}: {e}")
+        raise
+
+
+def _purge_stale_spool():
+    directory = form_upload_spool_dir()
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - FORM_UPLOAD_SPOOL_RETENTION.total_seconds()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove stale form upload {path}: {e}")
+
+
+# --- Handlers ---
+# Views are imported lazily: events.views enqueues jobs and imports this module.
+
+def _run_form_upload(job):
+    from events import views
+
+    subscription = Subscription.objects.select_related('event').get(pk=job.subscription_id)
+    field_name = job.payload['field']
+    spool_path = os.path.join(form_upload_spool_dir(), job.payload['spool_path'])
+    if not (subscription.form_data or {}).get(field_name):
+        event = subscription.event
+        with open(spool_path, 'rb') as spooled:
+            upload = File(spooled, name=job.payload['filename'])
+            upload.content_type = job.payload.get('content_type') or 'application/octet-stream'
+            link = views._upload_form_file_to_drive(upload, event.id, field_name, event.name, event.date)
+
+        with transaction.atomic():
+            subscription = Subscription.objects.select_for_update().get(pk=subscription.pk)
+            form_data = subscription.form_data or {}
+            form_data[field_name] = link
+            subscription.form_data = form_data
+            subscription.save(update_fields=['form_data'])
+
+    try:
+        os.remove(spool_path)
+    except FileNotFoundError:
+        pass
+    _purge_stale_spool()
+
+
+def _run_form_checkout(job):
+    from events import views
+
+    with transaction.atomic():
+        subscription = (
+            Subscription.objects
+            .select_for_update()
+            .select_related('event', 'profile')
+            .get(pk=job.subscription_id)
+        )
+        if subscription.sumup_checkout_id or subscription.sumup_transaction_id:
+            return
+
+        event = subscription.event
+        total_cost = (
+            Decimal(event.cost or 0)
+            + Decimal(event.deposit or 0)
+            + views._services_total(subscription.selected_services or [])
+        )
+        if total_cost <= 0:
+            return
+        checkout_id, _ = views.create_sumup_checkout(subscription, total_cost, currency="EUR")
+        subscription.sumup_checkout_id = checkout_id
+        subscription.save(update_fields=['sumup_checkout_id'])
+
+
+def _run_checkout_backfill(job):
+    from events import views
+
+    views.process_subscription_checkout(job.subscription_id, job.payload.get('event_id'))
+
+
+def _run_form_email(job):
+    from events import views
+
+    payload = job.payload
+    online_payment = payload.get('online_payment', False)
+    # The email contains the payment link, so wait for the checkout job of the same subscription
+    if online_payment and EventJob.objects.filter(
+        subscription_id=job.subscription_id,
+        kind=EventJob.Kind.FORM_CHECKOUT,
+        status__in=[EventJob.Status.QUEUED, EventJob.Status.RUNNING],
+    ).exists():
+        raise JobDeferred()
+
+    subscription = Subscription.objects.select_related('event', 'profile').get(pk=job.subscription_id)
+    online_payment_required = bool(online_payment and subscription.sumup_checkout_id)
+    payment_required = online_payment_required or payload.get('payment_required', False)
+    views._send_form_subscription_email(
+        subscription,
+        payload.get('assigned_label', ''),
+        online_payment_required,
+        payment_required,
+        capacity_blocked=payload.get('capacity_blocked', False)
+    )
+    # _send_email swallows SMTP errors: surface them so the job is retried
+    if (views._subscription_recipient_email(subscription)
+            and not (subscription.additional_data or {}).get('subscription_confirmation_email_sent')):
+        raise RuntimeError("Confirmation email was not delivered")
+
+
+def _run_liberatorie(job):
+    from events.liberatorie import run_liberatorie_job
+
+    run_liberatorie_job(job)
+
+
+_JOB_HANDLERS = {
+    EventJob.Kind.FORM_UPLOAD: _run_form_upload,
+    EventJob.Kind.FORM_CHECKOUT: _run_form_checkout,
+    EventJob.Kind.FORM_EMAIL: _run_form_email,
+    EventJob.Kind.CHECKOUT_BACKFILL: _run_checkout_backfill,
+    EventJob.Kind.LIBERATORIE: _run_liberatorie,
+}
@@ -0,0 +1,293 @@
+"""
+Liberatorie (waiver) PDF rendering.
+
+Participant data is loaded with one query (subscriptions with their profile and the
+denormalized latest ESNcard/document) and serialized in a single pass. The waiver and
+privacy paragraphs are the same for every participant of an event, so they are parsed and
+line-broken once per PDF (SharedParagraph) instead of on every page, which was most of the
+rendering time.
+
+Small selections are rendered in the request (generate_liberatorie_pdf); larger ones run
+as a LIBERATORIE EventJob that writes the PDF to LIBERATORIE_DIR and reports its progress
+in the job payload (see liberatorie_job_status / liberatorie_job_download).
+"""
+import logging
+import os
+import time
+from datetime import timedelta
+
+from babel.dates import format_date
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak, Flowable
+
+from events.models import Event, EventJob, Subscription
+from events.serializers import LiberatoriaProfileSerializer
+
+logger = logging.getLogger(__name__)
+
+LOGO_PATH = 'static/esnpolimi-logo.png'
+# How often (in participants) a background render writes its progress to the job
+PROGRESS_STEP = 25
+# Rendered files older than this are removed when a new render starts
+ARTIFACT_RETENTION = timedelta(days=1)
+
+PRIVACY_TEXT = """
+<b>INFORMAZIONI AI SENSI DELLA LEGGE 675/96</b><br/>
+ESN Politecnico Milano desidera informarla che la legge 675/96 prevede la tutela delle persone rispetto al trattamento dei dati
+personali. In base alla legge, il trattamento che intendiamo effettuare utilizzando i suoi dati è possibile soltanto con il suo consenso scritto e:il trattamento verrà effettuato con sistemi
+prevalentemente informatici;ai sensi della legge sulla privacy, il trattamento sarà svolto in base ai principi di correttezza, trasparenza e liceità, per consentire la tutela della riservatezza dei
+suoi dati e del relativi diritti. Il rilascio dei suoi dati non è obbligatorio se non per le finalità legate alle prenotazioni in corso e in ogni caso avrà la possibilità di esercitare i diritti
+riconosciuti dall'Art. 13 della legge in oggetto che prevedono in qualsiasi momento la verifica dell'esistenza dei suoi dati presso gli archivi cartacei ed informatici, dei criteri e degli scopi
+del trattamento dei dati, richiedendo la verifica, cancellazione, aggiornamento ed opposizione al loro utilizzo. Il titolare del trattamento dei suoi dati è ESN Politecnico Milano, Via Bonardi
+3, 20133, Milano. Acquisite le suddette informazioni, rese ai sensi dell'Art 10 della legge 675/96, acconsento al trattamento dei miei dati personali da parte di ESN Politecnico Milano.<br/><br/>
+Accettazione: SI NO<br/><br/>
+Firma/Signature______________________
+"""
+
+
+def italian_date(dt):
+    if not dt:
+        return "N/A"
+    return format_date(dt, format='d MMMM yyyy', locale='it')
+
+
+def display_na(value):
+    return value if value not in [None, '', [], {}] else 'N/A'
+
+
+def artifact_dir():
+    return getattr(settings, 'LIBERATORIE_DIR', os.path.join(settings.BASE_DIR, 'media', 'liberatorie'))
+
+
+def artifact_path(job):
+    return os.path.join(artifact_dir(), f"liberatorie_{job.pk}.pdf")
+
+
+def download_filename(event_name):
+    return f"ESNPolimi_Liberatoria_{event_name}.pdf"
+
+
+# --- Data ---
+
+def _external_row(sub):
+    """Partial data of an external subscription (profile=None), from its external fields."""
+    first_name = sub.external_first_name or ''
+    last_name = sub.external_last_name or ''
+    if not first_name and not last_name and sub.external_name:
+        parts = sub.external_name.split(None, 1)
+        first_name = parts[0] if parts else ''
+        last_name = parts[1] if len(parts) > 1 else ''
+    return {
+        'name': first_name,
+        'surname': last_name,
+        'address': '',
+        'esncard_number': '',
+        'document_number': '',
+        'document_expiry': '',
+        'date_of_birth': '',
+        'place_of_birth': '',
+        'phone': sub.external_whatsapp_number or '',
+        'email': '',
+        'matricola': '',
+        'codice_persona': '',
+    }
+
+
+def liberatoria_rows(subscriptions):
+    """Participant data (one dict per subscription, in queryset order) loaded with a single query."""
+    subscriptions = list(subscriptions.select_related('profile__latest_esncard', 'profile__latest_document'))
+    profile_rows = iter(LiberatoriaProfileSerializer(
+        [sub.profile for sub in subscriptions if sub.profile is not None], many=True
+    ).data)
+    return [next(profile_rows) if sub.profile is not None else _external_row(sub) for sub in subscriptions]
+
+
+# --- Rendering ---
+
+class SharedParagraph(Flowable):
+    """
+    Places the same Paragraph on many pages: line breaking (Paragraph.wrap) runs again only
+    when the available width changes, drawing reuses the computed lines.
+    """
+
+    def __init__(self, paragraph):
+        super().__init__()
+        self.paragraph = paragraph
+
+    def wrap(self, availWidth, availHeight):
+        if getattr(self.paragraph, '_shared_wrap_width', None) != availWidth:
+            self.paragraph._shared_size = self.paragraph.wrap(availWidth, availHeight)
+            self.paragraph._shared_wrap_width = availWidth
+        self.width, self.height = self.paragraph._shared_size
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        # Rare (the page is already full): fall back to a normal Paragraph split
+        self.paragraph._shared_wrap_width = None
+        return self.paragraph.split(availWidth, availHeight)
+
+    def draw(self):
+        self.paragraph.drawOn(self.canv, 0, 0)
+
+
+class LiberatoriaTemplate:
+    """Styles and pre-parsed static flowables of the liberatorie of one event."""
+
+    def __init__(self, event_name, event_date):
+        self.styles = getSampleStyleSheet()
+        self.styles.add(ParagraphStyle(name='Justify', alignment=0))  # 0 for Left alignment (1 for Center)
+        self.logo = self._load_logo()
+
+        # Calculate age limit date (18 years before event)
+        age_limit_date = event_date - timedelta(days=18 * 365.25)
+        waiver_text = f"""
+            La presente dichiarazione liberatoria dovrà essere letta e firmata, in calce alla stessa, in nome e per conto proprio, oltre che in nome e per conto
+            delle persone sotto elencate, nonchè dal legale responsabile qualora l'iscritto non sia maggiorenne (nato dopo il <b>{italian_date(age_limit_date)}</b>). La firma apposta
+            in fondo alla presente dichiarazione comporta la piena e consapevole lettura e comprensione del contenuto e la conferma della volontà di attenersi
+            alla stessa: sono a conoscenza dei rischi connessi riguardo alla mia partecipazione a questo pacchetto viaggio e alle relative attività collaterali.
+            Con la sottoscrizione della presente dichiaro di voler liberare ed esonerare, come in effetti libero ed esonero, qualsiasi persona dell'organizzazione
+            Erasmus Student Network Politecnico Milano, gli organizzatori dell'evento <b>"{event_name}" ({italian_date(event_date)})</b>, collettivamente
+            denominati organizzatori dell'evento, da tutte le azioni, cause qualsiasi procedimento giudiziario e arbitrale tra questi compresi ma non limitati a
+            quelli relativi al rischio di infortuni durante la disputa delle attività e al rischio di smarrimento di effetti personali per furto o per qualsiasi altra
+            ragione. Prima dell'iscrizione a questo pacchetto viaggio sarà mia cura e onere verificare le norme e le disposizioni che mi consentono di
+            partecipare al viaggio. Inoltre, con la sottoscrizione della presente, concedo agli organizzatori dell'evento la mia completa autorizzazione a tale
+            viaggio con foto, servizi filmati, TV, radio, videoregistrazioni e altri strumenti di comunicazione noti o sconosciuti, indipendentemente da chi li
+            abbia effettuati e a utilizzare gli stessi nel modo che verrà ritenuto più opportuno, con assoluta discrezione, per ogni forma di pubblicità,
+            promozione, annuncio, progetti di scambio o a scopo commerciale senza pretendere alcun rimborso di qualsiasi natura e senza richiedere alcuna
+            forma di ricompensa.
+            """
+        self.waiver = Paragraph(waiver_text, self.styles['Justify'])
+        self.signature = Paragraph("Firma/Signature _______________________________", self.styles['Normal'])
+        self.privacy = Paragraph(PRIVACY_TEXT, self.styles['Justify'])
+
+    @staticmethod
+    def _load_logo():
+        try:
+            scale = 0.2
+            orig_width, orig_height = 600, 334
+            width = orig_width * scale * 0.0352778  # convert px to cm (1 px ≈ 0.0352778 cm)
+            height = orig_height * scale * 0.0352778
+
+            logo = Image(LOGO_PATH, width=width * cm, height=height * cm)
+            logo.hAlign = 'CENTER'
+            return logo
+        except (OSError, IOError):
+            return None
+
+    def details(self, profile_data):
+        # Build phone with prefix if available
+        phone_combined = (profile_data.get('phone') or '').strip()
+        if not phone_combined:
+            pn = (profile_data.get('phone_number') or profile_data.get('phone') or '').strip()
+            pp = (profile_data.get('phone_prefix') or '').strip()
+            if pn and pp and not pn.startswith(pp):
+                phone_combined = f"{pp} {pn}"
+            else:
+                phone_combined = pn
+
+        details = f"""
+            <b>Nome/Name:</b> {display_na(profile_data.get('name'))}<br/>
+            <b>Cognome/Surname:</b> {display_na(profile_data.get('surname'))}<br/>
+            <b>Indirizzo/Address:</b> {display_na(profile_data.get('address'))}<br/>
+            <b>ESNcard N°:</b> {display_na(profile_data.get('esncard_number'))}<br/>
+            <b>ID/Passport N°:</b> {display_na(profile_data.get('document_number'))}<br/>
+            <b>Data di scadenza/Expiration date:</b> {display_na(profile_data.get('document_expiry'))}<br/>
+            <b>Data e Luogo di nascita/Date and Place of birth:</b> {display_na(profile_data.get('date_of_birth'))} - {display_na(profile_data.get('place_of_birth'))}<br/>
+            <b>Telefono/Telephone:</b> {display_na(phone_combined)}<br/>
+            <b>E-mail:</b> {display_na(profile_data.get('email'))}<br/>
+            <b>Matricola/Enrollment Number:</b> {display_na(profile_data.get('matricola'))}<br/>
+            <b>Codice Persona/Personal Code:</b> {display_na(profile_data.get('codice_persona'))}<br/>
+            """
+        return Paragraph(details, self.styles['Normal'])
+
+    def participant_story(self, profile_data):
+        """Flowables of one participant's page."""
+        story = []
+        if self.logo:
+            story.append(self.logo)
+            story.append(Spacer(1, 1 * cm))
+        story.append(self.details(profile_data))
+        story.append(Spacer(1, 1 * cm))
+        story.append(SharedParagraph(self.waiver))
+        story.append(Spacer(1, 1 * cm))
+        story.append(SharedParagraph(self.signature))
+        story.append(Spacer(1, 1 * cm))
+        story.append(SharedParagraph(self.privacy))
+        story.append(PageBreak())
+        return story
+
+
+def render_liberatorie(event_name, event_date, rows, output, progress=None):
+    """
+    Write the liberatorie of the given participant rows to output (path or binary file object).
+    progress(done, total) is called after each participant's page break.
+    """
+    template = LiberatoriaTemplate(event_name, event_date)
+    doc = SimpleDocTemplate(output, pagesize=A4,
+                            rightMargin=1 * cm, leftMargin=1 * cm,
+                            topMargin=1 * cm, bottomMargin=1 * cm)
+    story = []
+    for profile_data in rows:
+        story.extend(template.participant_story(profile_data))
+
+    if progress:
+        total = len(rows)
+        done = [0]
+
+        def after_flowable(flowable):
+            if isinstance(flowable, PageBreak):
+                done[0] += 1
+                progress(done[0], total)
+
+        doc.afterFlowable = after_flowable
+    doc.build(story)
+
+
+# --- Background job ---
+
+def _purge_old_artifacts():
+    directory = artifact_dir()
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - ARTIFACT_RETENTION.total_seconds()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove old liberatorie file {path}: {e}")
+
+
+def _set_progress(job, **values):
+    # Updated in SQL so the status endpoint sees it while the job is still running
+    job.payload = {**job.payload, **values}
+    EventJob.objects.filter(pk=job.pk).update(payload=job.payload)
+
+
+def run_liberatorie_job(job):
+    """EventJob handler: render the selected subscriptions to artifact_path(job)."""
+    event = Event.objects.get(pk=job.payload['event_id'])
+    subscriptions = Subscription.objects.filter(id__in=job.payload['subscription_ids'], event=event)
+    rows = liberatoria_rows(subscriptions)
+
+    _purge_old_artifacts()
+    os.makedirs(artifact_dir(), exist_ok=True)
+    path = artifact_path(job)
+    tmp_path = f"{path}.part"
+    _set_progress(job, total=len(rows), done=0)
+
+    def progress(done, total):
+        if done % PROGRESS_STEP == 0 or done == total:
+            _set_progress(job, done=done)
+
+    try:
+        render_liberatorie(event.name, event.date, rows, tmp_path, progress=progress)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _set_progress(job, done=len(rows), filename=download_filename(event.name))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from events.models import EventList
+
+
+class Command(BaseCommand):
+    help = 'Recompute EventList.subscription_counter from the actual subscriptions and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report lists whose counter is out of sync.',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options.get('dry_run')
+        checked = 0
+        repaired = 0
+
+        list_ids = list(EventList.objects.order_by('id').values_list('id', flat=True))
+        for list_id in list_ids:
+            with transaction.atomic():
+                # Lock the row so concurrent signups wait for the repaired value
+                event_list = (EventList.objects
+                              .select_for_update()
+                              .with_occupancy()
+                              .filter(pk=list_id)
+                              .first())
+                if event_list is None:
+                    continue
+                checked += 1
+                actual = event_list.annotated_subscription_count
+                if event_list.subscription_counter == actual:
+                    continue
+                self.stdout.write(
+                    f'List {event_list.pk} ({event_list.name}): counter {event_list.subscription_counter}, actual {actual}'
+                )
+                repaired += 1
+                if not dry_run:
+                    EventList.objects.filter(pk=list_id).update(subscription_counter=actual)
+
+        verb = 'out of sync' if dry_run else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} lists, {repaired} {verb}.'))
@@ -0,0 +1,105 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from events.jobs import claim_next_job, run_job
+from events.models import EventJob
+
+
+class Command(BaseCommand):
+    help = 'Run queued event jobs (form checkouts, confirmation emails, Drive uploads, checkout backfills)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the jobs that are currently due and exit instead of polling.',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Number of worker threads, each with its own DB connection (default: 1).',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait when the queue is empty (default: 2).',
+        )
+        parser.add_argument(
+            '--max-jobs',
+            type=int,
+            help='Exit after processing this many jobs.',
+        )
+        parser.add_argument(
+            '--kind',
+            action='append',
+            choices=EventJob.Kind.values,
+            help='Only run jobs of this kind (repeatable).',
+        )
+
+    def handle(self, *args, **options):
+        self.once = options.get('once')
+        self.poll_interval = options.get('poll_interval')
+        self.max_jobs = options.get('max_jobs')
+        self.kinds = options.get('kind')
+        self.processed = 0
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+
+        concurrency = max(options.get('concurrency') or 1, 1)
+        if concurrency == 1:
+            try:
+                self._work()
+            except KeyboardInterrupt:
+                pass
+        else:
+            threads = [
+                threading.Thread(target=self._work, name=f'event_jobs_{i}', daemon=True)
+                for i in range(concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+            try:
+                for thread in threads:
+                    while thread.is_alive():
+                        thread.join(timeout=1)
+            except KeyboardInterrupt:
+                # Running jobs finish; their lease covers a hard kill
+                self.stop.set()
+                for thread in threads:
+                    thread.join()
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {self.processed} jobs.'))
+
+    def _take_slot(self):
+        with self.lock:
+            if self.max_jobs is not None and self.processed >= self.max_jobs:
+                return False
+            self.processed += 1
+            return True
+
+    def _release_slot(self):
+        with self.lock:
+            self.processed -= 1
+
+    def _work(self):
+        try:
+            while not self.stop.is_set() and self._take_slot():
+                # Long-running process: drop connections the DB server may have closed
+                close_old_connections()
+                job = claim_next_job(self.kinds)
+                if job is None:
+                    self._release_slot()
+                    if self.once:
+                        break
+                    self.stop.wait(self.poll_interval)
+                    continue
+                run_job(job)
+                self.stdout.write(f'Job {job.pk} ({job.kind}): {job.status}')
+        finally:
+            # Worker threads own their connection; the main thread's is closed by Django
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
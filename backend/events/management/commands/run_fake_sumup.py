@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.fake_sumup import FakeSumUpServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local fake SumUp API for offline development and load tests (set SUMUP_API_BASE_URL to its URL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Interface to bind (default: 127.0.0.1).')
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765).')
+
+    def handle(self, *args, **options):
+        server = FakeSumUpServer(host=options['host'], port=options['port']).start()
+        self.stdout.write(self.style.SUCCESS(f'Fake SumUp listening on {server.url}'))
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            self.stdout.write(
+                f'Served {sum(server.requests.values())} requests on {server.connections} connections, '
+                f'{server.token_requests} token requests.'
+            )
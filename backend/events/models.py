@@ -1,9 +1,14 @@
 from jsonschema import validate
 
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, When, Value, Count, OuterRef, Subquery, F
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils import timezone
 
+from backend.audit_models import AuditSnapshotMixin
 from profiles.models import Profile, BaseEntity
 
 
@@ -208,6 +213,25 @@ def validate_field_data(field_config, data_dict, field_type_filter=None):
     return errors
 
 
+class EventQuerySet(models.QuerySet):
+    def with_status(self, now=None):
+        """
+        Annotate each event with `computed_status`, the SQL equivalent of Event.status
+        ('open' / 'not_yet' / 'closed'), so that status filtering and ordering run in the database.
+        """
+        now = now or timezone.now()
+        return self.annotate(computed_status=Case(
+            When(subscription_start_date__gt=now, then=Value('not_yet')),
+            When(subscription_end_date__lt=now, then=Value('closed')),
+            default=Value('open'),
+            output_field=models.CharField(max_length=8),
+        ))
+
+    def filter_status(self, statuses, now=None):
+        """Keep only events whose status is in the given iterable of statuses."""
+        return self.with_status(now).filter(computed_status__in=list(statuses))
+
+
 # Class the describes an event
 class Event(BaseEntity):
     id = models.AutoField(primary_key=True)
@@ -255,6 +279,8 @@ class Event(BaseEntity):
     # Make the reimbursements doable only by organizers or board members
     reimbursements_by_organizers_only = models.BooleanField(default=False)
 
+    objects = EventQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} ({self.date})"
 
@@ -314,6 +340,7 @@ class Event(BaseEntity):
 
     @property
     def status(self):
+        # Keep in sync with EventQuerySet.with_status
         now = timezone.now()
         if self.subscription_start_date and self.subscription_end_date:
             if self.subscription_start_date <= now <= self.subscription_end_date:
@@ -352,7 +379,7 @@ class EventOrganizer(BaseEntity):
         return f"{self.profile} - {self.event}"
 
 
-class EventListEvent(models.Model):
+class EventListEvent(AuditSnapshotMixin, models.Model):
     """
     Intermediate table for Many-to-Many relationship between EventList and Event.
     Allows a single EventList to be shared across multiple Events.
@@ -368,6 +395,22 @@ class EventListEvent(models.Model):
         return f"{self.eventlist.name} → {self.event.name}"
 
 
+class EventListQuerySet(models.QuerySet):
+    def with_occupancy(self):
+        """
+        Annotate each list with its actual subscription count (COUNT over subscriptions),
+        using a correlated subquery so the count stays correct when lists are prefetched
+        through the events relation. Used to detect drift of EventList.subscription_counter.
+        """
+        counts = (Subscription.objects
+                  .filter(list=OuterRef('pk'))
+                  .order_by()
+                  .values('list')
+                  .annotate(total=Count('id'))
+                  .values('total'))
+        return self.annotate(annotated_subscription_count=Coalesce(Subquery(counts), 0))
+
+
 class EventList(BaseEntity):
     """
     Dynamic lists for events, with customizable names and capacities.
@@ -396,6 +439,12 @@ class EventList(BaseEntity):
     is_main_list = models.BooleanField(default=False)
     is_waiting_list = models.BooleanField(default=False)
 
+    # Denormalized number of subscriptions in this list, maintained by Subscription.save and the
+    # post_delete handler below. Drift (e.g. from queryset.update) is repaired by reconcile_list_counters.
+    subscription_counter = models.PositiveIntegerField(default=0)
+
+    objects = EventListQuerySet.as_manager()
+
     class Meta:
         ordering = ['display_order', 'id']
 
@@ -425,8 +474,9 @@ class EventList(BaseEntity):
         """
         Total subscriptions across all events sharing this list.
         This counts towards the shared capacity pool.
+        Reads the maintained counter: lock the row with select_for_update for race-free capacity decisions.
         """
-        return self.subscriptions.count()
+        return self.subscription_counter
 
     @property
     def available_capacity(self):
@@ -438,6 +488,16 @@ class EventList(BaseEntity):
             return None  # Unlimited capacity
         return max(0, self.capacity - self.subscription_count)
 
+    @classmethod
+    def adjust_subscription_counter(cls, list_id, delta):
+        """Atomically add delta to the subscription counter of a list (never below zero)."""
+        if not list_id or not delta:
+            return
+        qs = cls.objects.filter(pk=list_id)
+        if delta < 0:
+            qs = qs.filter(subscription_counter__gte=-delta)
+        qs.update(subscription_counter=F('subscription_counter') + delta)
+
 
 class SubscriptionStatus(models.TextChoices):
     PENDING = 'pending', 'Pending'
@@ -480,11 +540,40 @@ class Subscription(BaseEntity):
             )
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored list so save() can move the counters when the list changes
+        instance._loaded_list_id = instance.__dict__.get('list_id')
+        return instance
+
+    def _stored_list_id(self):
+        if self._state.adding:
+            return None
+        if hasattr(self, '_loaded_list_id'):
+            return self._loaded_list_id
+        return Subscription.objects.filter(pk=self.pk).values_list('list_id', flat=True).first()
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            is_new = self._state.adding
+            previous_list_id = self._stored_list_id()
+            super().save(*args, **kwargs)
+            if is_new:
+                EventList.adjust_subscription_counter(self.list_id, 1)
+            elif previous_list_id != self.list_id and (update_fields is None or 'list' in update_fields):
+                EventList.adjust_subscription_counter(previous_list_id, -1)
+                EventList.adjust_subscription_counter(self.list_id, 1)
+            self._loaded_list_id = self.list_id
+
     def clean(self):
         super().clean()
         # Ensure list capacity isn't exceeded (if capacity is not 0/unlimited)
         if self.list.capacity > 0:
-            current_count = Subscription.objects.filter(list=self.list).exclude(pk=self.pk).count()
+            current_count = self.list.subscription_count
+            if self.pk and self._stored_list_id() == self.list_id:
+                current_count -= 1  # this subscription already occupies a spot in the list
             if current_count >= self.list.capacity:
                 raise ValidationError(f"{self.list.name} capacity exceeded")
         # Validate form data using unified fields
@@ -506,6 +595,58 @@ class Subscription(BaseEntity):
         return f"{self.profile} - {self.event} ({self.list.name})"
 
 
+@receiver(post_delete, sender=Subscription)
+def _release_list_spot(sender, instance, **kwargs):
+    # post_delete also fires for queryset and cascade deletes, unlike Model.delete()
+    list_id = getattr(instance, '_loaded_list_id', None) or instance.list_id
+    EventList.adjust_subscription_counter(list_id, -1)
+
+
+class EventJob(AuditSnapshotMixin, models.Model):
+    """
+    Durable queue entry for side effects that must not run inside a request
+    (SumUp checkout creation, confirmation emails, Drive uploads, large liberatorie PDFs).
+    Jobs are executed by the run_event_jobs management command (see events/jobs.py).
+    """
+
+    class Kind(models.TextChoices):
+        FORM_UPLOAD = 'form_upload', 'Form file upload'
+        FORM_CHECKOUT = 'form_checkout', 'Form checkout creation'
+        FORM_EMAIL = 'form_email', 'Form confirmation email'
+        CHECKOUT_BACKFILL = 'checkout_backfill', 'Online payment checkout backfill'
+        LIBERATORIE = 'liberatorie', 'Liberatorie PDF rendering'
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    kind = models.CharField(max_length=32, choices=Kind.choices)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.QUEUED)
+    # Enqueueing twice with the same key returns the existing job instead of creating a new one
+    idempotency_key = models.CharField(max_length=191, unique=True)
+    subscription = models.ForeignKey(Subscription, on_delete=models.CASCADE, blank=True, null=True,
+                                     related_name='jobs')
+    payload = models.JSONField(blank=True, default=default_empty_dict)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Lease of the worker running the job; a running job whose lease expired is claimed again
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='eventjob_status_run_after'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
 CANONICAL_PROFILE_ORDER = [
     'name', 'surname', 'birthdate', 'email', 'latest_esncard', 'country', 'domicile',
     'phone_prefix', 'phone_number', 'whatsapp_prefix', 'whatsapp_number',
@@ -29,6 +29,41 @@ def order_profile_fields(fields):
     return [f for f in CANONICAL_PROFILE_ORDER if f in fields]
 
 
+def build_subscription_roster_context(subscriptions):
+    """
+    Roster mode for SubscriptionSerializer.
+    Loads all transactions of the given subscriptions in one query (grouped in memory, newest first),
+    plus latest ESNcard / document of their profiles in one query, so that serializing
+    a roster costs a constant number of queries regardless of its size.
+    Pass the returned dict as serializer context.
+    """
+    subscription_ids = [sub.id for sub in subscriptions]
+    profile_ids = {sub.profile_id for sub in subscriptions if sub.profile_id}
+
+    transactions_by_sub = {sub_id: [] for sub_id in subscription_ids}
+    if subscription_ids:
+        for tx in (Transaction.objects
+                   .filter(subscription_id__in=subscription_ids)
+                   .select_related('account')
+                   .order_by('-id')):
+            transactions_by_sub[tx.subscription_id].append(tx)
+
+    esncards = {}
+    documents = {}
+    if profile_ids:
+        for profile in (Profile.objects.filter(pk__in=profile_ids)
+                        .select_related('latest_esncard', 'latest_document')
+                        .only('id', 'latest_esncard', 'latest_document')):
+            esncards[profile.pk] = profile.latest_esncard
+            documents[profile.pk] = profile.latest_document
+
+    return {
+        'roster_transactions': transactions_by_sub,
+        'roster_esncards': esncards,
+        'roster_documents': documents,
+    }
+
+
 # A reusable mixin that calls the model's clean()
 class ModelCleanSerializerMixin:
     """
@@ -103,6 +138,22 @@ class EventListSerializer(serializers.ModelSerializer):
         return [event.name for event in obj.events.all()]
 
 
+class EventListOccupancySerializer(EventListSerializer):
+    """EventListSerializer plus a compact occupancy summary (count / capacity / available)."""
+    occupancy = serializers.SerializerMethodField()
+
+    class Meta(EventListSerializer.Meta):
+        fields = EventListSerializer.Meta.fields + ['occupancy']
+
+    @staticmethod
+    def get_occupancy(obj):
+        return {
+            'count': obj.subscription_count,
+            'capacity': obj.capacity,
+            'available': obj.available_capacity,
+        }
+
+
 # Serializers for Event
 class EventsListSerializer(serializers.ModelSerializer):
     lists_capacity = serializers.SerializerMethodField()
@@ -127,8 +178,8 @@ class EventsListSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_lists_capacity(obj):
-        qs = obj.lists.all().order_by('display_order', 'id')
-        return EventListSerializer(qs, many=True).data
+        # Default EventList ordering is (display_order, id); all() keeps prefetched lists usable
+        return EventListOccupancySerializer(obj.lists.all(), many=True).data
 
 
 class EventOrganizerSerializer(serializers.ModelSerializer):
@@ -562,7 +613,7 @@ class EventCreationSerializer(ModelCleanSerializerMixin, serializers.ModelSerial
                 new_capacity = list_data.get('capacity', current_list.capacity)
 
                 # Get total subscription count for this list across all events
-                subscription_count = Subscription.objects.filter(list_id=list_id).count()
+                subscription_count = current_list.subscription_count
                 if new_capacity > 0 and subscription_count > new_capacity:
                     raise serializers.ValidationError({
                         'lists': f"Non è possibile impostare una capacità lista minore del numero di iscrizioni presenti ({subscription_count})"
@@ -796,17 +847,22 @@ class SubscriptionProfileInlineSerializer(serializers.ModelSerializer):
             return whatsapp_number
         return self._combine(obj.phone_prefix, obj.phone_number)
 
-    @staticmethod
-    def get_latest_esncard(obj):
-        card = getattr(obj, 'latest_esncard', None)
+    def _latest(self, obj, roster_key, attr):
+        # In roster mode the latest card / document comes from the prefetched index
+        index = self.context.get(roster_key)
+        if index is not None:
+            return index.get(obj.pk)
+        return getattr(obj, attr, None)
+
+    def get_latest_esncard(self, obj):
+        card = self._latest(obj, 'roster_esncards', 'latest_esncard')
         try:
             return card.number if card else ''
         except Exception:
             return ''
 
-    @staticmethod
-    def get_latest_document(obj):
-        doc = getattr(obj, 'latest_document', None)
+    def get_latest_document(self, obj):
+        doc = self._latest(obj, 'roster_documents', 'latest_document')
         try:
             return doc.number if doc else ''
         except Exception:
@@ -885,13 +941,30 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             return obj.external_name
         return ""
 
-    @staticmethod
-    def get_account_id(obj):
+    def _roster_transactions(self, obj, tx_type=None):
+        """
+        Transactions of obj (newest first) from the roster index, optionally filtered by type.
+        Returns None outside roster mode, so callers fall back to per-row queries.
+        """
+        index = self.context.get('roster_transactions')
+        if index is None:
+            return None
+        txs = index.get(obj.id, [])
+        if tx_type is not None:
+            txs = [tx for tx in txs if tx.type == tx_type]
+        return txs
+
+    def get_account_id(self, obj):
+        txs = self._roster_transactions(obj)
+        if txs is not None:
+            return txs[0].account.id if txs else None
         transaction = Transaction.objects.filter(subscription=obj.id).order_by('-id').first()
         return transaction.account.id if transaction else None
 
-    @staticmethod
-    def get_account_name(obj):
+    def get_account_name(self, obj):
+        txs = self._roster_transactions(obj)
+        if txs is not None:
+            return txs[0].account.name if txs else None
         transaction = Transaction.objects.filter(subscription=obj.id).order_by('-id').first()
         return transaction.account.name if transaction else None
 
@@ -909,52 +982,55 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             return []
         return list(event.fields or [])
 
-    @staticmethod
-    def get_deposit_reimbursement_transaction_id(obj):
+    def get_deposit_reimbursement_transaction_id(self, obj):
+        txs = self._roster_transactions(obj, Transaction.TransactionType.CAUZIONE)
+        if txs is not None:
+            return txs[0].id if txs else None
         tx = Transaction.objects.filter(subscription=obj, type=Transaction.TransactionType.CAUZIONE).order_by(
             '-id').first()
         return tx.id if tx else None
 
-    @staticmethod
-    def get_quota_reimbursement_transaction_id(obj):
+    def get_quota_reimbursement_transaction_id(self, obj):
+        txs = self._roster_transactions(obj, Transaction.TransactionType.RIMBORSO_QUOTA)
+        if txs is not None:
+            return txs[0].id if txs else None
         tx = Transaction.objects.filter(subscription=obj, type=Transaction.TransactionType.RIMBORSO_QUOTA).order_by(
             '-id').first()
         return tx.id if tx else None
 
-    @staticmethod
-    def get_status_quota(obj):
+    def _has_transaction(self, obj, tx_type):
+        txs = self._roster_transactions(obj, tx_type)
+        if txs is not None:
+            return bool(txs)
+        return Transaction.objects.filter(subscription=obj, type=tx_type).exists()
+
+    def get_status_quota(self, obj):
         # Only return if event has quota (cost > 0)
         if obj.event and obj.event.cost and float(obj.event.cost) > 0:
-            if Transaction.objects.filter(subscription=obj, type=Transaction.TransactionType.RIMBORSO_QUOTA).exists():
+            if self._has_transaction(obj, Transaction.TransactionType.RIMBORSO_QUOTA):
                 return 'reimbursed'
-            elif Transaction.objects.filter(subscription=obj, type=Transaction.TransactionType.SUBSCRIPTION).exists():
+            elif self._has_transaction(obj, Transaction.TransactionType.SUBSCRIPTION):
                 return 'paid'
             else:
                 return 'pending'
         return None
 
-    @staticmethod
-    def get_status_cauzione(obj):
+    def get_status_cauzione(self, obj):
         # Only return if event has deposit (deposit > 0)
         if obj.event and obj.event.deposit and float(obj.event.deposit) > 0:
-            cauzione_tx = Transaction.objects.filter(subscription=obj,
-                                                     type=Transaction.TransactionType.CAUZIONE).first()
-            reimbursed = Transaction.objects.filter(subscription=obj,
-                                                    type=Transaction.TransactionType.RIMBORSO_CAUZIONE).exists()
-            if reimbursed:
+            if self._has_transaction(obj, Transaction.TransactionType.RIMBORSO_CAUZIONE):
                 return 'reimbursed'
-            elif cauzione_tx:
+            elif self._has_transaction(obj, Transaction.TransactionType.CAUZIONE):
                 return 'paid'
             else:
                 return 'pending'
         return None
 
-    @staticmethod
-    def get_status_services(obj):
+    def get_status_services(self, obj):
         if obj.selected_services:
-            if Transaction.objects.filter(subscription=obj, type=Transaction.TransactionType.RIMBORSO_SERVICE).exists():
+            if self._has_transaction(obj, Transaction.TransactionType.RIMBORSO_SERVICE):
                 return 'reimbursed'
-            elif Transaction.objects.filter(subscription=obj, type=Transaction.TransactionType.SERVICE).exists():
+            elif self._has_transaction(obj, Transaction.TransactionType.SERVICE):
                 return 'paid'
             else:
                 return 'pending'
@@ -1126,12 +1202,14 @@ class EventWithSubscriptionsSerializer(serializers.ModelSerializer):
         originating event.
         """
         list_ids = obj.lists.values_list('id', flat=True)
-        qs = (Subscription.objects
-              .filter(list_id__in=list_ids)
-              .select_related('event', 'list', 'profile')
-              .order_by('-created_at'))
-
-        serialized = SubscriptionSerializer(qs, many=True).data
+        subscriptions = list(Subscription.objects
+                             .filter(list_id__in=list_ids)
+                             .select_related('event', 'list', 'profile')
+                             .order_by('-created_at'))
+
+        serialized = SubscriptionSerializer(
+            subscriptions, many=True, context=build_subscription_roster_context(subscriptions)
+        ).data
 
         for entry in serialized:
             entry['shared_from_other_event'] = entry.get('event_id') != obj.id
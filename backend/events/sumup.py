@@ -0,0 +1,157 @@
+"""
+SumUp API client shared by the payment views and the event jobs.
+
+One client per process keeps a pooled keep-alive requests.Session. The OAuth
+token lives in Django's default cache. Only a shared backend (the database
+cache configured in Deploy.md) lets all workers reuse one token, with the cache
+lock ensuring a single worker refreshes it; with Django's default LocMemCache
+the token and the lock are per process (each worker fetches its own token).
+"""
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+SUMUP_API_BASE_URL = "https://api.sumup.com"
+
+# Seconds shaved off the token lifetime so a token is never used right as it expires
+TOKEN_EXPIRY_MARGIN = 30
+# How long a refresh may hold the lock, and how long other callers wait for it
+TOKEN_LOCK_TIMEOUT = 20
+TOKEN_LOCK_WAIT = 25
+
+
+class SumUpError(RuntimeError):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SumUpClient:
+    """
+    Thin wrapper around the SumUp REST API.
+    Only GET requests are retried on connection errors and 429/5xx: a failed PUT (card charge)
+    may still have been processed, so callers read the checkout back instead of resending it.
+    A 401 drops the cached token and repeats the request once with a new one.
+    """
+
+    def __init__(self, base_url=None, client_id=None, client_secret=None, *,
+                 pool_size=10, connect_timeout=5, read_timeout=15, retries=3):
+        self.base_url = (base_url or SUMUP_API_BASE_URL).rstrip('/')
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout = (connect_timeout, read_timeout)
+        self.token_cache_key = f"sumup:token:{self.client_id}:{self.base_url}"
+        self.token_lock_key = f"{self.token_cache_key}:lock"
+        self._token_lock = threading.Lock()
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    # --- OAuth token ---
+
+    def access_token(self):
+        token = cache.get(self.token_cache_key)
+        if token:
+            return token
+        # Threads of this process queue here; processes queue on the cache lock below (shared cache only)
+        with self._token_lock:
+            token = cache.get(self.token_cache_key)
+            if token:
+                return token
+            deadline = time.monotonic() + TOKEN_LOCK_WAIT
+            while True:
+                if cache.add(self.token_lock_key, 1, timeout=TOKEN_LOCK_TIMEOUT):
+                    try:
+                        return cache.get(self.token_cache_key) or self._fetch_token()
+                    finally:
+                        cache.delete(self.token_lock_key)
+                time.sleep(0.05)
+                token = cache.get(self.token_cache_key)
+                if token:
+                    return token
+                if time.monotonic() > deadline:
+                    # The refreshing worker died or hung: refresh ourselves
+                    return self._fetch_token()
+
+    def invalidate_token(self):
+        cache.delete(self.token_cache_key)
+
+    def _fetch_token(self):
+        r = self.session.post(
+            f"{self.base_url}/token",
+            data={
+                "grant_type": "client_credentials",
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "scope": "payments",
+            },
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        token_data = r.json()
+        access_token = token_data["access_token"]
+        expires_in = token_data.get("expires_in", 300)
+        cache.set(self.token_cache_key, access_token, timeout=max(expires_in - TOKEN_EXPIRY_MARGIN, 1))
+        return access_token
+
+    # --- API calls ---
+
+    def request(self, method, path, *, timeout=None, **kwargs):
+        """Authenticated request; returns the requests.Response whatever its status code."""
+        url = f"{self.base_url}{path}"
+        extra_headers = kwargs.pop('headers', None) or {}
+        for attempt in range(2):
+            headers = {**extra_headers, "Authorization": f"Bearer {self.access_token()}"}
+            r = self.session.request(method, url, headers=headers, timeout=timeout or self.timeout, **kwargs)
+            if r.status_code != 401 or attempt:
+                return r
+            # Token revoked or expired early: refresh once
+            self.invalidate_token()
+        return r
+
+    def create_checkout(self, payload):
+        r = self.request('POST', '/v0.1/checkouts', json=payload)
+        if r.status_code >= 300:
+            raise SumUpError(f"SumUp error {r.status_code}: {r.text}", r.status_code)
+        return r.json()
+
+    def get_checkout(self, checkout_id, timeout=None):
+        return self.request('GET', f'/v0.1/checkouts/{checkout_id}', timeout=timeout)
+
+    def process_checkout(self, checkout_id, payload, timeout=None):
+        """Charge the checkout. Never retried: on errors reconcile with get_checkout()."""
+        return self.request('PUT', f'/v0.1/checkouts/{checkout_id}', json=payload, timeout=timeout)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_sumup_client():
+    """Process-wide client, rebuilt if the SumUp settings change (e.g. override_settings in tests)."""
+    global _client
+    base_url = getattr(settings, 'SUMUP_API_BASE_URL', SUMUP_API_BASE_URL)
+    client_id = settings.SUMUP_CLIENT_ID
+    with _client_lock:
+        if _client is None or (_client.base_url, _client.client_id) != (base_url.rstrip('/'), client_id):
+            _client = SumUpClient(
+                base_url,
+                client_id,
+                settings.SUMUP_CLIENT_SECRET,
+                pool_size=getattr(settings, 'SUMUP_POOL_SIZE', 10),
+            )
+        return _client
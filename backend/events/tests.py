@@ -1,18 +1,37 @@
 """Tests for events module endpoints and behaviors."""
 
+import json
+import os
+import shutil
+import tempfile
+import threading
 import unittest
 from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework.test import APITestCase
 
-from events.models import Event, EventList, Subscription, EventOrganizer
-from profiles.models import Profile
-from treasury.models import Account, Transaction
+from events.fake_sumup import FakeSumUpServer
+from events.jobs import enqueue_job, run_jobs_inline, run_pending_jobs, claim_next_job, retry_delay
+from events.liberatorie import liberatoria_rows
+from events.models import Event, EventList, Subscription, EventOrganizer, EventJob
+from events.serializers import SubscriptionSerializer, build_subscription_roster_context
+from events.sumup import SumUpClient, SumUpError, get_sumup_client
+from events.views import create_sumup_checkout, _process_sumup_checkout
+from profiles.models import Profile, Document
+from treasury.models import Account, Transaction, ESNcard
 
 
 User = get_user_model()
@@ -98,6 +117,17 @@ class EventsBaseTestCase(APITestCase):
 		"""Force authenticate the API client with the given user."""
 		self.client.force_authenticate(user=user)
 
+	def start_fake_sumup(self):
+		"""Point the SumUp client at a local fake server for the duration of the test."""
+		server = FakeSumUpServer().start()
+		self.addCleanup(server.stop)
+		settings_override = override_settings(SUMUP_API_BASE_URL=server.url)
+		settings_override.enable()
+		self.addCleanup(settings_override.disable)
+		cache.clear()
+		self.addCleanup(cache.clear)
+		return server
+
 
 class EventsListTests(EventsBaseTestCase):
 	"""Tests for events list endpoint."""
@@ -163,6 +193,53 @@ class EventsListTests(EventsBaseTestCase):
 		self.assertEqual(response.status_code, 200)
 		self.assertTrue(all("Welcome" in e["name"] for e in response.data["results"]))
 
+	def test_events_list_exposes_list_occupancy(self):
+		"""Each list in lists_capacity should report its occupancy."""
+		profile = _create_profile("viewer@esnpolimi.it")
+		user = _create_user(profile)
+		user.user_permissions.add(self.perm_view_event)
+		self.authenticate(user)
+
+		event = _create_event(name="Occupancy Event")
+		main_list = _create_event_list(event, capacity=3)
+		_create_event_list(event, name="Waiting List", capacity=0, is_main_list=False, is_waiting_list=True)
+		Subscription.objects.create(profile=_create_profile("occ1@uni.it", is_esner=False), event=event, list=main_list)
+
+		response = self.client.get("/backend/events/")
+
+		self.assertEqual(response.status_code, 200)
+		lists = response.data["results"][0]["lists_capacity"]
+		self.assertEqual(lists[0]["occupancy"], {"count": 1, "capacity": 3, "available": 2})
+		self.assertEqual(lists[0]["subscription_count"], 1)
+		self.assertEqual(lists[0]["event_names"], ["Occupancy Event"])
+		self.assertEqual(lists[1]["occupancy"], {"count": 0, "capacity": 0, "available": None})
+
+	def test_events_list_query_count_independent_of_page_size(self):
+		"""Lists, counts and event names are prefetched, not queried per event."""
+		profile = _create_profile("viewer@esnpolimi.it")
+		user = _create_user(profile)
+		user.user_permissions.add(self.perm_view_event)
+		self.authenticate(user)
+
+		def add_events(start, count):
+			for i in range(start, start + count):
+				event = _create_event(name=f"Paged Event {i}")
+				main_list = _create_event_list(event)
+				_create_event_list(event, name="Waiting List", is_main_list=False, is_waiting_list=True)
+				Subscription.objects.create(profile=_create_profile(f"paged{i}@uni.it", is_esner=False),
+											event=event, list=main_list)
+
+		add_events(0, 2)
+		self.client.get("/backend/events/")  # warm up permission caches
+		with CaptureQueriesContext(connection) as small:
+			self.client.get("/backend/events/")
+		add_events(2, 5)
+		with CaptureQueriesContext(connection) as large:
+			response = self.client.get("/backend/events/")
+
+		self.assertEqual(len(response.data["results"]), 7)
+		self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
 
 class EventCreationTests(EventsBaseTestCase):
 	"""Tests for event creation endpoint."""
@@ -411,6 +488,40 @@ class EventDetailTests(EventsBaseTestCase):
 		self.assertEqual(mock_create_checkout.call_count, 2)
 		self.assertEqual(mock_send_link_email.call_count, 1)
 
+	@patch("events.views._send_online_payment_link_email", return_value=True)
+	@patch("events.views.create_sumup_checkout")
+	def test_event_detail_patch_enable_online_payment_queues_backfill_jobs(self, mock_create_checkout, _):
+		"""Asynchronous backfill should persist one job per subscription and leave the work to the worker."""
+		mock_create_checkout.side_effect = lambda subscription, total_amount, currency="EUR": (f"chk_{subscription.pk}", None)
+
+		profile = _create_profile("editor-jobs@esnpolimi.it")
+		user = _create_user(profile)
+		user.user_permissions.add(self.perm_change_event)
+		self.authenticate(user)
+
+		event = _create_event(name="Queued Backfill", allow_online_payment=False, cost=10, deposit=0)
+		list_main = _create_event_list(event)
+		subs = [
+			Subscription.objects.create(profile=_create_profile(f"queued{i}@uni.it", is_esner=False), event=event, list=list_main)
+			for i in range(3)
+		]
+
+		response = self.client.patch(f"/backend/event/{event.pk}/", {"allow_online_payment": True}, format="json")
+
+		self.assertEqual(response.status_code, 200)
+		mock_create_checkout.assert_not_called()
+		jobs = EventJob.objects.filter(kind=EventJob.Kind.CHECKOUT_BACKFILL)
+		self.assertEqual(jobs.count(), 3)
+		self.assertTrue(all(job.status == EventJob.Status.QUEUED for job in jobs))
+
+		call_command("run_event_jobs", "--once", stdout=StringIO())
+
+		for sub in subs:
+			sub.refresh_from_db()
+			self.assertEqual(sub.sumup_checkout_id, f"chk_{sub.pk}")
+		self.assertEqual(mock_create_checkout.call_count, 3)
+		self.assertFalse(jobs.exclude(status=EventJob.Status.DONE).exists())
+
 	def test_event_detail_patch_cannot_remove_list_with_subscriptions(self):
 		"""Removing a list with subscriptions from payload should fail with 400."""
 		profile = _create_profile("editor-list-remove@esnpolimi.it")
@@ -487,6 +598,65 @@ class EventDetailTests(EventsBaseTestCase):
 		self.assertEqual(response.status_code, 200)
 		self.assertFalse(Event.objects.filter(pk=event.pk).exists())
 
+	def _create_roster(self, event, event_list, account, user, start, count):
+		"""Create paid subscriptions with ESNcard and document for roster tests."""
+		for i in range(start, start + count):
+			profile_sub = _create_profile(f"roster{i}@uni.it", is_esner=False)
+			ESNcard.objects.create(profile=profile_sub, number=f"ROSTER{i}")
+			Document.objects.create(profile=profile_sub, type="Passport", number=f"DOC{i}", expiration="2030-01-01")
+			sub = Subscription.objects.create(profile=profile_sub, event=event, list=event_list)
+			Transaction.objects.create(type=Transaction.TransactionType.SUBSCRIPTION, subscription=sub,
+									   account=account, executor=user, amount=10, description="quota")
+			Transaction.objects.create(type=Transaction.TransactionType.CAUZIONE, subscription=sub,
+									   account=account, executor=user, amount=5, description="cauzione")
+
+	def test_event_detail_roster_query_count_is_constant(self):
+		"""GET event detail should not issue per-subscription queries."""
+		profile = _create_profile("roster-viewer@esnpolimi.it")
+		user = _create_user(profile)
+		user.user_permissions.add(self.perm_view_event)
+		self.authenticate(user)
+		account = _create_account("Cassa Roster", user=user)
+
+		event = _create_event(name="Roster Event", cost=10, deposit=5)
+		list_main = _create_event_list(event)
+		self._create_roster(event, list_main, account, user, 0, 2)
+		self.client.get(f"/backend/event/{event.pk}/")  # warm up permission caches
+
+		with CaptureQueriesContext(connection) as small:
+			response = self.client.get(f"/backend/event/{event.pk}/")
+		self.assertEqual(response.status_code, 200)
+
+		self._create_roster(event, list_main, account, user, 2, 6)
+		with CaptureQueriesContext(connection) as large:
+			response = self.client.get(f"/backend/event/{event.pk}/")
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.data["subscriptions"]), 8)
+		self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+	def test_event_detail_roster_matches_per_row_serialization(self):
+		"""Roster mode output must be identical to the per-row SubscriptionSerializer output."""
+		profile = _create_profile("roster-viewer@esnpolimi.it")
+		user = _create_user(profile)
+		account = _create_account("Cassa Roster", user=user)
+
+		event = _create_event(name="Roster Event", cost=10, deposit=5,
+							  services=[{"id": "svc", "name": "Sci", "price": 20}])
+		list_main = _create_event_list(event)
+		self._create_roster(event, list_main, account, user, 0, 3)
+		reimbursed = Subscription.objects.filter(event=event).first()
+		reimbursed.selected_services = [{"service_id": "svc", "name": "Sci", "price_at_purchase": "20", "quantity": 1}]
+		reimbursed.save()
+		Transaction.objects.create(type=Transaction.TransactionType.RIMBORSO_QUOTA, subscription=reimbursed,
+								   account=account, executor=user, amount=-10, description="rimborso")
+		Subscription.objects.create(event=event, list=list_main, external_name="Esterno Roster")
+
+		subs = list(Subscription.objects.filter(event=event).select_related('event', 'list', 'profile'))
+		per_row = SubscriptionSerializer(subs, many=True).data
+		roster = SubscriptionSerializer(subs, many=True, context=build_subscription_roster_context(subs)).data
+
+		self.assertEqual(json.dumps(per_row, cls=DjangoJSONEncoder), json.dumps(roster, cls=DjangoJSONEncoder))
+
 
 class SubscriptionCreateTests(EventsBaseTestCase):
 	"""Tests for subscription creation endpoint."""
@@ -996,6 +1166,249 @@ class EventFormTests(EventsBaseTestCase):
 		self.assertEqual(response.status_code, 400)
 		self.assertIn("Form list", response.data["error"])
 
+	@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend", EVENT_FORM_JOBS_ASYNC=True)
+	@patch("events.views.create_sumup_checkout", return_value=("chk_async", None))
+	def test_event_form_submit_async_defers_checkout_and_email_to_worker(self, mock_checkout):
+		"""Async submit should only enqueue jobs; the worker creates the checkout, then sends the email."""
+		event = _create_event(enable_form=True, allow_online_payment=True, cost=10)
+		_create_event_list(event, name="Form List", is_main_list=False)
+		_create_event_list(event, name="Main List", capacity=10, is_main_list=True)
+		profile = _create_profile("async_submit@uni.it", is_esner=False)
+
+		response = self.client.post(f"/backend/event/{event.pk}/formsubmit/", {
+			"email": profile.email,
+			"form_data": {},
+		}, format="json")
+
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.data["checkout_pending"])
+		self.assertIsNone(response.data["checkout_id"])
+		mock_checkout.assert_not_called()
+		self.assertEqual(len(mail.outbox), 0)
+		sub = Subscription.objects.get(pk=response.data["subscription_id"])
+		self.assertEqual(
+			set(EventJob.objects.filter(subscription=sub).values_list("kind", "status")),
+			{(EventJob.Kind.FORM_CHECKOUT, EventJob.Status.QUEUED), (EventJob.Kind.FORM_EMAIL, EventJob.Status.QUEUED)}
+		)
+
+		call_command("run_event_jobs", "--once", stdout=StringIO())
+
+		sub.refresh_from_db()
+		self.assertEqual(sub.sumup_checkout_id, "chk_async")
+		self.assertEqual(len(mail.outbox), 1)
+		self.assertIn(f"subscriptionId={sub.pk}", mail.outbox[0].alternatives[0][0])
+		self.assertFalse(EventJob.objects.exclude(status=EventJob.Status.DONE).exists())
+
+	@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend", EVENT_FORM_JOBS_ASYNC=True)
+	@patch("events.views.create_sumup_checkout")
+	def test_event_form_jobs_retry_failed_checkout_before_sending_email(self, mock_checkout):
+		"""A failed checkout job is retried later and the email waits for it."""
+		mock_checkout.side_effect = [RuntimeError("SumUp down"), ("chk_retry", None)]
+		event = _create_event(enable_form=True, allow_online_payment=True, cost=10)
+		_create_event_list(event, name="Form List", is_main_list=False)
+		_create_event_list(event, name="Main List", capacity=10, is_main_list=True)
+		profile = _create_profile("retry_submit@uni.it", is_esner=False)
+
+		response = self.client.post(f"/backend/event/{event.pk}/formsubmit/", {
+			"email": profile.email,
+			"form_data": {},
+		}, format="json")
+		sub_id = response.data["subscription_id"]
+
+		run_pending_jobs()
+
+		checkout_job = EventJob.objects.get(subscription_id=sub_id, kind=EventJob.Kind.FORM_CHECKOUT)
+		self.assertEqual(checkout_job.status, EventJob.Status.QUEUED)
+		self.assertEqual(checkout_job.attempts, 1)
+		self.assertIn("SumUp down", checkout_job.last_error)
+		self.assertGreater(checkout_job.run_after, timezone.now())
+		self.assertEqual(len(mail.outbox), 0)
+
+		EventJob.objects.update(run_after=timezone.now())
+		run_pending_jobs()
+
+		self.assertEqual(Subscription.objects.get(pk=sub_id).sumup_checkout_id, "chk_retry")
+		self.assertEqual(len(mail.outbox), 1)
+		self.assertFalse(EventJob.objects.exclude(status=EventJob.Status.DONE).exists())
+
+	@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend", EVENT_FORM_JOBS_ASYNC=True)
+	@patch("events.views._upload_form_file_to_drive")
+	def test_event_form_submit_async_upload_fills_link_field(self, mock_upload):
+		"""Uploaded files are spooled to disk for a job and the Drive link is written to form_data by the worker."""
+		spool_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+		uploaded = {}
+
+		def fake_upload(file_obj, *args):
+			uploaded[file_obj.name] = file_obj.read()
+			return "https://drive.google.com/file/d/abc/view"
+
+		mock_upload.side_effect = fake_upload
+		event = _create_event(
+			enable_form=True,
+			fields=[{"name": "passport", "type": "l", "field_type": "form"}]
+		)
+		_create_event_list(event, name="Form List", is_main_list=False)
+		profile = _create_profile("upload_submit@uni.it", is_esner=False)
+
+		with override_settings(FORM_UPLOAD_SPOOL_DIR=spool_dir):
+			response = self.client.post(f"/backend/event/{event.pk}/formsubmit/", {
+				"email": profile.email,
+				"form_data": json.dumps({}),
+				"passport": SimpleUploadedFile("passport.pdf", b"%PDF-1.4 test", content_type="application/pdf"),
+			}, format="multipart")
+
+			self.assertEqual(response.status_code, 200)
+			mock_upload.assert_not_called()
+			job = EventJob.objects.get(kind=EventJob.Kind.FORM_UPLOAD)
+			self.assertEqual(os.listdir(spool_dir), [job.payload["spool_path"]])
+
+			run_pending_jobs()
+
+		sub = Subscription.objects.get(pk=response.data["subscription_id"])
+		self.assertEqual(sub.form_data["passport"], "https://drive.google.com/file/d/abc/view")
+		self.assertEqual(uploaded, {"passport.pdf": b"%PDF-1.4 test"})
+		job.refresh_from_db()
+		self.assertEqual(job.status, EventJob.Status.DONE)
+		self.assertEqual(os.listdir(spool_dir), [])
+
+	@override_settings(EVENT_FORM_JOBS_ASYNC=True)
+	def test_event_form_submit_rejected_leaves_no_spooled_upload(self):
+		"""A submission rejected by validation should not leave its uploaded files in the spool directory."""
+		spool_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+		event = _create_event(
+			enable_form=True,
+			fields=[
+				{"name": "passport", "type": "l", "field_type": "form"},
+				{"name": "sport", "type": "s", "field_type": "form", "choices": ["Ski", "Snowboard"]},
+			]
+		)
+		_create_event_list(event, name="Form List", is_main_list=False)
+		profile = _create_profile("rejected_upload@uni.it", is_esner=False)
+
+		with override_settings(FORM_UPLOAD_SPOOL_DIR=spool_dir):
+			response = self.client.post(f"/backend/event/{event.pk}/formsubmit/", {
+				"email": profile.email,
+				"form_data": json.dumps({"sport": "Sled"}),
+				"passport": SimpleUploadedFile("passport.pdf", b"%PDF-1.4 test", content_type="application/pdf"),
+			}, format="multipart")
+
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(os.listdir(spool_dir), [])
+		self.assertFalse(EventJob.objects.exists())
+
+	@patch("events.views._upload_form_file_to_drive")
+	def test_event_form_submit_uploads_link_fields_in_parallel(self, mock_upload):
+		"""Files of several link fields are uploaded concurrently and every link lands in form_data."""
+		both_started = threading.Barrier(2, timeout=5)
+
+		def fake_upload(file_obj, event_id, field_name, *args):
+			both_started.wait()  # raises BrokenBarrierError if the uploads ran one after the other
+			return f"https://drive.google.com/file/d/{field_name}/view"
+
+		mock_upload.side_effect = fake_upload
+		event = _create_event(
+			enable_form=True,
+			fields=[
+				{"name": "passport", "type": "l", "field_type": "form"},
+				{"name": "insurance", "type": "l", "field_type": "form"},
+			]
+		)
+		_create_event_list(event, name="Form List", is_main_list=False)
+		profile = _create_profile("parallel_upload@uni.it", is_esner=False)
+
+		response = self.client.post(f"/backend/event/{event.pk}/formsubmit/", {
+			"email": profile.email,
+			"form_data": json.dumps({}),
+			"passport": SimpleUploadedFile("passport.pdf", b"%PDF-1.4 a", content_type="application/pdf"),
+			"insurance": SimpleUploadedFile("insurance.pdf", b"%PDF-1.4 b", content_type="application/pdf"),
+		}, format="multipart")
+
+		self.assertEqual(response.status_code, 200)
+		sub = Subscription.objects.get(pk=response.data["subscription_id"])
+		self.assertEqual(sub.form_data["passport"], "https://drive.google.com/file/d/passport/view")
+		self.assertEqual(sub.form_data["insurance"], "https://drive.google.com/file/d/insurance/view")
+
+	def test_enqueue_job_is_idempotent(self):
+		"""Enqueueing twice with the same key returns the existing job."""
+		event = _create_event()
+		sub = Subscription.objects.create(
+			profile=_create_profile("idem_job@uni.it"), event=event, list=_create_event_list(event)
+		)
+
+		first = enqueue_job(EventJob.Kind.FORM_EMAIL, f"form_email:{sub.pk}", subscription=sub)
+		second = enqueue_job(EventJob.Kind.FORM_EMAIL, f"form_email:{sub.pk}", subscription=sub)
+
+		self.assertEqual(first.pk, second.pk)
+		self.assertEqual(EventJob.objects.count(), 1)
+
+	def test_inline_job_audit_diffs_against_the_claimed_state(self):
+		"""run_jobs_inline claims with update() and refreshes: the audit logs running -> done, not queued -> done."""
+		event = _create_event()
+		sub = Subscription.objects.create(
+			profile=_create_profile("audit_job@uni.it"), event=event, list=_create_event_list(event)
+		)
+		job = enqueue_job(EventJob.Kind.FORM_EMAIL, f"form_email:{sub.pk}", subscription=sub)
+
+		with patch.dict("events.jobs._JOB_HANDLERS", {EventJob.Kind.FORM_EMAIL: lambda job: None}), \
+				patch("backend.db_audit._write_event") as write_event:
+			run_jobs_inline([job])
+
+		job_events = [call.args[0] for call in write_event.call_args_list if call.args[0]["model"] == "events.EventJob"]
+		self.assertEqual(job_events[-1]["changes"]["status"], {"old": "running", "new": "done"})
+
+	def test_claim_next_job_respects_leases_and_backoff(self):
+		"""Live leases are not stolen, expired leases are reclaimed and retries back off exponentially."""
+		event = _create_event()
+		sub = Subscription.objects.create(
+			profile=_create_profile("lease_job@uni.it"), event=event, list=_create_event_list(event)
+		)
+		job = enqueue_job(EventJob.Kind.CHECKOUT_BACKFILL, f"checkout_backfill:{sub.pk}", subscription=sub)
+
+		claimed = claim_next_job()
+		self.assertEqual(claimed.pk, job.pk)
+		self.assertEqual(claimed.status, EventJob.Status.RUNNING)
+		self.assertIsNone(claim_next_job())
+
+		# The worker died: once the lease expires another worker takes the job over
+		EventJob.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+		reclaimed = claim_next_job()
+		self.assertEqual(reclaimed.pk, job.pk)
+		self.assertEqual(reclaimed.attempts, 2)
+
+		self.assertEqual(retry_delay(1), timedelta(seconds=30))
+		self.assertEqual(retry_delay(3), timedelta(minutes=2))
+		self.assertEqual(retry_delay(20), timedelta(hours=1))
+
+	def test_event_jobs_backlog_is_board_only(self):
+		"""The job backlog endpoint reports counts per status/kind to Board members only."""
+		event = _create_event()
+		sub = Subscription.objects.create(
+			profile=_create_profile("backlog_job@uni.it"), event=event, list=_create_event_list(event)
+		)
+		enqueue_job(EventJob.Kind.CHECKOUT_BACKFILL, f"checkout_backfill:{sub.pk}", subscription=sub)
+		failed = enqueue_job(EventJob.Kind.FORM_EMAIL, f"form_email:{sub.pk}", subscription=sub)
+		EventJob.objects.filter(pk=failed.pk).update(status=EventJob.Status.FAILED, last_error="SMTP down")
+
+		member = _create_user(_create_profile("backlog_member@esnpolimi.it"))
+		self.authenticate(member)
+		self.assertEqual(self.client.get("/backend/event-jobs/").status_code, 403)
+
+		board = _create_user(_create_profile("backlog_board@esnpolimi.it"))
+		board.groups.add(self.group_board)
+		self.authenticate(board)
+		response = self.client.get(f"/backend/event-jobs/?event={event.pk}")
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data["by_status"]["queued"], 1)
+		self.assertEqual(response.data["by_status"]["failed"], 1)
+		self.assertEqual(response.data["by_kind"]["checkout_backfill"]["queued"], 1)
+		self.assertEqual(response.data["failed"][0]["last_error"], "SMTP down")
+		self.assertIsNotNone(response.data["oldest_due_at"])
+
+		self.assertEqual(self.client.get("/backend/event-jobs/?event=abc").status_code, 400)
+
 
 class PaymentStatusTests(EventsBaseTestCase):
 	"""Tests for subscription payment status endpoint."""
@@ -1034,13 +1447,11 @@ class PaymentStatusTests(EventsBaseTestCase):
 class SumUpWebhookTests(EventsBaseTestCase):
 	"""Tests for SumUp webhook endpoint (mocked)."""
 
-	@patch("events.views.requests.get")
-	@patch("events.views.get_sumup_access_token")
-	def test_sumup_webhook_marks_paid(self, mock_token, mock_get):
+	def test_sumup_webhook_marks_paid(self):
 		"""Webhook should mark paid and create transactions when SumUp reports success."""
-		mock_token.return_value = "token"
-		mock_get.return_value.status_code = 200
-		mock_get.return_value.json.return_value = {
+		server = self.start_fake_sumup()
+		server.checkouts["chk_1"] = {
+			"id": "chk_1",
 			"status": "PAID",
 			"transactions": [{"status": "SUCCESSFUL", "id": "tx_1"}],
 		}
@@ -1593,13 +2004,11 @@ class SumUpWebhookEdgeCaseTests(EventsBaseTestCase):
 		self.assertEqual(response.status_code, 200)
 		self.assertEqual(response.data["status"], "ignored")
 
-	@patch("events.views.requests.get")
-	@patch("events.views.get_sumup_access_token")
-	def test_sumup_webhook_failed_marks_subscription(self, mock_token, mock_get):
+	def test_sumup_webhook_failed_marks_subscription(self):
 		"""Failed webhook should set payment_failed flag."""
-		mock_token.return_value = "token"
-		mock_get.return_value.status_code = 200
-		mock_get.return_value.json.return_value = {
+		server = self.start_fake_sumup()
+		server.checkouts["chk_2"] = {
+			"id": "chk_2",
 			"status": "FAILED",
 			"transactions": [],
 		}
@@ -1620,6 +2029,106 @@ class SumUpWebhookEdgeCaseTests(EventsBaseTestCase):
 		self.assertTrue(sub.additional_data.get("payment_failed"))
 
 
+class SumUpClientTests(EventsBaseTestCase):
+	"""Tests for the pooled SumUp client against the local fake server."""
+
+	def setUp(self):
+		self.server = self.start_fake_sumup()
+
+	def test_client_reuses_token_and_connection(self):
+		"""Consecutive calls should share one cached token and one keep-alive connection."""
+		client = get_sumup_client()
+		for i in range(5):
+			client.create_checkout({"checkout_reference": f"ref_{i}", "amount": 10.0, "currency": "EUR"})
+
+		self.assertEqual(self.server.token_requests, 1)
+		self.assertEqual(self.server.connections, 1)
+		self.assertEqual(len(self.server.checkouts), 5)
+
+	def test_token_refresh_is_single_flight(self):
+		"""Concurrent callers (threads or processes sharing the cache) should trigger a single token refresh."""
+		clients = [get_sumup_client(), SumUpClient(self.server.url, "dummy", "dummy")]
+		tokens = []
+
+		def _fetch(client):
+			tokens.append(client.access_token())
+
+		threads = [threading.Thread(target=_fetch, args=(clients[i % 2],)) for i in range(8)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(self.server.token_requests, 1)
+		self.assertEqual(len(set(tokens)), 1)
+
+	def test_revoked_token_is_refreshed_once(self):
+		"""A 401 should drop the cached token and repeat the request with a new one."""
+		client = get_sumup_client()
+		checkout = client.create_checkout({"checkout_reference": "ref_401", "amount": 5.0, "currency": "EUR"})
+		self.server.revoke_tokens()
+
+		response = client.get_checkout(checkout["id"])
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(self.server.token_requests, 2)
+
+	def test_only_get_requests_are_retried(self):
+		"""GET is retried on 503; POST and PUT surface the error to avoid duplicate checkouts and charges."""
+		client = get_sumup_client()
+		checkout = client.create_checkout({"checkout_reference": "ref_retry", "amount": 5.0, "currency": "EUR"})
+
+		self.server.fail_next(503, count=2, path_prefix=f"/v0.1/checkouts/{checkout['id']}")
+		self.assertEqual(client.get_checkout(checkout["id"]).status_code, 200)
+
+		self.server.fail_next(503, path_prefix="/v0.1/checkouts")
+		with self.assertRaises(SumUpError):
+			client.create_checkout({"checkout_reference": "ref_retry_2", "amount": 5.0, "currency": "EUR"})
+		self.assertEqual(self.server.requests[("POST", "/v0.1/checkouts")], 2)
+
+		path = f"/v0.1/checkouts/{checkout['id']}"
+		self.server.fail_next(503, path_prefix=path, method="PUT")
+		response = client.process_checkout(checkout["id"], {"payment_type": "card", "card": {"token": "tok"}})
+		self.assertEqual(response.status_code, 503)
+		self.assertEqual(self.server.requests[("PUT", path)], 1)
+
+	def test_lost_process_response_is_reconciled_without_charging_again(self):
+		"""A 5xx after the charge went through should be resolved by reading the checkout, not resending the PUT."""
+		profile = _create_profile("lost_put_payer@uni.it", is_esner=False)
+		_create_account("SumUp", user=_create_user(profile))
+		event = _create_event(cost=10)
+		sub = Subscription.objects.create(profile=profile, event=event, list=_create_event_list(event))
+		checkout_id, _ = create_sumup_checkout(sub, 10)
+		sub.sumup_checkout_id = checkout_id
+		sub.save(update_fields=["sumup_checkout_id"])
+		self.server.fail_next(502, path_prefix=f"/v0.1/checkouts/{checkout_id}", method="PUT", after_processing=True)
+
+		status_flag, _ = _process_sumup_checkout(sub, "card_tok")
+
+		self.assertEqual(status_flag, "PAID")
+		self.assertEqual(self.server.requests[("PUT", f"/v0.1/checkouts/{checkout_id}")], 1)
+		sub.refresh_from_db()
+		self.assertTrue(sub.sumup_transaction_id.startswith("tx_"))
+
+	def test_checkout_flow_against_fake_server(self):
+		"""create_sumup_checkout and _process_sumup_checkout should complete a payment end to end."""
+		profile = _create_profile("fake_sumup_payer@uni.it", is_esner=False)
+		_create_account("SumUp", user=_create_user(profile))
+		event = _create_event(cost=10)
+		sub = Subscription.objects.create(profile=profile, event=event, list=_create_event_list(event))
+
+		checkout_id, _ = create_sumup_checkout(sub, 10)
+		sub.sumup_checkout_id = checkout_id
+		sub.save(update_fields=["sumup_checkout_id"])
+		self.assertEqual(self.server.checkouts[checkout_id]["checkout_reference"], str(sub.pk))
+
+		status_flag, _ = _process_sumup_checkout(sub, "card_tok")
+
+		self.assertEqual(status_flag, "PAID")
+		sub.refresh_from_db()
+		self.assertTrue(sub.sumup_transaction_id.startswith("tx_"))
+
+
 class SubscriptionProcessPaymentTests(EventsBaseTestCase):
 	"""Tests for subscription process payment endpoint."""
 
@@ -1708,6 +2217,68 @@ class EventModelTests(EventsBaseTestCase):
 
 		self.assertIn("VIP List", str(event_list))
 
+	def test_event_list_counter_tracks_create_move_delete(self):
+		"""subscription_counter follows subscriptions being created, moved and deleted."""
+		event = _create_event()
+		main_list = _create_event_list(event)
+		waiting_list = _create_event_list(event, name="Waiting List", is_main_list=False, is_waiting_list=True)
+
+		sub1 = Subscription.objects.create(profile=_create_profile("cnt1@uni.it", is_esner=False), event=event, list=main_list)
+		sub2 = Subscription.objects.create(profile=_create_profile("cnt2@uni.it", is_esner=False), event=event, list=main_list)
+		main_list.refresh_from_db()
+		self.assertEqual(main_list.subscription_count, 2)
+
+		moved = Subscription.objects.get(pk=sub1.pk)
+		moved.list = waiting_list
+		moved.save(update_fields=["list"])
+		main_list.refresh_from_db()
+		waiting_list.refresh_from_db()
+		self.assertEqual((main_list.subscription_count, waiting_list.subscription_count), (1, 1))
+
+		moved.notes = "no list change"
+		moved.save()
+		waiting_list.refresh_from_db()
+		self.assertEqual(waiting_list.subscription_count, 1)
+
+		sub2.delete()
+		Subscription.objects.filter(pk=sub1.pk).delete()
+		main_list.refresh_from_db()
+		waiting_list.refresh_from_db()
+		self.assertEqual((main_list.subscription_count, waiting_list.subscription_count), (0, 0))
+
+	def test_reconcile_list_counters_repairs_drift(self):
+		"""The reconcile command resets counters to the actual number of subscriptions."""
+		event = _create_event()
+		main_list = _create_event_list(event)
+		Subscription.objects.create(profile=_create_profile("drift@uni.it", is_esner=False), event=event, list=main_list)
+		EventList.objects.filter(pk=main_list.pk).update(subscription_counter=7)
+
+		call_command("reconcile_list_counters", "--dry-run", stdout=StringIO())
+		main_list.refresh_from_db()
+		self.assertEqual(main_list.subscription_counter, 7)
+
+		call_command("reconcile_list_counters", stdout=StringIO())
+		main_list.refresh_from_db()
+		self.assertEqual(main_list.subscription_counter, 1)
+
+	def test_event_status_annotation_matches_property(self):
+		"""EventQuerySet.with_status should agree with Event.status for every date combination."""
+		now = timezone.now()
+		past, future = now - timedelta(days=2), now + timedelta(days=2)
+		combos = [
+			(past, future), (future, future + timedelta(days=1)), (past - timedelta(days=1), past),
+			(past, None), (future, None), (None, future), (None, past), (None, None),
+		]
+		for idx, (start, end) in enumerate(combos):
+			_create_event(name=f"Status Event {idx}", subscription_start_date=start, subscription_end_date=end)
+
+		for event in Event.objects.with_status():
+			self.assertEqual(event.computed_status, event.status, event.name)
+		self.assertEqual(
+			set(Event.objects.filter_status({"open"}).values_list("name", flat=True)),
+			{e.name for e in Event.objects.all() if e.status == "open"},
+		)
+
 
 class SubscriptionEdgeCaseTests(EventsBaseTestCase):
 	"""Edge case tests for subscriptions."""
@@ -2272,7 +2843,7 @@ class GenerateLiberatoriePdfTests(EventsBaseTestCase):
 		response = self._post(self.event.pk, [999999])
 		self.assertEqual(response.status_code, 403)
 
-	@patch("events.views.SimpleDocTemplate")
+	@patch("events.liberatorie.SimpleDocTemplate")
 	def test_allows_lead_organizer(self, mock_doc):
 		"""Lead organizer can access the endpoint and generate a PDF (not blocked by 403)."""
 		mock_doc.return_value.build = lambda story: None
@@ -2311,7 +2882,7 @@ class GenerateLiberatoriePdfTests(EventsBaseTestCase):
 
 		self.assertEqual(response.status_code, 400)
 
-	@patch("events.views.SimpleDocTemplate")
+	@patch("events.liberatorie.SimpleDocTemplate")
 	def test_generates_pdf_for_regular_subscription(self, mock_doc):
 		"""PDF generation succeeds for a subscription linked to a Profile."""
 		mock_doc.return_value.build = lambda story: None
@@ -2329,7 +2900,7 @@ class GenerateLiberatoriePdfTests(EventsBaseTestCase):
 		self.assertEqual(response.status_code, 200)
 		self.assertEqual(response["Content-Type"], "application/pdf")
 
-	@patch("events.views.SimpleDocTemplate")
+	@patch("events.liberatorie.SimpleDocTemplate")
 	def test_generates_pdf_for_external_subscription_no_crash(self, mock_doc):
 		"""PDF generation must not raise AttributeError when profile is None (external subscription)."""
 		mock_doc.return_value.build = lambda story: None
@@ -2351,7 +2922,7 @@ class GenerateLiberatoriePdfTests(EventsBaseTestCase):
 		self.assertEqual(response.status_code, 200)
 		self.assertEqual(response["Content-Type"], "application/pdf")
 
-	@patch("events.views.SimpleDocTemplate")
+	@patch("events.liberatorie.SimpleDocTemplate")
 	def test_external_subscription_external_name_fallback(self, mock_doc):
 		"""When external_first/last_name are blank, external_name is split as first/last."""
 		mock_doc.return_value.build = lambda story: None
@@ -2368,7 +2939,7 @@ class GenerateLiberatoriePdfTests(EventsBaseTestCase):
 
 		self.assertEqual(response.status_code, 200)
 
-	@patch("events.views.SimpleDocTemplate")
+	@patch("events.liberatorie.SimpleDocTemplate")
 	def test_generates_pdf_for_mixed_subscriptions(self, mock_doc):
 		"""PDF generation works when subscription list mixes regular and external entries."""
 		mock_doc.return_value.build = lambda story: None
@@ -2393,6 +2964,57 @@ class GenerateLiberatoriePdfTests(EventsBaseTestCase):
 		self.assertEqual(response.status_code, 200)
 		self.assertEqual(response["Content-Type"], "application/pdf")
 
+	def test_large_selection_is_rendered_by_a_job(self):
+		"""Above LIBERATORIE_SYNC_MAX the PDF is rendered by a job, followed on the status endpoint and downloaded."""
+		self.authenticate(self.board_user)
+		subs = [
+			Subscription.objects.create(
+				profile=_create_profile(f"lib_job_{i}@test.com", name=f"Nome{i}", surname="Job"),
+				event=self.event,
+				list=self.event_list,
+			)
+			for i in range(2)
+		]
+		artifacts = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, artifacts, ignore_errors=True)
+
+		with override_settings(LIBERATORIE_SYNC_MAX=1, LIBERATORIE_DIR=artifacts):
+			response = self._post(self.event.pk, [sub.pk for sub in subs])
+			self.assertEqual(response.status_code, 202)
+			self.assertEqual(response.data["status"], EventJob.Status.DONE)
+			self.assertEqual((response.data["done"], response.data["total"]), (2, 2))
+
+			status_response = self.client.get(f"/backend/liberatorie-jobs/{response.data['job_id']}/")
+			self.assertEqual(status_response.status_code, 200)
+			download_path = status_response.data["download_path"]
+
+			download = self.client.get(f"/backend{download_path}")
+			self.assertEqual(download.status_code, 200)
+			self.assertEqual(download["Content-Type"], "application/pdf")
+			self.assertIn("ESNPolimi_Liberatoria_Test Trip.pdf", download["Content-Disposition"])
+			self.assertTrue(b"".join(download.streaming_content).startswith(b"%PDF"))
+
+		# Other users cannot follow the job
+		other = _create_user(_create_profile("lib_job_other@test.com"))
+		self.authenticate(other)
+		self.assertEqual(self.client.get(f"/backend/liberatorie-jobs/{response.data['job_id']}/").status_code, 403)
+
+	def test_liberatoria_rows_use_one_query(self):
+		"""Participant data is loaded with a single query, external subscriptions included."""
+		for i in range(3):
+			Subscription.objects.create(
+				profile=_create_profile(f"lib_rows_{i}@test.com"),
+				event=self.event,
+				list=self.event_list,
+			)
+		Subscription.objects.create(profile=None, event=self.event, list=self.event_list, external_name="Carlo Bianchi")
+
+		with self.assertNumQueries(1):
+			rows = liberatoria_rows(Subscription.objects.filter(event=self.event).order_by("pk"))
+
+		self.assertEqual(len(rows), 4)
+		self.assertEqual((rows[-1]["name"], rows[-1]["surname"]), ("Carlo", "Bianchi"))
+
 
 class PrintableLiberatorieTests(EventsBaseTestCase):
 	"""Tests for the printable_liberatorie endpoint."""
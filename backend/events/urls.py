@@ -27,6 +27,10 @@ urlpatterns = [
     # Endpoint to generate liberatorie PDF
     path('generate_liberatorie_pdf/', views.generate_liberatorie_pdf),
 
+    # Endpoints to follow and download a liberatorie PDF rendered in the background
+    path('liberatorie-jobs/<int:job_id>/', views.liberatorie_job_status),
+    path('liberatorie-jobs/<int:job_id>/download/', views.liberatorie_job_download),
+
     # Public endpoint to retrieve event form configuration
     path('event/<str:event_id>/form/', views.event_form_view),
 
@@ -55,4 +59,7 @@ urlpatterns = [
     # Endpoint to get events available for sharing lists
     path('available-for-sharing/', views.available_events_for_sharing),
 
+    # Endpoint to monitor the background job queue (Board only)
+    path('event-jobs/', views.event_jobs_backlog),
+
 ]
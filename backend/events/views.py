@@ -1,27 +1,23 @@
-import concurrent.futures
 import logging
+import tempfile
 import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
 from decimal import Decimal
-from io import BytesIO
 
 import requests
 import sentry_sdk
-from babel.dates import format_date
 from django.conf import settings
 from django.core.exceptions import ValidationError, PermissionDenied, ObjectDoesNotExist
 from django.core.mail import send_mail
 from django.core.validators import validate_email
-from django.db import close_old_connections, transaction
-from django.db.models import Q, Count
-from django.http import HttpResponse
+from django.db import connections, transaction
+from django.db.models import Q, Count, Prefetch
+from django.http import FileResponse
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak
 from rest_framework.decorators import api_view, permission_classes
 
 PERM_VIEW_EVENT = 'events.view_event'
@@ -30,18 +26,19 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 import os
-from googleapiclient.http import MediaIoBaseUpload
-from utils.google_drive import get_drive_service, find_or_create_folder
+from utils.google_drive import upload_to_folder_path
 import json
 
-from events.models import Event, Subscription, EventOrganizer
+from events.jobs import enqueue_job, run_jobs_inline, job_backlog, spooled_form_uploads
+from events.liberatorie import artifact_path, download_filename, liberatoria_rows, render_liberatorie
+from events.models import Event, Subscription, EventOrganizer, EventJob
 from events.models import EventList, validate_field_data
 from events.serializers import (
     EventsListSerializer, EventCreationSerializer,
     SubscriptionCreateSerializer, SubscriptionUpdateSerializer,
-    EventWithSubscriptionsSerializer, SubscriptionSerializer, PrintableLiberatoriaSerializer,
-    LiberatoriaProfileSerializer
+    EventWithSubscriptionsSerializer, SubscriptionSerializer, PrintableLiberatoriaSerializer
 )
+from events.sumup import get_sumup_client
 from profiles.models import Profile
 from treasury.models import Transaction, Account
 
@@ -77,50 +74,61 @@ def _validate_form_upload(file_obj):
     return True
 
 
-def _get_or_create_event_folder(service, parent_folder_id, event_name, event_id, event_date=None):
-    current_year = datetime.now().year
-    year_folder_id = find_or_create_folder(service, str(current_year), parent_folder_id)
-    viaggi_folder_id = find_or_create_folder(service, "Viaggi", year_folder_id)
+def _event_folder_path(event_name, event_id, event_date=None):
+    """{Year}/Viaggi/{event} folder names of an event's form uploads."""
     safe_event_name = "".join(c for c in event_name if c.isalnum() or c in (' ', '-', '_'))[:100]
     if event_date:
         folder_name = f"{safe_event_name} ({event_date.strftime('%Y-%m-%d')})"
     else:
         folder_name = f"{safe_event_name} (ID_{event_id})"
-    return find_or_create_folder(service, folder_name, viaggi_folder_id)
+    return [str(datetime.now().year), "Viaggi", folder_name]
 
 
 def _upload_form_file_to_drive(file_obj, event_id, _field_name, event_name=None, event_date=None):
     """
     Uploads file for form 'l' field to Drive and returns public link.
-    Creates a dedicated folder for the event if event_name is provided.
+    Creates a dedicated folder for the event if event_name is provided
+    (folder ids are cached, see utils/google_drive.py).
     """
-    GOOGLE_DRIVE_FOLDER_ID = settings.GOOGLE_DRIVE_FOLDER_ID
-    service = get_drive_service()
-    
-    # Get or create event-specific folder
-    if event_name:
-        target_folder_id = _get_or_create_event_folder(service, GOOGLE_DRIVE_FOLDER_ID, event_name, event_id, event_date)
-    else:
-        target_folder_id = GOOGLE_DRIVE_FOLDER_ID
-    
-    file_obj.seek(0)
-    mimetype = getattr(file_obj, 'content_type', 'application/octet-stream')
+    folder_path = _event_folder_path(event_name, event_id, event_date) if event_name else []
     # Use original filename
-    filename = file_obj.name
-    media = MediaIoBaseUpload(file_obj, mimetype=mimetype)
-    metadata = {'name': filename, 'parents': [target_folder_id]}
-    created = service.files().create(
-        body=metadata,
-        media_body=media,
-        fields='id',
-        supportsAllDrives=True
-    ).execute()
-    service.permissions().create(
-        fileId=created['id'],
-        body={'role': 'reader', 'type': 'anyone'},
-        supportsAllDrives=True
-    ).execute()
-    return f"https://drive.google.com/file/d/{created['id']}/view?usp=sharing"
+    return upload_to_folder_path(
+        file_obj,
+        file_obj.name,
+        getattr(file_obj, 'content_type', 'application/octet-stream'),
+        settings.GOOGLE_DRIVE_FOLDER_ID,
+        *folder_path,
+    )
+
+
+def _upload_form_files_to_drive(uploads, event):
+    """
+    Upload the files of several link fields ({field name: file}) in parallel (FORM_UPLOAD_WORKERS
+    threads, default 4); returns ({field name: link}, {field name: exception}).
+    """
+    def upload(fname, file_obj):
+        try:
+            return _upload_form_file_to_drive(file_obj, event.id, fname, event.name, event.date)
+        finally:
+            connections.close_all()  # connections opened by this thread (e.g. database cache)
+
+    if len(uploads) == 1:
+        [(fname, file_obj)] = uploads.items()
+        try:
+            return {fname: _upload_form_file_to_drive(file_obj, event.id, fname, event.name, event.date)}, {}
+        except Exception as exc:
+            return {}, {fname: exc}
+
+    links, failures = {}, {}
+    max_workers = min(len(uploads), getattr(settings, 'FORM_UPLOAD_WORKERS', 4))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {fname: executor.submit(upload, fname, file_obj) for fname, file_obj in uploads.items()}
+        for fname, future in futures.items():
+            try:
+                links[fname] = future.result()
+            except Exception as exc:
+                failures[fname] = exc
+    return links, failures
 
 
 # Merge phone/whatsapp prefixes into numbers in any dict/list payload
@@ -536,97 +544,77 @@ def _send_online_payment_link_email(subscription):
 
 
 def process_subscription_checkout(subscription_id, event_id):
-    """Background task: create a SumUp checkout and send the payment-link email for one subscription."""
-    subscription_for_email = None
-    try:
-        with transaction.atomic():
-            # select_for_update() acquires a row-level lock so that concurrent
-            # workers cannot both pass the sumup_checkout_id is None guard and
-            # each create their own checkout for the same subscription.
-            subscription = (
-                Subscription.objects
-                .select_for_update()
-                .select_related('event', 'profile', 'list')
-                .get(pk=subscription_id)
-            )
-
-            # Idempotency guard: another worker may have already created the
-            # checkout while this one was waiting for the lock.
-            if subscription.sumup_checkout_id is not None:
-                logger.info(
-                    f"process_subscription_checkout: checkout already exists for sub {subscription_id} "
-                    f"in event {event_id}, skipping"
-                )
-                return
-
-            # Already-paid guard: do not create a new checkout if the
-            # subscription has already been paid (a successful SumUp
-            # transaction was recorded).
-            if subscription.sumup_transaction_id is not None:
-                logger.info(
-                    f"process_subscription_checkout: subscription {subscription_id} "
-                    f"in event {event_id} is already paid, skipping"
-                )
-                return
+    """
+    Create a SumUp checkout and send the payment-link email for one subscription.
+    Runs as a CHECKOUT_BACKFILL EventJob: errors propagate so the job queue retries them.
+    """
+    with transaction.atomic():
+        # select_for_update() acquires a row-level lock so that concurrent
+        # workers cannot both pass the sumup_checkout_id is None guard and
+        # each create their own checkout for the same subscription.
+        subscription = (
+            Subscription.objects
+            .select_for_update()
+            .select_related('event', 'profile', 'list')
+            .get(pk=subscription_id)
+        )
 
-            event = subscription.event
-            total_cost = (
-                Decimal(event.cost or 0)
-                + Decimal(event.deposit or 0)
-                + _services_total(subscription.selected_services or [])
+        # Idempotency guard: another worker may have already created the
+        # checkout while this one was waiting for the lock.
+        if subscription.sumup_checkout_id is not None:
+            logger.info(
+                f"process_subscription_checkout: checkout already exists for sub {subscription_id} "
+                f"in event {event_id}, skipping"
             )
-            checkout_id, _ = create_sumup_checkout(subscription, total_cost, currency="EUR")
-            subscription.sumup_checkout_id = checkout_id
-
-            additional_data = subscription.additional_data or {}
-            if additional_data.get('payment_failed'):
-                additional_data.pop('payment_failed', None)
-                subscription.additional_data = additional_data
-                subscription.save(update_fields=['sumup_checkout_id', 'additional_data'])
-            else:
-                subscription.save(update_fields=['sumup_checkout_id'])
-
-            # Capture the object to use after the transaction commits; email is
-            # sent outside the atomic block to avoid holding the DB lock during
-            # network I/O.
-            subscription_for_email = subscription
-
-        # Transaction has committed – safe to do network I/O now.
-        _send_online_payment_link_email(subscription_for_email)
-        logger.info(
-            f"process_subscription_checkout: checkout created for sub {subscription_id} "
-            f"in event {event_id}"
-        )
-    except Exception as e:
-        logger.error(
-            f"process_subscription_checkout: failed for sub {subscription_id} "
-            f"in event {event_id}: {e}"
-        )
-        sentry_sdk.capture_exception(e)
-    finally:
-        # Manually spawned threads are not managed by Django's request/response
-        # cycle, so DB connections must be explicitly released to avoid leaks.
-        close_old_connections()
+            return
 
+        # Already-paid guard: do not create a new checkout if the
+        # subscription has already been paid (a successful SumUp
+        # transaction was recorded).
+        if subscription.sumup_transaction_id is not None:
+            logger.info(
+                f"process_subscription_checkout: subscription {subscription_id} "
+                f"in event {event_id} is already paid, skipping"
+            )
+            return
 
-# Maximum number of worker threads used by _backfill_online_checkouts_for_event
-# when CHECKOUT_BACKFILL_ASYNC is True.  Keep this small to avoid exhausting
-# the DB connection pool or the OS thread limit.
-MAX_CHECKOUT_BACKFILL_WORKERS = 4
+        event = subscription.event
+        total_cost = (
+            Decimal(event.cost or 0)
+            + Decimal(event.deposit or 0)
+            + _services_total(subscription.selected_services or [])
+        )
+        checkout_id, _ = create_sumup_checkout(subscription, total_cost, currency="EUR")
+        subscription.sumup_checkout_id = checkout_id
+
+        additional_data = subscription.additional_data or {}
+        if additional_data.get('payment_failed'):
+            additional_data.pop('payment_failed', None)
+            subscription.additional_data = additional_data
+            subscription.save(update_fields=['sumup_checkout_id', 'additional_data'])
+        else:
+            subscription.save(update_fields=['sumup_checkout_id'])
+
+    # Transaction has committed – safe to do network I/O now; the email is
+    # sent outside the atomic block to avoid holding the DB lock.
+    _send_online_payment_link_email(subscription)
+    logger.info(
+        f"process_subscription_checkout: checkout created for sub {subscription_id} "
+        f"in event {event_id}"
+    )
 
 
 def _backfill_online_checkouts_for_event(event):
-    """Submit checkout creation for each eligible subscription.
+    """Queue checkout creation for each eligible subscription.
 
-    When ``settings.CHECKOUT_BACKFILL_ASYNC`` is ``True`` (the default) tasks
-    are submitted to a bounded ``ThreadPoolExecutor`` and the function returns
-    immediately without waiting for them to finish.  The executor is shut down
-    with ``wait=False`` so that already-submitted tasks still run to completion but no
-    new work is accepted after this call.
+    One CHECKOUT_BACKFILL EventJob is enqueued per subscription (keyed on the
+    subscription, so toggling online payment again re-queues finished jobs
+    instead of duplicating them) and run by the run_event_jobs worker, which
+    leases, retries with backoff and records failures.
 
-    When ``CHECKOUT_BACKFILL_ASYNC`` is ``False`` the function runs each task
-    in-process (useful for tests and one-off admin operations) and blocks until
-    all are finished.
+    When ``settings.CHECKOUT_BACKFILL_ASYNC`` is ``False`` the jobs are run
+    in-process (useful for tests and one-off admin operations); failures are
+    left queued for the worker.
     """
     queued = 0
     skipped = 0
@@ -653,10 +641,7 @@ def _backfill_online_checkouts_for_event(event):
     ).values_list('subscription_id', 'type'):
         paid_types_by_sub.setdefault(sub_id, set()).add(txn_type)
 
-    # Collect eligible (subscription_pk, event_pk) pairs in a single pass so
-    # that submission to the executor (or direct execution) is decoupled from
-    # the filtering logic.
-    eligible: list[tuple[int, int]] = []
+    eligible = []
     for subscription in subscriptions:
         services_total = _services_total(subscription.selected_services or [])
         total_cost = event_cost + event_deposit + services_total
@@ -678,31 +663,25 @@ def _backfill_online_checkouts_for_event(event):
             skipped += 1
             continue
 
-        eligible.append((subscription.pk, event.pk))
+        eligible.append(subscription)
         queued += 1
 
     if not eligible:
         return {'queued': queued, 'skipped': skipped}
 
-    use_async = getattr(settings, 'CHECKOUT_BACKFILL_ASYNC', True)
-    if use_async:
-        # Create a *single* executor for this backfill run so the total number
-        # of worker threads is bounded by MAX_CHECKOUT_BACKFILL_WORKERS,
-        # regardless of how many eligible subscriptions were found.
-        executor = concurrent.futures.ThreadPoolExecutor(
-            max_workers=MAX_CHECKOUT_BACKFILL_WORKERS,
-            thread_name_prefix='checkout_backfill',
-        )
-        try:
-            for sub_pk, evt_pk in eligible:
-                executor.submit(process_subscription_checkout, sub_pk, evt_pk)
-        finally:
-            # shutdown(wait=False): stop accepting new tasks but let already-
-            # submitted futures run to completion without blocking the caller.
-            executor.shutdown(wait=False)
-    else:
-        for sub_pk, evt_pk in eligible:
-            process_subscription_checkout(sub_pk, evt_pk)
+    with transaction.atomic():
+        jobs = [
+            enqueue_job(
+                EventJob.Kind.CHECKOUT_BACKFILL, f"checkout_backfill:{subscription.pk}",
+                subscription=subscription,
+                payload={'event_id': event.pk},
+                requeue=True
+            )
+            for subscription in eligible
+        ]
+
+    if not getattr(settings, 'CHECKOUT_BACKFILL_ASYNC', True):
+        run_jobs_inline(jobs, allow_retry=True)
 
     return {
         'queued': queued,
@@ -961,8 +940,7 @@ def events_list(request):
     if status_param:
         status_set = {s.strip() for s in status_param.split(',') if s.strip()}
         if status_set:
-            matching_ids = [e.id for e in events if e.status in status_set]
-            events = events.filter(id__in=matching_ids)
+            events = events.filter_status(status_set)
 
     date_from = request.GET.get('dateFrom')
     if date_from:
@@ -971,6 +949,11 @@ def events_list(request):
     if date_to:
         events = events.filter(date__lte=parse_datetime(date_to) + timedelta(days=1))
 
+    # Lists (occupancy comes from their counters) and their event names, in a fixed number of queries per page
+    events = events.prefetch_related(
+        Prefetch('lists', queryset=EventList.objects.prefetch_related('events'))
+    )
+
     paginator = PageNumberPagination()
     paginator.page_size_query_param = 'page_size'
     page = paginator.paginate_queryset(events, request=request)
@@ -1318,15 +1301,17 @@ def move_subscriptions(request):
         if not target_list.events.filter(id=target_event.id).exists():
             return Response({'error': "La lista selezionata non appartiene all'evento indicato"}, status=400)
 
-        # Check if moving the subscriptions would exceed the target list's capacity
-        current_count = Subscription.objects.filter(list=target_list, event=target_event).count()
-        if target_list.capacity > 0 and current_count + len(subscription_ids) > target_list.capacity:
-            return Response(
-                {'error': "Numero di iscrizioni in eccesso per la capacità libera nella lista di destinazione"},
-                status=400)
-
         # Update the list for each subscription
         with transaction.atomic():
+            # Check if moving the subscriptions would exceed the target list's (pooled) capacity,
+            # holding the list row lock so concurrent moves/signups cannot overbook it
+            target_list = EventList.objects.select_for_update().get(pk=target_list.pk)
+            incoming = sum(1 for sub in subscriptions if sub.list_id != target_list.pk)
+            if target_list.capacity > 0 and target_list.subscription_count + incoming > target_list.capacity:
+                return Response(
+                    {'error': "Numero di iscrizioni in eccesso per la capacità libera nella lista di destinazione"},
+                    status=400)
+
             for subscription in subscriptions:
                 # Ensure unique constraint won't be violated when switching event
                 if subscription.profile_id and Subscription.objects.filter(
@@ -1377,29 +1362,52 @@ def move_subscriptions(request):
         return Response({'message': "Iscrizioni spostate con successo"}, status=200)
     except ValidationError as e:
         return Response({'error': str(e)}, status=400)
+def _can_manage_liberatorie(user, event_id):
+    """Board members and the lead organizers of the event can print its liberatorie."""
+    if user.groups.filter(name='Board').exists():
+        return True
+    return (
+        hasattr(user, 'profile') and
+        EventOrganizer.objects.filter(event_id=event_id, profile=user.profile, is_lead=True).exists()
+    )
+
+
+def _liberatorie_job_data(job):
+    payload = job.payload or {}
+    data = {
+        'job_id': job.pk,
+        'status': job.status,
+        'done': payload.get('done', 0),
+        'total': payload.get('total', len(payload.get('subscription_ids', []))),
+        'error': job.last_error or None,
+    }
+    if job.status == EventJob.Status.DONE:
+        data['download_path'] = f"/liberatorie-jobs/{job.pk}/download/"
+    return data
+
+
+def _pdf_response(file, filename):
+    response = FileResponse(file, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def generate_liberatorie_pdf(request):
-    def italian_date(dt):
-        if not dt:
-            return "N/A"
-        return format_date(dt, format='d MMMM yyyy', locale='it')
-
-    def display_na(value):
-        return value if value not in [None, '', [], {}] else 'N/A'
-
+    """
+    Liberatorie PDF of the selected subscriptions.
+    Up to LIBERATORIE_SYNC_MAX subscriptions the PDF is rendered in the request and streamed from a
+    temporary file. Larger selections are rendered by a LIBERATORIE EventJob: the response is 202
+    with the job status, to poll on liberatorie_job_status until it can be downloaded.
+    """
     event_id = request.data.get('event_id')
     subscription_ids = request.data.get('subscription_ids', [])
 
     if not event_id or not subscription_ids:
         return Response({'error': 'Event ID and Subscription IDs are required.'}, status=400)
 
-    is_board = request.user.groups.filter(name='Board').exists()
-    is_lead_organizer = (
-        hasattr(request.user, 'profile') and
-        EventOrganizer.objects.filter(event_id=event_id, profile=request.user.profile, is_lead=True).exists()
-    )
-    if not (is_board or is_lead_organizer):
+    if not _can_manage_liberatorie(request.user, event_id):
         return Response({'error': 'Non hai i permessi per generare liberatorie.'}, status=403)
     try:
         event = Event.objects.get(pk=event_id)
@@ -1408,135 +1416,67 @@ def generate_liberatorie_pdf(request):
         if subscriptions.count() != len(subscription_ids):
             return Response({'error': 'Alcune iscrizioni non appartengono a questo evento o non esistono.'}, status=400)
 
-        # Build profile data list, handling external subscriptions (profile=None).
-        profiles_data = []
-        for sub in subscriptions:
-            if sub.profile is not None:
-                profiles_data.append(LiberatoriaProfileSerializer(sub.profile).data)
-            else:
-                # External subscription: build partial data from available external fields.
-                first_name = sub.external_first_name or ''
-                last_name = sub.external_last_name or ''
-                if not first_name and not last_name and sub.external_name:
-                    parts = sub.external_name.split(None, 1)
-                    first_name = parts[0] if parts else ''
-                    last_name = parts[1] if len(parts) > 1 else ''
-                profiles_data.append({
-                    'name': first_name,
-                    'surname': last_name,
-                    'address': '',
-                    'esncard_number': '',
-                    'document_number': '',
-                    'document_expiry': '',
-                    'date_of_birth': '',
-                    'place_of_birth': '',
-                    'phone': sub.external_whatsapp_number or '',
-                    'email': '',
-                    'matricola': '',
-                    'codice_persona': '',
-                })
-
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4,
-                                rightMargin=1 * cm, leftMargin=1 * cm,
-                                topMargin=1 * cm, bottomMargin=1 * cm)
-        story = []
-        styles = getSampleStyleSheet()
-        styles.add(ParagraphStyle(name='Justify', alignment=0))  # 0 for Left alignment (1 for Center)
-
-        # --- ESN Logo ---
-        logo_path = 'static/esnpolimi-logo.png'
-        try:
-            scale = 0.2
-            orig_width, orig_height = 600, 334
-            width = orig_width * scale * 0.0352778  # convert px to cm (1 px ≈ 0.0352778 cm)
-            height = orig_height * scale * 0.0352778
-
-            logo = Image(logo_path, width=width * cm, height=height * cm)
-            logo.hAlign = 'CENTER'
-        except (OSError, IOError):
-            logo = None
-
-        # Calculate age limit date (18 years before event)
-        age_limit_date = event.date - timedelta(days=18 * 365.25)
-
-        for profile_data in profiles_data:
-            if logo:
-                story.append(logo)
-                story.append(Spacer(1, 1 * cm))
-
-            # Build phone with prefix if available
-            phone_combined = (profile_data.get('phone') or '').strip()
-            if not phone_combined:
-                pn = (profile_data.get('phone_number') or profile_data.get('phone') or '').strip()
-                pp = (profile_data.get('phone_prefix') or '').strip()
-                if pn and pp and not pn.startswith(pp):
-                    phone_combined = f"{pp} {pn}"
-                else:
-                    phone_combined = pn
-
-            # --- Personal Details ---
-            details = f"""
-            <b>Nome/Name:</b> {display_na(profile_data.get('name'))}<br/>
-            <b>Cognome/Surname:</b> {display_na(profile_data.get('surname'))}<br/>
-            <b>Indirizzo/Address:</b> {display_na(profile_data.get('address'))}<br/>
-            <b>ESNcard N°:</b> {display_na(profile_data.get('esncard_number'))}<br/>
-            <b>ID/Passport N°:</b> {display_na(profile_data.get('document_number'))}<br/>
-            <b>Data di scadenza/Expiration date:</b> {display_na(profile_data.get('document_expiry'))}<br/>
-            <b>Data e Luogo di nascita/Date and Place of birth:</b> {display_na(profile_data.get('date_of_birth'))} - {display_na(profile_data.get('place_of_birth'))}<br/>
-            <b>Telefono/Telephone:</b> {display_na(phone_combined)}<br/>
-            <b>E-mail:</b> {display_na(profile_data.get('email'))}<br/>
-            <b>Matricola/Enrollment Number:</b> {display_na(profile_data.get('matricola'))}<br/>
-            <b>Codice Persona/Personal Code:</b> {display_na(profile_data.get('codice_persona'))}<br/>
-            """
-            story.append(Paragraph(details, styles['Normal']))
-            story.append(Spacer(1, 1 * cm))
-
-            # --- Waiver Text ---
-            waiver_text_1 = f"""
-            La presente dichiarazione liberatoria dovrà essere letta e firmata, in calce alla stessa, in nome e per conto proprio, oltre che in nome e per conto
-            delle persone sotto elencate, nonchè dal legale responsabile qualora l'iscritto non sia maggiorenne (nato dopo il <b>{italian_date(age_limit_date)}</b>). La firma apposta
-            in fondo alla presente dichiarazione comporta la piena e consapevole lettura e comprensione del contenuto e la conferma della volontà di attenersi
-            alla stessa: sono a conoscenza dei rischi connessi riguardo alla mia partecipazione a questo pacchetto viaggio e alle relative attività collaterali.
-            Con la sottoscrizione della presente dichiaro di voler liberare ed esonerare, come in effetti libero ed esonero, qualsiasi persona dell'organizzazione
-            Erasmus Student Network Politecnico Milano, gli organizzatori dell'evento <b>"{event.name}" ({italian_date(event.date)})</b>, collettivamente
-            denominati organizzatori dell'evento, da tutte le azioni, cause qualsiasi procedimento giudiziario e arbitrale tra questi compresi ma non limitati a
-            quelli relativi al rischio di infortuni durante la disputa delle attività e al rischio di smarrimento di effetti personali per furto o per qualsiasi altra
-            ragione. Prima dell'iscrizione a questo pacchetto viaggio sarà mia cura e onere verificare le norme e le disposizioni che mi consentono di
-            partecipare al viaggio. Inoltre, con la sottoscrizione della presente, concedo agli organizzatori dell'evento la mia completa autorizzazione a tale
-            viaggio con foto, servizi filmati, TV, radio, videoregistrazioni e altri strumenti di comunicazione noti o sconosciuti, indipendentemente da chi li
-            abbia effettuati e a utilizzare gli stessi nel modo che verrà ritenuto più opportuno, con assoluta discrezione, per ogni forma di pubblicità,
-            promozione, annuncio, progetti di scambio o a scopo commerciale senza pretendere alcun rimborso di qualsiasi natura e senza richiedere alcuna
-            forma di ricompensa.
-            """
-            story.append(Paragraph(waiver_text_1, styles['Justify']))
-            story.append(Spacer(1, 1 * cm))
-            story.append(Paragraph("Firma/Signature _______________________________", styles['Normal']))
-            story.append(Spacer(1, 1 * cm))
-
-            privacy_text = """
-            <b>INFORMAZIONI AI SENSI DELLA LEGGE 675/96</b><br/>
-            ESN Politecnico Milano desidera informarla che la legge 675/96 prevede la tutela delle persone rispetto al trattamento dei dati
-            personali. In base alla legge, il trattamento che intendiamo effettuare utilizzando i suoi dati è possibile soltanto con il suo consenso scritto e:il trattamento verrà effettuato con sistemi
-            prevalentemente informatici;ai sensi della legge sulla privacy, il trattamento sarà svolto in base ai principi di correttezza, trasparenza e liceità, per consentire la tutela della riservatezza dei
-            suoi dati e del relativi diritti. Il rilascio dei suoi dati non è obbligatorio se non per le finalità legate alle prenotazioni in corso e in ogni caso avrà la possibilità di esercitare i diritti
-            riconosciuti dall'Art. 13 della legge in oggetto che prevedono in qualsiasi momento la verifica dell'esistenza dei suoi dati presso gli archivi cartacei ed informatici, dei criteri e degli scopi
-            del trattamento dei dati, richiedendo la verifica, cancellazione, aggiornamento ed opposizione al loro utilizzo. Il titolare del trattamento dei suoi dati è ESN Politecnico Milano, Via Bonardi
-            3, 20133, Milano. Acquisite le suddette informazioni, rese ai sensi dell'Art 10 della legge 675/96, acconsento al trattamento dei miei dati personali da parte di ESN Politecnico Milano.<br/><br/>
-            Accettazione: SI NO<br/><br/>
-            Firma/Signature______________________
-            """
-            story.append(Paragraph(privacy_text, styles['Justify']))
-            story.append(PageBreak())
-
-        doc.build(story)
-        buffer.seek(0)
-        response = HttpResponse(buffer, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="ESNPolimi_Liberatoria_{event.name}.pdf"'
-        return response
+        if len(subscription_ids) > getattr(settings, 'LIBERATORIE_SYNC_MAX', 50):
+            job = enqueue_job(
+                EventJob.Kind.LIBERATORIE,
+                f"liberatorie:{event.pk}:{uuid.uuid4().hex}",
+                payload={
+                    'event_id': event.pk,
+                    'subscription_ids': list(subscription_ids),
+                    'requested_by': request.user.pk,
+                },
+            )
+            if not getattr(settings, 'LIBERATORIE_JOBS_ASYNC', True):
+                run_jobs_inline([job])
+                job.refresh_from_db()
+            return Response(_liberatorie_job_data(job), status=202)
+
+        rows = liberatoria_rows(subscriptions)
+        output = tempfile.TemporaryFile()
+        render_liberatorie(event.name, event.date, rows, output)
+        output.seek(0)
+        return _pdf_response(output, download_filename(event.name))
 
     except Event.DoesNotExist:
         return Response({'error': "Event not found"}, status=404)
+
+
+def _get_liberatorie_job(request, job_id):
+    """The LIBERATORIE job, or an error Response if it does not exist or the user cannot access it."""
+    job = EventJob.objects.filter(pk=job_id, kind=EventJob.Kind.LIBERATORIE).first()
+    if job is None:
+        return None, Response({'error': 'Job non trovato.'}, status=404)
+    if not _can_manage_liberatorie(request.user, job.payload.get('event_id')):
+        return None, Response({'error': 'Non hai i permessi per visualizzare le liberatorie.'}, status=403)
+    return job, None
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def liberatorie_job_status(request, job_id):
+    """Status and progress (done/total participants) of a liberatorie rendering job."""
+    job, error = _get_liberatorie_job(request, job_id)
+    if error:
+        return error
+    return Response(_liberatorie_job_data(job), status=200)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def liberatorie_job_download(request, job_id):
+    """Download the PDF rendered by a finished liberatorie job."""
+    job, error = _get_liberatorie_job(request, job_id)
+    if error:
+        return error
+    if job.status != EventJob.Status.DONE:
+        return Response({'error': 'Il PDF non è ancora pronto.'}, status=409)
+    try:
+        pdf = open(artifact_path(job), 'rb')
+    except FileNotFoundError:
+        return Response({'error': 'Il PDF non è più disponibile, generalo di nuovo.'}, status=410)
+    return _pdf_response(pdf, job.payload.get('filename') or download_filename(job.payload.get('event_id')))
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def printable_liberatorie(request, event_id):
@@ -1544,12 +1484,7 @@ def printable_liberatorie(request, event_id):
     Returns all subscriptions for the event with a paid quota (status_quota == 'paid').
     Optional query param: list=<list_id> to filter by list.
     """
-    is_board = request.user.groups.filter(name='Board').exists()
-    is_lead_organizer = (
-        hasattr(request.user, 'profile') and
-        EventOrganizer.objects.filter(event_id=event_id, profile=request.user.profile, is_lead=True).exists()
-    )
-    if not (is_board or is_lead_organizer):
+    if not _can_manage_liberatorie(request.user, event_id):
         return Response({'error': 'Non hai i permessi per visualizzare le liberatorie.'}, status=403)
     try:
         event = Event.objects.get(pk=event_id)
@@ -1574,7 +1509,6 @@ def printable_liberatorie(request, event_id):
     except Event.DoesNotExist:
         return Response({'error': "L'evento non esiste"}, status=404)
 # --- SumUp helpers ---
-_SUMUP_TOKEN_CACHE = {"token": None, "expires_at": 0}
 
 
 # NOTE (SumUp / Cloudflare debug):
@@ -1586,29 +1520,9 @@ _SUMUP_TOKEN_CACHE = {"token": None, "expires_at": 0}
 # Safe to ignore; it does not affect payment confirmation logic (_process_sumup_checkout / webhook).
 def get_sumup_access_token():
     """
-    Cached SumUp access token (simple in-memory cache).
+    SumUp access token, shared by all workers through the Django cache (see events/sumup.py).
     """
-    now = time.time()
-    if _SUMUP_TOKEN_CACHE["token"] and _SUMUP_TOKEN_CACHE["expires_at"] > now + 30:
-        return _SUMUP_TOKEN_CACHE["token"]
-
-    r = requests.post(
-        "https://api.sumup.com/token",
-        data={
-            "grant_type": "client_credentials",
-            "client_id": settings.SUMUP_CLIENT_ID,
-            "client_secret": settings.SUMUP_CLIENT_SECRET,
-            "scope": "payments",
-        },
-        timeout=15,
-    )
-    r.raise_for_status()
-    token_data = r.json()
-    access_token = token_data["access_token"]
-    expires_in = token_data.get("expires_in", 300)
-    _SUMUP_TOKEN_CACHE["token"] = access_token
-    _SUMUP_TOKEN_CACHE["expires_at"] = now + expires_in
-    return access_token
+    return get_sumup_client().access_token()
 
 
 def create_sumup_checkout(subscription, total_amount, currency="EUR"):
@@ -1629,13 +1543,6 @@ def create_sumup_checkout(subscription, total_amount, currency="EUR"):
             return {"pay_to_email": pay_to_email}
         raise RuntimeError("SumUp not configured: set SUMUP_MERCHANT_CODE or SUMUP_PAY_TO_EMAIL")
 
-    def _sumup_headers():
-        access_token = get_sumup_access_token()  # fetch dynamically
-        return {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-
     if subscription.profile:
         payer_label = f"{subscription.profile.name} {subscription.profile.surname}"
     elif subscription.external_name:
@@ -1650,11 +1557,7 @@ def create_sumup_checkout(subscription, total_amount, currency="EUR"):
         "description": f"Subscription {subscription.event.name} (ID {subscription.event.id}) - {payer_label} - SUB#{subscription.pk}",
     }
     payload.update(_sumup_destination_fields())
-    headers = _sumup_headers()
-    r = requests.post("https://api.sumup.com/v0.1/checkouts", json=payload, headers=headers, timeout=15)
-    if r.status_code >= 300:
-        raise RuntimeError(f"SumUp error {r.status_code}: {r.text}")
-    data = r.json()
+    data = get_sumup_client().create_checkout(payload)
     checkout_id = data.get("id") or data.get("checkout_reference")
     if not checkout_id:
         raise RuntimeError("SumUp response missing checkout id")
@@ -1704,16 +1607,11 @@ def _process_sumup_checkout(subscription, card_token):
         return 'ERROR', {'error': 'Missing checkout id'}
     checkout_id = subscription.sumup_checkout_id
     try:
-        access_token = get_sumup_access_token()
+        client = get_sumup_client()
 
         def fetch():
-            r = requests.get(
-                f"https://api.sumup.com/v0.1/checkouts/{checkout_id}",
-                headers={"Authorization": f"Bearer {access_token}"},
-                timeout=12
-            )
+            r = client.get_checkout(checkout_id, timeout=12)
             if r.status_code != 200:
-                print(f"[SUMUP] Fetch {checkout_id} status={r.status_code}")
                 logger.debug(f"[SUMUP] Fetch {checkout_id} status={r.status_code}")
                 return None, r.status_code
             return r.json(), 200
@@ -1749,15 +1647,15 @@ def _process_sumup_checkout(subscription, card_token):
 
         if card_token:
             put_payload = {"payment_type": "card", "card": {"token": card_token}}
-            r_put = requests.put(
-                f"https://api.sumup.com/v0.1/checkouts/{checkout_id}",
-                json=put_payload,
-                headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"},
-                timeout=25
-            )
-            if r_put.status_code not in (200, 202, 409):
-                return 'ERROR', {"error": f"Process response {r_put.status_code}"}
-            # 409 means already processed by widget; continue
+            try:
+                put_status = client.process_checkout(checkout_id, put_payload, timeout=25).status_code
+            except requests.RequestException as e:
+                # The charge may have gone through with the response lost: reconcile below, never resend the PUT
+                logger.warning(f"[SUMUP] Process {checkout_id} failed, reconciling with GET: {e}")
+                put_status = None
+            if put_status is not None and put_status < 500 and put_status not in (200, 202, 409):
+                return 'ERROR', {"error": f"Process response {put_status}"}
+            # 409 means already processed by widget; 5xx/no response may hide a processed charge: continue
 
             time.sleep(0.4)  # short settle
             data2, _ = fetch()
@@ -1784,7 +1682,6 @@ def _process_sumup_checkout(subscription, card_token):
         return 'PENDING', {'status': rs or 'PENDING'}
 
     except Exception as e:
-        print(f"[SUMUP] Exception in _process_sumup_checkout: {e}")
         logger.error(f"[SUMUP] Exception in _process_sumup_checkout: {e}")
         return 'ERROR', {"error": str(e)}
 
@@ -1842,7 +1739,7 @@ def event_form_status(_, event_id):
                 return True
             if lst.capacity == 0:
                 return False  # unlimited
-            return lst.subscriptions.count() >= lst.capacity
+            return lst.subscription_count >= lst.capacity
 
         main_list_full = is_full(main_list)
         waiting_list_full = is_full(waiting_list)
@@ -1865,7 +1762,7 @@ def event_form_status(_, event_id):
             "message": message,
             "form_list_full": form_list_full,
             "form_list_capacity": getattr(form_list, 'capacity', None),
-            "form_list_subscriptions": form_list.subscriptions.count() if form_list else 0,
+            "form_list_subscriptions": form_list.subscription_count if form_list else 0,
             "form_message": form_message
         }, status=200)
     except Event.DoesNotExist:
@@ -1943,18 +1840,22 @@ def event_form_submit(request, event_id):
         if external_name and Subscription.objects.filter(external_name=external_name, event=event).exists():
             return Response({"error": "Already subscribed to this event as external"}, status=400)
 
+        # Checkout creation, email and Drive uploads run as EventJobs (see events/jobs.py).
+        # Async (default): they are left to the run_event_jobs worker; otherwise they run inline below.
+        run_async = getattr(settings, 'EVENT_FORM_JOBS_ASYNC', True)
+
         # --- Handle file uploads for 'l' type fields BEFORE validation ---
         link_fields = [f['name'] for f in event.form_fields if f.get('type') == 'l']
-        for fname in link_fields:
-            uploaded = request.FILES.get(fname)
-            if uploaded:
-                _validate_form_upload(uploaded)
-                try:
-                    link = _upload_form_file_to_drive(uploaded, event.id, fname, event.name, event.date)
-                except Exception as up_err:
-                    logger.error(f"Upload failed for field {fname}: {up_err}")
-                    return Response({"error": f"Upload failed for field {fname}"}, status=500)
-                form_data[fname] = link
+        uploads = {fname: request.FILES[fname] for fname in link_fields if request.FILES.get(fname)}
+        for uploaded in uploads.values():
+            _validate_form_upload(uploaded)
+        if not run_async and uploads:
+            links, failures = _upload_form_files_to_drive(uploads, event)
+            for fname, up_err in failures.items():
+                logger.error(f"Upload failed for field {fname}: {up_err}")
+            if failures:
+                return Response({"error": f"Upload failed for field {next(iter(failures))}"}, status=500)
+            form_data.update(links)
 
         # Validate only form field data (now includes generated links)
         errors = validate_field_data(event.fields, form_data, 'form')
@@ -1971,64 +1872,80 @@ def event_form_submit(request, event_id):
         if not form_list:
             return Response({"error": "Form list not configured for this event"}, status=400)
 
-        sub = Subscription.objects.create(
-            profile=profile,
-            external_name=external_name,
-            event=event,
-            list=form_list,  # assigned_list
-            form_data=form_data,
-            form_notes=form_notes,
-            additional_data={'form_email': email},
-            selected_services=normalized_selected,
-            created_by_form=True,
-            external_first_name=external_first_name,
-            external_last_name=external_last_name,
-            external_has_esncard=external_has_esncard,
-            external_esncard_number=external_esncard_number,
-            external_whatsapp_number=external_whatsapp_number
-        )
+        # Async: links are written into form_data by the upload jobs, from files spooled to disk only
+        # now that the submission is accepted (and removed again if creating it fails)
+        with spooled_form_uploads(uploads if run_async else {}) as pending_uploads, transaction.atomic():
+            sub = Subscription.objects.create(
+                profile=profile,
+                external_name=external_name,
+                event=event,
+                list=form_list,  # assigned_list
+                form_data=form_data,
+                form_notes=form_notes,
+                additional_data={'form_email': email},
+                selected_services=normalized_selected,
+                created_by_form=True,
+                external_first_name=external_first_name,
+                external_last_name=external_last_name,
+                external_has_esncard=external_has_esncard,
+                external_esncard_number=external_esncard_number,
+                external_whatsapp_number=external_whatsapp_number
+            )
 
-        total_cost = (event.cost or Decimal('0')) + (event.deposit or Decimal('0')) + _services_total(normalized_selected)
+            total_cost = (event.cost or Decimal('0')) + (event.deposit or Decimal('0')) + _services_total(normalized_selected)
 
-        # --- Capacity check (must happen before SumUp checkout creation) ---
-        assigned_label = ''
-        capacity_blocked = False
+            # --- Capacity check (must happen before SumUp checkout creation) ---
+            assigned_label = ''
+            capacity_blocked = False
 
-        # Subscription is always created in Form List and is never rejected here due to Main/Waiting capacity.
-        # Capacity information is used to decide whether to create a live payment checkout.
-        if event.allow_online_payment and total_cost > 0:
-            main_list, waiting_list = _get_main_waiting_lists(event)
+            # Subscription is always created in Form List and is never rejected here due to Main/Waiting capacity.
+            # Capacity information is used to decide whether to create a live payment checkout.
+            if event.allow_online_payment and total_cost > 0:
+                main_list, waiting_list = _get_main_waiting_lists(event)
 
-            if _list_has_space(main_list):
-                assigned_label = "Main List"
-            elif _list_has_space(waiting_list):
-                assigned_label = "Waiting List"
-            else:
-                assigned_label = "Form List"
-                capacity_blocked = True
+                if _list_has_space(main_list):
+                    assigned_label = "Main List"
+                elif _list_has_space(waiting_list):
+                    assigned_label = "Waiting List"
+                else:
+                    assigned_label = "Form List"
+                    capacity_blocked = True
+
+            # --- SumUp integration (widget-only) — only create checkout when capacity is available ---
+            online_checkout = bool(event.allow_online_payment and total_cost > 0 and not capacity_blocked)
+
+            jobs = [
+                enqueue_job(
+                    EventJob.Kind.FORM_UPLOAD, f"form_upload:{sub.pk}:{fname}",
+                    subscription=sub,
+                    payload={
+                        'field': fname,
+                        'filename': uploaded.name,
+                        'content_type': getattr(uploaded, 'content_type', None),
+                        'spool_path': spool_name,
+                    },
+                )
+                for fname, uploaded, spool_name in pending_uploads
+            ]
+            if online_checkout:
+                jobs.append(enqueue_job(EventJob.Kind.FORM_CHECKOUT, f"form_checkout:{sub.pk}", subscription=sub))
+            jobs.append(enqueue_job(
+                EventJob.Kind.FORM_EMAIL, f"form_email:{sub.pk}",
+                subscription=sub,
+                payload={
+                    'assigned_label': assigned_label,
+                    'online_payment': online_checkout,
+                    'payment_required': total_cost > 0,
+                    'capacity_blocked': capacity_blocked,
+                }
+            ))
 
-        # --- SumUp integration (widget-only) — only create checkout when capacity is available ---
         payment_error = None
-        if event.allow_online_payment and total_cost > 0 and not capacity_blocked:
-            try:
-                checkout_id, _ = create_sumup_checkout(sub, total_cost, currency="EUR")
-                sub.sumup_checkout_id = checkout_id
-                sub.save(update_fields=['sumup_checkout_id'])
-            except Exception as e:
+        if not run_async:
+            run_jobs_inline(jobs)
+            sub.refresh_from_db()
+            if online_checkout and not sub.sumup_checkout_id:
                 payment_error = "online_payment_unavailable"
-                print(f"[ERROR] Failed SumUp checkout for subscription {sub.pk}: {e}")
-                logger.error(f"Failed SumUp checkout for subscription {sub.pk}: {e}")
-
-        online_payment_required = bool(event.allow_online_payment and total_cost > 0 and not payment_error and not capacity_blocked)
-        payment_required = online_payment_required or total_cost > 0
-
-        _send_form_subscription_email(
-            sub, 
-            assigned_label, 
-            online_payment_required, 
-            payment_required, 
-            capacity_blocked=capacity_blocked
-        )
 
         return Response({
             "success": True,
@@ -2037,7 +1954,9 @@ def event_form_submit(request, event_id):
             "payment_required": bool(event.allow_online_payment and total_cost > 0 and not payment_error),
             "checkout_id": sub.sumup_checkout_id,
             "payment_error": payment_error,
-            "capacity_blocked": capacity_blocked
+            "capacity_blocked": capacity_blocked,
+            # Checkout is being created by the job worker; the payment link arrives by email
+            "checkout_pending": bool(run_async and online_checkout)
         }, status=200)
     except Event.DoesNotExist:
         return Response({"error": "Event not found"}, status=404)
@@ -2210,12 +2129,7 @@ def sumup_webhook(request):
     ).exists()
 
     try:
-        access_token = get_sumup_access_token()
-        r = requests.get(
-            f"https://api.sumup.com/v0.1/checkouts/{checkout_id}",
-            headers={"Authorization": f"Bearer {access_token}"},
-            timeout=12
-        )
+        r = get_sumup_client().get_checkout(checkout_id, timeout=12)
         if r.status_code != 200:
             logger.warning(f"Webhook fetch failed {r.status_code} for checkout {checkout_id}")
             return Response({"status": "pending", "reason": "fetch_failed"}, status=200)
@@ -2488,3 +2402,31 @@ def available_events_for_sharing(request):
         })
 
     return Response(result, status=200)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def event_jobs_backlog(request):
+    """
+    Board-only view of the EventJob queue: counts by status/kind and the latest failed jobs.
+    Optional ?event=<id> restricts it to the jobs of one event's subscriptions.
+    """
+    if not request.user.groups.filter(name='Board').exists():
+        return Response({'error': 'Non hai i permessi per visualizzare la coda dei job.'}, status=403)
+
+    jobs = EventJob.objects.all()
+    event_id = request.GET.get('event')
+    if event_id:
+        try:
+            event_id = int(event_id)
+        except ValueError:
+            return Response({'error': 'Parametro event non valido.'}, status=400)
+        jobs = jobs.filter(subscription__event_id=event_id)
+
+    failed = (jobs.filter(status=EventJob.Status.FAILED)
+              .order_by('-updated_at')
+              .values('id', 'kind', 'subscription_id', 'attempts', 'last_error', 'updated_at')[:20])
+    return Response({
+        **job_backlog(jobs),
+        'failed': list(failed),
+    }, status=200)
@@ -0,0 +1,222 @@
+"""
+ASGI server-sent events for maintenance notifications (GET /backend/maintenance/stream/).
+
+One MaintenanceBroadcaster per process (and event loop) watches maintenance_notification.json:
+a single task stats the file every MAINTENANCE_WATCH_INTERVAL seconds (default 1), parses it
+only when its mtime/inode/size changed, and fans a 'maintenance' event out to the queue of every
+connected client. Connections are coroutines waiting on their queue, so thousands of idle
+browser tabs cost no threads and no per-client file reads; a heartbeat comment is sent every
+MAINTENANCE_HEARTBEAT seconds (default 30) to keep proxies from closing them.
+
+backend/asgi.py routes the stream path here and everything else to Django; under WSGI the
+thread-per-client fallback view in maintenance/views.py is used instead. Clients open the
+stream only when /maintenance/status/ reports "stream": true, i.e. under ASGI with
+MAINTENANCE_SSE_ENABLED = True; otherwise they poll.
+"""
+import asyncio
+import json
+import logging
+import re
+import weakref
+from urllib.parse import parse_qs
+
+from corsheaders.conf import conf as cors_conf
+from django.conf import settings
+from django.urls import reverse
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from maintenance.views import DEFAULT_MESSAGE, _notification_signature, _read_notification, _stream_state
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per client; a client that falls this far behind only misses older events
+_CLIENT_QUEUE_SIZE = 8
+
+
+def _event_payload(notification):
+    return json.dumps({
+        "notification_id": notification.get("notification_id"),
+        "message": notification.get("message", DEFAULT_MESSAGE),
+        "triggered_at": notification.get("triggered_at", ""),
+    }, ensure_ascii=False)
+
+
+class MaintenanceBroadcaster:
+    """Watches the notification file once and pushes changes to every subscriber queue."""
+
+    def __init__(self, interval=None):
+        self.interval = interval if interval is not None else getattr(settings, 'MAINTENANCE_WATCH_INTERVAL', 1.0)
+        self._subscribers = set()
+        self._task = None
+        self._signature = None
+        self._last_id = None
+
+    @property
+    def clients(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """New client queue; starts the watcher on the first subscriber."""
+        if self._task is None or self._task.done():
+            self._signature = _notification_signature()
+            self._last_id = _read_notification().get("notification_id")
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+        subscriber = asyncio.Queue(maxsize=_CLIENT_QUEUE_SIZE)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+    def publish(self, payload):
+        for subscriber in list(self._subscribers):
+            if subscriber.full():
+                subscriber.get_nowait()
+            subscriber.put_nowait(payload)
+
+    def check(self):
+        """Publish the notification if the file changed to a new notification_id."""
+        signature = _notification_signature()
+        if signature == self._signature:
+            return
+        self._signature = signature
+        current = _read_notification()
+        current_id = current.get("notification_id")
+        if current_id and current_id != self._last_id:
+            self.publish(_event_payload(current))
+        self._last_id = current_id
+
+    async def _watch(self):
+        # Stops when the last client leaves; the next subscriber starts it again
+        while self._subscribers:
+            await asyncio.sleep(self.interval)
+            try:
+                self.check()
+            except Exception:  # noqa: BLE001
+                logger.exception("[Maintenance] Could not read the notification file")
+
+
+_broadcasters = weakref.WeakKeyDictionary()
+
+
+def get_broadcaster():
+    """The broadcaster of the running event loop."""
+    loop = asyncio.get_running_loop()
+    broadcaster = _broadcasters.get(loop)
+    if broadcaster is None:
+        broadcaster = _broadcasters[loop] = MaintenanceBroadcaster()
+    return broadcaster
+
+
+def _cors_headers(scope):
+    """
+    CORS headers for the request's Origin, as CorsMiddleware would add them: the stream is
+    answered outside Django, and a cross-origin EventSource is blocked without them.
+    """
+    origin = next((value.decode("latin-1") for name, value in scope.get("headers", ()) if name == b"origin"), None)
+    if not origin:
+        return []
+    allowed = (
+        cors_conf.CORS_ALLOW_ALL_ORIGINS
+        or origin in cors_conf.CORS_ALLOWED_ORIGINS
+        or any(re.match(pattern, origin) for pattern in cors_conf.CORS_ALLOWED_ORIGIN_REGEXES)
+    )
+    if not allowed:
+        return []
+    headers = [(b"access-control-allow-origin", origin.encode("latin-1")), (b"vary", b"origin")]
+    if cors_conf.CORS_ALLOW_CREDENTIALS:
+        headers.append((b"access-control-allow-credentials", b"true"))
+    return headers
+
+
+async def _send_json(send, status, body, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), *headers],
+    })
+    await send({"type": "http.response.body", "body": json.dumps(body).encode("utf-8")})
+
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def _query_token(scope):
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("token")
+    return values[0] if values else ""
+
+
+async def maintenance_sse(scope, receive, send):
+    """
+    ASGI SSE endpoint. Requires a valid JWT access token as the ``token`` query parameter
+    (native EventSource cannot send Authorization headers).
+    """
+    cors = _cors_headers(scope)
+    token = _query_token(scope)
+    if not token:
+        await _send_json(send, 403, {"detail": "Authentication required to connect to the maintenance stream."}, cors)
+        return
+    try:
+        AccessToken(token)  # validates signature, expiry, and token type
+    except TokenError:
+        await _send_json(send, 403, {"detail": "Invalid or expired token."}, cors)
+        return
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),  # disable nginx buffering
+            *cors,
+        ],
+    })
+    heartbeat = getattr(settings, 'MAINTENANCE_HEARTBEAT', 30)
+    broadcaster = get_broadcaster()
+    subscriber = broadcaster.subscribe()
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({"type": "http.response.body", "body": b": connected\n\n", "more_body": True})
+        while not disconnected.done():
+            next_event = asyncio.ensure_future(subscriber.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, timeout=heartbeat,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if next_event in done:
+                chunk = f"event: maintenance\ndata: {next_event.result()}\n\n"
+            else:
+                next_event.cancel()
+                if disconnected.done():
+                    break
+                chunk = ": heartbeat\n\n"
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+    except OSError:
+        pass  # client gone while sending
+    finally:
+        broadcaster.unsubscribe(subscriber)
+        disconnected.cancel()
+
+
+def with_maintenance_stream(django_application):
+    """ASGI application serving the maintenance stream path natively and the rest with Django."""
+    _stream_state["asgi"] = True  # advertised to clients by maintenance_status (if MAINTENANCE_SSE_ENABLED)
+    stream_path = None
+
+    async def application(scope, receive, send):
+        nonlocal stream_path
+        if scope["type"] == "http" and scope.get("method") == "GET":
+            if stream_path is None:
+                stream_path = reverse('maintenance-stream')
+            path = scope["path"]
+            root_path = scope.get("root_path", "")
+            if root_path and path.startswith(root_path):
+                path = path[len(root_path):]
+            if path == stream_path:
+                await maintenance_sse(scope, receive, send)
+                return
+        await django_application(scope, receive, send)
+
+    return application
@@ -0,0 +1,54 @@
+"""Tests for the maintenance module."""
+
+import asyncio
+
+from django.test import SimpleTestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from maintenance.sse import maintenance_sse
+
+
+def _run_stream(query_string=b"", origin=None):
+	"""Run the ASGI stream until the client disconnects; returns the response start message."""
+	headers = [(b"origin", origin.encode())] if origin else []
+	scope = {"type": "http", "method": "GET", "path": "/backend/maintenance/stream/",
+			 "query_string": query_string, "headers": headers}
+	sent = []
+
+	async def receive():
+		return {"type": "http.disconnect"}
+
+	async def send(message):
+		sent.append(message)
+
+	asyncio.run(maintenance_sse(scope, receive, send))
+	return next(message for message in sent if message["type"] == "http.response.start")
+
+
+class MaintenanceStreamCorsTests(SimpleTestCase):
+	"""The native ASGI stream answers outside CorsMiddleware and sets the CORS headers itself."""
+
+	def test_stream_allows_configured_origin(self):
+		"""A cross-origin EventSource from an allowed origin gets Access-Control-Allow-Origin."""
+		token = str(AccessToken())
+
+		start = _run_stream(f"token={token}".encode(), origin="http://localhost:3000")
+
+		headers = dict(start["headers"])
+		self.assertEqual(start["status"], 200)
+		self.assertEqual(headers[b"access-control-allow-origin"], b"http://localhost:3000")
+		self.assertEqual(headers[b"access-control-allow-credentials"], b"true")
+
+	def test_rejection_carries_cors_headers(self):
+		"""The 403 of a missing token is readable by the allowed origin too."""
+		start = _run_stream(origin="http://localhost:3000")
+
+		self.assertEqual(start["status"], 403)
+		self.assertEqual(dict(start["headers"])[b"access-control-allow-origin"], b"http://localhost:3000")
+
+	@override_settings(CORS_ALLOWED_ORIGINS=["https://mgmt.esnpolimi.it"])
+	def test_other_origins_get_no_cors_headers(self):
+		"""Origins not in CORS_ALLOWED_ORIGINS are not allowed."""
+		start = _run_stream(f"token={AccessToken()}".encode(), origin="http://evil.example")
+
+		self.assertNotIn(b"access-control-allow-origin", dict(start["headers"]))
@@ -4,6 +4,7 @@ import time
 import uuid
 import logging
 
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.http import StreamingHttpResponse, JsonResponse
 from django.shortcuts import render
@@ -28,13 +29,53 @@ DEFAULT_MESSAGE = "The system will undergo maintenance in 10 minutes. Please sav
 # Helpers
 # ---------------------------------------------------------------------------
 
+# Set by maintenance.sse.with_maintenance_stream when this process serves the stream under ASGI
+_stream_state = {"asgi": False}
+
+
+def stream_available():
+    """
+    Whether clients should use the SSE stream: only when the deployment opts in
+    (MAINTENANCE_SSE_ENABLED) and the stream is served by the ASGI broadcaster. Under WSGI
+    every stream holds a worker thread, so clients keep polling the status endpoint.
+    """
+    return bool(getattr(settings, 'MAINTENANCE_SSE_ENABLED', False)) and _stream_state["asgi"]
+
+
+# (mtime_ns, inode, size) of the file -> parsed content, so unchanged files are not re-parsed
+_notification_cache = {"signature": None, "data": None}
+
+
+def _notification_signature():
+    """Cheap change marker of the notification file (None if it does not exist)."""
+    try:
+        stat = os.stat(NOTIFICATION_FILE)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_ino, stat.st_size
+
+
 def _read_notification():
-    """Return the current notification dict from the JSON file."""
+    """Return the current notification dict from the JSON file (parsed again only when the file changed)."""
+    signature = _notification_signature()
+    if signature is not None and signature == _notification_cache["signature"]:
+        return dict(_notification_cache["data"])
     try:
         with open(NOTIFICATION_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            data = json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
         return {"notification_id": None, "message": DEFAULT_MESSAGE, "triggered_at": None}
+    _notification_cache.update(signature=signature, data=data)
+    return dict(data)
+
+
+def _save_notification(data):
+    # Write-then-rename: readers (the SSE broadcaster) never see a half-written file
+    tmp_path = f"{NOTIFICATION_FILE}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, NOTIFICATION_FILE)
+    return data
 
 
 def _write_notification(message=DEFAULT_MESSAGE):
@@ -44,9 +85,7 @@ def _write_notification(message=DEFAULT_MESSAGE):
         "message": message,
         "triggered_at": timezone.now().isoformat(),
     }
-    with open(NOTIFICATION_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    return data
+    return _save_notification(data)
 
 
 def _clear_notification():
@@ -56,19 +95,16 @@ def _clear_notification():
         "message": DEFAULT_MESSAGE,
         "triggered_at": None,
     }
-    with open(NOTIFICATION_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    return data
+    return _save_notification(data)
 
 
 # ---------------------------------------------------------------------------
 # SSE stream  –  GET /backend/maintenance/stream/
-# Authentication required: anonymous requests are rejected with 403 to prevent
-# any client from opening unbounded long-lived worker-thread connections.
-# Each accepted connection auto-recycles after MAX_TICKS (~10 min); the
-# browser EventSource reconnects automatically.
-# NOTE: until the WSGI blocking issue is resolved this view must stay
-# protected – do not remove the authentication guard.
+# Under ASGI (backend/asgi.py) this path is served by maintenance/sse.py: one
+# broadcaster per process watches the file and pushes to every connection
+# without holding a thread. The view below is only the WSGI fallback: it holds
+# a worker thread per client, so it stays authenticated and each connection
+# auto-recycles after MAX_TICKS (~10 min); EventSource reconnects on its own.
 # ---------------------------------------------------------------------------
 
 def _sse_event_generator():
@@ -163,6 +199,7 @@ def maintenance_status(request):
         "notification_id": current.get("notification_id"),
         "message": current.get("message", DEFAULT_MESSAGE),
         "triggered_at": current.get("triggered_at", ""),
+        "stream": stream_available(),
     })
 
 # ---------------------------------------------------------------------------
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ProfilesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'profiles'
+
+    def ready(self):
+        from profiles import latest, search
+
+        latest.connect_signals()
+        search.connect_signals()
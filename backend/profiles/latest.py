@@ -0,0 +1,62 @@
+"""
+Maintenance of Profile.latest_esncard / Profile.latest_document.
+
+The pointer of a profile is recomputed whenever one of its ESNcards or Documents is saved or
+deleted, inside the same transaction as the write; refresh_latest_pointers() recomputes many
+profiles in SQL (UPDATE ... SET latest_x = (newest enabled row)).
+Writes that bypass signals (queryset.update(), bulk_create, raw SQL) must call
+refresh_latest_pointers() themselves, or run `python manage.py refresh_latest_pointers`.
+"""
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save
+
+from profiles.models import Document, Profile
+
+
+def _newest_enabled(model):
+    return Subquery(
+        model.objects.filter(profile=OuterRef('pk'), enabled=True).order_by('-created_at', '-id').values('id')[:1]
+    )
+
+
+def refresh_latest_pointers(profile_ids=None, *, esncard=True, document=True):
+    """Recompute the pointers of the given profiles (default: all) with one UPDATE; returns the rows updated."""
+    from treasury.models import ESNcard
+
+    values = {}
+    if esncard:
+        values['latest_esncard'] = _newest_enabled(ESNcard)
+    if document:
+        values['latest_document'] = _newest_enabled(Document)
+    profiles = Profile.objects.all() if profile_ids is None else Profile.objects.filter(pk__in=profile_ids)
+    return profiles.update(**values)
+
+
+def _sync_profile(instance, field_name):
+    """Point the card/document's profile at its newest enabled sibling, also on the cached Profile instance."""
+    model = type(instance)
+    latest = (model.objects.filter(profile_id=instance.profile_id, enabled=True)
+              .order_by('-created_at', '-id').first())
+    Profile.objects.filter(pk=instance.profile_id).update(**{field_name: latest})
+    # Callers often keep using the profile they created the card/document with
+    if model._meta.get_field('profile').is_cached(instance):
+        setattr(instance.profile, field_name, latest)
+
+
+def _on_esncard_changed(sender, instance, raw=False, **kwargs):
+    if not raw and instance.profile_id:
+        _sync_profile(instance, 'latest_esncard')
+
+
+def _on_document_changed(sender, instance, raw=False, **kwargs):
+    if not raw and instance.profile_id:
+        _sync_profile(instance, 'latest_document')
+
+
+def connect_signals():
+    from treasury.models import ESNcard
+
+    post_save.connect(_on_esncard_changed, sender=ESNcard, dispatch_uid='profile_latest_esncard_saved')
+    post_delete.connect(_on_esncard_changed, sender=ESNcard, dispatch_uid='profile_latest_esncard_deleted')
+    post_save.connect(_on_document_changed, sender=Document, dispatch_uid='profile_latest_document_saved')
+    post_delete.connect(_on_document_changed, sender=Document, dispatch_uid='profile_latest_document_deleted')
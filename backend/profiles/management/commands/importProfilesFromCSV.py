@@ -1,11 +1,16 @@
 """
     Usage:
       python manage.py importProfilesFromCSV "C:\\path\\to\\file.csv" [--dry-run] [--export [path]] [--max-count X]
+                                             [--chunk-size N] [--checkpoint [path]] [--resume]
 
     Options:
-      --dry-run         Run without saving to database.
-      --export [path]   Generate an Excel preview file (default: ./profiles_export.xlsx).
-      --max-count X     Import only the first X profiles from the CSV.
+      --dry-run            Run without saving to database.
+      --export [path]      Generate an Excel preview file (default: ./profiles_export.xlsx).
+      --max-count X        Import only the first X profiles from the CSV.
+      --chunk-size N       Rows read, validated and saved together, in one transaction (default: 500).
+      --checkpoint [path]  After every committed chunk, save the last imported row to a JSON file
+                           (default: <file>.checkpoint.json). The file is removed when the import completes.
+      --resume             Skip the rows already imported according to the checkpoint file.
 
     CSV constraints:
       - The file MUST BE IN CSV UTF-8 FORMAT and have the following columns:
@@ -17,33 +22,75 @@
         * %Y-%m-%d %H:%M:%S for registration date
       - Phone numbers should be in international format or local format with a valid country.
       - Required fields: email, nome, cognome, status, nazione
+
+    The file is streamed: each chunk is checked against the database with one query per table
+    (emails, matricola and person codes, document and ESNcard numbers) and saved with bulk_create.
+    bulk_create sends no signals, so the search index and the latest ESNcard/document pointers
+    of the new profiles are refreshed explicitly (no per-row db_audit entries are written).
+    Rows are shuffled within each chunk.
 """
-import re
+import csv
+import json
 import os
 import random
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
 
 from django.contrib.auth.models import Group
-from django.core.management.base import BaseCommand
-import csv
-from datetime import datetime
-from django.utils import timezone
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from profiles.models import Profile, Document
-from treasury.models import ESNcard
+from django.db.models import Q
+from django.utils import timezone
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.utils import get_column_letter
 
+from profiles.latest import refresh_latest_pointers
+from profiles.models import Profile, Document
+from profiles.search import reindex_profiles
+from treasury.models import ESNcard
 from users.models import User
-from utils.country_prefix_utils import load_country_data, map_country_to_code, get_prefix_by_country_code
+from utils.country_prefix_utils import CountryIndex, load_country_data
+
+DEFAULT_CHUNK_SIZE = 500
+
+# Group of the inactive account created for ESNers, by CSV status
+GROUP_BY_STATUS = {
+    'Aspirante': 'Aspiranti',
+    'Associato': 'Attivi',
+}
+
+
+@dataclass
+class ImportRow:
+    """A parsed CSV row waiting to be saved."""
+    number: int
+    row: dict
+    profile: Profile
+    document: Document = None
+    esncard: ESNcard = None
+
+    @property
+    def label(self):
+        return f"row {self.number} ({self.row.get('email', 'unknown')})"
 
 
 class Command(BaseCommand):
     help = 'Import profiles from a CSV file'
-    country_codes = []
+    countries = None
+    verbosity = 1
     AA = None
     status = None
 
+    # Document type mapping
+    document_type_mapping = {
+        'PA': Document.Type.PASSPORT,
+        'ID': Document.Type.NATIONAL_ID,
+    }
+
     def add_arguments(self, parser):
         parser.add_argument('file_path', type=str, help='Path to the CSV file')
         parser.add_argument('--dry-run', action='store_true', help='Run without saving to database')
@@ -51,26 +98,49 @@ class Command(BaseCommand):
                             help='Enable export. Optionally specify path (defaults to profiles_export.xlsx)')
         parser.add_argument('--max-count', type=int, default=None,
                             help='Maximum number of profiles to import (default: all)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f'Rows saved per transaction (default: {DEFAULT_CHUNK_SIZE})')
+        parser.add_argument('--checkpoint', nargs='?', type=str, const='',
+                            help='Save progress after every chunk. Optionally specify path '
+                                 '(defaults to <file>.checkpoint.json)')
+        parser.add_argument('--resume', action='store_true',
+                            help='Resume from the checkpoint file, skipping the rows already imported')
 
     def handle(self, *args, **options):
         dry_run = options.get('dry_run', False)
+        self.verbosity = options.get('verbosity', 1)
         file_path = options['file_path']
         export_path = options.get('export')
         max_count = options.get('max_count')
+        chunk_size = options.get('chunk_size') or DEFAULT_CHUNK_SIZE
+        checkpoint_path = options.get('checkpoint')
+        resume = options.get('resume', False)
+
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be a positive number")
+        if checkpoint_path == '' or (resume and checkpoint_path is None):
+            checkpoint_path = f"{file_path}.checkpoint.json"
 
         # Add debug output for export path
         if export_path:
             self.stdout.write(f"Will export to: {os.path.abspath(export_path)}")
 
-        # Load country codes and store in instance variable
-        self.country_codes = load_country_data()
-        if not self.country_codes:
+        # Load country codes once, indexed by name and dial code
+        country_codes = load_country_data()
+        if not country_codes:
             self.stdout.write(self.style.ERROR("Failed to load country codes"))
             return
+        self.countries = CountryIndex(country_codes)
 
-        result = self.import_profiles_from_csv(file_path, export_path, dry_run, max_count)
+        result = self.import_profiles_from_csv(
+            file_path, export_path, dry_run, max_count,
+            chunk_size=chunk_size, checkpoint_path=checkpoint_path, resume=resume,
+        )
 
-        self.stdout.write(self.style.SUCCESS(f"Successfully imported {result['success_count']} profiles"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully imported {result['success_count']} profiles "
+            f"({result['rows']} rows in {result['elapsed']:.1f}s, {result['rows_per_second']:.0f} rows/s)"
+        ))
         if result['export_path']:
             self.stdout.write(self.style.SUCCESS(f"Exported data to {result['export_path']}"))
         else:
@@ -82,90 +152,84 @@ class Command(BaseCommand):
             for error in result['errors']:
                 self.stdout.write(self.style.ERROR(error))
 
-    def import_profiles_from_csv(self, file_path, export_path, dry_run=False, max_count=None):
+    def import_profiles_from_csv(self, file_path, export_path, dry_run=False, max_count=None,
+                                 chunk_size=DEFAULT_CHUNK_SIZE, checkpoint_path=None, resume=False):
         """
-        Import profiles from a CSV file.
+        Import profiles from a CSV file, one chunk of rows at a time.
 
         Args:
             file_path: Path to the CSV file
             export_path: Path to export Excel file
             dry_run: Whether to commit changes to the database
+            max_count: Maximum number of profiles to import
+            chunk_size: Number of rows validated and saved per transaction
+            checkpoint_path: JSON file recording the last committed row (None: no checkpoint)
+            resume: Skip the rows recorded in the checkpoint file
         """
-        # Initialize counters and collectors
         success_count = 0
         error_count = 0
         errors = []
         export_data = []
+        started = time.monotonic()
+        rows_read = 0
 
-        if not self.country_codes:
+        if not self.countries:
             errors.append("Failed to load country codes")
-            return {'success_count': 0, 'error_count': 1, 'errors': errors, 'export_path': None}
+            return {'success_count': 0, 'error_count': 1, 'errors': errors, 'export_path': None,
+                    'rows': 0, 'elapsed': 0.0, 'rows_per_second': 0.0}
 
-        # Document type mapping
-        document_type_mapping = {
-            'PA': Document.Type.PASSPORT,
-            'ID': Document.Type.NATIONAL_ID,
-        }
+        start_after = 0
+        if resume:
+            checkpoint = self._load_checkpoint(checkpoint_path, file_path)
+            start_after = checkpoint['row']
+            success_count = checkpoint['success_count']
+            error_count = checkpoint['error_count']
+            self.stdout.write(f"Resuming after row {start_after} ({success_count} profiles already imported)")
 
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as csv_file:
-            # First detect actual headers
-            csv_reader = csv.reader(csv_file, delimiter=',')
-            headers = next(csv_reader)
-            self.stdout.write(f"CSV headers: {headers}")
+        # Values already used by an earlier row of this run (the database is checked per chunk)
+        self._seen = {'email': set(), 'matricola': set(), 'person_code': set(), 'document': set(), 'esncard': set()}
 
-            # Reset file pointer and create DictReader
-            csv_file.seek(0)
+        with open(file_path, 'r', encoding='utf-8', errors='replace', newline='') as csv_file:
             csv_reader = csv.DictReader(csv_file, delimiter=',')
+            self.stdout.write(f"CSV headers: {csv_reader.fieldnames}")
 
-            # Read all rows into a list
-            rows = list(csv_reader)
-            # Shuffle rows for random import order
-            random.shuffle(rows)
-
-            # Process each row
-            for row in rows:
-                # Skip rows with missing/null/empty codice_persona or matricola
-                if (not row.get('codice_persona') or row['codice_persona'] in ('NULL', '', None) or
-                        not row.get('matricola') or row['matricola'] in ('NULL', '', None)):
-                    continue
-                if max_count is not None and success_count >= max_count:
+            numbered_rows = islice(enumerate(csv_reader, 1), start_after, None)
+            while max_count is None or success_count < max_count:
+                chunk = list(islice(numbered_rows, chunk_size))
+                if not chunk:
                     break
-                try:
-                    # Process profile data - do this outside the transaction
-                    profile, document, esncard = self._process_row(row, document_type_mapping)
-                    if not profile:
-                        continue
-
-                    # Collect data for export regardless of dry run
-                    profile_data = self._create_export_data(profile, document, esncard)
-                    export_data.append(profile_data)
-
-                    # Only save to database if not dry run
-                    if not dry_run:
-                        with transaction.atomic():
-                            profile.save()
-                            if document:
-                                document.profile = profile
-                                document.save()
-                            if esncard:
-                                esncard.profile = profile
-                                esncard.save()
-                            if profile.is_esner:
-                                user = User.objects.create_user(
-                                    profile=profile,
-                                    password=None
-                                )
-                                user.is_active = False  # Will be activated upon verification
-                                if row['status'] == 'Aspirante':
-                                    group, created = Group.objects.get_or_create(name="Aspiranti")
-                                elif row['status'] == 'Associato':
-                                    group, created = Group.objects.get_or_create(name="Attivi")
-                                user.groups.add(group)
-
-                    success_count += 1
-                except Exception as e:
-                    error_count += 1
-                    errors.append(f"Error processing row for {row.get('email', 'unknown')}: {str(e)}")
+                last_row = chunk[-1][0]
+                rows_read += len(chunk)
+                # Shuffle rows for random import order
+                random.shuffle(chunk)
+
+                entries, chunk_errors = self._prepare_chunk(chunk)
+                truncated = max_count is not None and len(entries) > max_count - success_count
+                if truncated:
+                    entries = entries[:max_count - success_count]
+                if not dry_run and entries:
+                    entries, save_errors = self._save_chunk(entries)
+                    chunk_errors.extend(save_errors)
+
+                export_data.extend(self._create_export_data(e.profile, e.document, e.esncard) for e in entries)
+                success_count += len(entries)
+                error_count += len(chunk_errors)
+                errors.extend(chunk_errors)
+
+                # A chunk cut by --max-count is not complete: resuming must read it again
+                if checkpoint_path and not dry_run and not truncated:
+                    self._save_checkpoint(checkpoint_path, file_path, last_row, success_count, error_count)
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"Row {last_row}: {success_count} imported, {error_count} errors "
+                    f"({rows_read / elapsed if elapsed else 0:.0f} rows/s)"
+                )
+
+        if checkpoint_path and not dry_run and (max_count is None or success_count < max_count):
+            # Whole file imported: a later run starts from the beginning
+            if os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
 
         if dry_run:
             self.stdout.write(self.style.WARNING("Dry run, no changes saved to database"))
@@ -178,20 +242,182 @@ class Command(BaseCommand):
             except Exception as e:
                 errors.append(f"Error creating Excel export: {str(e)}")
 
+        elapsed = time.monotonic() - started
         return {
             'success_count': success_count,
             'error_count': error_count,
             'errors': errors,
-            'export_path': export_file_path
+            'export_path': export_file_path,
+            'rows': rows_read,
+            'elapsed': elapsed,
+            'rows_per_second': rows_read / elapsed if elapsed else 0.0,
         }
 
+    # --- Chunk processing ---
+
+    def _prepare_chunk(self, chunk):
+        """Parse the (row number, row) pairs of a chunk and drop duplicates. Returns (entries, errors)."""
+        entries = []
+        errors = []
+        for number, row in chunk:
+            # Skip rows with missing/null/empty codice_persona or matricola
+            if (not row.get('codice_persona') or row['codice_persona'] in ('NULL', '', None) or
+                    not row.get('matricola') or row['matricola'] in ('NULL', '', None)):
+                continue
+            try:
+                profile, document, esncard = self._process_row(row, self.document_type_mapping)
+            except Exception as e:
+                errors.append(f"Error processing row {number} for {row.get('email', 'unknown')}: {str(e)}")
+                continue
+            if profile:
+                entries.append(ImportRow(number, row, profile, document, esncard))
+        return self._validate_chunk(entries, errors)
+
+    @staticmethod
+    def _unique_values(entry):
+        """(kind, value) pairs of the unique columns set by an entry."""
+        values = [('email', entry.profile.email)]
+        if entry.profile.matricola_number is not None:
+            values.append(('matricola', str(entry.profile.matricola_number)))
+        if entry.profile.person_code is not None:
+            values.append(('person_code', str(entry.profile.person_code)))
+        if entry.document:
+            values.append(('document', entry.document.number))
+        if entry.esncard:
+            values.append(('esncard', entry.esncard.number))
+        return values
+
+    def _validate_chunk(self, entries, errors):
+        """Reject entries whose unique values are already in the database or used by an earlier row."""
+        wanted = {kind: set() for kind in self._seen}
+        for entry in entries:
+            for kind, value in self._unique_values(entry):
+                wanted[kind].add(value)
+
+        existing = {kind: set() for kind in self._seen}
+        if wanted['email'] or wanted['matricola'] or wanted['person_code']:
+            profiles = Profile.objects.filter(
+                Q(email__in=wanted['email'])
+                | Q(matricola_number__in=wanted['matricola'])
+                | Q(person_code__in=wanted['person_code'])
+            ).values_list('email', 'matricola_number', 'person_code')
+            for email, matricola, person_code in profiles:
+                existing['email'].add(email)
+                existing['matricola'].add(matricola)
+                existing['person_code'].add(person_code)
+        if wanted['document']:
+            existing['document'].update(
+                Document.objects.filter(number__in=wanted['document']).values_list('number', flat=True))
+        if wanted['esncard']:
+            existing['esncard'].update(
+                ESNcard.objects.filter(number__in=wanted['esncard']).values_list('number', flat=True))
+
+        valid = []
+        for entry in entries:
+            values = self._unique_values(entry)
+            conflicts = [kind for kind, value in values if value in existing[kind] or value in self._seen[kind]]
+            if conflicts:
+                errors.append(f"Error processing {entry.label}: {', '.join(conflicts)} already exists")
+                continue
+            for kind, value in values:
+                self._seen[kind].add(value)
+            valid.append(entry)
+        return valid, errors
+
+    def _save_chunk(self, entries):
+        """Save a chunk in one transaction; if it fails, retry its rows one at a time. Returns (saved, errors)."""
+        try:
+            with transaction.atomic():
+                self._bulk_save(entries)
+            return entries, []
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f"Chunk insert failed ({e}), saving rows one by one"))
+
+        saved, errors = [], []
+        for entry in entries:
+            for obj in (entry.profile, entry.document, entry.esncard):
+                if obj is not None:
+                    obj.pk = None
+            try:
+                with transaction.atomic():
+                    self._bulk_save([entry])
+                saved.append(entry)
+            except Exception as e:
+                errors.append(f"Error processing {entry.label}: {str(e)}")
+        return saved, errors
+
+    def _bulk_save(self, entries):
+        """Insert profiles, documents, ESNcards, ESNer accounts and their groups with bulk_create."""
+        profiles = [entry.profile for entry in entries]
+        Profile.objects.bulk_create(profiles)
+        if any(profile.pk is None for profile in profiles):
+            # Backends without INSERT ... RETURNING do not set the primary keys
+            ids = dict(Profile.objects.filter(email__in=[p.email for p in profiles]).values_list('email', 'id'))
+            for profile in profiles:
+                profile.pk = ids[profile.email]
+
+        documents, esncards, users, memberships = [], [], [], []
+        groups = {}
+        for entry in entries:
+            if entry.document:
+                entry.document.profile = entry.profile
+                documents.append(entry.document)
+            if entry.esncard:
+                entry.esncard.profile = entry.profile
+                esncards.append(entry.esncard)
+            if entry.profile.is_esner:
+                user = User.objects.create_user(profile=entry.profile, password=None)
+                user.is_active = False  # Will be activated upon verification
+                users.append(user)
+                group_name = GROUP_BY_STATUS.get(entry.row.get('status'))
+                if group_name:
+                    if group_name not in groups:
+                        groups[group_name], _ = Group.objects.get_or_create(name=group_name)
+                    memberships.append(User.groups.through(user_id=entry.profile.email, group=groups[group_name]))
+
+        Document.objects.bulk_create(documents)
+        ESNcard.objects.bulk_create(esncards)
+        User.objects.bulk_create(users)
+        User.groups.through.objects.bulk_create(memberships)
+
+        # bulk_create skips the post_save handlers that maintain these
+        profile_ids = [profile.pk for profile in profiles]
+        refresh_latest_pointers(profile_ids)
+        reindex_profiles(profiles)
+
+    @staticmethod
+    def _load_checkpoint(checkpoint_path, file_path):
+        try:
+            with open(checkpoint_path, 'r', encoding='utf-8') as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+        except FileNotFoundError:
+            raise CommandError(f"Checkpoint file not found: {checkpoint_path}")
+        except ValueError as e:
+            raise CommandError(f"Invalid checkpoint file {checkpoint_path}: {e}")
+        if checkpoint.get('file') != os.path.abspath(file_path):
+            raise CommandError(f"Checkpoint {checkpoint_path} belongs to {checkpoint.get('file')}")
+        return checkpoint
+
+    @staticmethod
+    def _save_checkpoint(checkpoint_path, file_path, row, success_count, error_count):
+        # Written to a temporary file and renamed, so an interrupted run never leaves half a checkpoint
+        tmp_path = f"{checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump({
+                'file': os.path.abspath(file_path),
+                'row': row,
+                'success_count': success_count,
+                'error_count': error_count,
+            }, checkpoint_file)
+        os.replace(tmp_path, checkpoint_path)
+
     def _process_row(self, row, document_type_mapping):
         """Process a single CSV row and return profile, document, and ESNcard objects."""
         if ((self.AA is not None and row['AA'] != self.AA) or
                 (self.status is not None and row['status'] != self.status)):
             return None, None, None
 
-        if 'nome' in row:
+        if 'nome' in row and self.verbosity > 1:
             self.stdout.write(f"Processing {row['nome']} {row['cognome']}")
 
         # Parse birthdate
@@ -204,7 +430,7 @@ class Command(BaseCommand):
 
         # Get country code
         country_name = row.get('nazione', '')
-        country_code = map_country_to_code(country_name, self.country_codes)
+        country_code = self.countries.code(country_name)
         if not country_code:
             self.stdout.write(f"Failed to map country code for {country_name}")
             return None, None, None
@@ -275,11 +501,10 @@ class Command(BaseCommand):
 
         if phone_str.startswith('+'):
             # Try to match country code from our database
-            for country in self.country_codes:
-                dial_code = country['dial']
-                if phone_str.startswith(dial_code):
-                    number_part = phone_str[len(dial_code):]
-                    return dial_code, int(number_part) if number_part.isdigit() else None
+            dial_code = self.countries.match_dial(phone_str)
+            if dial_code:
+                number_part = phone_str[len(dial_code):]
+                return dial_code, int(number_part) if number_part.isdigit() else None
 
             # If we couldn't match a specific code, use a generic approach
             match = re.match(r'^\+(\d{1,4})(\d+)$', phone_str)
@@ -300,7 +525,7 @@ class Command(BaseCommand):
 
         # If we have a country name, try to use its dial code
         elif country_name:
-            dial_code = get_prefix_by_country_code(country_name, self.country_codes)
+            dial_code = self.countries.dial(country_name)
             if dial_code:
                 return dial_code, int(phone_str) if phone_str.isdigit() else None
 
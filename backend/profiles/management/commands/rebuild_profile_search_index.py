@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from profiles.models import Profile
+from profiles.search import reindex_profiles
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the profile search index (ProfileSearchToken) for all profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Profiles reindexed per transaction (default: 500).',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(options.get('batch_size') or 500, 1)
+        profiles = Profile.objects.order_by('pk')
+        last_pk = 0
+        indexed = 0
+        tokens = 0
+        while True:
+            batch = list(profiles.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                tokens += reindex_profiles(batch)
+            indexed += len(batch)
+            last_pk = batch[-1].pk
+            self.stdout.write(f'Indexed {indexed} profiles...')
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} profiles ({tokens} tokens).'))
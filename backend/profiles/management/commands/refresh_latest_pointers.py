@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from profiles.latest import refresh_latest_pointers
+from profiles.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Backfill/repair Profile.latest_esncard and Profile.latest_document from the ESNcard and Document tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Profiles updated per statement (default: 1000).',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(options.get('batch_size') or 1000, 1)
+        profile_ids = list(Profile.objects.order_by('pk').values_list('pk', flat=True))
+        updated = 0
+        for start in range(0, len(profile_ids), batch_size):
+            with transaction.atomic():
+                updated += refresh_latest_pointers(profile_ids[start:start + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(f'Refreshed latest ESNcard/document of {updated} profiles.'))
@@ -3,13 +3,15 @@ from datetime import date
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from backend.audit_models import AuditSnapshotMixin
+
 
 # Base class that will be extended by all models in the database. In this way
 # each object has by default the fields created_at, updated_at, enabled.
 # Enabled serves as a way of marking objects as deleted without actually deleting them
 # from the database.
 
-class BaseEntity(models.Model):
+class BaseEntity(AuditSnapshotMixin, models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     enabled = models.BooleanField(default=True)
@@ -21,6 +23,10 @@ class BaseEntity(models.Model):
         abstract = True
 
 
+# Denormalized pointers of Profile, never written by full saves (see Profile.save)
+LATEST_POINTER_FIELDS = ('latest_esncard', 'latest_document')
+
+
 # Class that describes a Profile
 class Profile(BaseEntity):
     # Inner class describing the Profile.Course type (it's like an enum inner class)
@@ -52,24 +58,27 @@ class Profile(BaseEntity):
     matricola_number = models.CharField(max_length=10, unique=True, null=True)
     matricola_expiration = models.DateField(null=True)
 
+    # Newest enabled ESNcard / document (by created_at), denormalized so that lists can select_related them.
+    # Maintained by profiles.latest on every card/document save and delete;
+    # repaired with `python manage.py refresh_latest_pointers`.
+    latest_esncard = models.ForeignKey('treasury.ESNcard', null=True, blank=True, editable=False,
+                                       on_delete=models.SET_NULL, related_name='+')
+    latest_document = models.ForeignKey('Document', null=True, blank=True, editable=False,
+                                        on_delete=models.SET_NULL, related_name='+')
+
     # Return a string format of the profile object, contains only name, surname and email
     def __str__(self):
         return self.email
 
-    # @property decorator serves for turning functions into field. For example,
-    # instead of calling profile.latest_esncard() I can do profile.latest_esncard
-
-    # Returns latest esncard released to the profile
-    @property
-    def latest_esncard(self):
-        enabled_esncards = self.esncard_set.filter(enabled=True)
-        return enabled_esncards.latest('created_at') if enabled_esncards.exists() else None
-
-    # Returns latest document of the profile
-    @property
-    def latest_document(self):
-        enabled_documents = self.document_set.filter(enabled=True)
-        return enabled_documents.latest('created_at') if enabled_documents.exists() else None
+    def save(self, *args, **kwargs):
+        # The latest_* pointers are written with UPDATEs by profiles.latest: a full save of an instance
+        # loaded earlier must not write back pointers changed in the meantime (e.g. a concurrent emission)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in LATEST_POINTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
 
 # Class that describes document object
@@ -95,3 +104,22 @@ class Document(BaseEntity):
     @property
     def is_valid(self):
         return date.today() < self.expiration
+
+
+# Denormalized search index of a profile: one row per normalized token of its searchable
+# fields, ESNcard numbers and enabled document numbers. Kept up to date by profiles.search.
+class ProfileSearchToken(models.Model):
+    # Rebuilt on every profile/card/document save: not worth auditing
+    __audit_skip__ = True
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='search_tokens')
+    field = models.CharField(max_length=32)
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'field']),
+        ]
+
+    def __str__(self):
+        return f"{self.profile_id} {self.field}:{self.token}"
@@ -0,0 +1,161 @@
+"""
+Indexed profile search used by profile_list and search_profiles.
+
+Every profile has rows in ProfileSearchToken with the normalized (lowercase, no accents)
+tokens of its text fields, ESNcard numbers and enabled document numbers. A search term
+matches a profile when it is a prefix of one of its tokens, so lookups are index range
+scans on ProfileSearchToken.token instead of LIKE '%term%' over every profile column.
+Profiles rank higher when more terms match a whole token.
+
+The index is rebuilt for a profile whenever the profile, one of its ESNcards or one of
+its documents is saved or deleted (signals connected in ProfilesConfig.ready); existing
+data is indexed with `python manage.py rebuild_profile_search_index`.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+
+from profiles.models import Document, Profile, ProfileSearchToken
+
+TOKEN_MAX_LENGTH = ProfileSearchToken._meta.get_field('token').max_length
+
+# Profile columns indexed for the profile lists (char/text/email fields)
+INDEXED_PROFILE_FIELDS = [
+    'email', 'name', 'surname', 'country', 'course', 'phone_prefix', 'phone_number',
+    'whatsapp_prefix', 'whatsapp_number', 'person_code', 'domicile', 'matricola_number',
+]
+ESNCARD_FIELD = 'esncard'
+DISABLED_ESNCARD_FIELD = 'esncard_disabled'
+DOCUMENT_FIELD = 'document'
+
+# Fields matched by the quick search (GET /profiles/search/)
+QUICK_SEARCH_FIELDS = ['name', 'surname', ESNCARD_FIELD]
+
+_WORD = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Lowercase and strip accents ('Nicolò' -> 'nicolo')."""
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(value):
+    """Tokens of a field value: its words plus the whole value without spaces (emails, card numbers)."""
+    if value in (None, ''):
+        return set()
+    normalized = normalize(value)
+    tokens = set(_WORD.findall(normalized))
+    tokens.add(''.join(normalized.split()))
+    return {token[:TOKEN_MAX_LENGTH] for token in tokens if token}
+
+
+def search_terms(query):
+    """Normalized terms of a user query (whitespace separated)."""
+    return [normalize(term)[:TOKEN_MAX_LENGTH] for term in query.split() if term]
+
+
+def profile_tokens(profile, esncards=(), documents=()):
+    """(field, token) pairs to index for a profile and its cards/documents."""
+    pairs = set()
+    for field in INDEXED_PROFILE_FIELDS:
+        pairs.update((field, token) for token in tokenize(getattr(profile, field)))
+    for card in esncards:
+        field = ESNCARD_FIELD if card.enabled else DISABLED_ESNCARD_FIELD
+        pairs.update((field, token) for token in tokenize(card.number))
+    for document in documents:
+        if document.enabled:
+            pairs.update((DOCUMENT_FIELD, token) for token in tokenize(document.number))
+    return pairs
+
+
+def reindex_profiles(profiles):
+    """Rebuild the index rows of the given profiles (instances); returns the number of rows written."""
+    from treasury.models import ESNcard
+
+    profiles = list(profiles)
+    ids = [p.pk for p in profiles]
+    cards, documents = {}, {}
+    for card in ESNcard.objects.filter(profile_id__in=ids).only('profile_id', 'number', 'enabled'):
+        cards.setdefault(card.profile_id, []).append(card)
+    for document in Document.objects.filter(profile_id__in=ids, enabled=True).only('profile_id', 'number', 'enabled'):
+        documents.setdefault(document.profile_id, []).append(document)
+
+    rows = [
+        ProfileSearchToken(profile_id=profile.pk, field=field, token=token)
+        for profile in profiles
+        for field, token in sorted(profile_tokens(profile, cards.get(profile.pk, ()), documents.get(profile.pk, ())))
+    ]
+    ProfileSearchToken.objects.filter(profile_id__in=ids).delete()
+    ProfileSearchToken.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def reindex_profile(profile_id):
+    profile = Profile.objects.filter(pk=profile_id).first()
+    if profile is None:
+        ProfileSearchToken.objects.filter(profile_id=profile_id).delete()
+        return 0
+    return reindex_profiles([profile])
+
+
+def filter_profiles(profiles, query, fields=None):
+    """
+    Restrict the profiles queryset to those matching every term of the query (prefix match on
+    any token, optionally limited to the given index fields) and annotate `search_rank`
+    with the number of terms that match a whole token.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return profiles.annotate(search_rank=Value(0, output_field=IntegerField()))
+
+    index = ProfileSearchToken.objects.all()
+    if fields:
+        index = index.filter(field__in=fields)
+    for term in terms:
+        # istartswith: LIKE 'term%' can use the token index (tokens are stored lowercase)
+        profiles = profiles.filter(pk__in=index.filter(token__istartswith=term).values('profile_id'))
+
+    exact_matches = (
+        index.filter(profile_id=OuterRef('pk'), token__in=terms)
+        .order_by().values('profile_id')
+        .annotate(matches=Count('token', distinct=True))
+        .values('matches')
+    )
+    return profiles.annotate(
+        search_rank=Coalesce(Subquery(exact_matches, output_field=IntegerField()), Value(0))
+    )
+
+
+# --- Index maintenance ---
+
+def _on_profile_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields and not set(update_fields) & set(INDEXED_PROFILE_FIELDS)):
+        return
+    reindex_profiles([instance])
+
+
+def _on_related_saved(sender, instance, raw=False, **kwargs):
+    if not raw and instance.profile_id:
+        reindex_profile(instance.profile_id)
+
+
+def _on_related_deleted(sender, instance, **kwargs):
+    # After commit: when the whole profile is being deleted its cards and documents go first,
+    # and rows written now would reference a profile that is about to disappear
+    profile_id = instance.profile_id
+    if profile_id:
+        transaction.on_commit(lambda: reindex_profile(profile_id))
+
+
+def connect_signals():
+    from treasury.models import ESNcard
+
+    post_save.connect(_on_profile_saved, sender=Profile, dispatch_uid='profile_search_profile_saved')
+    for model in (ESNcard, Document):
+        post_save.connect(_on_related_saved, sender=model, dispatch_uid=f'profile_search_{model.__name__}_saved')
+        post_delete.connect(_on_related_deleted, sender=model, dispatch_uid=f'profile_search_{model.__name__}_deleted')
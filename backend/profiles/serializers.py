@@ -1,5 +1,6 @@
 import re
 
+from django.db import models
 from rest_framework import serializers
 from django_countries.serializer_fields import CountryField
 from rest_framework.fields import SerializerMethodField
@@ -41,6 +42,47 @@ class DocumentEditSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+def primary_group_names(profile_ids):
+    """
+    {profile id: name of the first group (lowest id, as user.groups.first()) of the profile's user},
+    in one query. Profiles without a user or without groups are left out.
+    """
+    names = {}
+    if not profile_ids:
+        return names
+    rows = (User.groups.through.objects
+            .filter(user__profile__id__in=profile_ids)
+            .order_by('group_id')
+            .values_list('user__profile__id', 'group__name'))
+    for profile_id, group_name in rows:
+        names.setdefault(profile_id, group_name)
+    return names
+
+
+def resolve_profile_groups(context, profile_ids):
+    """Load the first group of every profile in profile_ids into the serializer context, in one query."""
+    groups = context.setdefault('profile_groups', {'resolved': set(), 'names': {}})
+    groups['names'].update(primary_group_names(profile_ids))
+    groups['resolved'].update(profile_ids)
+
+
+def primary_group_name(serializer, profile):
+    # Lists resolve the whole page at once (resolve_profile_groups); single objects cost one query
+    groups = serializer.context.get('profile_groups')
+    if groups is not None and profile.pk in groups.get('resolved', ()):
+        return groups['names'].get(profile.pk)
+    return primary_group_names([profile.pk]).get(profile.pk)
+
+
+class ProfileGroupsListSerializer(serializers.ListSerializer):
+    """List serializer for profile serializers with a `group` field: one query for the whole page."""
+
+    def to_representation(self, data):
+        profiles = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        resolve_profile_groups(self.context, [p.pk for p in profiles if self.child.needs_group(p)])
+        return super().to_representation(profiles)
+
+
 # Serializer to view a profile in detail (i.e. including all esncards, documents and matricole),
 class ProfileDetailViewSerializer(serializers.ModelSerializer):
     esncards = SerializerMethodField()
@@ -55,6 +97,7 @@ class ProfileDetailViewSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_views = ['id', 'created_at', 'updated_at', 'enabled', 'esncards', 'documents',
                            'latest_esncard', 'latest_document']
+        list_serializer_class = ProfileGroupsListSerializer
 
     @staticmethod
     def get_esncards(obj):
@@ -67,13 +110,11 @@ class ProfileDetailViewSerializer(serializers.ModelSerializer):
         return DocumentViewSerializer(enabled_documents, many=True).data
 
     @staticmethod
-    def get_group(obj):
-        try:
-            user = User.objects.get(profile=obj)
-            group_obj = user.groups.first()
-            return group_obj.name if group_obj else None
-        except User.DoesNotExist:
-            return None
+    def needs_group(obj):
+        return True
+
+    def get_group(self, obj):
+        return primary_group_name(self, obj)
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
@@ -92,17 +133,17 @@ class ProfileListViewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Profile
         fields = '__all__'
+        list_serializer_class = ProfileGroupsListSerializer
 
     @staticmethod
-    def get_group(obj):
-        if getattr(obj, 'is_esner', False):
-            try:
-                user = User.objects.get(profile=obj)
-                group_obj = user.groups.first()
-                return group_obj.name if group_obj else None
-            except User.DoesNotExist:
-                return None
-        return None
+    def needs_group(obj):
+        # Only ESNers have a group
+        return getattr(obj, 'is_esner', False)
+
+    def get_group(self, obj):
+        if not self.needs_group(obj):
+            return None
+        return primary_group_name(self, obj)
 
 
 # Serializer for editing a profile (except for specified fields)
@@ -151,7 +192,7 @@ class ZeroPlaceholderMixin:
 class ProfileFullEditSerializer(ZeroPlaceholderMixin, serializers.ModelSerializer):
     class Meta:
         model = Profile
-        exclude = ['id', 'created_at', 'updated_at', 'enabled', 'email']
+        exclude = ['id', 'created_at', 'updated_at', 'enabled', 'email', 'latest_esncard', 'latest_document']
         extra_kwargs = {
             'person_code': {'required': False, 'allow_blank': True},
             'matricola_number': {'required': False, 'allow_blank': True},
@@ -187,7 +228,7 @@ class ProfileFullEditSerializer(ZeroPlaceholderMixin, serializers.ModelSerialize
 class ProfileCreateSerializer(ZeroPlaceholderMixin, serializers.ModelSerializer):
     class Meta:
         model = Profile
-        exclude = ['id', 'created_at', 'updated_at', 'enabled', 'email_is_verified']
+        exclude = ['id', 'created_at', 'updated_at', 'enabled', 'email_is_verified', 'latest_esncard', 'latest_document']
         extra_kwargs = {
             'person_code': {'required': False, 'allow_blank': True},
             'matricola_number': {'required': False, 'allow_blank': True},
@@ -1,18 +1,27 @@
 """Tests for profiles module endpoints and behaviors."""
 
+import csv
+import json
+import os
+import tempfile
 from datetime import timedelta
+from io import StringIO
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
 from django.core import mail
+from django.core.management import call_command
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 from rest_framework.test import APITestCase
 
 from events.models import Event, EventList, Subscription, EventOrganizer
-from profiles.models import Profile, Document
+from profiles.models import Profile, Document, ProfileSearchToken
+from profiles.search import filter_profiles
 from profiles.tokens import email_verification_token
 from treasury.models import ESNcard
 
@@ -131,6 +140,30 @@ class ProfileListTests(ProfilesBaseTestCase):
 		self.assertIn("board@esnpolimi.it", emails)
 		self.assertNotIn("attivo@esnpolimi.it", emails)
 
+	def test_esner_list_resolves_groups_in_one_query(self):
+		"""Groups of a whole ESNers page are resolved together, not per row."""
+		viewer = _create_user(_create_profile("viewer@esnpolimi.it", is_esner=True))
+		viewer.groups.add(self.group_board)
+		self.authenticate(viewer)
+
+		def add_esners(count):
+			for _ in range(count):
+				index = Profile.objects.count()
+				user = _create_user(_create_profile(f"esner{index}@esnpolimi.it", is_esner=True))
+				user.groups.add(self.group_attivi)
+
+		add_esners(2)
+		with CaptureQueriesContext(connection) as small:
+			self.client.get("/backend/esner_profiles/")
+		add_esners(6)
+		with CaptureQueriesContext(connection) as large:
+			response = self.client.get("/backend/esner_profiles/?page_size=50")
+
+		self.assertEqual(len(small), len(large))
+		groups = {p["email"]: p["group"] for p in response.data["results"]}
+		self.assertEqual(groups["viewer@esnpolimi.it"], "Board")
+		self.assertEqual(groups["esner3@esnpolimi.it"], "Attivi")
+
 	def test_profile_list_search_by_name(self):
 		"""Search should filter profiles by name token."""
 		viewer_profile = _create_profile("viewer@esnpolimi.it", is_esner=True)
@@ -195,6 +228,34 @@ class ProfileListTests(ProfilesBaseTestCase):
 		self.assertIn("valid@uni.it", emails)
 		self.assertIn("absent@uni.it", emails)
 
+	def test_profile_list_esncard_validity_uses_latest_enabled_card_and_paginates(self):
+		"""Validity is decided by the latest enabled card, at the Sept 1 boundary, with SQL pagination."""
+		viewer = _create_user(_create_profile("viewer@esnpolimi.it", is_esner=True))
+		self.authenticate(viewer)
+		valid_since = ESNcard.valid_since()
+
+		for i in range(3):
+			card = ESNcard.objects.create(profile=_create_profile(f"valid{i}@uni.it"), number=f"VAL{i}")
+			if i == 0:
+				ESNcard.objects.filter(pk=card.pk).update(created_at=valid_since)
+		boundary = ESNcard.objects.create(profile=_create_profile("boundary@uni.it"), number="BOUNDARY")
+		ESNcard.objects.filter(pk=boundary.pk).update(created_at=valid_since - timedelta(seconds=1))
+		# A newer but disabled card does not count
+		revoked = _create_profile("revoked@uni.it")
+		old_card = ESNcard.objects.create(profile=revoked, number="OLD")
+		ESNcard.objects.filter(pk=old_card.pk).update(created_at=valid_since - timedelta(days=30))
+		ESNcard.objects.create(profile=revoked, number="REVOKED", enabled=False)
+
+		for card in ESNcard.objects.filter(enabled=True):
+			self.assertEqual(card.is_valid, card.created_at >= valid_since)
+
+		response = self.client.get("/backend/erasmus_profiles/?esncardValidity=valid&page_size=2&ordering=esncard")
+		self.assertEqual(response.data["count"], 3)
+		self.assertEqual([p["email"] for p in response.data["results"]], ["valid0@uni.it", "valid1@uni.it"])
+
+		response = self.client.get("/backend/erasmus_profiles/?esncardValidity=expired")
+		self.assertCountEqual([p["email"] for p in response.data["results"]], ["boundary@uni.it", "revoked@uni.it"])
+
 
 class InitiateProfileCreationTests(ProfilesBaseTestCase):
 	"""Tests for profile initiate creation endpoint."""
@@ -401,6 +462,7 @@ class VerifyEmailTests(ProfilesBaseTestCase):
 		self.assertTrue(profile.enabled)
 		self.assertTrue(profile.email_is_verified)
 		self.assertTrue(document.enabled)
+		self.assertEqual(profile.latest_document_id, document.pk)
 
 	def test_verify_email_already_verified_esner(self):
 		"""Already verified ESNer should return success message."""
@@ -866,6 +928,58 @@ class SearchProfilesTests(ProfilesBaseTestCase):
 		self.assertEqual(response.status_code, 200)
 		self.assertEqual(response.data["results"][0]["email"], "card@uni.it")
 
+	def test_search_prefix_accents_and_ranking(self):
+		"""Terms prefix-match tokens ignoring case/accents; whole-word matches rank first."""
+		viewer = _create_user(_create_profile("viewer@esnpolimi.it", is_esner=True))
+		self.authenticate(viewer)
+
+		_create_profile("rossi@uni.it", is_esner=False, name="Nicolò", surname="Rossi")
+		_create_profile("rossini@uni.it", is_esner=False, name="Nicola", surname="Rossini")
+		_create_profile("bianchi@uni.it", is_esner=False, name="Anna", surname="Bianchi")
+
+		response = self.client.get("/backend/profiles/search/?q=nicol ross")
+		emails = [p["email"] for p in response.data["results"]]
+		self.assertCountEqual(emails, ["rossi@uni.it", "rossini@uni.it"])
+
+		response = self.client.get("/backend/profiles/search/?q=NICOLO rossi")
+		self.assertEqual([p["email"] for p in response.data["results"]], ["rossi@uni.it"])
+
+		response = self.client.get("/backend/erasmus_profiles/?search=ross")
+		self.assertEqual([p["email"] for p in response.data["results"]], ["rossini@uni.it", "rossi@uni.it"])
+		response = self.client.get("/backend/erasmus_profiles/?search=rossi")
+		self.assertEqual([p["email"] for p in response.data["results"]], ["rossi@uni.it", "rossini@uni.it"])
+
+	def test_search_index_follows_profile_and_document_changes(self):
+		"""Saving a profile or deleting a document updates the search index."""
+		viewer = _create_user(_create_profile("viewer@esnpolimi.it", is_esner=True))
+		self.authenticate(viewer)
+		profile = _create_profile("doc@uni.it", is_esner=False, name="Paola")
+		document = Document.objects.create(profile=profile, type="Passport", number="YA1234567",
+										   expiration=timezone.now().date() + timedelta(days=365))
+
+		response = self.client.get("/backend/erasmus_profiles/?search=ya1234")
+		self.assertEqual([p["email"] for p in response.data["results"]], ["doc@uni.it"])
+
+		with self.captureOnCommitCallbacks(execute=True):
+			document.delete()
+		response = self.client.get("/backend/erasmus_profiles/?search=ya1234")
+		self.assertEqual(response.data["results"], [])
+
+		profile.name = "Giulia"
+		profile.save()
+		self.assertEqual(self.client.get("/backend/profiles/search/?q=paola").data["results"], [])
+		self.assertEqual(len(self.client.get("/backend/profiles/search/?q=giul").data["results"]), 1)
+
+	def test_rebuild_profile_search_index_command(self):
+		"""The rebuild command restores missing index rows."""
+		profile = _create_profile("rebuild@uni.it", is_esner=False, name="Marta")
+		ProfileSearchToken.objects.all().delete()
+
+		call_command("rebuild_profile_search_index", "--batch-size", "1", stdout=StringIO())
+
+		self.assertTrue(ProfileSearchToken.objects.filter(profile=profile, field="name", token="marta").exists())
+		self.assertTrue(ProfileSearchToken.objects.filter(profile=profile, field="email", token="rebuild@uni.it").exists())
+
 
 class CheckErasmusEmailTests(ProfilesBaseTestCase):
 	"""Tests for check_erasmus_email endpoint."""
@@ -1061,6 +1175,71 @@ class ProfileModelTests(ProfilesBaseTestCase):
 		latest = profile.latest_document
 		self.assertEqual(latest.number, "DOC1")
 
+	def test_latest_pointers_follow_disable_and_delete(self):
+		"""Disabling or deleting the latest card/document moves the pointer to the previous one."""
+		profile = _create_profile("pointers@uni.it", is_esner=False)
+		old_card = ESNcard.objects.create(profile=profile, number="OLD-CARD")
+		ESNcard.objects.filter(pk=old_card.pk).update(created_at=timezone.now() - timedelta(days=10))
+		new_card = ESNcard.objects.create(profile=profile, number="NEW-CARD")
+		document = Document.objects.create(profile=profile, type="Passport", number="PTR1", expiration="2030-01-01")
+
+		profile.refresh_from_db()
+		self.assertEqual(profile.latest_esncard, new_card)
+		self.assertEqual(profile.latest_document, document)
+
+		new_card.enabled = False
+		new_card.save()
+		document.delete()
+		profile.refresh_from_db()
+		self.assertEqual(profile.latest_esncard, old_card)
+		self.assertIsNone(profile.latest_document)
+
+	def test_full_save_of_stale_profile_keeps_latest_pointers(self):
+		"""Saving a profile loaded before a card emission does not reset its pointer."""
+		profile = _create_profile("stale@uni.it", is_esner=False)
+		stale = Profile.objects.get(pk=profile.pk)
+		card = ESNcard.objects.create(profile=profile, number="STALE-1")
+
+		stale.name = "Edited"
+		stale.save()
+
+		profile.refresh_from_db()
+		self.assertEqual(profile.name, "Edited")
+		self.assertEqual(profile.latest_esncard, card)
+
+	def test_refresh_latest_pointers_command_repairs_pointers(self):
+		"""The backfill command recomputes pointers written around the signals."""
+		profile = _create_profile("repair@uni.it", is_esner=False)
+		card = ESNcard.objects.create(profile=profile, number="REPAIR-1")
+		Profile.objects.filter(pk=profile.pk).update(latest_esncard=None)
+
+		call_command("refresh_latest_pointers", stdout=StringIO())
+
+		profile.refresh_from_db()
+		self.assertEqual(profile.latest_esncard, card)
+
+	def test_profile_list_latest_columns_cost_no_queries_per_row(self):
+		"""Card and document columns of a profile page come from select_related pointers."""
+		viewer = _create_user(_create_profile("viewer@esnpolimi.it", is_esner=True))
+		self.authenticate(viewer)
+
+		def add_profiles(count):
+			for _ in range(count):
+				index = Profile.objects.count()
+				profile = _create_profile(f"row{index}@uni.it", is_esner=False)
+				ESNcard.objects.create(profile=profile, number=f"ROW-{index:05d}")
+				Document.objects.create(profile=profile, type="Passport", number=f"DOC{index}", expiration="2030-01-01")
+
+		add_profiles(2)
+		with CaptureQueriesContext(connection) as small:
+			self.client.get("/backend/erasmus_profiles/")
+		add_profiles(6)
+		with CaptureQueriesContext(connection) as large:
+			response = self.client.get("/backend/erasmus_profiles/")
+
+		self.assertEqual(len(small), len(large))
+		self.assertTrue(all(p["latest_esncard"]["number"].startswith("ROW-") for p in response.data["results"]))
+
 	def test_profile_str_representation(self):
 		"""Profile str should return email."""
 		profile = _create_profile("str@uni.it", is_esner=False, name="Test", surname="User")
@@ -1240,6 +1419,8 @@ class ManualErasmusVerificationTests(ProfilesBaseTestCase):
 		self.assertTrue(target_profile.enabled)
 		self.assertTrue(target_profile.email_is_verified)
 		self.assertTrue(doc.enabled)
+		self.assertEqual(target_profile.latest_document_id, doc.pk)
+		self.assertTrue(filter_profiles(Profile.objects.all(), "DOCMANUAL001").filter(pk=target_profile.pk).exists())
 
 	def test_manual_verify_esner_target_success(self):
 		"""Manual verify endpoint can also verify ESNer profiles."""
@@ -1269,4 +1450,103 @@ class ManualErasmusVerificationTests(ProfilesBaseTestCase):
 		target_profile = _create_profile("erasmus3@uni.it", is_esner=False, verified=True, enabled=True)
 		response = self.client.post(f"/backend/profile/{target_profile.pk}/manual-verify-email/")
 
-		self.assertEqual(response.status_code, 200)
\ No newline at end of file
+		self.assertEqual(response.status_code, 200)
+
+class ImportProfilesFromCSVTests(ProfilesBaseTestCase):
+	"""Tests for the chunked importProfilesFromCSV command."""
+
+	HEADERS = [
+		"nome", "cognome", "email", "data_nascita", "nazione", "telefono", "whatsapp", "matricola",
+		"codice_persona", "data_iscrizione", "periodo_permanenza", "status", "documento",
+		"tipo_documento", "data_documento", "ESN_card", "indirizzo_residenza",
+	]
+
+	def _write_csv(self, rows):
+		handle = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8", newline="")
+		with handle:
+			writer = csv.DictWriter(handle, fieldnames=self.HEADERS)
+			writer.writeheader()
+			for row in rows:
+				writer.writerow({header: row.get(header, "") for header in self.HEADERS})
+		self.addCleanup(lambda: os.path.exists(handle.name) and os.remove(handle.name))
+		return handle.name
+
+	def _row(self, index, **overrides):
+		row = {
+			"nome": f"Nome{index}",
+			"cognome": f"Cognome{index}",
+			"email": f"import{index}@mail.polimi.it",
+			"data_nascita": "15/01/2000",
+			"nazione": "Spain",
+			"telefono": f"+34600{index:06d}",
+			"matricola": f"{100000 + index}",
+			"codice_persona": f"{10000000 + index}",
+			"data_iscrizione": "2024-09-15 10:00:00",
+			"periodo_permanenza": "1",
+			"status": "Erasmus",
+			"documento": f"DOC{index}",
+			"tipo_documento": "PA",
+			"data_documento": "01/01/2030",
+			"ESN_card": f"CARD{index}",
+		}
+		row.update(overrides)
+		return row
+
+	def test_import_creates_profiles_in_chunks(self):
+		"""Rows are saved in chunks with documents, cards, ESNer accounts, groups and search index."""
+		_create_profile("taken@mail.polimi.it")
+		path = self._write_csv([
+			self._row(1),
+			self._row(2, status="Associato", ESN_card=""),
+			self._row(3, email="taken@mail.polimi.it"),
+			self._row(4, documento="DOC1"),
+			self._row(5, matricola="NULL"),
+		])
+		out = StringIO()
+
+		call_command("importProfilesFromCSV", path, "--chunk-size", "2", stdout=out)
+
+		self.assertEqual(Profile.objects.filter(email__startswith="import").count(), 2)
+		erasmus = Profile.objects.get(email="import1@mail.polimi.it")
+		self.assertEqual(erasmus.country, "ES")
+		self.assertEqual(erasmus.phone_prefix, "+34")
+		self.assertEqual(erasmus.latest_esncard.number, "CARD1")
+		self.assertEqual(erasmus.latest_document.number, "DOC1")
+		self.assertTrue(ProfileSearchToken.objects.filter(profile=erasmus, token="card1").exists())
+		self.assertFalse(User.objects.filter(profile=erasmus).exists())
+
+		esner = Profile.objects.get(email="import2@mail.polimi.it")
+		self.assertTrue(esner.is_esner)
+		self.assertEqual(list(esner.user.groups.values_list("name", flat=True)), ["Attivi"])
+		self.assertIsNone(esner.latest_esncard)
+
+		output = out.getvalue()
+		self.assertIn("Successfully imported 2 profiles", output)
+		self.assertIn("rows/s", output)
+		self.assertIn("email already exists", output)
+		self.assertIn("document already exists", output)
+
+	def test_import_resumes_from_checkpoint(self):
+		"""--resume skips the rows recorded in the checkpoint and the checkpoint is removed at the end."""
+		path = self._write_csv([self._row(index) for index in range(1, 5)])
+		checkpoint = f"{path}.checkpoint.json"
+		self.addCleanup(lambda: os.path.exists(checkpoint) and os.remove(checkpoint))
+		with open(checkpoint, "w", encoding="utf-8") as handle:
+			json.dump({"file": os.path.abspath(path), "row": 2, "success_count": 2, "error_count": 0}, handle)
+
+		out = StringIO()
+		call_command("importProfilesFromCSV", path, "--resume", "--chunk-size", "1", stdout=out)
+
+		imported = set(Profile.objects.filter(email__startswith="import").values_list("email", flat=True))
+		self.assertEqual(imported, {"import3@mail.polimi.it", "import4@mail.polimi.it"})
+		self.assertIn("Successfully imported 4 profiles", out.getvalue())
+		self.assertFalse(os.path.exists(checkpoint))
+
+	def test_dry_run_saves_nothing(self):
+		"""--dry-run validates the rows without writing profiles or a checkpoint."""
+		path = self._write_csv([self._row(1), self._row(2)])
+
+		call_command("importProfilesFromCSV", path, "--dry-run", "--checkpoint", stdout=StringIO())
+
+		self.assertFalse(Profile.objects.filter(email__startswith="import").exists())
+		self.assertFalse(os.path.exists(f"{path}.checkpoint.json"))
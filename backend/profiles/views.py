@@ -7,7 +7,6 @@ from django.core.mail import send_mail
 from django.db import transaction
 from django.db.models import Q, OuterRef, Subquery, Value
 from django.db.models.functions import Coalesce
-from django.db import models
 from django.utils.encoding import force_bytes
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
@@ -22,11 +21,14 @@ from django.core.paginator import InvalidPage
 MSG_INTERNAL_ERROR = 'Errore interno del server.'
 
 from events.models import Subscription, EventOrganizer
-from events.serializers import SubscriptionSerializer, OrganizedEventSerializer
+from events.serializers import SubscriptionSerializer, OrganizedEventSerializer, build_subscription_roster_context
+from profiles.latest import refresh_latest_pointers
 from profiles.models import Profile, Document
+from profiles.search import QUICK_SEARCH_FIELDS, filter_profiles, reindex_profile
 from profiles.serializers import DocumentCreateSerializer, DocumentEditSerializer, ProfileFullEditSerializer
 from profiles.serializers import ProfileListViewSerializer, ProfileCreateSerializer, ProfileDetailViewSerializer
 from profiles.tokens import email_verification_token
+from treasury.models import ESNcard
 from users.models import User
 from users.serializers import UserGroupEditSerializer
 from utils.permissions import user_is_board
@@ -34,14 +36,6 @@ from utils.permissions import user_is_board
 logger = logging.getLogger(__name__)
 SCHEME_HOST = settings.SCHEME_HOST
 
-# Dynamically collect searchable Profile fields (char/text/email)
-SEARCHABLE_PROFILE_FIELDS = [
-    f.name for f in Profile._meta.get_fields()
-    if hasattr(f, 'attname') and isinstance(f, (models.CharField, models.TextField, models.EmailField))
-    and f.name not in ['password']
-]
-
-
 def get_action_permissions(action, user):
     """
     Returns True if the user has permission for the specified action.
@@ -57,11 +51,26 @@ def get_action_permissions(action, user):
     return True
 
 
+def _latest_esncards():
+    """Enabled ESNcards of the outer profile, newest first (Profile.latest_esncard as a subquery)."""
+    return ESNcard.objects.filter(profile=OuterRef('pk'), enabled=True).order_by('-created_at')
+
+
+def _set_documents_enabled(profile, enabled):
+    """
+    Enable/disable every document of the profile. update() sends no signals, so the latest
+    document pointer and the search index (document numbers) are refreshed here.
+    """
+    Document.objects.filter(profile=profile).update(enabled=enabled)
+    refresh_latest_pointers([profile.pk], esncard=False)
+    reindex_profile(profile.pk)
+
+
 # Endpoint to retrieve a list of Erasmus or ESNers profiles. Pagination is implemented
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def profile_list(request, is_esner):
-    profiles = Profile.objects.filter(is_esner=is_esner)
+    profiles = Profile.objects.filter(is_esner=is_esner).select_related('latest_esncard', 'latest_document')
     # Ordering (simplified whitelist + composite handling)
     ordering_param = request.GET.get('ordering', '-created_at').strip()
     if ordering_param:
@@ -91,6 +100,12 @@ def profile_list(request, is_esner):
                 _latest_doc_number=Coalesce(latest_doc_number_sq, Value(''))
             )
             order_expressions = ['-_latest_doc_number' if desc else '_latest_doc_number']
+        elif base == 'esncard':
+            # DB-side annotation of latest enabled ESNcard number
+            profiles = profiles.annotate(
+                _latest_esncard_number=Coalesce(Subquery(_latest_esncards().values('number')[:1]), Value(''))
+            )
+            order_expressions = ['-_latest_esncard_number' if desc else '_latest_esncard_number']
         else:
             order_expressions = [f'-{normalized}' if desc else normalized]
 
@@ -101,20 +116,10 @@ def profile_list(request, is_esner):
 
     search = request.GET.get('search', '').strip()
     if search:
-        # Support multi-token search: each token must appear in at least one field (AND across tokens)
-        tokens = [t for t in search.split() if t]
-        for token in tokens:
-            token_q = Q()
-            for field_name in SEARCHABLE_PROFILE_FIELDS:
-                print(f"Searching in field: {field_name}")
-                token_q |= Q(**{f"{field_name}__icontains": token})
-            # Extra related / composite fields
-            token_q |= Q(esncard__number__icontains=token)
-            token_q |= Q(document__enabled=True, document__number__icontains=token)
-            token_q |= Q(phone_prefix__icontains=token) | Q(phone_number__icontains=token)
-            token_q |= Q(whatsapp_prefix__icontains=token) | Q(whatsapp_number__icontains=token)
-            profiles = profiles.filter(token_q)
-        profiles = profiles.distinct()
+        # Every term must prefix-match a token of the profile (see profiles.search)
+        profiles = filter_profiles(profiles, search)
+        if not request.GET.get('ordering'):
+            profiles = profiles.order_by('-search_rank', '-created_at')
 
     # Filter by user's group (only if ESNer)
     if is_esner:
@@ -126,24 +131,22 @@ def profile_list(request, is_esner):
                     .values_list('profile__id', flat=True).distinct()
                 profiles = profiles.filter(id__in=user_profile_ids)
 
-    # Updated ESNcard validity multi-selection filtering (union logic)
+    # ESNcard validity multi-selection filtering (union logic), on the latest enabled card
     esncard_validity_param = request.GET.get('esncardValidity', '')
     if esncard_validity_param:
         validity_values = [v.strip() for v in esncard_validity_param.split(',') if v.strip()]
-        profiles = profiles.prefetch_related('esncard_set')
-        profiles_list = list(profiles)
-        union_ids = set()
-        for profile in profiles_list:
-            card = profile.latest_esncard
-            if card:
-                if card.is_valid and 'valid' in validity_values:
-                    union_ids.add(profile.id)
-                elif not card.is_valid and 'expired' in validity_values:
-                    union_ids.add(profile.id)
-            else:
-                if 'absent' in validity_values:
-                    union_ids.add(profile.id)
-        profiles = profiles.filter(id__in=union_ids) if union_ids else profiles.none()
+        profiles = profiles.annotate(_latest_esncard_created_at=Subquery(
+            _latest_esncards().values('created_at')[:1]
+        ))
+        valid_since = ESNcard.valid_since()
+        validity_q = Q(pk__in=[])
+        if 'valid' in validity_values:
+            validity_q |= Q(_latest_esncard_created_at__gte=valid_since)
+        if 'expired' in validity_values:
+            validity_q |= Q(_latest_esncard_created_at__lt=valid_since)
+        if 'absent' in validity_values:
+            validity_q |= Q(_latest_esncard_created_at__isnull=True)
+        profiles = profiles.filter(validity_q)
 
     paginator = PageNumberPagination()
     paginator.page_size_query_param = 'page_size'
@@ -302,10 +305,10 @@ def verify_email_and_enable_profile(request, uid, token):
     with transaction.atomic():
         profile.email_is_verified = True
         profile.enabled = True
-        profile.save()
+        profile.save(update_fields=['email_is_verified', 'enabled'])
 
         # Enable document
-        Document.objects.filter(profile=profile).update(enabled=True)
+        _set_documents_enabled(profile, True)
 
         # Activate user if esner
         if profile.is_esner:
@@ -358,7 +361,7 @@ def manual_verify_profile_email(request, pk):
         profile.enabled = True
         profile.email_is_verified = True
         profile.save(update_fields=['enabled', 'email_is_verified'])
-        Document.objects.filter(profile=profile).update(enabled=True)
+        _set_documents_enabled(profile, True)
             
         if profile.is_esner:
             try:
@@ -370,7 +373,7 @@ def manual_verify_profile_email(request, pk):
                 profile.enabled = False
                 profile.email_is_verified = False
                 profile.save(update_fields=['enabled', 'email_is_verified'])
-                Document.objects.filter(profile=profile).update(enabled=False)
+                _set_documents_enabled(profile, False)
                 return Response({'error': 'L\'utente associato a questo profilo non esiste. Impossibile attivare il profilo.'}, status=409)
 
     profile_type_label = 'ESNer' if profile.is_esner else 'Erasmus'
@@ -500,16 +503,10 @@ def search_profiles(request):
     if len(query) < 2:
         return Response({"results": []})
 
-    # Search by name, surname, or esncard
-    tokens = query.split()
-    q_filter = Q()
-    for token in tokens:
-        q_filter &= (
-                Q(name__icontains=token) |
-                Q(surname__icontains=token) |
-                Q(esncard__enabled=True, esncard__number__icontains=token)
-        )
-    profiles = Profile.objects.filter(q_filter).distinct()
+    # Search by name, surname, or enabled esncard number
+    profiles = filter_profiles(
+        Profile.objects.select_related('latest_esncard', 'latest_document'), query, fields=QUICK_SEARCH_FIELDS
+    )
 
     if valid_only:
         profiles = profiles.filter(enabled=True, email_is_verified=True)
@@ -517,8 +514,8 @@ def search_profiles(request):
     if esner_only:
         profiles = profiles.filter(is_esner=True)
 
-    # Order by most relevant (exact matches first, then contains)
-    profiles = profiles.order_by('-created_at')
+    # Most relevant first (whole-word matches), then newest
+    profiles = profiles.order_by('-search_rank', '-created_at')
 
     paginator = PageNumberPagination()
     paginator.page_size_query_param = 'page_size'
@@ -552,8 +549,8 @@ def profile_subscriptions(request, pk):
                 status=403
             )
         
-        subs = Subscription.objects.filter(profile_id=pk).select_related('event', 'list')
-        serializer = SubscriptionSerializer(subs, many=True)
+        subs = list(Subscription.objects.filter(profile_id=pk).select_related('event', 'list', 'profile'))
+        serializer = SubscriptionSerializer(subs, many=True, context=build_subscription_roster_context(subs))
         return Response(serializer.data, status=200)
     except Profile.DoesNotExist:
         return Response({'error': 'Profilo non trovato.'}, status=404)
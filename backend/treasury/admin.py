@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from treasury.models import ESNcard, Transaction, Account, Settings, ReimbursementRequest
+from treasury.models import ESNcard, Transaction, Account, AccountDailyBalance, Settings, ReimbursementRequest
 
 
 @admin.register(Settings)
@@ -231,3 +231,18 @@ class ReimbursementRequestAdmin(admin.ModelAdmin):
         if obj and obj.is_reimbursed:
             return False
         return super().has_delete_permission(request, obj)
+
+
+@admin.register(AccountDailyBalance)
+class AccountDailyBalanceAdmin(admin.ModelAdmin):
+    list_display = ('account', 'day', 'opening', 'closing', 'inflows', 'outflows', 'transactions_count')
+    list_filter = ('account',)
+    date_hierarchy = 'day'
+    ordering = ('-day', 'account')
+
+    # Written only by snapshot_account_balances
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
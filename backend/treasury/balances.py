@@ -0,0 +1,228 @@
+"""
+Daily account balances (AccountDailyBalance snapshots).
+
+snapshot_daily_balances() (nightly `python manage.py snapshot_account_balances`) keeps one row
+per account and day (Europe/Rome), from the account's first day up to yesterday:
+- a run only adds the days after the last snapshotted one, from a single GROUP BY over the
+  transactions of those days;
+- the opening balance of the new days is the current Account.balance minus everything created
+  since, as the reports always computed it. If it differs from the stored closing of the day
+  before, a transaction of an already snapshotted day was edited, moved or deleted: the rows of
+  that account are recomputed from its first day. rebuild=True recomputes every account.
+
+day_balances() returns opening/closing balances and totals of a range of days: snapshotted
+days are read from the table (one indexed query, whatever the age of the day), only the days
+after the last snapshot are computed from the ledger.
+
+Transactions are grouped by (account, UTC hour) in the database and the hours folded into local
+days here: Europe/Rome offsets are whole hours, and truncating in UTC needs no time zone
+conversion by MySQL (which would require its time zone tables to be loaded).
+"""
+import logging
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, Max, Min, Sum, Value, When
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from treasury.export_rows import export_timezone
+from treasury.models import Account, AccountDailyBalance, Transaction
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal("0.00")
+_AMOUNT_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _to_decimal(value):
+    return Decimal(str(value or 0))
+
+
+def day_start(day, tz):
+    """Aware datetime of the local midnight starting day."""
+    return timezone.make_aware(datetime.combine(day, time.min), tz)
+
+
+def _transactions(account_ids=None):
+    txs = Transaction.objects.order_by()
+    return txs if account_ids is None else txs.filter(account_id__in=account_ids)
+
+
+def daily_totals(start_dt, end_dt, tz, account_ids=None):
+    """
+    {(account id, local day): {"total", "inflows", "outflows", "count"}} of the transactions
+    created in [start_dt, end_dt). Outflows are positive.
+    """
+    rows = _transactions(account_ids).filter(
+        created_at__gte=start_dt,
+        created_at__lt=end_dt,
+    ).annotate(
+        hour=TruncHour("created_at", tzinfo=dt_timezone.utc),
+    ).values("account_id", "hour").annotate(
+        total=Sum("amount"),
+        total_in=Sum(Case(When(amount__gt=0, then="amount"), default=Value(ZERO), output_field=_AMOUNT_FIELD)),
+        total_out=Sum(Case(When(amount__lt=0, then="amount"), default=Value(ZERO), output_field=_AMOUNT_FIELD)),
+        count=Count("id"),
+    )
+    totals = {}
+    for row in rows:
+        key = (row["account_id"], row["hour"].astimezone(tz).date())
+        bucket = totals.setdefault(key, {"total": ZERO, "inflows": ZERO, "outflows": ZERO, "count": 0})
+        bucket["total"] += _to_decimal(row["total"])
+        bucket["inflows"] += _to_decimal(row["total_in"])
+        bucket["outflows"] -= _to_decimal(row["total_out"])
+        bucket["count"] += row["count"]
+    return totals
+
+
+def _sums_since(start_dt=None, account_ids=None):
+    """{account id: sum of the transactions created at or after start_dt (all of them if None)}."""
+    txs = _transactions(account_ids)
+    if start_dt is not None:
+        txs = txs.filter(created_at__gte=start_dt)
+    return {
+        row["account_id"]: _to_decimal(row["total"])
+        for row in txs.values("account_id").annotate(total=Sum("amount"))
+    }
+
+
+def last_snapshot_day():
+    return AccountDailyBalance.objects.aggregate(day=Max("day"))["day"]
+
+
+def _day_entry(opening, totals=None):
+    totals = totals or {}
+    return {
+        "opening": opening,
+        "closing": opening + totals.get("total", ZERO),
+        "inflows": totals.get("inflows", ZERO),
+        "outflows": totals.get("outflows", ZERO),
+        "count": totals.get("count", 0),
+    }
+
+
+# --- Snapshots ---
+
+def snapshot_daily_balances(until=None, tz=None, rebuild=False):
+    """
+    Write the AccountDailyBalance rows of the days up to `until` (default yesterday) that are not
+    snapshotted yet. Returns {"rows": rows written, "rebuilt_accounts": [account ids recomputed]}.
+    """
+    tz = tz or export_timezone()
+    until = until or timezone.localtime(timezone.now(), tz).date() - timedelta(days=1)
+    stats = {"rows": 0, "rebuilt_accounts": []}
+
+    # One transaction: balances and sums are read from the same consistent snapshot
+    with transaction.atomic():
+        if rebuild:
+            AccountDailyBalance.objects.all().delete()
+        last_day = last_snapshot_day()
+        previous, since = {}, {}
+        if last_day is not None:
+            previous = dict(AccountDailyBalance.objects.filter(day=last_day).values_list("account_id", "closing"))
+            since = _sums_since(day_start(last_day + timedelta(days=1), tz))
+
+        starts = {}  # account id: (first day to write, opening balance of that day)
+        from_scratch = []
+        for account in Account.objects.order_by("pk"):
+            balance = _to_decimal(account.balance)
+            if account.pk in previous:
+                opening = balance - since.get(account.pk, ZERO)
+                if opening == previous[account.pk]:
+                    starts[account.pk] = (last_day + timedelta(days=1), opening)
+                    continue
+                logger.warning(
+                    f"Daily balances of account {account.pk} are stale (closing {previous[account.pk]} "
+                    f"on {last_day}, ledger says {opening}): recomputing them"
+                )
+                stats["rebuilt_accounts"].append(account.pk)
+            from_scratch.append(account)
+
+        if from_scratch:
+            ids = [account.pk for account in from_scratch]
+            AccountDailyBalance.objects.filter(account_id__in=ids).delete()
+            totals_all = _sums_since(account_ids=ids)
+            first_tx = dict(
+                _transactions(ids).values("account_id").annotate(first=Min("created_at"))
+                .values_list("account_id", "first")
+            )
+            for account in from_scratch:
+                first = min(filter(None, (account.created_at, first_tx.get(account.pk))))
+                opening = _to_decimal(account.balance) - totals_all.get(account.pk, ZERO)
+                starts[account.pk] = (timezone.localtime(first, tz).date(), opening)
+
+        starts = {pk: start for pk, start in starts.items() if start[0] <= until}
+        if not starts:
+            return stats
+        first_day = min(day for day, _ in starts.values())
+        totals = daily_totals(day_start(first_day, tz), day_start(until + timedelta(days=1), tz), tz)
+
+        rows = []
+        for account_id, (day, balance) in starts.items():
+            while day <= until:
+                entry = _day_entry(balance, totals.get((account_id, day)))
+                rows.append(AccountDailyBalance(
+                    account_id=account_id,
+                    day=day,
+                    opening=entry["opening"],
+                    closing=entry["closing"],
+                    inflows=entry["inflows"],
+                    outflows=entry["outflows"],
+                    transactions_count=entry["count"],
+                ))
+                balance = entry["closing"]
+                day += timedelta(days=1)
+        AccountDailyBalance.objects.bulk_create(rows, batch_size=1000)
+        stats["rows"] = len(rows)
+    return stats
+
+
+# --- Reads ---
+
+def day_balances(first_day, last_day, tz=None, account_ids=None):
+    """
+    {day: {account id: {"opening", "closing", "inflows", "outflows", "count"}}} for every day of
+    [first_day, last_day]. On snapshotted days accounts that did not exist yet are missing.
+    """
+    tz = tz or export_timezone()
+    result = {first_day + timedelta(days=offset): {} for offset in range((last_day - first_day).days + 1)}
+    last_day_covered = last_snapshot_day()
+
+    if last_day_covered is not None and first_day <= last_day_covered:
+        snapshots = AccountDailyBalance.objects.filter(day__range=(first_day, min(last_day, last_day_covered)))
+        if account_ids is not None:
+            snapshots = snapshots.filter(account_id__in=account_ids)
+        for row in snapshots.order_by():
+            result[row.day][row.account_id] = {
+                "opening": row.opening,
+                "closing": row.closing,
+                "inflows": row.inflows,
+                "outflows": row.outflows,
+                "count": row.transactions_count,
+            }
+
+    first_computed = first_day
+    if last_day_covered is not None:
+        first_computed = max(first_day, last_day_covered + timedelta(days=1))
+    if first_computed > last_day:
+        return result
+
+    # Not snapshotted yet: walk back from the current balances
+    end_dt = day_start(last_day + timedelta(days=1), tz)
+    totals = daily_totals(day_start(first_computed, tz), end_dt, tz, account_ids)
+    after = _sums_since(end_dt, account_ids)
+    accounts = Account.objects.order_by("pk")
+    if account_ids is not None:
+        accounts = accounts.filter(pk__in=account_ids)
+    for account_id, balance in accounts.values_list("pk", "balance"):
+        closing = _to_decimal(balance) - after.get(account_id, ZERO)
+        day = last_day
+        while day >= first_computed:
+            day_totals = totals.get((account_id, day), {})
+            opening = closing - day_totals.get("total", ZERO)
+            result[day][account_id] = _day_entry(opening, day_totals)
+            closing = opening
+            day -= timedelta(days=1)
+    return result
@@ -0,0 +1,229 @@
+"""
+Row builders for the treasury exports (transactions_export and the daily report in treasury.reports).
+
+Everything that does not depend on the single transaction (ESNcard fees from Settings,
+the export timezone, event names and dates) is loaded once into an ExportContext;
+the *_row functions are then pure functions of (transaction, context) and do not
+touch the database, as long as the queryset selects the relations they read
+(see LEDGER_SELECT_RELATED / REPORT_SELECT_RELATED).
+"""
+import logging
+from decimal import Decimal
+
+from django.utils import timezone
+
+from events.models import Event
+from treasury.models import Settings, Transaction
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover
+    ZoneInfo = None
+
+logger = logging.getLogger(__name__)
+
+LEDGER_HEADERS = [
+    "Registrazione",
+    "Esecuzione",
+    "Attività",
+    "Descrizione",
+    "Importo",
+    "Cassa",
+    "Commenti",
+    "Descrizione (gestionale)",
+    "Eseguito da",
+]
+# Events are not joined: their labels come from ExportContext.event_labels
+LEDGER_SELECT_RELATED = (
+    "account",
+    "subscription__profile",
+    "esncard__profile",
+    "executor__profile",
+)
+
+REPORT_HEADERS = [
+    "ID",
+    "Data/Ora",
+    "Tipo",
+    "Importo",
+    "Cassa",
+    "Descrizione",
+    "Executor",
+    "Subscription ID",
+    "ESNcard ID",
+    "Event Ref ID",
+    "Receipt Link",
+]
+REPORT_SELECT_RELATED = (
+    "account",
+    "executor__profile",
+)
+
+ATTIVITA_BY_TYPE = {
+    Transaction.TransactionType.ESNCARD: "Quota Associativa",
+    Transaction.TransactionType.RIMBORSO_ESNCARD: "Rimborso ESNcard",
+    Transaction.TransactionType.DEPOSIT: "Deposito",
+    Transaction.TransactionType.WITHDRAWAL: "Prelievo",
+    Transaction.TransactionType.REIMBURSEMENT: "Richiesta Rimborso",
+}
+EVENT_LABEL_BY_TYPE = {
+    Transaction.TransactionType.SUBSCRIPTION: "iscrizione",
+    Transaction.TransactionType.CAUZIONE: "cauzione",
+    Transaction.TransactionType.RIMBORSO_QUOTA: "rimborso iscrizione",
+    Transaction.TransactionType.RIMBORSO_CAUZIONE: "rimborso cauzione",
+    Transaction.TransactionType.SERVICE: "servizio",
+    Transaction.TransactionType.RIMBORSO_SERVICE: "rimborso servizio",
+}
+
+
+def export_timezone():
+    return ZoneInfo("Europe/Rome") if ZoneInfo else timezone.get_current_timezone()
+
+
+def load_event_labels(transactions):
+    """{event id: (name, 'dd/mm' or '')} for every event referenced by the transactions queryset."""
+    event_ids = set(
+        transactions.filter(subscription__isnull=False)
+        .order_by().values_list("subscription__event_id", flat=True).distinct()
+    )
+    event_ids.update(
+        transactions.filter(event_reference_manual__isnull=False)
+        .order_by().values_list("event_reference_manual_id", flat=True).distinct()
+    )
+    if not event_ids:
+        return {}
+    return {
+        event_id: (name or "", event_date.strftime("%d/%m") if event_date else "")
+        for event_id, name, event_date in Event.objects.filter(id__in=event_ids).values_list("id", "name", "date")
+    }
+
+
+class ExportContext:
+    """Per-export values shared by all rows."""
+
+    def __init__(self, tz=None, event_labels=None, esncard_fees=None):
+        self.tz = tz or export_timezone()
+        self.event_labels = event_labels or {}
+        # (release fee, lost fee) as floats, or None if Settings could not be read
+        self.esncard_fees = esncard_fees
+
+    @classmethod
+    def for_transactions(cls, transactions, tz=None):
+        """Load the Settings fees and the labels of the events referenced by the queryset."""
+        try:
+            settings_obj = Settings.get()
+            esncard_fees = (float(settings_obj.esncard_release_fee), float(settings_obj.esncard_lost_fee))
+        except (Settings.DoesNotExist, AttributeError, ValueError, TypeError) as exc:
+            logger.error(f"Errore lettura quote ESNcard per l'export: {exc}")
+            esncard_fees = None
+        return cls(
+            tz=tz,
+            event_labels=load_event_labels(transactions),
+            esncard_fees=esncard_fees,
+        )
+
+    def localtime(self, dt):
+        return timezone.localtime(dt, self.tz)
+
+
+def academic_year(date_obj):
+    # Academic year starts Sept 1.
+    start = date_obj.year % 100 if date_obj.month >= 9 else (date_obj.year - 1) % 100
+    return f"{start:02d}/{(start + 1) % 100:02d}"
+
+
+def transaction_event_id(tx):
+    if tx.subscription_id:
+        return tx.subscription.event_id
+    return tx.event_reference_manual_id
+
+
+def profile_name(profile):
+    return f"{profile.name} {profile.surname}"
+
+
+def compute_amount(tx, ctx):
+    """Amount as float; ESNcard transactions recorded at 0 take the fee from Settings."""
+    amt = float(tx.amount) if tx.amount is not None else None
+    if tx.type == Transaction.TransactionType.ESNCARD and not amt:
+        if ctx.esncard_fees is None:
+            return None
+        release_fee, lost_fee = ctx.esncard_fees
+        amt = lost_fee if "smarrita" in (tx.description or "").lower() else release_fee
+    return amt
+
+
+def build_attivita(tx, ctx):
+    if tx.type in ATTIVITA_BY_TYPE:
+        return ATTIVITA_BY_TYPE[tx.type]
+    label = ctx.event_labels.get(transaction_event_id(tx))
+    return label[0] if label else ""
+
+
+def build_descrizione(tx, ctx):
+    if tx.type == Transaction.TransactionType.ESNCARD:
+        return f"Quota Associativa {academic_year(tx.created_at)}"
+    if tx.type == Transaction.TransactionType.RIMBORSO_ESNCARD:
+        return f"Rimborso Quota Associativa {academic_year(tx.created_at)}"
+    label = ctx.event_labels.get(transaction_event_id(tx))
+    kind = EVENT_LABEL_BY_TYPE.get(tx.type)
+    if not label or not label[1] or not kind:
+        return ""
+    return f"{label[1]} - {kind}"
+
+
+def build_commenti(tx):
+    if tx.subscription_id and tx.subscription.profile_id:
+        return profile_name(tx.subscription.profile)
+    if tx.subscription_id and tx.subscription.external_name:
+        return tx.subscription.external_name
+    if tx.esncard_id and tx.esncard.profile_id:
+        return profile_name(tx.esncard.profile)
+    return build_eseguito_da(tx)
+
+
+def build_eseguito_da(tx):
+    if tx.executor_id and getattr(tx.executor, "profile", None):
+        return profile_name(tx.executor.profile)
+    return ""
+
+
+def executor_display(tx):
+    if tx.executor_id and getattr(tx.executor, "profile", None):
+        return profile_name(tx.executor.profile)
+    if tx.executor_id:
+        return tx.executor.email or ""
+    return ""
+
+
+def ledger_row(tx, ctx):
+    """Row of transactions_export (LEDGER_HEADERS)."""
+    local_dt = ctx.localtime(tx.created_at)
+    return (
+        local_dt.strftime("%d/%m/%Y %H:%M:%S"),
+        local_dt.strftime("%d/%m/%Y"),
+        build_attivita(tx, ctx),
+        build_descrizione(tx, ctx),
+        compute_amount(tx, ctx),
+        tx.account.name if tx.account_id else "",
+        build_commenti(tx),
+        tx.description,
+        build_eseguito_da(tx),
+    )
+
+
+def report_row(tx, ctx):
+    """Row of the daily transactions report (REPORT_HEADERS)."""
+    return (
+        tx.id,
+        ctx.localtime(tx.created_at).strftime("%d/%m/%Y %H:%M:%S"),
+        tx.type,
+        Decimal(str(tx.amount)),
+        tx.account.name if tx.account_id else "",
+        tx.description,
+        executor_display(tx),
+        tx.subscription_id or "",
+        tx.esncard_id or "",
+        tx.event_reference_manual_id or "",
+        tx.receipt_link or "",
+    )
@@ -0,0 +1,105 @@
+"""
+Constant-memory spreadsheet writers for treasury exports.
+
+Rows are consumed from an iterator (typically built on queryset.iterator()), so
+memory does not grow with the number of transactions:
+- CSV is produced row by row for a StreamingHttpResponse;
+- XLSX uses openpyxl write-only mode. Column widths must be known before the
+  first row is written, so rows are first spooled to a temporary file while
+  the widths are measured, then written to a temporary workbook file.
+"""
+import csv
+import pickle
+import tempfile
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+
+EXCEL_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_MIMETYPE = "text/csv; charset=utf-8"
+
+# Same limit as the in-memory autosize (treasury.reports._autosize_columns)
+MAX_COLUMN_WIDTH = 50
+
+
+class ColumnWidths:
+    """Running max of the rendered value length per column."""
+
+    def __init__(self, column_count):
+        self.max_lengths = [0] * column_count
+
+    def update(self, values):
+        for index, value in enumerate(values):
+            if value:
+                length = len(str(value))
+                if length > self.max_lengths[index]:
+                    self.max_lengths[index] = length
+
+    def widths(self):
+        return [min(length + 2, MAX_COLUMN_WIDTH) for length in self.max_lengths]
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer in a generator."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(headers, rows):
+    """Yield CSV lines (with a BOM so Excel detects UTF-8) for a StreamingHttpResponse."""
+    writer = csv.writer(_Echo())
+    yield "\ufeff" + writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(["" if value is None else value for value in row])
+
+
+def write_xlsx(headers, rows, *, title, number_formats=None):
+    """
+    Write rows to a temporary .xlsx file and return it opened and rewound (for FileResponse).
+    number_formats maps a 0-based column index to an Excel number format.
+    """
+    number_formats = number_formats or {}
+    widths = ColumnWidths(len(headers))
+    widths.update(headers)
+
+    with tempfile.TemporaryFile() as spool:
+        for row in rows:
+            widths.update(row)
+            pickle.dump(row, spool, protocol=pickle.HIGHEST_PROTOCOL)
+        spool.seek(0)
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title)
+        for index, width in enumerate(widths.widths(), 1):
+            ws.column_dimensions[get_column_letter(index)].width = width
+
+        header_font = Font(bold=True)
+        header_alignment = Alignment(horizontal="center")
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = header_font
+            cell.alignment = header_alignment
+            header_cells.append(cell)
+        ws.append(header_cells)
+
+        while True:
+            try:
+                row = pickle.load(spool)
+            except EOFError:
+                break
+            if number_formats:
+                row = list(row)
+                for index, number_format in number_formats.items():
+                    cell = WriteOnlyCell(ws, value=row[index])
+                    cell.number_format = number_format
+                    row[index] = cell
+            ws.append(row)
+
+        output = tempfile.TemporaryFile()
+        wb.save(output)
+    output.seek(0)
+    return output
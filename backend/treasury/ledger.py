@@ -0,0 +1,83 @@
+"""
+Account balance mutations.
+
+Every change to Account.balance goes through this module so that concurrent writers
+(cash desk operators, SumUp webhooks, event jobs) never lose an update:
+- the account rows are locked (select_for_update, in pk order to avoid deadlocks)
+  before the balance is validated;
+- the balance is written with a single UPDATE ... SET balance = balance + delta,
+  never by saving a possibly stale instance; since update() sends no signals, every
+  change is written to the db_audit log here (old and new balance).
+Callers must already be inside transaction.atomic().
+"""
+import logging
+from decimal import Decimal
+
+from django.db.models import F
+
+from backend.db_audit import record_update
+from treasury.models import Account
+
+logger = logging.getLogger(__name__)
+
+
+def _to_decimal(value):
+    return Decimal(str(value or 0))
+
+
+def lock_accounts(*accounts):
+    """
+    Lock the given accounts (instances or ids) until the end of the transaction and copy their
+    committed balance onto the instances. Returns {account id: current balance}.
+    """
+    ids = sorted({a.pk if isinstance(a, Account) else a for a in accounts if a is not None})
+    balances = dict(
+        Account.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', 'balance')
+    )
+    for account in accounts:
+        if isinstance(account, Account) and account.pk in balances:
+            account.balance = balances[account.pk]
+    return balances
+
+
+def apply_delta(account, delta):
+    """
+    Add delta to the locked account's balance with one UPDATE and audit the change; the
+    instance (if given) gets the new value.
+    """
+    delta = _to_decimal(delta)
+    if isinstance(account, Account):
+        account_id, old_balance = account.pk, _to_decimal(account.balance)
+    else:
+        account_id, account = account, None
+        old_balance = _to_decimal(Account.objects.filter(pk=account_id).values_list('balance', flat=True).first())
+    Account.objects.filter(pk=account_id).update(balance=F('balance') + delta)
+    new_balance = old_balance + delta
+    if account is not None:
+        account.balance = new_balance
+    record_update(Account, account_id, {'balance': (old_balance, new_balance)}, instance=account)
+    return delta
+
+
+def record_transaction_save(tx, original=None):
+    """
+    Balance side of Transaction.save: apply the amount of a new transaction, or the difference
+    with its stored version (original) when it is edited or moved to another account.
+    The accounts must have been locked with lock_accounts.
+    """
+    if original is None:
+        apply_delta(tx.account, tx.amount)
+        logger.info(f"Log: new transaction of €{tx.amount} on account {tx.account.name}, new balance: €{tx.account.balance}")
+    elif original.account_id != tx.account_id:
+        apply_delta(original.account_id, -_to_decimal(original.amount))
+        apply_delta(tx.account, tx.amount)
+        logger.info(f"Log: moved transaction of €{tx.amount} from account {original.account_id} to {tx.account.name}, new balance: €{tx.account.balance}")
+    else:
+        apply_delta(tx.account, _to_decimal(tx.amount) - _to_decimal(original.amount))
+        logger.info(f"Log: updated transaction of €{tx.amount} on account {tx.account.name}, new balance: €{tx.account.balance}")
+
+
+def record_transaction_delete(tx):
+    """Balance side of Transaction.delete: revert the amount."""
+    apply_delta(tx.account, -_to_decimal(tx.amount))
+
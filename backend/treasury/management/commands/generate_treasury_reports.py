@@ -1,11 +1,6 @@
-import logging
-
 from django.core.management.base import BaseCommand, CommandError
-from googleapiclient.errors import HttpError
-
-from treasury.reports import generate_daily_reports, ReportDateError
 
-logger = logging.getLogger(__name__)
+from treasury.reports import generate_reports_range, ReportDateError
 
 
 class Command(BaseCommand):
@@ -17,6 +12,28 @@ class Command(BaseCommand):
             type=str,
             help="Report date in YYYY-MM-DD. Defaults to today in Europe/Rome.",
         )
+        parser.add_argument(
+            "--from",
+            dest="date_from",
+            type=str,
+            help="First day of a range of reports in YYYY-MM-DD (with --to, instead of --date).",
+        )
+        parser.add_argument(
+            "--to",
+            dest="date_to",
+            type=str,
+            help="Last day of the range in YYYY-MM-DD. Defaults to today in Europe/Rome.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Days built and uploaded in parallel (default TREASURY_REPORT_WORKERS, 4).",
+        )
+        parser.add_argument(
+            "--output-dir",
+            type=str,
+            help="Write the workbooks to <dir>/Casse and <dir>/Transazioni instead of uploading them.",
+        )
         parser.add_argument(
             "--dry-run",
             action="store_true",
@@ -25,29 +42,54 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         report_date = options.get("date")
+        date_from, date_to = options.get("date_from"), options.get("date_to")
         dry_run = options.get("dry_run")
+        if report_date and (date_from or date_to):
+            raise CommandError("Use either --date or --from/--to.")
+        if date_to and not date_from:
+            raise CommandError("--to requires --from.")
+        if report_date or not date_from:
+            date_from = date_to = report_date
 
         try:
-            results = generate_daily_reports(report_date=report_date, dry_run=dry_run)
+            results = generate_reports_range(
+                date_from,
+                date_to,
+                dry_run=dry_run,
+                output_dir=options.get("output_dir"),
+                workers=options.get("workers"),
+            )
         except ReportDateError as exc:
             raise CommandError(str(exc)) from exc
-        except HttpError as exc:
-            logger.exception("Drive upload failed")
-            raise CommandError("Drive upload failed") from exc
 
         if dry_run:
-            self.stdout.write(self.style.WARNING("Dry run: skipping Drive upload."))
+            self.stdout.write(self.style.WARNING(f"Dry run: {len(results)} day(s) generated, skipping Drive upload."))
             return
 
-        accounts = results.get("accounts", {})
-        transactions = results.get("transactions", {})
-        self.stdout.write(
-            self.style.SUCCESS(
-                "Accounts report {0} (fileId={1}), transactions report {2} (fileId={3})".format(
-                    accounts.get("action"),
-                    accounts.get("file_id"),
-                    transactions.get("action"),
-                    transactions.get("file_id"),
+        failed = []
+        for result in results:
+            day = result["report_date"].strftime("%Y-%m-%d")
+            if "error" in result:
+                failed.append(day)
+                self.stderr.write(f"{day}: {result['error']}")
+                continue
+            accounts = result.get("accounts", {})
+            transactions = result.get("transactions", {})
+            if "path" in accounts:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{day}: accounts report {accounts['path']}, transactions report {transactions['path']}"
+                ))
+                continue
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "{0}: accounts report {1} (fileId={2}), transactions report {3} (fileId={4})".format(
+                        day,
+                        accounts.get("action"),
+                        accounts.get("file_id"),
+                        transactions.get("action"),
+                        transactions.get("file_id"),
+                    )
                 )
             )
-        )
+        if failed:
+            raise CommandError(f"Reports not generated for {len(failed)} day(s): {', '.join(failed)}")
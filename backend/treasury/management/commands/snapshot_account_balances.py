@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from treasury.balances import snapshot_daily_balances
+from treasury.reports import ReportDateError, get_report_timezone, resolve_report_date
+
+
+class Command(BaseCommand):
+    help = "Write the daily account balance snapshots (AccountDailyBalance) up to yesterday"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--until",
+            type=str,
+            help="Last day to snapshot in YYYY-MM-DD. Defaults to yesterday in Europe/Rome.",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Drop every snapshot and recompute them from the ledger.",
+        )
+
+    def handle(self, *args, **options):
+        tz = get_report_timezone()
+        until = None
+        if options.get("until"):
+            try:
+                until = resolve_report_date(options["until"], tz)
+            except ReportDateError as exc:
+                raise CommandError(str(exc)) from exc
+
+        stats = snapshot_daily_balances(until=until, tz=tz, rebuild=options.get("rebuild"))
+
+        if stats["rebuilt_accounts"]:
+            self.stdout.write(self.style.WARNING(
+                "Recomputed the snapshots of accounts changed after they were taken: "
+                + ", ".join(str(pk) for pk in stats["rebuilt_accounts"])
+            ))
+        self.stdout.write(self.style.SUCCESS(f"{stats['rows']} daily balances written"))
@@ -1,5 +1,5 @@
 import logging
-from datetime import date
+from datetime import date, datetime, timezone as dt_timezone
 from decimal import Decimal
 
 from django.conf import settings
@@ -8,12 +8,13 @@ from django.core.exceptions import PermissionDenied, ValidationError
 from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 
+from backend.audit_models import AuditSnapshotMixin
 from profiles.models import Profile, BaseEntity
 
 logger = logging.getLogger(__name__)
 
 
-class Settings(models.Model):
+class Settings(AuditSnapshotMixin, models.Model):
     esncard_release_fee = models.DecimalField(max_digits=9, decimal_places=2, default=10.0)
     esncard_lost_fee = models.DecimalField(max_digits=9, decimal_places=2, default=4.0)
 
@@ -44,6 +45,14 @@ class ESNcard(BaseEntity):
     def is_valid(self):
         return date.today() < self.expiration
 
+    # Same rule as expiration/is_valid, for queries: a card is valid today if and only if it
+    # was created on or after Sept 1 of the current association year (created_at is in UTC)
+    @staticmethod
+    def valid_since(today=None):
+        today = today or date.today()
+        year = today.year if today.month >= 9 else today.year - 1
+        return datetime(year, 9, 1, tzinfo=dt_timezone.utc)
+
     @property
     def membership_year(self):
         return str(self.expiration.year - 1) + '/' + str(self.expiration.year)
@@ -149,40 +158,58 @@ class Transaction(BaseEntity):
         super(Transaction, self).clean()
 
     def save(self, *args, **kwargs):
+        # Imported here: treasury.ledger imports this module
+        from treasury import ledger
+
         with transaction.atomic():
-            self.clean()
+            original_transaction = None
             if self.pk:
                 # Lock current stored version
-                original_transaction = Transaction.objects.select_for_update().get(pk=self.pk)
-                if original_transaction.account_id != self.account_id:
-                    # Move transaction from old to new account:
-                    # 1. Revert effect on old account
-                    old_acc = original_transaction.account
-                    old_acc.balance = Decimal(str(old_acc.balance)) - Decimal(str(original_transaction.amount))
-                    old_acc.save(update_fields=['balance'])
-                    # 2. Apply full effect on new account
-                    self.account.balance = Decimal(str(self.account.balance)) + Decimal(str(self.amount))
-                    logger.info(f"Log: moved transaction of €{self.amount} from account {old_acc.name} to {self.account.name}, new balance: €{self.account.balance}")
-                else:
-                    # Same account: only apply difference
-                    amount_difference = Decimal(str(self.amount)) - Decimal(str(original_transaction.amount))
-                    self.account.balance = Decimal(str(self.account.balance)) + amount_difference
-                    logger.info(f"Log: updated transaction of €{self.amount} on account {self.account.name}, new balance: €{self.account.balance}")
-            else:
-                # New transaction
-                self.account.balance = Decimal(str(self.account.balance)) + Decimal(str(self.amount))
-                logger.info(f"Log: new transaction of €{self.amount} on account {self.account.name}, new balance: €{self.account.balance}")
-            self.account.save(update_fields=['balance'])
+                original_transaction = Transaction.objects.select_for_update().filter(pk=self.pk).first()
+            # Lock the accounts so validation and the balance update see the committed balance
+            ledger.lock_accounts(self.account, original_transaction.account_id if original_transaction else None)
+            self.clean()
+            ledger.record_transaction_save(self, original_transaction)
             super(Transaction, self).save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
+        from treasury import ledger
+
         with transaction.atomic():
-            self.account.balance = Decimal(str(self.account.balance)) - Decimal(str(self.amount))
-            self.account.save()
-            super(Transaction, self).delete(*args, **kwargs)
+            ledger.lock_accounts(self.account)
+            ledger.record_transaction_delete(self)
+            return super(Transaction, self).delete(*args, **kwargs)
+
+
+class AccountDailyBalance(AuditSnapshotMixin, models.Model):
+    """
+    Balance of an account at the end of one day (Europe/Rome) with the day's totals.
+    Rows are written by `python manage.py snapshot_account_balances` (treasury/balances.py),
+    one per account per day up to the last snapshotted day, and read by the reports and
+    the balance history API instead of summing the ledger.
+    """
+    account = models.ForeignKey('Account', on_delete=models.CASCADE, related_name='daily_balances')
+    day = models.DateField()
+    opening = models.DecimalField(max_digits=12, decimal_places=2)
+    closing = models.DecimalField(max_digits=12, decimal_places=2)
+    inflows = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    outflows = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    transactions_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Account Daily Balance"
+        verbose_name_plural = "Account Daily Balances"
+        unique_together = ('account', 'day')
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+        ordering = ['account', 'day']
+
+    def __str__(self):
+        return f"{self.account_id} {self.day}: {self.closing}"
 
 
-class ReimbursementRequest(models.Model):
+class ReimbursementRequest(AuditSnapshotMixin, models.Model):
     PAYMENT_CHOICES = [
         ("cash", "Contanti"),
         ("paypal", "PayPal"),
@@ -1,23 +1,22 @@
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 from io import BytesIO
 
 from django.conf import settings
-from django.db.models import Case, Count, DecimalField, Sum, Value, When
 from django.utils import timezone
 
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseUpload
 from openpyxl import Workbook
 from openpyxl.styles import Alignment, Font
 
+from treasury.balances import day_balances
+from treasury.export_rows import ExportContext, REPORT_HEADERS, REPORT_SELECT_RELATED, export_timezone, report_row
 from treasury.models import Account, Transaction
-from utils.google_drive import get_drive_service, find_or_create_folder
-
-try:
-    from zoneinfo import ZoneInfo
-except ImportError:  # pragma: no cover
-    ZoneInfo = None
+from utils.google_drive import find_or_create_folder, forget_folder_path, get_drive_service, is_not_found
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +31,7 @@ class ReportDateError(ValueError):
 
 
 def get_report_timezone():
-    return ZoneInfo("Europe/Rome") if ZoneInfo else timezone.get_current_timezone()
+    return export_timezone()
 
 
 def resolve_report_date(report_date, tz):
@@ -72,10 +71,35 @@ def _find_file_id(service, folder_id, filename):
     return files[0]["id"] if files else None
 
 
-def _upload_excel(service, folder_id, filename, content_stream):
+def _existing_files(service, folder_id, filenames):
+    """{filename: file id} of the given files already in folder_id (one list call per 50 names)."""
+    found = {}
+    names = sorted(set(filenames))
+    for offset in range(0, len(names), 50):
+        clause = " or ".join("name='{0}'".format(name.replace("'", "\\'")) for name in names[offset:offset + 50])
+        query = f"({clause}) and '{folder_id}' in parents and trashed=false"
+        page_token = None
+        while True:
+            results = service.files().list(
+                q=query,
+                spaces="drive",
+                fields="nextPageToken, files(id, name)",
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True,
+                pageToken=page_token,
+            ).execute()
+            for found_file in results.get("files", []):
+                found.setdefault(found_file["name"], found_file["id"])
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+    return found
+
+
+def _put_excel(service, folder_id, filename, content_stream, existing_id):
+    """Replace the content of existing_id, or create filename in folder_id if it is None."""
     content_stream.seek(0)
     media = MediaIoBaseUpload(content_stream, mimetype=EXCEL_MIMETYPE)
-    existing_id = _find_file_id(service, folder_id, filename)
     if existing_id:
         service.files().update(
             fileId=existing_id,
@@ -93,6 +117,17 @@ def _upload_excel(service, folder_id, filename, content_stream):
     return created["id"], "created"
 
 
+def _upload_excel(service, folder_id, filename, content_stream):
+    return _put_excel(service, folder_id, filename, content_stream, _find_file_id(service, folder_id, filename))
+
+
+def _save_excel(directory, filename, content_stream):
+    path = os.path.join(directory, filename)
+    with open(path, "wb") as handle:
+        handle.write(content_stream.getvalue())
+    return {"filename": filename, "path": path, "action": "saved"}
+
+
 def _autosize_columns(worksheet):
     for column in worksheet.columns:
         max_len = 0
@@ -125,7 +160,24 @@ def ensure_report_folders(service, parent_folder_id):
     return root_folder_id, accounts_folder_id, transactions_folder_id
 
 
-def build_accounts_workbook(start_dt, end_dt, report_date):
+def _with_report_folders(service, upload):
+    """
+    Call upload(report folder ids). Folder ids are cached (utils/google_drive.py): if Drive
+    answers 404 the cached ids are dropped and the upload retried once on fresh ones.
+    """
+    parent_folder_id = settings.GOOGLE_DRIVE_FOLDER_ID
+    try:
+        return upload(ensure_report_folders(service, parent_folder_id))
+    except HttpError as exc:
+        if not is_not_found(exc):
+            raise
+        forget_folder_path(parent_folder_id, ROOT_FOLDER_NAME, ACCOUNTS_FOLDER_NAME)
+        forget_folder_path(parent_folder_id, ROOT_FOLDER_NAME, TRANSACTIONS_FOLDER_NAME)
+        return upload(ensure_report_folders(service, parent_folder_id))
+
+
+def _accounts_workbook(report_date, accounts, balances):
+    """Accounts sheet of one day from {account id: day_balances() entry}."""
     headers = [
         "Data",
         "Account ID",
@@ -144,57 +196,20 @@ def build_accounts_workbook(start_dt, end_dt, report_date):
     ws.title = "Casse"
     _write_headers(ws, headers)
 
-    amount_field = DecimalField(max_digits=12, decimal_places=2)
-    daily_totals = Transaction.objects.filter(
-        created_at__gte=start_dt,
-        created_at__lt=end_dt,
-    ).values("account_id").annotate(
-        total=Sum("amount"),
-        total_in=Sum(
-            Case(
-                When(amount__gt=0, then="amount"),
-                default=Value(Decimal("0.00")),
-                output_field=amount_field,
-            )
-        ),
-        total_out=Sum(
-            Case(
-                When(amount__lt=0, then="amount"),
-                default=Value(Decimal("0.00")),
-                output_field=amount_field,
-            )
-        ),
-        count=Count("id"),
-    )
-    totals_by_account = {row["account_id"]: row for row in daily_totals}
-
-    after_totals = Transaction.objects.filter(
-        created_at__gte=end_dt,
-    ).values("account_id").annotate(total=Sum("amount"))
-    after_by_account = {row["account_id"]: row for row in after_totals}
-
     row_idx = 2
     report_date_str = report_date.strftime("%d/%m/%Y")
-    for account in Account.objects.all().order_by("name"):
-        totals = totals_by_account.get(account.id, {})
-        total = totals.get("total") or Decimal("0.00")
-        total_in = totals.get("total_in") or Decimal("0.00")
-        total_out = totals.get("total_out") or Decimal("0.00")
-        count = totals.get("count") or 0
-
-        total_after = after_by_account.get(account.id, {}).get("total") or Decimal("0.00")
-        saldo_finale = Decimal(str(account.balance or 0)) - Decimal(str(total_after))
-        saldo_iniziale = saldo_finale - Decimal(str(total))
+    for account in accounts:
+        day = balances.get(account.id) or {}
 
         ws.cell(row=row_idx, column=1, value=report_date_str)
         ws.cell(row=row_idx, column=2, value=account.id)
         ws.cell(row=row_idx, column=3, value=account.name)
         ws.cell(row=row_idx, column=4, value=account.status)
-        ws.cell(row=row_idx, column=5, value=saldo_iniziale)
-        ws.cell(row=row_idx, column=6, value=saldo_finale)
-        ws.cell(row=row_idx, column=7, value=Decimal(str(total_in)))
-        ws.cell(row=row_idx, column=8, value=abs(Decimal(str(total_out))))
-        ws.cell(row=row_idx, column=9, value=count)
+        ws.cell(row=row_idx, column=5, value=day.get("opening", Decimal("0.00")))
+        ws.cell(row=row_idx, column=6, value=day.get("closing", Decimal("0.00")))
+        ws.cell(row=row_idx, column=7, value=day.get("inflows", Decimal("0.00")))
+        ws.cell(row=row_idx, column=8, value=day.get("outflows", Decimal("0.00")))
+        ws.cell(row=row_idx, column=9, value=day.get("count", 0))
         ws.cell(row=row_idx, column=10, value="")
 
         for col in (5, 6, 7, 8):
@@ -206,71 +221,46 @@ def build_accounts_workbook(start_dt, end_dt, report_date):
     return wb
 
 
-def _executor_display(tx_obj):
-    if tx_obj.executor and getattr(tx_obj.executor, "profile", None):
-        return f"{tx_obj.executor.profile.name} {tx_obj.executor.profile.surname}"
-    if tx_obj.executor:
-        return getattr(tx_obj.executor, "email", "") or ""
-    return ""
+def build_accounts_workbook(report_date, tz=None):
+    # From the daily snapshots (treasury/balances.py) when the day is already snapshotted
+    balances = day_balances(report_date, report_date, tz)[report_date]
+    return _accounts_workbook(report_date, Account.objects.all().order_by("name"), balances)
 
 
-def build_transactions_workbook(start_dt, end_dt, tz):
-    headers = [
-        "ID",
-        "Data/Ora",
-        "Tipo",
-        "Importo",
-        "Cassa",
-        "Descrizione",
-        "Executor",
-        "Subscription ID",
-        "ESNcard ID",
-        "Event Ref ID",
-        "Receipt Link",
-    ]
-
+def _transactions_workbook(rows):
     wb = Workbook()
     ws = wb.active
     ws.title = "Transazioni"
-    _write_headers(ws, headers)
+    _write_headers(ws, REPORT_HEADERS)
+
+    for row in rows:
+        ws.append(row)
+        ws.cell(row=ws.max_row, column=4).number_format = "#,##0.00"
 
-    txs = Transaction.objects.filter(
+    _autosize_columns(ws)
+    return wb
+
+
+def _report_transactions(start_dt, end_dt):
+    return Transaction.objects.filter(
         created_at__gte=start_dt,
         created_at__lt=end_dt,
-    ).select_related(
-        "account",
-        "executor__profile",
-    ).order_by("created_at", "id")
+    ).select_related(*REPORT_SELECT_RELATED).order_by("created_at", "id")
 
-    row_idx = 2
-    for tx in txs:
-        local_dt = timezone.localtime(tx.created_at, tz) if tz else timezone.localtime(tx.created_at)
-        ws.cell(row=row_idx, column=1, value=tx.id)
-        ws.cell(row=row_idx, column=2, value=local_dt.strftime("%d/%m/%Y %H:%M:%S"))
-        ws.cell(row=row_idx, column=3, value=tx.type)
-        ws.cell(row=row_idx, column=4, value=Decimal(str(tx.amount)))
-        ws.cell(row=row_idx, column=5, value=tx.account.name if tx.account else "")
-        ws.cell(row=row_idx, column=6, value=tx.description)
-        ws.cell(row=row_idx, column=7, value=_executor_display(tx))
-        ws.cell(row=row_idx, column=8, value=tx.subscription_id or "")
-        ws.cell(row=row_idx, column=9, value=tx.esncard_id or "")
-        ws.cell(row=row_idx, column=10, value=tx.event_reference_manual_id or "")
-        ws.cell(row=row_idx, column=11, value=tx.receipt_link or "")
-
-        ws.cell(row=row_idx, column=4).number_format = "#,##0.00"
-        row_idx += 1
 
-    _autosize_columns(ws)
-    return wb
+def build_transactions_workbook(start_dt, end_dt, tz):
+    # The report columns need neither the Settings fees nor event labels
+    export_ctx = ExportContext(tz=tz)
+    txs = _report_transactions(start_dt, end_dt)
+    return _transactions_workbook(report_row(tx, export_ctx) for tx in txs.iterator())
 
 
 def generate_accounts_report(report_date=None, tz=None, dry_run=False):
     tz = tz or get_report_timezone()
     report_date = resolve_report_date(report_date, tz)
-    start_dt, end_dt = get_day_bounds(report_date, tz)
     filename = report_date.strftime("%d-%m-%Y") + ".xlsx"
 
-    workbook = build_accounts_workbook(start_dt, end_dt, report_date)
+    workbook = build_accounts_workbook(report_date, tz)
     if dry_run:
         return {
             "filename": filename,
@@ -279,9 +269,10 @@ def generate_accounts_report(report_date=None, tz=None, dry_run=False):
         }
 
     service = get_drive_service()
-    _, accounts_folder_id, _ = ensure_report_folders(service, settings.GOOGLE_DRIVE_FOLDER_ID)
     stream = _workbook_to_stream(workbook)
-    file_id, action = _upload_excel(service, accounts_folder_id, filename, stream)
+    file_id, action = _with_report_folders(
+        service, lambda folders: _upload_excel(service, folders[1], filename, stream)
+    )
     return {
         "filename": filename,
         "file_id": file_id,
@@ -305,9 +296,10 @@ def generate_transactions_report(report_date=None, tz=None, dry_run=False):
         }
 
     service = get_drive_service()
-    _, _, transactions_folder_id = ensure_report_folders(service, settings.GOOGLE_DRIVE_FOLDER_ID)
     stream = _workbook_to_stream(workbook)
-    file_id, action = _upload_excel(service, transactions_folder_id, filename, stream)
+    file_id, action = _with_report_folders(
+        service, lambda folders: _upload_excel(service, folders[2], filename, stream)
+    )
     return {
         "filename": filename,
         "file_id": file_id,
@@ -316,35 +308,105 @@ def generate_transactions_report(report_date=None, tz=None, dry_run=False):
     }
 
 
-def generate_daily_reports(report_date=None, tz=None, dry_run=False):
+def _report_filename(report_date):
+    return report_date.strftime("%d-%m-%Y") + ".xlsx"
+
+
+def _report_rows_by_day(start_dt, end_dt, tz):
+    """{local day: report rows} of the transactions created in [start_dt, end_dt), from one query."""
+    export_ctx = ExportContext(tz=tz)
+    rows = {}
+    for tx in _report_transactions(start_dt, end_dt).iterator():
+        rows.setdefault(timezone.localtime(tx.created_at, tz).date(), []).append(report_row(tx, export_ctx))
+    return rows
+
+
+def generate_reports_range(date_from, date_to, tz=None, dry_run=False, output_dir=None, workers=None):
+    """
+    Accounts and transactions reports of every day in [date_from, date_to].
+
+    The data of the whole range is read up front: balances and totals with day_balances()
+    (snapshots plus one GROUP BY on (account, hour) for the days not snapshotted yet) and the
+    transaction rows with one query. Workbooks are then built and published by a pool of
+    `workers` threads (TREASURY_REPORT_WORKERS, default 4), which touch no database: each
+    writes to output_dir/Casse and output_dir/Transazioni when given, otherwise uploads to Drive
+    with its own client. The report folders and the reports already on Drive are looked up once
+    for the range. Returns one result per day in date order, shaped like generate_daily_reports();
+    a day that could not be published has "error" (the exception) instead.
+    """
     tz = tz or get_report_timezone()
-    report_date = resolve_report_date(report_date, tz)
-    start_dt, end_dt = get_day_bounds(report_date, tz)
+    date_from = resolve_report_date(date_from, tz)
+    date_to = resolve_report_date(date_to, tz)
+    if date_from > date_to:
+        raise ReportDateError("Start date must not be after end date.")
+    days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
 
-    accounts_wb = build_accounts_workbook(start_dt, end_dt, report_date)
-    transactions_wb = build_transactions_workbook(start_dt, end_dt, tz)
+    accounts = list(Account.objects.all().order_by("name"))
+    balances = day_balances(date_from, date_to, tz)
+    rows = _report_rows_by_day(get_day_bounds(date_from, tz)[0], get_day_bounds(date_to, tz)[1], tz)
 
-    filename = report_date.strftime("%d-%m-%Y") + ".xlsx"
+    folders, existing = None, ({}, {})
     if dry_run:
+        pass
+    elif output_dir:
+        for folder_name in (ACCOUNTS_FOLDER_NAME, TRANSACTIONS_FOLDER_NAME):
+            os.makedirs(os.path.join(output_dir, folder_name), exist_ok=True)
+    else:
+        service = get_drive_service()
+        filenames = [_report_filename(day) for day in days]
+        folders, existing = _with_report_folders(service, lambda found: (found, (
+            _existing_files(service, found[1], filenames),
+            _existing_files(service, found[2], filenames),
+        )))
+
+    def publish(day):
+        filename = _report_filename(day)
+        accounts_wb = _accounts_workbook(day, accounts, balances[day])
+        transactions_wb = _transactions_workbook(rows.get(day, []))
+        if dry_run:
+            return {
+                "report_date": day,
+                "accounts": {"filename": filename, "action": "dry-run"},
+                "transactions": {"filename": filename, "action": "dry-run"},
+            }
+
+        accounts_stream = _workbook_to_stream(accounts_wb)
+        transactions_stream = _workbook_to_stream(transactions_wb)
+        if output_dir:
+            return {
+                "report_date": day,
+                "accounts": _save_excel(os.path.join(output_dir, ACCOUNTS_FOLDER_NAME), filename, accounts_stream),
+                "transactions": _save_excel(
+                    os.path.join(output_dir, TRANSACTIONS_FOLDER_NAME), filename, transactions_stream
+                ),
+            }
+
+        service = get_drive_service()  # client of this worker thread
+        acc_id, acc_action = _put_excel(service, folders[1], filename, accounts_stream, existing[0].get(filename))
+        tx_id, tx_action = _put_excel(service, folders[2], filename, transactions_stream, existing[1].get(filename))
         return {
-            "report_date": report_date,
-            "accounts": {"filename": filename, "action": "dry-run"},
-            "transactions": {"filename": filename, "action": "dry-run"},
+            "report_date": day,
+            "accounts": {"filename": filename, "file_id": acc_id, "action": acc_action},
+            "transactions": {"filename": filename, "file_id": tx_id, "action": tx_action},
         }
 
-    service = get_drive_service()
-    _, accounts_folder_id, transactions_folder_id = ensure_report_folders(
-        service, settings.GOOGLE_DRIVE_FOLDER_ID
-    )
-
-    accounts_stream = _workbook_to_stream(accounts_wb)
-    acc_id, acc_action = _upload_excel(service, accounts_folder_id, filename, accounts_stream)
+    results = []
+    max_workers = min(len(days), workers or getattr(settings, "TREASURY_REPORT_WORKERS", 4))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(day, executor.submit(publish, day)) for day in days]
+        for day, future in futures:
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                logger.exception(f"Treasury reports of {day} failed")
+                results.append({"report_date": day, "error": exc})
+    return results
 
-    transactions_stream = _workbook_to_stream(transactions_wb)
-    tx_id, tx_action = _upload_excel(service, transactions_folder_id, filename, transactions_stream)
 
-    return {
-        "report_date": report_date,
-        "accounts": {"filename": filename, "file_id": acc_id, "action": acc_action},
-        "transactions": {"filename": filename, "file_id": tx_id, "action": tx_action},
-    }
+def generate_daily_reports(report_date=None, tz=None, dry_run=False):
+    tz = tz or get_report_timezone()
+    report_date = resolve_report_date(report_date, tz)
+    result = generate_reports_range(report_date, report_date, tz, dry_run=dry_run, workers=1)[0]
+    if "error" in result:
+        raise result["error"]
+    return result
@@ -4,41 +4,37 @@ from datetime import datetime
 from django.conf import settings
 from django.contrib.auth.models import Group
 from django.db import transaction
-from googleapiclient.http import MediaIoBaseUpload
 from rest_framework import serializers
 
 from profiles.models import Profile
 from treasury.models import ESNcard, Transaction, Account, ReimbursementRequest
 from events.models import Event
-from utils.google_drive import get_drive_service, find_or_create_folder
+from utils.google_drive import upload_to_folder_path
 
 DEFAULT_MIMETYPE = 'application/octet-stream'
 
 
 # --- Shared Drive upload helper for receipts (transactions + reimbursements) ---
+def _receipt_filename(receipt_file, user, instance_time, prefix):
+    ext = os.path.splitext(receipt_file.name)[1].lower()
+    return f"{prefix}_{user.profile.name}_{user.profile.surname}_{instance_time.strftime('%Y%m%d_%H%M%S')}{ext}"
+
+
 def upload_receipt_to_drive(receipt_file, user, instance_time, prefix):
     if not receipt_file:
         return None
-    GOOGLE_DRIVE_FOLDER_ID = settings.GOOGLE_DRIVE_FOLDER_ID
-    service = get_drive_service()
-    receipt_file.seek(0)
-    mimetype = getattr(receipt_file, 'content_type', DEFAULT_MIMETYPE)
-    media = MediaIoBaseUpload(receipt_file, mimetype=mimetype)
-    ext = os.path.splitext(receipt_file.name)[1].lower()
-    filename = f"{prefix}_{user.profile.name}_{user.profile.surname}_{instance_time.strftime('%Y%m%d_%H%M%S')}{ext}"
-    metadata = {'name': filename, 'parents': [GOOGLE_DRIVE_FOLDER_ID]}
-    uploaded = service.files().create(
-        body=metadata,
-        media_body=media,
-        fields='id',
-        supportsAllDrives=True
-    ).execute()
-    service.permissions().create(
-        fileId=uploaded['id'],
-        body={'role': 'reader', 'type': 'anyone'},
-        supportsAllDrives=True
-    ).execute()
-    return f"https://drive.google.com/file/d/{uploaded['id']}/view?usp=sharing"
+    return upload_to_folder_path(
+        receipt_file,
+        _receipt_filename(receipt_file, user, instance_time, prefix),
+        getattr(receipt_file, 'content_type', DEFAULT_MIMETYPE),
+        settings.GOOGLE_DRIVE_FOLDER_ID,
+    )
+
+
+def _event_folder_name(event):
+    # Format: EventName_EventDate (e.g., "Winter Trip_2026-02-15")
+    event_date_str = event.date.strftime('%Y-%m-%d') if event.date else 'NoDate'
+    return f"{event.name}_{event_date_str}"
 
 
 # --- Specific upload helper for reimbursement receipts with folder structure ---
@@ -47,55 +43,19 @@ def upload_reimbursement_receipt_to_drive(receipt_file, user, instance_time, eve
     Upload reimbursement receipt to Google Drive with organized folder structure:
     {Year}/Rimborsi/rimborsi generici  (if no event)
     {Year}/Rimborsi/{EventName_EventDate}  (if event specified)
+    Folder ids come from the folder cache (utils/google_drive.py): a known path costs no Drive call.
     """
     if not receipt_file:
         return None
-    
-    GOOGLE_DRIVE_FOLDER_ID = settings.GOOGLE_DRIVE_FOLDER_ID
-    service = get_drive_service()
-    
-    # Create folder structure: {Year}/Rimborsi/{rimborsi generici or EventName_EventDate}
-    current_year = instance_time.year
-    
-    # Find or create year folder (e.g., "2026")
-    year_folder_id = find_or_create_folder(service, str(current_year), GOOGLE_DRIVE_FOLDER_ID)
-    
-    # Find or create "Rimborsi" folder
-    rimborsi_folder_id = find_or_create_folder(service, "Rimborsi", year_folder_id)
-    
-    # Determine final folder based on event
-    if event:
-        # Format: EventName_EventDate (e.g., "Winter Trip_2026-02-15")
-        event_date_str = event.date.strftime('%Y-%m-%d') if event.date else 'NoDate'
-        event_folder_name = f"{event.name}_{event_date_str}"
-        final_folder_id = find_or_create_folder(service, event_folder_name, rimborsi_folder_id)
-    else:
-        # Use "rimborsi generici" folder
-        final_folder_id = find_or_create_folder(service, "rimborsi generici", rimborsi_folder_id)
-    
-    # Upload file to the final folder
-    receipt_file.seek(0)
-    mimetype = getattr(receipt_file, 'content_type', DEFAULT_MIMETYPE)
-    media = MediaIoBaseUpload(receipt_file, mimetype=mimetype)
-    ext = os.path.splitext(receipt_file.name)[1].lower()
-    filename = f"rimborso_{user.profile.name}_{user.profile.surname}_{instance_time.strftime('%Y%m%d_%H%M%S')}{ext}"
-    
-    metadata = {'name': filename, 'parents': [final_folder_id]}
-    uploaded = service.files().create(
-        body=metadata,
-        media_body=media,
-        fields='id',
-        supportsAllDrives=True
-    ).execute()
-    
-    # Make file readable by anyone with the link
-    service.permissions().create(
-        fileId=uploaded['id'],
-        body={'role': 'reader', 'type': 'anyone'},
-        supportsAllDrives=True
-    ).execute()
-    
-    return f"https://drive.google.com/file/d/{uploaded['id']}/view?usp=sharing"
+    return upload_to_folder_path(
+        receipt_file,
+        _receipt_filename(receipt_file, user, instance_time, "rimborso"),
+        getattr(receipt_file, 'content_type', DEFAULT_MIMETYPE),
+        settings.GOOGLE_DRIVE_FOLDER_ID,
+        str(instance_time.year),
+        "Rimborsi",
+        _event_folder_name(event) if event else "rimborsi generici",
+    )
 
 
 # --- Specific upload helper for transaction receipts with folder structure ---
@@ -107,49 +67,15 @@ def upload_transaction_receipt_to_drive(receipt_file, user, instance_time, event
     """
     if not receipt_file:
         return None
-
-    GOOGLE_DRIVE_FOLDER_ID = settings.GOOGLE_DRIVE_FOLDER_ID
-    service = get_drive_service()
-
-    # Create folder structure: {Year}/Transazioni/{transazioni generiche or EventName_EventDate}
-    current_year = instance_time.year
-
-    # Find or create year folder (e.g., "2026")
-    year_folder_id = find_or_create_folder(service, str(current_year), GOOGLE_DRIVE_FOLDER_ID)
-
-    # Find or create "Transazioni" folder
-    transazioni_folder_id = find_or_create_folder(service, "Transazioni", year_folder_id)
-
-    # Determine final folder based on event
-    if event:
-        event_date_str = event.date.strftime('%Y-%m-%d') if event.date else 'NoDate'
-        event_folder_name = f"{event.name}_{event_date_str}"
-        final_folder_id = find_or_create_folder(service, event_folder_name, transazioni_folder_id)
-    else:
-        final_folder_id = find_or_create_folder(service, "transazioni generiche", transazioni_folder_id)
-
-    # Upload file to the final folder
-    receipt_file.seek(0)
-    mimetype = getattr(receipt_file, 'content_type', DEFAULT_MIMETYPE)
-    media = MediaIoBaseUpload(receipt_file, mimetype=mimetype)
-    ext = os.path.splitext(receipt_file.name)[1].lower()
-    filename = f"transazione_{user.profile.name}_{user.profile.surname}_{instance_time.strftime('%Y%m%d_%H%M%S')}{ext}"
-
-    metadata = {'name': filename, 'parents': [final_folder_id]}
-    uploaded = service.files().create(
-        body=metadata,
-        media_body=media,
-        fields='id',
-        supportsAllDrives=True
-    ).execute()
-
-    service.permissions().create(
-        fileId=uploaded['id'],
-        body={'role': 'reader', 'type': 'anyone'},
-        supportsAllDrives=True
-    ).execute()
-
-    return f"https://drive.google.com/file/d/{uploaded['id']}/view?usp=sharing"
+    return upload_to_folder_path(
+        receipt_file,
+        _receipt_filename(receipt_file, user, instance_time, "transazione"),
+        getattr(receipt_file, 'content_type', DEFAULT_MIMETYPE),
+        settings.GOOGLE_DRIVE_FOLDER_ID,
+        str(instance_time.year),
+        "Transazioni",
+        _event_folder_name(event) if event else "transazioni generiche",
+    )
 
 
 # Centralized allowed mimetypes / extensions for receipt uploads
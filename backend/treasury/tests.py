@@ -1,14 +1,28 @@
 """Tests for treasury module endpoints and behaviors."""
 
+import csv
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
-from io import BytesIO
+from io import BytesIO, StringIO
 from datetime import timedelta
 from decimal import Decimal
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from googleapiclient.errors import HttpError
 from httplib2 import Response as HttpLib2Response
@@ -17,10 +31,16 @@ from rest_framework.test import APITestCase
 
 from events.models import Event, EventList, Subscription, EventOrganizer
 from profiles.models import Profile
-from treasury.models import Account, ESNcard, Transaction, ReimbursementRequest, Settings
+from treasury.balances import day_start, snapshot_daily_balances
+from treasury.export_rows import ExportContext, export_timezone, ledger_row, report_row
+from treasury.models import Account, AccountDailyBalance, ESNcard, Transaction, ReimbursementRequest, Settings
+from treasury.reports import build_accounts_workbook
+from treasury.serializers import upload_reimbursement_receipt_to_drive
+from utils.google_drive import get_drive_service, reset_drive_service
 
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 def _create_profile(email, *, is_esner=True, verified=True, enabled=True, name="Mario", surname="Rossi"):
@@ -1277,7 +1297,7 @@ class TransactionsExportTests(TreasuryBaseTestCase):
 		self.assertEqual(response.status_code, 200)
 		self.assertIn("application/vnd.openxmlformats", response["Content-Type"])
 
-		wb = load_workbook(filename=BytesIO(response.content))
+		wb = load_workbook(filename=BytesIO(b"".join(response.streaming_content)))
 		ws = wb.active
 		headers = [ws.cell(row=1, column=i).value for i in range(1, 10)]
 		self.assertIn("Eseguito da", headers)
@@ -1309,13 +1329,172 @@ class TransactionsExportTests(TreasuryBaseTestCase):
 		response = self.client.get("/backend/transactions_export/")
 		self.assertEqual(response.status_code, 200)
 
-		wb = load_workbook(filename=BytesIO(response.content))
+		wb = load_workbook(filename=BytesIO(b"".join(response.streaming_content)))
 		ws = wb.active
 
 		# Column 7 = "Commenti" and column 9 = "Eseguito da".
 		self.assertEqual(ws.cell(row=2, column=7).value, "John External")
 		self.assertEqual(ws.cell(row=2, column=9).value, "Mario Rossi")
 
+	def _create_export_transactions(self, count):
+		profile = _create_profile("exporter@esnpolimi.it", name="Anna", surname="Bianchi")
+		user = _create_user(profile)
+		self.authenticate(user)
+		account = _create_account("Cassa Export", user=user)
+		for i in range(count):
+			Transaction.objects.create(
+				account=account,
+				executor=user,
+				type=Transaction.TransactionType.DEPOSIT,
+				amount=Decimal("5.00"),
+				description=f"Versamento numero {i}" + ("x" * 80 if i == 0 else ""),
+			)
+
+	def test_transactions_export_xlsx_is_streamed_with_column_widths(self):
+		"""XLSX export is a streamed file with formatted amounts and widths measured on all rows."""
+		self._create_export_transactions(3)
+
+		response = self.client.get("/backend/transactions_export/")
+
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.streaming)
+		self.assertIn('.xlsx"', response["Content-Disposition"])
+		ws = load_workbook(filename=BytesIO(b"".join(response.streaming_content))).active
+		self.assertEqual(ws.title, "Bilancio")
+		self.assertEqual(ws.max_row, 4)
+		self.assertTrue(ws.cell(row=1, column=1).font.bold)
+		self.assertEqual(ws.cell(row=2, column=5).value, 5)
+		self.assertEqual(ws.cell(row=2, column=5).number_format, "#,##0.00 €")
+		self.assertEqual(ws.column_dimensions["H"].width, 50)
+		self.assertEqual(ws.column_dimensions["F"].width, len("Cassa Export") + 2)
+
+	def test_transactions_export_csv(self):
+		"""file_format=csv streams the same columns as CSV."""
+		self._create_export_transactions(2)
+
+		response = self.client.get("/backend/transactions_export/?file_format=csv")
+
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.streaming)
+		self.assertIn("text/csv", response["Content-Type"])
+		content = b"".join(response.streaming_content).decode("utf-8-sig")
+		rows = list(csv.reader(StringIO(content)))
+		self.assertEqual(rows[0][0], "Registrazione")
+		self.assertEqual(rows[0][8], "Eseguito da")
+		self.assertEqual(len(rows), 3)
+		self.assertEqual(rows[1][2], "Deposito")
+		self.assertEqual(rows[1][4], "5.0")
+		self.assertEqual(rows[1][8], "Anna Bianchi")
+
+	def test_transactions_export_rejects_unknown_format(self):
+		"""Unsupported file formats return 400."""
+		self._create_export_transactions(1)
+
+		response = self.client.get("/backend/transactions_export/?file_format=pdf")
+
+		self.assertEqual(response.status_code, 400)
+
+	def test_transactions_export_queries_do_not_grow_with_rows(self):
+		"""Event labels and Settings fees are loaded once per export, not per row."""
+		profile = _create_profile("ledger@esnpolimi.it", name="Luca", surname="Verdi")
+		user = _create_user(profile)
+		self.authenticate(user)
+		account = _create_account("Cassa Eventi", user=user)
+
+		def add_event_transactions(count):
+			for i in range(count):
+				event = _create_event(name=f"Gita {Event.objects.count()}", date=timezone.now().date())
+				sub = Subscription.objects.create(profile=profile, event=event, list=_create_event_list(event))
+				Transaction.objects.create(subscription=sub, account=account, executor=user,
+										   type=Transaction.TransactionType.SUBSCRIPTION,
+										   amount=Decimal("10.00"), description="Quota")
+				esncard = ESNcard.objects.create(profile=profile, number=f"ESN{ESNcard.objects.count():06d}")
+				Transaction.objects.create(account=account, executor=user, esncard=esncard,
+										   type=Transaction.TransactionType.ESNCARD,
+										   amount=Decimal("0.00"), description="ESNcard smarrita")
+
+		def export_rows():
+			with CaptureQueriesContext(connection) as queries:
+				response = self.client.get("/backend/transactions_export/?file_format=csv")
+				content = b"".join(response.streaming_content).decode("utf-8-sig")
+			return list(csv.reader(StringIO(content))), len(queries)
+
+		Settings.get()
+		add_event_transactions(2)
+		small_rows, small_queries = export_rows()
+		add_event_transactions(6)
+		large_rows, large_queries = export_rows()
+
+		self.assertEqual(len(small_rows), 5)
+		self.assertEqual(len(large_rows), 17)
+		self.assertEqual(small_queries, large_queries)
+		subscription_row = next(row for row in large_rows if row[3].endswith("- iscrizione"))
+		self.assertTrue(subscription_row[2].startswith("Gita "))
+		self.assertEqual(subscription_row[6], "Luca Verdi")
+		esncard_row = next(row for row in large_rows if row[2] == "Quota Associativa")
+		self.assertEqual(esncard_row[4], str(float(Settings.get().esncard_lost_fee)))
+
+
+class ExportRowsTests(TreasuryBaseTestCase):
+	"""Row builders of treasury.export_rows over prefetched transactions."""
+
+	ROWS = 30
+	BENCHMARK_ROWS = 3000
+	# Generous floor (the builders do well over 10x this); catches a builder going back to per-row queries
+	MIN_ROWS_PER_SECOND = 2000
+
+	def setUp(self):
+		super().setUp()
+		profile = _create_profile("bench@esnpolimi.it", name="Sara", surname="Neri")
+		self.user = _create_user(profile)
+		self.account = _create_account("Cassa Bench", user=self.user)
+		self.event = _create_event(name="Benchmark Trip")
+		self.sub = Subscription(id=1, event_id=self.event.id, profile=profile)
+		self.ctx = ExportContext.for_transactions(Transaction.objects.none())
+		self.ctx.event_labels = {self.event.id: (self.event.name, self.event.date.strftime("%d/%m"))}
+
+	def _transactions(self, count):
+		created_at = timezone.now()
+		types = [
+			Transaction.TransactionType.SUBSCRIPTION,
+			Transaction.TransactionType.ESNCARD,
+			Transaction.TransactionType.DEPOSIT,
+		]
+		transactions = []
+		for i in range(count):
+			tx = Transaction(id=i + 1, type=types[i % 3], amount=Decimal("0.00") if i % 3 == 1 else Decimal("12.50"),
+							 account=self.account, executor=self.user, description=f"Movimento {i}",
+							 created_at=created_at)
+			if i % 3 == 0:
+				tx.subscription = self.sub
+			transactions.append(tx)
+		return transactions
+
+	def test_rows_are_built_without_queries(self):
+		"""ledger_row/report_row never hit the database."""
+		transactions = self._transactions(self.ROWS)
+
+		for builder in (ledger_row, report_row):
+			with self.assertNumQueries(0):
+				rows = [builder(tx, self.ctx) for tx in transactions]
+			self.assertEqual(len(rows), self.ROWS)
+
+		self.assertEqual(ledger_row(transactions[0], self.ctx)[2], "Benchmark Trip")
+		self.assertEqual(ledger_row(transactions[1], self.ctx)[4], float(Settings.get().esncard_release_fee))
+		self.assertEqual(report_row(transactions[2], self.ctx)[6], "Sara Neri")
+
+	def test_row_builder_throughput(self):
+		"""Benchmark: rows/second of each builder, logged (treasury.tests, INFO) and checked against a floor."""
+		transactions = self._transactions(self.BENCHMARK_ROWS)
+
+		for builder in (ledger_row, report_row):
+			with self.subTest(builder=builder.__name__):
+				start = time.perf_counter()
+				rows = [builder(tx, self.ctx) for tx in transactions]
+				rows_per_second = len(rows) / max(time.perf_counter() - start, 1e-9)
+				logger.info("%s: %.0f rows/s over %d rows", builder.__name__, rows_per_second, len(rows))
+				self.assertGreater(rows_per_second, self.MIN_ROWS_PER_SECOND)
+
 
 class TreasuryReportEndpointsTests(TreasuryBaseTestCase):
 	"""Tests for treasury Drive report endpoints."""
@@ -1374,6 +1553,268 @@ class TreasuryReportEndpointsTests(TreasuryBaseTestCase):
 		self.assertEqual(response.data.get("error"), "Errore Drive durante la generazione report.")
 
 
+class DriveClientCacheTests(TreasuryBaseTestCase):
+	"""Tests for the cached Drive client and folder ids (utils/google_drive.py) used by receipt uploads."""
+
+	def setUp(self):
+		super().setUp()
+		cache.clear()
+		self.addCleanup(cache.clear)
+		reset_drive_service()
+		self.addCleanup(reset_drive_service)
+		profile = _create_profile("receipt@esnpolimi.it")
+		self.user = _create_user(profile)
+
+	@staticmethod
+	def _service(create_side_effect=None):
+		service = MagicMock()
+		files = service.files.return_value
+		files.list.return_value.execute.return_value = {"files": [{"id": "folder-id"}]}
+		files.create.return_value.execute.side_effect = create_side_effect or (lambda **kwargs: {"id": "file-id"})
+		return service
+
+	def _upload(self, service):
+		receipt = SimpleUploadedFile("scontrino.pdf", b"%PDF-1.4", content_type="application/pdf")
+		with patch("utils.google_drive.get_drive_service", return_value=service):
+			return upload_reimbursement_receipt_to_drive(receipt, self.user, timezone.now())
+
+	def test_known_folder_path_costs_no_lookup(self):
+		"""The second upload to the same folder path only creates and shares the file."""
+		first, second = self._service(), self._service()
+
+		self._upload(first)
+		link = self._upload(second)
+
+		self.assertEqual(first.files.return_value.list.call_count, 3)
+		second.files.return_value.list.assert_not_called()
+		second.files.return_value.create.assert_called_once()
+		self.assertEqual(link, "https://drive.google.com/file/d/file-id/view?usp=sharing")
+
+	def test_cached_folder_not_found_is_resolved_again(self):
+		"""A 404 on a cached folder drops the cached path and retries the upload once."""
+		self._upload(self._service())
+		not_found = HttpError(HttpLib2Response({"status": "404"}), b"File not found")
+		calls = iter([not_found, {"id": "file-id"}])
+
+		def create(**kwargs):
+			result = next(calls)
+			if isinstance(result, Exception):
+				raise result
+			return result
+
+		service = self._service(create_side_effect=create)
+		link = self._upload(service)
+
+		self.assertEqual(service.files.return_value.list.call_count, 3)
+		self.assertEqual(link, "https://drive.google.com/file/d/file-id/view?usp=sharing")
+
+	@patch("utils.google_drive.build")
+	@patch("utils.google_drive.service_account.Credentials.from_service_account_file")
+	def test_drive_service_is_built_once_per_thread(self, mock_credentials, mock_build):
+		"""Credentials are read once per process and the client is built once per thread."""
+		services = [get_drive_service() for _ in range(3)]
+		thread_services = []
+		thread = threading.Thread(target=lambda: thread_services.append(get_drive_service()))
+		thread.start()
+		thread.join()
+
+		mock_credentials.assert_called_once()
+		self.assertEqual(mock_build.call_count, 2)
+		self.assertIs(services[0], services[2])
+
+	@override_settings(GOOGLE_DRIVE_UPLOAD_CHUNK_SIZE=256 * 1024, GOOGLE_DRIVE_UPLOAD_RETRIES=3)
+	def test_large_file_is_uploaded_in_resumable_chunks(self):
+		"""Files larger than one chunk are sent chunk by chunk, each chunk with its own retries."""
+		service = self._service()
+		request = service.files.return_value.create.return_value
+		request.next_chunk.side_effect = [(None, None), (None, None), (None, {"id": "big-id"})]
+		receipt = SimpleUploadedFile("scontrino.pdf", b"x" * (600 * 1024), content_type="application/pdf")
+
+		with patch("utils.google_drive.get_drive_service", return_value=service):
+			link = upload_reimbursement_receipt_to_drive(receipt, self.user, timezone.now())
+
+		media = service.files.return_value.create.call_args.kwargs["media_body"]
+		self.assertTrue(media.resumable())
+		self.assertEqual(media.chunksize(), 256 * 1024)
+		self.assertEqual(request.next_chunk.call_count, 3)
+		request.next_chunk.assert_called_with(num_retries=3)
+		request.execute.assert_not_called()
+		self.assertEqual(link, "https://drive.google.com/file/d/big-id/view?usp=sharing")
+
+
+class AccountDailyBalanceTests(TreasuryBaseTestCase):
+	"""Tests for the daily balance snapshots (treasury/balances.py) and their readers."""
+
+	def setUp(self):
+		super().setUp()
+		self.tz = export_timezone()
+		self.today = timezone.localtime(timezone.now(), self.tz).date()
+		self.user = _create_user(_create_profile("snapshot@esnpolimi.it"))
+		self.account = _create_account("Cassa", user=self.user)
+		Account.objects.filter(pk=self.account.pk).update(created_at=day_start(self._day(-4), self.tz))
+		self._tx("100.00", -4)
+		self._tx("-30.00", -3, minutes=30)  # 00:30 in Rome is still the day before in UTC
+		self._tx("50.00", -1)
+		self._tx("20.00", 0)
+
+	def _day(self, offset):
+		return self.today + timedelta(days=offset)
+
+	def _tx(self, amount, offset, minutes=12 * 60):
+		tx = Transaction.objects.create(
+			account=self.account,
+			executor=self.user,
+			type=Transaction.TransactionType.DEPOSIT if Decimal(amount) > 0 else Transaction.TransactionType.WITHDRAWAL,
+			amount=Decimal(amount),
+			description="Snapshot test",
+		)
+		created_at = day_start(self._day(offset), self.tz) + timedelta(minutes=minutes)
+		Transaction.objects.filter(pk=tx.pk).update(created_at=created_at)
+		return tx
+
+	def _closings(self):
+		return dict(AccountDailyBalance.objects.filter(account=self.account).values_list("day", "closing"))
+
+	def test_snapshot_is_incremental_and_matches_ledger(self):
+		"""A run writes one row per day up to yesterday; the next run only adds the new days."""
+		stats = snapshot_daily_balances(tz=self.tz)
+
+		self.assertEqual(stats, {"rows": 4, "rebuilt_accounts": []})
+		self.assertEqual(self._closings(), {
+			self._day(-4): Decimal("100.00"),
+			self._day(-3): Decimal("70.00"),
+			self._day(-2): Decimal("70.00"),
+			self._day(-1): Decimal("120.00"),
+		})
+		row = AccountDailyBalance.objects.get(account=self.account, day=self._day(-3))
+		self.assertEqual((row.opening, row.outflows, row.transactions_count), (Decimal("100.00"), Decimal("30.00"), 1))
+
+		self.assertEqual(snapshot_daily_balances(tz=self.tz)["rows"], 0)
+		self.assertEqual(snapshot_daily_balances(until=self.today, tz=self.tz)["rows"], 1)
+		self.assertEqual(self._closings()[self.today], Decimal("140.00"))
+
+	def test_changed_history_recomputes_the_account(self):
+		"""Editing a transaction of a snapshotted day is detected on the next run."""
+		snapshot_daily_balances(until=self._day(-2), tz=self.tz)
+		old = Transaction.objects.get(amount=Decimal("100.00"))
+		old.amount = Decimal("110.00")
+		old.save()
+
+		out = StringIO()
+		call_command("snapshot_account_balances", stdout=out)
+
+		self.assertIn("Recomputed", out.getvalue())
+		self.assertEqual(self._closings()[self._day(-3)], Decimal("80.00"))
+		self.assertEqual(self._closings()[self._day(-1)], Decimal("130.00"))
+
+		call_command("snapshot_account_balances", "--rebuild", stdout=StringIO())
+		self.assertEqual(AccountDailyBalance.objects.count(), 4)
+
+	def test_accounts_report_reads_snapshots(self):
+		"""A snapshotted day is reported without querying the transactions; later days from the ledger."""
+		snapshot_daily_balances(until=self._day(-2), tz=self.tz)
+
+		with CaptureQueriesContext(connection) as queries:
+			workbook = build_accounts_workbook(self._day(-3), self.tz)
+		self.assertFalse([q for q in queries.captured_queries if "treasury_transaction" in q["sql"]])
+		row = [cell.value for cell in workbook.active[2]]
+		self.assertEqual(row[4:9], [Decimal("100.00"), Decimal("70.00"), Decimal("0.00"), Decimal("30.00"), 1])
+
+		row = [cell.value for cell in build_accounts_workbook(self._day(-1), self.tz).active[2]]
+		self.assertEqual(row[4:9], [Decimal("70.00"), Decimal("120.00"), Decimal("50.00"), Decimal("0.00"), 1])
+
+	def test_balance_history_endpoint(self):
+		"""The endpoint merges snapshotted and live days and respects account visibility."""
+		snapshot_daily_balances(until=self._day(-2), tz=self.tz)
+		self.authenticate(self.user)
+
+		response = self.client.get(
+			f"/backend/account/{self.account.pk}/balance_history/?dateFrom={self._day(-5)}&dateTo={self.today}"
+		)
+
+		self.assertEqual(response.status_code, 200)
+		results = response.data["results"]
+		self.assertEqual([r["date"] for r in results][0], str(self._day(-4)))
+		self.assertEqual([r["closing"] for r in results], ["100.00", "70.00", "70.00", "120.00", "140.00"])
+		self.assertEqual(results[-1]["transactions"], 1)
+
+		bad = self.client.get(f"/backend/account/{self.account.pk}/balance_history/?dateFrom=2026-13-01")
+		self.assertEqual(bad.status_code, 400)
+
+		self.account.visible_to_groups.set([self.group_board])
+		self.assertEqual(self.client.get(f"/backend/account/{self.account.pk}/balance_history/").status_code, 403)
+
+
+class TreasuryReportRangeTests(TreasuryBaseTestCase):
+	"""Tests for generate_treasury_reports --from/--to (treasury.reports.generate_reports_range)."""
+
+	def setUp(self):
+		super().setUp()
+		cache.clear()
+		self.addCleanup(cache.clear)
+		self.tz = export_timezone()
+		self.today = timezone.localtime(timezone.now(), self.tz).date()
+		self.user = _create_user(_create_profile("range@esnpolimi.it"))
+		self.account = _create_account("Cassa Range", user=self.user)
+		for amount, offset in (("40.00", -3), ("15.00", -3), ("25.00", -1)):
+			tx = Transaction.objects.create(
+				account=self.account,
+				executor=self.user,
+				type=Transaction.TransactionType.DEPOSIT,
+				amount=Decimal(amount),
+				description="Range test",
+			)
+			created_at = day_start(self.today + timedelta(days=offset), self.tz) + timedelta(hours=10)
+			Transaction.objects.filter(pk=tx.pk).update(created_at=created_at)
+
+	def _range_args(self):
+		return "--from", str(self.today - timedelta(days=3)), "--to", str(self.today - timedelta(days=1))
+
+	def test_output_dir_writes_every_day_from_one_pass(self):
+		"""Each day gets both workbooks; transactions are read with one query for the whole range."""
+		output_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, output_dir, ignore_errors=True)
+
+		with CaptureQueriesContext(connection) as queries:
+			call_command("generate_treasury_reports", *self._range_args(), "--output-dir", output_dir, stdout=StringIO())
+
+		tx_queries = [q for q in queries.captured_queries if 'FROM "treasury_transaction"' in q["sql"]]
+		self.assertLessEqual(len(tx_queries), 3)  # day totals, later sums, report rows
+		first = (self.today - timedelta(days=3)).strftime("%d-%m-%Y") + ".xlsx"
+		last = (self.today - timedelta(days=1)).strftime("%d-%m-%Y") + ".xlsx"
+		self.assertEqual(len(os.listdir(os.path.join(output_dir, "Casse"))), 3)
+
+		accounts_row = [c.value for c in load_workbook(os.path.join(output_dir, "Casse", first)).active[2]]
+		self.assertEqual(accounts_row[4:9], [0, 55, 55, 0, 2])
+		accounts_row = [c.value for c in load_workbook(os.path.join(output_dir, "Casse", last)).active[2]]
+		self.assertEqual(accounts_row[4:6], [55, 80])
+		transactions_sheet = load_workbook(os.path.join(output_dir, "Transazioni", first)).active
+		self.assertEqual(transactions_sheet.max_row, 3)
+
+	def test_drive_range_resolves_folders_and_existing_files_once(self):
+		"""Folders and existing reports are looked up once; existing files are updated, others created."""
+		service = MagicMock()
+		files = service.files.return_value
+		existing_name = (self.today - timedelta(days=2)).strftime("%d-%m-%Y") + ".xlsx"
+		files.list.return_value.execute.side_effect = lambda: {"files": [{"id": "folder-or-file", "name": existing_name}]}
+		files.create.return_value.execute.return_value = {"id": "new-id"}
+
+		out = StringIO()
+		with patch("treasury.reports.get_drive_service", return_value=service):
+			call_command("generate_treasury_reports", *self._range_args(), "--workers", "3", stdout=out)
+
+		# 3 folder lookups + 1 listing per report folder
+		self.assertEqual(files.list.call_count, 5)
+		self.assertEqual(files.update.call_count, 2)
+		self.assertEqual(files.create.call_count, 4)
+		self.assertEqual(out.getvalue().count("accounts report"), 3)
+
+	def test_range_rejects_inverted_dates(self):
+		"""--from after --to is a command error."""
+		with self.assertRaises(CommandError):
+			call_command("generate_treasury_reports", "--from", "2026-05-02", "--to", "2026-05-01", stdout=StringIO())
+
+
 class AccountModelTests(TreasuryBaseTestCase):
 	"""Tests for Account model properties."""
 
@@ -1736,6 +2177,100 @@ class AccountBalanceEdgeCaseTests(TreasuryBaseTestCase):
 		self.assertIn(response.status_code, [400, 403])
 
 
+class LedgerTests(TreasuryBaseTestCase):
+	"""Balance updates through treasury.ledger."""
+
+	def setUp(self):
+		super().setUp()
+		self.user = _create_user(_create_profile("ledger@esnpolimi.it"))
+		self.account = _create_account("Ledger", user=self.user, balance="100.00")
+
+	def _transaction(self, amount, account=None, **kwargs):
+		return Transaction(
+			account=account or self.account,
+			executor=self.user,
+			type=kwargs.pop("type", Transaction.TransactionType.DEPOSIT),
+			amount=Decimal(amount),
+			description=kwargs.pop("description", "Movimento"),
+			**kwargs
+		)
+
+	def test_stale_account_instances_do_not_lose_updates(self):
+		"""Two writers holding the same stale Account instance both land on the balance."""
+		stale_a = Account.objects.get(pk=self.account.pk)
+		stale_b = Account.objects.get(pk=self.account.pk)
+
+		self._transaction("10.00", account=stale_a).save()
+		self._transaction("5.00", account=stale_b).save()
+
+		self.account.refresh_from_db()
+		self.assertEqual(self.account.balance, Decimal("115.00"))
+		self.assertEqual(stale_b.balance, Decimal("115.00"))
+
+	def test_negative_check_uses_committed_balance(self):
+		"""Validation reads the locked row, not the caller's instance."""
+		stale = Account.objects.get(pk=self.account.pk)
+		self._transaction("-80.00", type=Transaction.TransactionType.RIMBORSO_ESNCARD).save()
+
+		with self.assertRaises(ValidationError):
+			self._transaction("-30.00", account=stale, type=Transaction.TransactionType.RIMBORSO_ESNCARD).save()
+
+		self.account.refresh_from_db()
+		self.assertEqual(self.account.balance, Decimal("20.00"))
+
+	def test_edit_and_move_between_accounts(self):
+		"""Editing applies the difference; moving reverts the old account and charges the new one."""
+		other = _create_account("Ledger 2", user=self.user, balance="0.00")
+		tx = self._transaction("10.00")
+		tx.save()
+
+		tx.amount = Decimal("25.00")
+		tx.save()
+		self.account.refresh_from_db()
+		self.assertEqual(self.account.balance, Decimal("125.00"))
+
+		tx.account = other
+		tx.save()
+		self.account.refresh_from_db()
+		other.refresh_from_db()
+		self.assertEqual(self.account.balance, Decimal("100.00"))
+		self.assertEqual(other.balance, Decimal("25.00"))
+
+	def test_delete_only_updates_balance(self):
+		"""Deleting with a stale instance reverts the amount without overwriting other columns."""
+		tx = self._transaction("10.00")
+		tx.save()
+		Account.objects.filter(pk=self.account.pk).update(name="Renamed")
+
+		tx.delete()
+
+		self.account.refresh_from_db()
+		self.assertEqual(self.account.balance, Decimal("100.00"))
+		self.assertEqual(self.account.name, "Renamed")
+
+	def test_balance_changes_are_audited(self):
+		"""Balances are written with update(), so the ledger logs every change with its old and new value."""
+		other = _create_account("Ledger 2", user=self.user, balance="0.00")
+		with patch("backend.db_audit._write_event") as write_event:
+			tx = self._transaction("10.00")
+			tx.save()
+			tx.account = other
+			tx.save()
+			tx.delete()
+
+		balances = [
+			(event["pk"], event["changes"]["balance"])
+			for event in (call.args[0] for call in write_event.call_args_list)
+			if event["model"] == "treasury.Account"
+		]
+		self.assertEqual(balances, [
+			(self.account.pk, {"old": Decimal("100.00"), "new": Decimal("110.00")}),
+			(self.account.pk, {"old": Decimal("110.00"), "new": Decimal("100.00")}),
+			(other.pk, {"old": Decimal("0.00"), "new": Decimal("10.00")}),
+			(other.pk, {"old": Decimal("10.00"), "new": Decimal("0.00")}),
+		])
+
+
 class ESNcardComplexEdgeCaseTests(TreasuryBaseTestCase):
 	"""Complex scenario tests for ESNcard operations."""
 
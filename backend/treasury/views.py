@@ -6,10 +6,8 @@ import sentry_sdk
 from django.core.exceptions import PermissionDenied, ObjectDoesNotExist, ValidationError
 from django.db import transaction, IntegrityError
 from django.db.models import Q, Prefetch
-from django.http import HttpResponse
+from django.http import FileResponse, StreamingHttpResponse
 from django.utils.dateparse import parse_datetime
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment
 from rest_framework import serializers
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.pagination import PageNumberPagination
@@ -25,18 +23,21 @@ from treasury.serializers import TransactionViewSerializer, AccountDetailedViewS
     AccountCreateSerializer, ESNcardEmissionSerializer, TransactionCreateSerializer, \
     ESNcardSerializer, AccountListViewSerializer, ReimbursementRequestSerializer, ReimbursementRequestViewSerializer, \
     TransactionUpdateSerializer
-from treasury.reports import generate_accounts_report, generate_transactions_report, ReportDateError
+from treasury.exports import write_xlsx, stream_csv, EXCEL_MIMETYPE, CSV_MIMETYPE
+from treasury.export_rows import ExportContext, LEDGER_HEADERS, LEDGER_SELECT_RELATED, ledger_row
+from treasury.balances import day_balances
+from treasury.reports import generate_accounts_report, generate_transactions_report, ReportDateError, \
+    get_report_timezone, resolve_report_date
 from users.models import User
 from googleapiclient.errors import HttpError
 from django.conf import settings
-from django.utils import timezone
 from utils.permissions import user_is_board
-try:
-    from zoneinfo import ZoneInfo
-except Exception:
-    ZoneInfo = None
 
 MSG_UNAUTHORIZED = 'Non autorizzato.'
+BALANCE_HISTORY_MAX_DAYS = 366
+
+# Rows fetched per query by streaming exports
+EXPORT_CHUNK_SIZE = 2000
 
 logger = logging.getLogger(__name__)
 
@@ -509,6 +510,43 @@ def account_detail(request, pk):
             return Response({'error': "Metodo non consentito"}, status=405)
     except Account.DoesNotExist:
         return Response({'error': 'Account non trovato.'}, status=404)
+# Endpoint to retrieve the daily balances of an account (AccountDailyBalance snapshots)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def account_balance_history(request, pk):
+    try:
+        account = Account.objects.get(pk=pk)
+    except Account.DoesNotExist:
+        return Response({'error': 'Account non trovato.'}, status=404)
+    if not account.is_visible_to_user(request.user):
+        return Response({'error': MSG_UNAUTHORIZED}, status=403)
+
+    tz = get_report_timezone()
+    try:
+        date_to = resolve_report_date(request.query_params.get('dateTo'), tz)
+        date_from = request.query_params.get('dateFrom')
+        date_from = resolve_report_date(date_from, tz) if date_from else date_to - timedelta(days=29)
+    except ReportDateError as exc:
+        return Response({'error': str(exc)}, status=400)
+    if date_from > date_to:
+        return Response({'error': "La data di inizio deve precedere la data di fine."}, status=400)
+    if (date_to - date_from).days >= BALANCE_HISTORY_MAX_DAYS:
+        return Response({'error': f"Intervallo massimo: {BALANCE_HISTORY_MAX_DAYS} giorni."}, status=400)
+
+    results = []
+    for day, by_account in day_balances(date_from, date_to, tz, account_ids=[account.pk]).items():
+        entry = by_account.get(account.pk)
+        if entry is None:
+            continue  # the account did not exist yet
+        results.append({
+            'date': day.strftime('%Y-%m-%d'),
+            'opening': str(entry['opening']),
+            'closing': str(entry['closing']),
+            'inflows': str(entry['inflows']),
+            'outflows': str(entry['outflows']),
+            'transactions': entry['count'],
+        })
+    return Response({'account': account.pk, 'results': results}, status=200)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def reimbursement_request_creation(request):
@@ -898,173 +936,23 @@ def transactions_export(request):
     """
     Export filtered transactions with columns:
     Registrazione | Esecuzione | Attività | Descrizione | Importo | Cassa | Commenti | Descrizione (gestionale) | Eseguito da
+    Streams an .xlsx file (default) or, with ?file_format=csv, a CSV; memory does not depend on the row count.
     """
 
-    # Helper to compute (possibly adjusted) amount, with narrowed exception handling.
-    def compute_amount(tx_obj):
-        amt = float(tx_obj.amount) if tx_obj.amount is not None else None
-        if tx_obj.type == Transaction.TransactionType.ESNCARD and (amt is None or amt == 0):
-            try:
-                settings_obj = Settings.get()
-                desc_lower = (tx_obj.description or "").lower()
-                if "smarrita" in desc_lower:
-                    amt = float(settings_obj.esncard_lost_fee)
-                else:
-                    amt = float(settings_obj.esncard_release_fee)
-            except (Settings.DoesNotExist, AttributeError, ValueError) as calc_exc:
-                logger.error(f"Errore calcolo importo ESNcard (tx id={tx_obj.id}): {calc_exc}")
-                return None
-        return amt
-
-    txs_qs = Transaction.objects.all().select_related(
-        'account',
-        'subscription__event',
-        'subscription__profile',
-        'esncard__profile',
-        'event_reference_manual',
-        'executor__profile'
-    ).order_by('-created_at')
+    # Not "format": DRF reserves that query parameter for renderer selection
+    export_format = (request.GET.get('file_format') or 'xlsx').lower()
+    if export_format not in ('xlsx', 'csv'):
+        return Response({'error': 'Formato non supportato (xlsx o csv).'}, status=400)
+
+    txs_qs = Transaction.objects.all().select_related(*LEDGER_SELECT_RELATED).order_by('-created_at')
     txs_qs = apply_transaction_filters(txs_qs, request)
+    # Settings fees, timezone and event labels are loaded once, not per row
+    export_ctx = ExportContext.for_transactions(txs_qs)
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Bilancio"
-
-    # Updated headers: inserted computed "Descrizione" and renamed original.
-    headers = [
-        "Registrazione",
-        "Esecuzione",
-        "Attività",
-        "Descrizione",
-        "Importo",
-        "Cassa",
-        "Commenti",
-        "Descrizione (gestionale)",
-        "Eseguito da"
-    ]
-    header_font = Font(bold=True)
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center')
-
-    def build_attivita(tx_obj):
-        if tx_obj.type == Transaction.TransactionType.ESNCARD:
-            return "Quota Associativa"
-        if tx_obj.type == Transaction.TransactionType.RIMBORSO_ESNCARD:
-            return "Rimborso ESNcard"
-        if tx_obj.type == Transaction.TransactionType.DEPOSIT:
-            return "Deposito"
-        if tx_obj.type == Transaction.TransactionType.WITHDRAWAL:
-            return "Prelievo"
-        if tx_obj.type == Transaction.TransactionType.REIMBURSEMENT:
-            return "Richiesta Rimborso"
-        ev = None
-        if getattr(tx_obj, 'subscription_id', None) and getattr(tx_obj.subscription, 'event', None):
-            ev = tx_obj.subscription.event
-        elif getattr(tx_obj, 'event_reference_manual_id', None) and tx_obj.event_reference_manual:
-            ev = tx_obj.event_reference_manual
-        if not ev:
-            return ""
-        return ev.name or ""
-
-    def _academic_year(date_obj):
-        # Academic year starts Aug 1.
-        y = date_obj.year
-        if date_obj.month >= 9:
-            start = y % 100
-        else:
-            start = (y - 1) % 100
-        end = (start + 1) % 100
-        return f"{start:02d}/{end:02d}"
-
-    def build_descrizione(tx_obj):
-        # New computed description column.
-        if tx_obj.type == Transaction.TransactionType.ESNCARD:
-            return f"Quota Associativa {_academic_year(tx_obj.created_at)}"
-        if tx_obj.type == Transaction.TransactionType.RIMBORSO_ESNCARD:
-            return f"Rimborso Quota Associativa {_academic_year(tx_obj.created_at)}"
-        ev = None
-        if getattr(tx_obj, 'subscription_id', None) and getattr(tx_obj.subscription, 'event', None):
-            ev = tx_obj.subscription.event
-        elif getattr(tx_obj, 'event_reference_manual_id', None) and tx_obj.event_reference_manual:
-            ev = tx_obj.event_reference_manual
-        if not ev:
-            return ""
-        ev_date = getattr(ev, 'date', None) or getattr(ev, 'start_date', None) or getattr(ev, 'start', None)
-        if not ev_date:
-            return ""
-        try:
-            base_date = ev_date.strftime('%d/%m')
-        except Exception:
-            return ""
-        mapping = {
-            Transaction.TransactionType.SUBSCRIPTION: "iscrizione",
-            Transaction.TransactionType.CAUZIONE: "cauzione",
-            Transaction.TransactionType.RIMBORSO_QUOTA: "rimborso iscrizione",
-            Transaction.TransactionType.RIMBORSO_CAUZIONE: "rimborso cauzione",
-            Transaction.TransactionType.SERVICE: "servizio",
-            Transaction.TransactionType.RIMBORSO_SERVICE: "rimborso servizio"
-        }
-        label = mapping.get(tx_obj.type)
-        if not label:
-            return ""
-        return f"{base_date} - {label}"
-
-    def build_commenti(tx_obj):
-        if getattr(tx_obj, 'subscription_id', None) and getattr(tx_obj.subscription, 'profile', None):
-            p = tx_obj.subscription.profile
-            return f"{p.name} {p.surname}"
-        if getattr(tx_obj, 'subscription_id', None) and getattr(tx_obj.subscription, 'external_name', None):
-            return tx_obj.subscription.external_name
-        if getattr(tx_obj, 'esncard_id', None) and getattr(tx_obj.esncard, 'profile', None):
-            p = tx_obj.esncard.profile
-            return f"{p.name} {p.surname}"
-        if getattr(tx_obj, 'executor_id', None) and getattr(tx_obj.executor, 'profile', None):
-            p = tx_obj.executor.profile
-            return f"{p.name} {p.surname}"
-        return ""
-
-    def build_eseguito_da(tx_obj):
-        if getattr(tx_obj, 'executor_id', None) and getattr(tx_obj.executor, 'profile', None):
-            p = tx_obj.executor.profile
-            return f"{p.name} {p.surname}"
-        return ""
-
-    row_idx = 2
-    for tx in txs_qs:
-        amount_val = compute_amount(tx)
-        # Localize to Italian timezone (handles DST)
-        if ZoneInfo is not None:
-            local_dt = timezone.localtime(tx.created_at, ZoneInfo('Europe/Rome'))
-        else:
-            # Fallback to current timezone if zoneinfo unavailable
-            local_dt = timezone.localtime(tx.created_at)
-        ws.cell(row=row_idx, column=1, value=local_dt.strftime('%d/%m/%Y %H:%M:%S'))
-        ws.cell(row=row_idx, column=2, value=local_dt.strftime('%d/%m/%Y'))
-        ws.cell(row=row_idx, column=3, value=build_attivita(tx))
-        ws.cell(row=row_idx, column=4, value=build_descrizione(tx))
-        amt_cell = ws.cell(row=row_idx, column=5, value=amount_val)
-        amt_cell.number_format = '#,##0.00 €'
-        ws.cell(row=row_idx, column=6, value=tx.account.name if tx.account else '')
-        ws.cell(row=row_idx, column=7, value=build_commenti(tx))
-        ws.cell(row=row_idx, column=8, value=tx.description)
-        ws.cell(row=row_idx, column=9, value=build_eseguito_da(tx))
-        row_idx += 1
-
-    # Auto width
-    for column in ws.columns:
-        max_len = 0
-        col_letter = column[0].column_letter
-        for cell in column:
-            if cell.value:
-                max_len = max(max_len, len(str(cell.value)))
-        ws.column_dimensions[col_letter].width = min(max_len + 2, 50)
-
-    from io import BytesIO
-    stream = BytesIO()
-    wb.save(stream)
-    stream.seek(0)
+    def build_rows():
+        # iterator(): rows are fetched in chunks and never cached on the queryset
+        for tx in txs_qs.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield ledger_row(tx, export_ctx)
 
     event_id = request.GET.get('event')
     if event_id:
@@ -1076,11 +964,12 @@ def transactions_export(request):
     else:
         base = "Bilancio_Transazioni"
 
-    filename = f"{base}_{datetime.now().strftime('%d%m%Y_%H%M%S')}.xlsx"
-    response = HttpResponse(
-        stream.getvalue(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    filename = f"{base}_{datetime.now().strftime('%d%m%Y_%H%M%S')}.{export_format}"
+    if export_format == 'csv':
+        response = StreamingHttpResponse(stream_csv(LEDGER_HEADERS, build_rows()), content_type=CSV_MIMETYPE)
+    else:
+        xlsx_file = write_xlsx(LEDGER_HEADERS, build_rows(), title="Bilancio", number_formats={4: '#,##0.00 €'})
+        response = FileResponse(xlsx_file, content_type=EXCEL_MIMETYPE)
     response['Content-Disposition'] = f'attachment; filename="{filename}"; filename*=UTF-8\'\'{filename}'
     return response
 
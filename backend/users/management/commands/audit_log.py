@@ -0,0 +1,54 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.db_audit import get_audit_store
+
+
+class Command(BaseCommand):
+    help = 'Query the indexed db_audit history (newest first), e.g. --model treasury.Transaction --pk 1234'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', help='Model label, e.g. treasury.Transaction.')
+        parser.add_argument('--pk', help='Primary key of the object (requires --model to use the index).')
+        parser.add_argument('--user', dest='user_id', help='Actor user id (the user email).')
+        parser.add_argument('--action', choices=['create', 'update', 'delete', 'm2m_change', 'dropped'])
+        parser.add_argument('--since', help='From this date/datetime (ISO, inclusive).')
+        parser.add_argument('--until', help='Up to this date/datetime (ISO, exclusive).')
+        parser.add_argument('--limit', type=int, default=50, help='Events shown (default: 50).')
+        parser.add_argument('--offset', type=int, default=0, help='Events skipped (default: 0).')
+        parser.add_argument('--json', action='store_true', help='Print the raw JSON entries.')
+
+    def handle(self, *args, **options):
+        store = get_audit_store()
+        if store is None:
+            raise CommandError('The audit store is disabled (DB_AUDIT_STORE_FILE = None).')
+        try:
+            events = store.search(
+                model=options['model'], pk=options['pk'], user_id=options['user_id'],
+                action=options['action'], since=options['since'], until=options['until'],
+            )
+        except ValueError as exc:
+            raise CommandError(f'Invalid --since/--until: {exc}')
+
+        offset = max(options['offset'], 0)
+        page = events[offset:offset + max(options['limit'], 1)]
+        for event in page:
+            if options['json']:
+                self.stdout.write(json.dumps(event, ensure_ascii=False))
+            else:
+                self.stdout.write(self._describe(event))
+        self.stdout.write(self.style.SUCCESS(f'{len(page)} of {events.count()} events.'))
+
+    @staticmethod
+    def _describe(event):
+        actor = event.get('actor') or {}
+        line = (f"{event['timestamp']}  {event.get('action')}  {event.get('model', '')} {event.get('pk', '')}"
+                f"  by {actor.get('user_id') or '-'}")
+        if actor.get('path'):
+            line += f" ({actor.get('method')} {actor['path']})"
+        for field, change in (event.get('changes') or {}).items():
+            line += f"\n    {field}: {change.get('old')!r} -> {change.get('new')!r}"
+        if event.get('action') == 'dropped':
+            line += f"  {event.get('count')} events lost"
+        return line
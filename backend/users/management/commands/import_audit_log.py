@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.audit_store import AuditStore, read_log_lines
+from backend.db_audit import get_audit_store
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load db_audit JSON-lines logs (also rotated .gz files) into the indexed audit store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Log files, e.g. logs/db_audit.log logs/db_audit.log.*.gz')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Events inserted per transaction (default: 5000).',
+        )
+        parser.add_argument('--store', help='Store file (default: DB_AUDIT_STORE_FILE).')
+
+    def handle(self, *args, **options):
+        store = AuditStore(options['store']) if options['store'] else get_audit_store()
+        if store is None:
+            raise CommandError('The audit store is disabled (DB_AUDIT_STORE_FILE = None).')
+        batch_size = max(options.get('batch_size') or 5000, 1)
+
+        totals = {'read': 0, 'inserted': 0, 'invalid': 0}
+        for path in options['files']:
+            started = time.monotonic()
+            try:
+                stats = store.import_lines(read_log_lines(path), batch_size=batch_size)
+            except OSError as exc:
+                raise CommandError(f'Cannot read {path}: {exc}')
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f"{path}: {stats['inserted']} imported, {stats['read'] - stats['inserted'] - stats['invalid']} "
+                f"already present, {stats['invalid']} invalid ({stats['read'] / elapsed:.0f} lines/s)"
+            )
+            for key in totals:
+                totals[key] += stats[key]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['inserted']} of {totals['read']} audit events ({totals['invalid']} invalid lines)."
+        ))
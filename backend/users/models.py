@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.db import models
+
+from backend.audit_models import AuditSnapshotMixin
 from profiles.models import Profile
 from users.managers import UserManager
 
@@ -8,7 +10,7 @@ from users.managers import UserManager
 # password, last_login, is_active
 # ... and from PermissionsMixin:
 # is_superuser, groups, user_permissions
-class User(AbstractBaseUser, PermissionsMixin):
+class User(AuditSnapshotMixin, AbstractBaseUser, PermissionsMixin):
     profile = models.OneToOneField(Profile, to_field='email', primary_key=True, on_delete=models.CASCADE)
     is_staff = models.BooleanField(default=False)
     date_joined = models.DateTimeField(auto_now_add=True)
@@ -1,8 +1,9 @@
 from datetime import date, datetime
 
 from django.contrib.auth.models import Group
+from django.db import models
 from rest_framework import serializers
-from profiles.serializers import ProfileListViewSerializer
+from profiles.serializers import ProfileListViewSerializer, primary_group_name, resolve_profile_groups
 from .models import User
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
@@ -36,6 +37,18 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
 
 
+class UserProfileGroupsListSerializer(serializers.ListSerializer):
+    """
+    List serializer for user serializers nesting the profile: the groups of every profile are
+    resolved in one query (querysets should select_related('profile')).
+    """
+
+    def to_representation(self, data):
+        users = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        resolve_profile_groups(self.context, [user.profile.id for user in users])
+        return super().to_representation(users)
+
+
 class UserWithProfileAndGroupsSerializer(serializers.ModelSerializer):
     profile = ProfileListViewSerializer(read_only=True)
     group = serializers.SerializerMethodField()
@@ -43,11 +56,10 @@ class UserWithProfileAndGroupsSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['profile', 'group']
+        list_serializer_class = UserProfileGroupsListSerializer
 
-    @staticmethod
-    def get_group(obj):
-        first_group = obj.groups.first()
-        return first_group.name if first_group else None
+    def get_group(self, obj):
+        return primary_group_name(self, obj.profile)
 
 
 # Serializer for React, fetched at login time
@@ -63,6 +75,7 @@ class UserReactSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         exclude = ['password', 'user_permissions']
+        list_serializer_class = UserProfileGroupsListSerializer
 
     @classmethod
     def get_permissions(cls, obj):
@@ -1,17 +1,31 @@
 """Tests for users module endpoints and behaviors."""
 
+import gzip
+import json
+import shutil
+import sqlite3
+import tempfile
 import unittest
+from datetime import date, datetime, timezone as dt_timezone
+from pathlib import Path
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
 from django.core import mail
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 from django.contrib.auth.tokens import default_token_generator
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.test import APITestCase
 
+from backend.audit_store import AuditStore
+from backend.audit_writer import AuditWriter, WriterOptions
 from profiles.models import Profile
+from users.serializers import UserWithProfileAndGroupsSerializer
 
 
 User = get_user_model()
@@ -165,6 +179,42 @@ class UserListTests(UsersBaseTestCase):
 		self.assertEqual(response.status_code, 200)
 		self.assertEqual(len(response.data), 2)
 
+	def test_user_list_query_count_does_not_grow_with_users(self):
+		"""Groups and permissions of all users are prefetched, not loaded per row."""
+		user = _create_user(_create_profile("user@esnpolimi.it"))
+		self.authenticate(user)
+
+		def add_users(count):
+			for _ in range(count):
+				index = Profile.objects.count()
+				other = _create_user(_create_profile(f"user{index}@esnpolimi.it"))
+				other.groups.add(self.group_attivi)
+				other.user_permissions.add(self.perm_change_user)
+
+		add_users(1)
+		with CaptureQueriesContext(connection) as small:
+			self.client.get("/backend/users/")
+		add_users(10)
+		with CaptureQueriesContext(connection) as large:
+			response = self.client.get("/backend/users/")
+
+		self.assertEqual(len(small), len(large))
+		self.assertEqual(len(response.data), 12)
+		self.assertEqual(response.data[-1]["groups"], [self.group_attivi.pk])
+
+	def test_user_serializers_resolve_nested_profile_groups_once(self):
+		"""Nested profiles of a user list get their group from one query for the whole list."""
+		for index in range(3):
+			_create_user(_create_profile(f"nested{index}@esnpolimi.it")).groups.add(self.group_board)
+		users = User.objects.select_related('profile').prefetch_related('groups', 'user_permissions')
+
+		with CaptureQueriesContext(connection) as queries:
+			data = UserWithProfileAndGroupsSerializer(users, many=True).data
+
+		self.assertEqual([row["group"] for row in data], ["Board"] * 3)
+		self.assertEqual([row["profile"]["group"] for row in data], ["Board"] * 3)
+		self.assertEqual(len(queries), 4)
+
 	def test_user_create_requires_permission(self):
 		"""Creating user without add permission should be blocked."""
 		profile = _create_profile("user@esnpolimi.it", verified=True, is_esner=True)
@@ -593,3 +643,231 @@ class UserManagerTests(UsersBaseTestCase):
 
 		self.assertEqual(len(password), 20)
 
+
+
+class DbAuditTests(UsersBaseTestCase):
+	"""Tests for the db_audit signal handlers (backend/db_audit.py)."""
+
+	def _audited_save(self, instance, **kwargs):
+		"""Save the instance; return (queries run, audit payloads written)."""
+		with patch("backend.db_audit._write_event") as write_event, CaptureQueriesContext(connection) as queries:
+			instance.save(**kwargs)
+		return queries.captured_queries, [call.args[0] for call in write_event.call_args_list]
+
+	def test_update_of_loaded_instance_needs_no_select(self):
+		"""The diff uses the values the instance was loaded with: only the UPDATE runs."""
+		_create_profile("audit@esnpolimi.it")
+		profile = Profile.objects.get(email="audit@esnpolimi.it")
+		profile.birthdate = date(1996, 2, 20)
+
+		# birthdate is not in the search index, so no other handler queries
+		queries, events = self._audited_save(profile, update_fields=["birthdate"])
+
+		self.assertEqual(len(queries), 1)
+		self.assertTrue(queries[0]["sql"].startswith("UPDATE"))
+		self.assertEqual(events[0]["action"], "update")
+		self.assertEqual(events[0]["changes"], {"birthdate": {"old": date(1995, 1, 15), "new": date(1996, 2, 20)}})
+
+		# The snapshot follows the saved values: a second save diffs against the new date
+		profile.birthdate = date(1997, 3, 25)
+		_, events = self._audited_save(profile, update_fields=["birthdate"])
+		self.assertEqual(events[0]["changes"], {"birthdate": {"old": date(1996, 2, 20), "new": date(1997, 3, 25)}})
+
+	def test_update_fields_limits_the_diff(self):
+		"""Columns not in update_fields are neither compared nor logged."""
+		profile = _create_profile("audit-fields@esnpolimi.it", name="Mario", surname="Rossi")
+		profile.name = "Luigi"
+		profile.surname = "Verdi"
+
+		_, events = self._audited_save(profile, update_fields=["surname"])
+
+		self.assertEqual(events[0]["changes"], {"surname": {"old": "Rossi", "new": "Verdi"}})
+
+	def test_refresh_from_db_resets_the_snapshot(self):
+		"""A value written with update() and then refreshed is the "old" side of the next diff."""
+		_create_profile("audit-refresh@esnpolimi.it", surname="Rossi")
+		profile = Profile.objects.get(email="audit-refresh@esnpolimi.it")
+		Profile.objects.filter(pk=profile.pk).update(surname="Verdi")
+		profile.refresh_from_db()
+
+		profile.surname = "Rossi"
+		_, events = self._audited_save(profile, update_fields=["surname"])
+
+		self.assertEqual(events[0]["changes"], {"surname": {"old": "Verdi", "new": "Rossi"}})
+
+	def test_deferred_field_falls_back_to_the_stored_row(self):
+		"""A saved column that was not loaded is read from the database before the update."""
+		_create_profile("audit-deferred@esnpolimi.it", surname="Rossi")
+		profile = Profile.objects.only("email", "name").get(email="audit-deferred@esnpolimi.it")
+		profile.birthdate = date(2000, 5, 1)
+
+		queries, events = self._audited_save(profile, update_fields=["birthdate"])
+
+		self.assertEqual(len(queries), 2)
+		self.assertTrue(queries[0]["sql"].startswith("SELECT"))
+		self.assertEqual(events[0]["changes"], {"birthdate": {"old": date(1995, 1, 15), "new": date(2000, 5, 1)}})
+
+
+class AuditWriterTests(unittest.TestCase):
+	"""Tests for the batched db_audit writer (backend/audit_writer.py)."""
+
+	def setUp(self):
+		self.directory = Path(tempfile.mkdtemp())
+		self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+		self.path = self.directory / "db_audit.log"
+
+	def _writer(self, **options):
+		writer = AuditWriter(WriterOptions(path=self.path, tz=dt_timezone.utc, **options))
+		self.addCleanup(writer.close)
+		return writer
+
+	def _lines(self):
+		lines = self.path.read_text(encoding="utf-8").splitlines() if self.path.exists() else []
+		for archive in sorted(self.directory.glob("db_audit.log.*.gz")):
+			with gzip.open(archive, "rt", encoding="utf-8") as handle:
+				lines.extend(handle.read().splitlines())
+		return [json.loads(line) for line in lines]
+
+	def test_events_are_written_in_batches_and_rotated(self):
+		"""Queued events are written by the flusher thread; full files are rotated and gzipped."""
+		writer = self._writer(batch_size=5, flush_interval=0.05, max_bytes=400)
+		now = datetime.now(dt_timezone.utc)
+		for index in range(20):
+			self.assertTrue(writer.write(now, {"user_id": None}, {"action": "create", "model": "app.Model", "pk": index}))
+		writer.flush()
+		writer.close()
+
+		entries = self._lines()
+		self.assertEqual(sorted(entry["pk"] for entry in entries), list(range(20)))
+		self.assertGreater(writer.stats()["rotations"], 0)
+		self.assertTrue(list(self.directory.glob("db_audit.log.*.gz")))
+		self.assertEqual(writer.stats()["written"], 20)
+
+	def test_full_queue_drops_events_and_records_them(self):
+		"""When the queue is full events are dropped, counted, and a 'dropped' line is logged."""
+		writer = self._writer(queue_size=2)
+		with patch.object(AuditWriter, "_run", lambda self: None):
+			results = [writer.write(datetime.now(dt_timezone.utc), None, {"action": "create", "pk": i}) for i in range(5)]
+
+		self.assertEqual(results, [True, True, False, False, False])
+		self.assertEqual(writer.stats()["dropped"], 3)
+
+		writer._write_batch([])
+		[entry] = self._lines()
+		self.assertEqual((entry["action"], entry["count"]), ("dropped", 3))
+
+	def test_synchronous_mode_writes_immediately(self):
+		"""With asynchronous=False the event is in the file when write() returns."""
+		writer = self._writer(asynchronous=False)
+
+		writer.write(datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc), {"user_id": 1}, {"action": "delete", "pk": 7})
+
+		self.assertEqual(self._lines(), [{
+			"timestamp": "2026-01-01T12:00:00+00:00", "actor": {"user_id": 1}, "action": "delete", "pk": 7,
+		}])
+
+
+def _audit_line(timestamp, model, pk, user_id, action="update", **extra):
+	return json.dumps({
+		"timestamp": timestamp, "actor": {"user_id": user_id, "method": "PATCH", "path": "/x/", "ip": None},
+		"action": action, "model": model, "pk": pk, **extra,
+	})
+
+
+class AuditStoreTests(unittest.TestCase):
+	"""Tests for the indexed audit store (backend/audit_store.py)."""
+
+	def setUp(self):
+		self.directory = Path(tempfile.mkdtemp())
+		self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+		self.store = AuditStore(self.directory / "db_audit.sqlite3")
+		self.addCleanup(self.store.close)
+
+	def test_import_is_idempotent_and_skips_invalid_lines(self):
+		"""Re-importing a log inserts nothing twice; malformed lines are counted, not fatal."""
+		lines = [
+			_audit_line("2026-03-01T10:00:00+01:00", "treasury.Transaction", 1234, "a@esnpolimi.it"),
+			"not json",
+			_audit_line("2026-03-02T10:00:00+01:00", "treasury.Transaction", 99, "b@esnpolimi.it"),
+		]
+
+		first = self.store.import_lines(lines, batch_size=1)
+		second = self.store.import_lines(lines)
+
+		self.assertEqual(first, {"read": 3, "inserted": 2, "invalid": 1})
+		self.assertEqual(second["inserted"], 0)
+		self.assertEqual(self.store.search().count(), 2)
+
+	def test_search_filters_and_orders_newest_first(self):
+		"""Filters combine; results come newest first with timestamps compared in UTC."""
+		self.store.import_lines([
+			_audit_line("2026-03-01T10:00:00+01:00", "treasury.Transaction", 1234, "a@esnpolimi.it"),
+			_audit_line("2026-03-05T10:00:00+01:00", "treasury.Transaction", 1234, "b@esnpolimi.it"),
+			_audit_line("2026-03-06T10:00:00+01:00", "profiles.Profile", 1234, "a@esnpolimi.it"),
+		])
+
+		history = self.store.search(model="treasury.Transaction", pk="1234")
+		by_user = self.store.search(user_id="a@esnpolimi.it", since="2026-03-02", until="2026-03-07")
+
+		self.assertEqual([e["actor"]["user_id"] for e in history], ["b@esnpolimi.it", "a@esnpolimi.it"])
+		self.assertEqual([e["model"] for e in by_user], ["profiles.Profile"])
+		self.assertEqual(len(self.store.search()[1:2]), 1)
+
+	def test_store_is_append_only(self):
+		"""UPDATE and DELETE on the store are rejected."""
+		self.store.import_lines([_audit_line("2026-03-01T10:00:00+01:00", "treasury.Account", 1, None)])
+
+		with self.assertRaises(sqlite3.DatabaseError):
+			self.store._connection().execute("DELETE FROM audit_event")
+
+	def test_writer_adds_batches_to_the_store(self):
+		"""Events written by the audit writer are also searchable in the store."""
+		writer = AuditWriter(WriterOptions(
+			path=self.directory / "db_audit.log", tz=dt_timezone.utc, asynchronous=False, store=self.store,
+		))
+
+		writer.write(datetime(2026, 1, 1, tzinfo=dt_timezone.utc), {"user_id": "a@esnpolimi.it"},
+		             {"action": "delete", "model": "events.Event", "pk": 3})
+
+		[event] = self.store.search(model="events.Event", pk=3)
+		self.assertEqual(event["action"], "delete")
+
+
+class AuditLogApiTests(UsersBaseTestCase):
+	"""Tests for GET /backend/audit-log/."""
+
+	def setUp(self):
+		directory = Path(tempfile.mkdtemp())
+		self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+		self.store = AuditStore(directory / "db_audit.sqlite3")
+		self.addCleanup(self.store.close)
+		self.store.import_lines([
+			_audit_line(f"2026-03-0{day}T10:00:00+01:00", "treasury.Transaction", day, "a@esnpolimi.it")
+			for day in range(1, 4)
+		])
+		patcher = patch("users.views.get_audit_store", return_value=self.store)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def test_audit_log_is_board_only(self):
+		"""Non-Board users are refused."""
+		self.authenticate(_create_user(_create_profile("attivo@esnpolimi.it")))
+
+		response = self.client.get("/backend/audit-log/")
+
+		self.assertEqual(response.status_code, 403)
+
+	def test_audit_log_is_filtered_and_paginated(self):
+		"""Board members get the filtered events, newest first, one page at a time."""
+		board = _create_user(_create_profile("board@esnpolimi.it"))
+		board.groups.add(self.group_board)
+		self.authenticate(board)
+
+		response = self.client.get("/backend/audit-log/", {"model": "treasury.Transaction", "page_size": 2})
+		bad = self.client.get("/backend/audit-log/", {"since": "ieri"})
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.data["count"], 3)
+		self.assertEqual([e["pk"] for e in response.data["results"]], [3, 2])
+		self.assertIsNotNone(response.data["next"])
+		self.assertEqual(bad.status_code, 400)
@@ -15,4 +15,5 @@ urlpatterns = [
     path('api/forgot-password/', views.forgot_password),
     path('api/reset-password/<uid>/<token>/', views.reset_password),
     path('groups/', views.group_list),
+    path('audit-log/', views.audit_log),  # db_audit history (Board only)
 ]
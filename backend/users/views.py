@@ -8,6 +8,7 @@ from django.utils import timezone
 from django.utils.encoding import force_bytes, force_str
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.exceptions import TokenError
@@ -17,6 +18,7 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login
 from django.utils.http import url_has_allowed_host_and_scheme
 
+from backend.db_audit import get_audit_store
 from profiles.models import Profile
 from users.models import User
 from users.serializers import CustomTokenObtainPairSerializer
@@ -160,7 +162,7 @@ def refresh_token_view(request):
 @permission_classes([IsAuthenticated])
 def user_list(request):
     if request.method == 'GET':
-        users = User.objects.all()
+        users = User.objects.select_related('profile').prefetch_related('groups', 'user_permissions')
         serializer = UserSerializer(users, many=True)
         return Response(serializer.data)
     elif request.method == 'POST':
@@ -332,3 +334,27 @@ def user_finance_permissions(request):
         return Response({'error': 'Metodo non consentito.'}, status=405)
     except User.DoesNotExist:
         return Response({'error': 'Utente non trovato.'}, status=404)
+
+
+# Endpoint to query the indexed db_audit history (Board only). Filters: model, pk, user_id, action,
+# since/until (ISO date or datetime); newest first, paginated (page, page_size)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def audit_log(request):
+    if not user_is_board(request.user):
+        return Response({'error': 'Solo Board può consultare lo storico delle modifiche.'}, status=403)
+    store = get_audit_store()
+    if store is None:
+        return Response({'error': 'Storico delle modifiche non disponibile.'}, status=503)
+    params = request.query_params
+    try:
+        events = store.search(
+            model=params.get('model'), pk=params.get('pk'), user_id=params.get('user_id'),
+            action=params.get('action'), since=params.get('since'), until=params.get('until'),
+        )
+    except ValueError:
+        return Response({'error': 'Parametri since/until non validi (formato ISO).'}, status=400)
+    paginator = PageNumberPagination()
+    paginator.page_size_query_param = 'page_size'
+    page = paginator.paginate_queryset(events, request=request)
+    return paginator.get_paginated_response(page)
@@ -37,3 +37,50 @@ def get_prefix_by_country_code(name, country_codes):
             return country['dial']
 
     return None
+
+
+class CountryIndex:
+    """
+    Dict-based lookups over the country list, built once for bulk imports.
+    Results are the same as map_country_to_code / get_prefix_by_country_code and the
+    dial-code scan of importProfilesFromCSV (first country in list order wins).
+    """
+
+    def __init__(self, country_codes):
+        self.country_codes = country_codes
+        self._code_by_name = {}
+        self._dial_by_name = {}
+        self._dial_position = {}
+        for position, country in enumerate(country_codes):
+            name = country['name'].lower()
+            self._code_by_name.setdefault(name, country['code'])
+            self._dial_by_name.setdefault(name, country['dial'])
+            self._dial_position.setdefault(country['dial'], position)
+        self._max_dial_length = max((len(dial) for dial in self._dial_position), default=0)
+        self._partial_matches = {}
+
+    def code(self, name):
+        """Country code for a name: exact match, then (memoized) partial match."""
+        if not name or name == "NULL" or name == "--":
+            return None
+        key = name.lower()
+        if key in self._code_by_name:
+            return self._code_by_name[key]
+        if key not in self._partial_matches:
+            self._partial_matches[key] = map_country_to_code(name, self.country_codes)
+        return self._partial_matches[key]
+
+    def dial(self, name):
+        """Dial code for a country name (exact match only)."""
+        if not name or name == "NULL" or name == "--":
+            return None
+        return self._dial_by_name.get(name.lower())
+
+    def match_dial(self, phone):
+        """Dial code of the first country (in list order) whose dial code prefixes the phone, or None."""
+        best = None
+        for length in range(1, min(len(phone), self._max_dial_length) + 1):
+            position = self._dial_position.get(phone[:length])
+            if position is not None and (best is None or position < best[0]):
+                best = (position, phone[:length])
+        return best[1] if best else None
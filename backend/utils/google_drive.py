@@ -1,24 +1,105 @@
+"""
+Google Drive helpers.
+
+- get_drive_service(): the service-account credentials are loaded once per process (again only
+  if the key file changes) and shared by all threads; google-auth refreshes the access token
+  when it expires. The discovery client is built once per thread, because the underlying
+  httplib2 connection is not thread-safe.
+- Folder ids are cached in Django's default cache (key per parent id + folder name, TTL
+  GOOGLE_DRIVE_FOLDER_CACHE_TTL, default 7 days), so a path like {Year}/Rimborsi/{event} is
+  resolved with no Drive call once it is known: by every worker with the shared database cache
+  of Deploy.md, per process with Django's default LocMemCache. A cached
+  id that Drive answers 404 for (folder deleted/moved) is forgotten and the path resolved again
+  (upload_to_folder_path does this automatically).
+- Files larger than one chunk (GOOGLE_DRIVE_UPLOAD_CHUNK_SIZE, default 5 MB) are sent with a
+  resumable upload read from the file chunk by chunk (a TemporaryUploadedFile is never loaded
+  in memory); a failed chunk is retried (GOOGLE_DRIVE_UPLOAD_RETRIES, exponential backoff)
+  and the upload resumes from the last byte Drive acknowledged instead of starting over.
+"""
+import hashlib
+import os
+import threading
+
 from django.conf import settings
+from django.core.cache import cache
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
 
 DRIVE_SCOPE = "https://www.googleapis.com/auth/drive"
+FOLDER_MIMETYPE = "application/vnd.google-apps.folder"
+DEFAULT_FOLDER_CACHE_TTL = 7 * 24 * 3600
+# Resumable chunks must be multiples of 256 KB
+DEFAULT_UPLOAD_CHUNK_SIZE = 20 * 256 * 1024
+DEFAULT_UPLOAD_RETRIES = 5
+
+_credentials_lock = threading.Lock()
+_credentials = {"key": None, "value": None}
+_local = threading.local()
+
+
+def _get_credentials():
+    """Service-account credentials, reloaded only when the key file changes."""
+    path = settings.GOOGLE_SERVICE_ACCOUNT_FILE
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+    except OSError:
+        key = (path, None)
+    with _credentials_lock:
+        if _credentials["key"] != key:
+            _credentials["value"] = service_account.Credentials.from_service_account_file(
+                path,
+                scopes=[DRIVE_SCOPE],
+            )
+            _credentials["key"] = key
+        return _credentials["value"]
 
 
 def get_drive_service():
-    credentials = service_account.Credentials.from_service_account_file(
-        settings.GOOGLE_SERVICE_ACCOUNT_FILE,
-        scopes=[DRIVE_SCOPE],
-    )
-    return build("drive", "v3", credentials=credentials)
+    """Drive v3 client of the calling thread (built on first use, rebuilt if the credentials changed)."""
+    credentials = _get_credentials()
+    service = getattr(_local, "service", None)
+    if service is None or getattr(_local, "credentials", None) is not credentials:
+        service = build("drive", "v3", credentials=credentials, cache_discovery=False)
+        _local.service = service
+        _local.credentials = credentials
+    return service
+
+
+def reset_drive_service():
+    """Forget the cached credentials and clients (e.g. after replacing the key file in place)."""
+    with _credentials_lock:
+        _credentials.update(key=None, value=None)
+    _local.service = None
+
+
+def is_not_found(exc):
+    return isinstance(exc, HttpError) and getattr(exc.resp, "status", None) == 404
+
+
+# --- Folder ids ---
+
+def _folder_cache_key(parent_id, folder_name):
+    digest = hashlib.sha1(f"{parent_id}/{folder_name}".encode("utf-8")).hexdigest()
+    return f"drive:folder:{digest}"
+
+
+def _folder_cache_ttl():
+    return getattr(settings, "GOOGLE_DRIVE_FOLDER_CACHE_TTL", DEFAULT_FOLDER_CACHE_TTL)
 
 
 def find_or_create_folder(service, folder_name, parent_id):
-    """Find or create a Drive folder by name under parent_id; returns folder ID."""
+    """Find or create a Drive folder by name under parent_id; returns folder ID (cached)."""
+    cache_key = _folder_cache_key(parent_id, folder_name)
+    folder_id = cache.get(cache_key)
+    if folder_id:
+        return folder_id
+
     escaped = folder_name.replace("'", "\\'")
     query = (
         f"name='{escaped}' and '{parent_id}' in parents "
-        "and mimeType='application/vnd.google-apps.folder' and trashed=false"
+        f"and mimeType='{FOLDER_MIMETYPE}' and trashed=false"
     )
     results = service.files().list(
         q=query,
@@ -29,14 +110,101 @@ def find_or_create_folder(service, folder_name, parent_id):
     ).execute()
     folders = results.get("files", [])
     if folders:
-        return folders[0]["id"]
-    folder = service.files().create(
-        body={
-            "name": folder_name,
-            "mimeType": "application/vnd.google-apps.folder",
-            "parents": [parent_id],
-        },
+        folder_id = folders[0]["id"]
+    else:
+        folder = service.files().create(
+            body={
+                "name": folder_name,
+                "mimeType": FOLDER_MIMETYPE,
+                "parents": [parent_id],
+            },
+            fields="id",
+            supportsAllDrives=True,
+        ).execute()
+        folder_id = folder["id"]
+    cache.set(cache_key, folder_id, _folder_cache_ttl())
+    return folder_id
+
+
+def resolve_folder_path(service, parent_id, *names):
+    """Id of the folder parent_id/names[0]/names[1]/..., creating missing levels."""
+    folder_id = parent_id
+    for name in names:
+        folder_id = find_or_create_folder(service, name, folder_id)
+    return folder_id
+
+
+def forget_folder_path(parent_id, *names):
+    """Drop the cached ids of every level of the path (after Drive answered 404 for one of them)."""
+    keys = []
+    folder_id = parent_id
+    for name in names:
+        key = _folder_cache_key(folder_id, name)
+        keys.append(key)
+        folder_id = cache.get(key)
+        if not folder_id:
+            break
+    cache.delete_many(keys)
+
+
+# --- Uploads ---
+
+def _file_size(file_obj):
+    size = getattr(file_obj, "size", None)
+    if size is None:
+        file_obj.seek(0, os.SEEK_END)
+        size = file_obj.tell()
+    return size
+
+
+def upload_file(service, folder_id, file_obj, filename, mimetype):
+    """
+    Create filename in folder_id with the content of file_obj (any seekable file); returns the file id.
+    Small files go in one request; larger ones as a resumable upload, chunk by chunk with retries.
+    """
+    chunk_size = getattr(settings, "GOOGLE_DRIVE_UPLOAD_CHUNK_SIZE", DEFAULT_UPLOAD_CHUNK_SIZE)
+    retries = getattr(settings, "GOOGLE_DRIVE_UPLOAD_RETRIES", DEFAULT_UPLOAD_RETRIES)
+    resumable = _file_size(file_obj) > chunk_size
+    file_obj.seek(0)
+    media = MediaIoBaseUpload(file_obj, mimetype=mimetype, chunksize=chunk_size, resumable=resumable)
+    request = service.files().create(
+        body={"name": filename, "parents": [folder_id]},
+        media_body=media,
         fields="id",
         supportsAllDrives=True,
+    )
+    if not resumable:
+        return request.execute(num_retries=retries)["id"]
+    response = None
+    while response is None:
+        # Retries only the current chunk; Drive keeps the bytes already received
+        _, response = request.next_chunk(num_retries=retries)
+    return response["id"]
+
+
+def upload_public_file(service, folder_id, file_obj, filename, mimetype):
+    """Upload file_obj into folder_id, make it readable by anyone with the link and return the link."""
+    file_id = upload_file(service, folder_id, file_obj, filename, mimetype)
+    service.permissions().create(
+        fileId=file_id,
+        body={"role": "reader", "type": "anyone"},
+        supportsAllDrives=True,
     ).execute()
-    return folder["id"]
+    return f"https://drive.google.com/file/d/{file_id}/view?usp=sharing"
+
+
+def upload_to_folder_path(file_obj, filename, mimetype, parent_id, *names, service=None):
+    """
+    upload_public_file into parent_id/names..., resolving the path from the folder cache.
+    If a cached folder no longer exists the path is resolved again and the upload retried once.
+    """
+    service = service or get_drive_service()
+    folder_id = resolve_folder_path(service, parent_id, *names)
+    try:
+        return upload_public_file(service, folder_id, file_obj, filename, mimetype)
+    except HttpError as exc:
+        if not is_not_found(exc) or not names:
+            raise
+        forget_folder_path(parent_id, *names)
+        folder_id = resolve_folder_path(service, parent_id, *names)
+        return upload_public_file(service, folder_id, file_obj, filename, mimetype)
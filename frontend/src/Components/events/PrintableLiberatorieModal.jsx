@@ -13,6 +13,7 @@ export default function PrintableLiberatorieModal({open, onClose, event, listId}
     const [subscriptions, setSubscriptions] = useState([]);
     const [selectedSubs, setSelectedSubs] = useState([]);
     const [submitting, setSubmitting] = useState(false);
+    const [progress, setProgress] = useState(null);
     const [popup, setPopup] = useState(null);
 
     useEffect(() => {
@@ -40,6 +41,55 @@ export default function PrintableLiberatorieModal({open, onClose, event, listId}
             : [...selectedSubs, id]);
     };
 
+    const downloadPdf = (response) => {
+        response.blob().then(blob => {
+            const url = window.URL.createObjectURL(blob);
+            const a = document.createElement('a');
+            a.style.display = 'none';
+            a.href = url;
+            const disposition = response.headers.get('Content-Disposition');
+            let filename = `ESNPolimi_Liberatoria_${event.name}.pdf`;
+            if (disposition && disposition.indexOf('attachment') !== -1) {
+                const filenameRegex = /filename[^;=\n]*=((['"]).*?\2|[^;\n]*)/;
+                const matches = filenameRegex.exec(disposition);
+                if (matches != null && matches[1]) {
+                    filename = matches[1].replace(/['"]/g, '');
+                }
+            }
+            a.download = filename;
+            document.body.appendChild(a);
+            a.click();
+            window.URL.revokeObjectURL(url);
+            a.remove();
+            setSubmitting(false);
+            setProgress(null);
+            onClose(true);
+        });
+    };
+
+    const handleError = (err) => {
+        defaultErrorHandler(err, setPopup);
+        setSubmitting(false);
+        setProgress(null);
+    };
+
+    // Large selections are rendered in the background: poll the job until the PDF can be downloaded
+    const followJob = (job) => {
+        setProgress(job);
+        if (job.status === 'done') {
+            fetchCustom("GET", job.download_path, {onSuccess: downloadPdf, onError: handleError});
+        } else if (job.status === 'failed') {
+            setPopup({message: `Errore nella generazione delle liberatorie: ${job.error}`, state: 'error', id: Date.now()});
+            setSubmitting(false);
+            setProgress(null);
+        } else {
+            setTimeout(() => fetchCustom("GET", `/liberatorie-jobs/${job.job_id}/`, {
+                onSuccess: (data) => followJob(data),
+                onError: handleError
+            }), 2000);
+        }
+    };
+
     const handleSubmit = () => {
         setSubmitting(true);
         setPopup(null);
@@ -49,31 +99,9 @@ export default function PrintableLiberatorieModal({open, onClose, event, listId}
                 event_id: event.id,
                 subscription_ids: selectedSubs
             },
-            onSuccess: (response) => {
-                response.blob().then(blob => {
-                    const url = window.URL.createObjectURL(blob);
-                    const a = document.createElement('a');
-                    a.style.display = 'none';
-                    a.href = url;
-                    const disposition = response.headers.get('Content-Disposition');
-                    let filename = `ESNPolimi_Liberatoria_${event.name}.pdf`;
-                    if (disposition && disposition.indexOf('attachment') !== -1) {
-                        const filenameRegex = /filename[^;=\n]*=((['"]).*?\2|[^;\n]*)/;
-                        const matches = filenameRegex.exec(disposition);
-                        if (matches != null && matches[1]) {
-                            filename = matches[1].replace(/['"]/g, '');
-                        }
-                    }
-                    a.download = filename;
-                    document.body.appendChild(a);
-                    a.click();
-                    window.URL.revokeObjectURL(url);
-                    a.remove();
-                    onClose(true);
-                });
-            },
-            onError: (err) => defaultErrorHandler(err, setPopup),
-            onFinally: () => setSubmitting(false)
+            // PDF (small selections) or JSON job status (202, large selections)
+            onSuccess: (data) => data instanceof Response ? downloadPdf(data) : followJob(data),
+            onError: handleError
         });
     };
 
@@ -151,6 +179,11 @@ export default function PrintableLiberatorieModal({open, onClose, event, listId}
                                         Stampa Liberatorie Selezionate
                                     </Button>
                                 </Box>
+                                {progress && (
+                                    <Typography variant="body2" color="text.secondary" align="center" sx={{mt: 1}}>
+                                        Generazione in corso: {progress.done}/{progress.total}
+                                    </Typography>
+                                )}
                             </Grid>
                         </Grid>
                         {popup && <Popup key={popup.id} message={popup.message} state={popup.state}/>}
@@ -271,7 +271,7 @@ export default function EventForm() {
                     });
                     return;
                 }
-                if (data.payment_required && data.checkout_id) {
+                if (data.payment_required && (data.checkout_id || data.checkout_pending)) {
                     // Do NOT redirect to widget now; user will use email link
                     navigate(`/event/${eventData.id}/formresult`, {
                         state: {
@@ -1,9 +1,12 @@
 import { useState, useEffect } from 'react';
 
 /**
- * Polls the backend maintenance status endpoint.
+ * Polls the backend every 5 minutes for maintenance notifications.
  * Returns the notification object { message, triggered_at } when a
  * maintenance event is active, or null while idle.
+ * If the status endpoint advertises the SSE stream ("stream": true, only on
+ * ASGI deployments with MAINTENANCE_SSE_ENABLED) the stream is used instead of
+ * polling; when the server refuses the stream, polling resumes.
  *
  * @param {string|null} accessToken - Current JWT access token from AuthContext.
  */
@@ -20,6 +23,37 @@ const useMaintenanceNotification = (accessToken) => {
         const url = `${apiHost}/maintenance/status/`;
 
         let lastNotificationId = null;
+        let intervalId = null;
+        let eventSource = null;
+        let cancelled = false;
+
+        const showNotification = (data) => {
+            if (data.notification_id && data.notification_id !== lastNotificationId) {
+                lastNotificationId = data.notification_id;
+                setNotification({
+                    message: data.message,
+                    triggered_at: data.triggered_at
+                });
+            }
+        };
+
+        const openStream = () => {
+            eventSource = new EventSource(`${apiHost}/maintenance/stream/?token=${encodeURIComponent(accessToken)}`);
+            eventSource.addEventListener('maintenance', (event) => {
+                try {
+                    showNotification(JSON.parse(event.data));
+                } catch (e) {
+                    console.error('[MaintenanceStream] Invalid maintenance event', e);
+                }
+            });
+            eventSource.onerror = () => {
+                // EventSource retries on its own unless the server refused the stream
+                if (eventSource.readyState === EventSource.CLOSED) {
+                    eventSource = null;
+                    if (!cancelled && !intervalId) intervalId = setInterval(checkStatus, 300000);
+                }
+            };
+        };
 
         const checkStatus = async () => {
             try {
@@ -35,13 +69,14 @@ const useMaintenanceNotification = (accessToken) => {
                 }
 
                 const data = await response.json();
-                
-                if (data.notification_id && data.notification_id !== lastNotificationId) {
-                    lastNotificationId = data.notification_id;
-                    setNotification({
-                        message: data.message,
-                        triggered_at: data.triggered_at
-                    });
+                showNotification(data);
+
+                if (data.stream && !cancelled && !eventSource && typeof EventSource !== 'undefined') {
+                    if (intervalId) {
+                        clearInterval(intervalId);
+                        intervalId = null;
+                    }
+                    openStream();
                 }
             } catch (e) {
                 console.error('[MaintenancePoll] Failed to fetch maintenance status', e);
@@ -51,11 +86,13 @@ const useMaintenanceNotification = (accessToken) => {
         // Check immediately
         checkStatus();
 
-        // Then poll every 5 minutes
-        const intervalId = setInterval(checkStatus, 300000);
+        // Poll every 5 minutes (stopped if the stream is advertised)
+        intervalId = setInterval(checkStatus, 300000);
 
         return () => {
-            clearInterval(intervalId);
+            cancelled = true;
+            if (eventSource) eventSource.close();
+            if (intervalId) clearInterval(intervalId);
         };
     }, [accessToken]);
 